@@ -1,5 +1,9 @@
 from .base import BaseAgent
 from .coding_agent import CodingAgent
 from .qa_agent import QAAgent
+from .reasoning_agent import ReasoningAgent
+from .pipeline import AgentPipeline, PipelineResult
+from .registry import AgentRegistry, agent_registry
 
-__all__ = ["BaseAgent", "CodingAgent", "QAAgent"]
+__all__ = ["BaseAgent", "CodingAgent", "QAAgent", "ReasoningAgent", "AgentPipeline", "PipelineResult",
+           "AgentRegistry", "agent_registry"]
@@ -1,43 +1,284 @@
 from abc import ABC, abstractmethod
+import asyncio
+import copy
+import time
+import uuid
 from sqlalchemy.orm import Session
 from llm.base import LLMRequest, LLMResponse
+from .tools import TOOLS, ToolBudget, ToolCallRecord, ToolLoopResult, ToolSession, ToolStep, truncate_result
 
 
 class BaseAgent(ABC):
+    # Bump an operation's version whenever its prompt template changes.
+    PROMPT_VERSIONS = {}
+    
     def __init__(self, db: Session, repo_id: str, model: str = "claude-3-sonnet"):
         self.db = db
         self.repo_id = repo_id
         self.model = model
         self.system_prompt = ""
+        self.tool_session = ToolSession()
+        self.tool_steps = []
     
     @abstractmethod
     async def process(self, user_message: str, context: dict = None) -> str:
         pass
     
-    def _build_llm_request(self, user_message: str, history: list = None) -> LLMRequest:
-        messages = history or []
+    async def _build_llm_request(self, user_message: str, history: list = None) -> LLMRequest:
+        messages = list(history or [])
         messages.append({"role": "user", "content": user_message})
         
         return LLMRequest(
-            system_prompt=self.system_prompt,
+            system_prompt=await self._system_prompt(),
             messages=messages,
             model=self.model,
             temperature=0.7,
             max_tokens=2000,
         )
     
-    async def search_codebase(self, query: str, limit: int = 5):
-        from models import CodeBlock
-        results = self.db.query(CodeBlock).filter(
-            CodeBlock.repository_id == self.repo_id,
-            CodeBlock.entity_name.ilike(f"%{query}%")
-        ).limit(limit).all()
-        return results
+    async def _system_prompt(self) -> str:
+        overview = await self.repository_overview()
+        if not overview:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\n{overview}"
+    
+    async def repository_overview(self):
+        from services.warmup import cached_overview
+        if not self.repo_id:
+            return None
+        return await self.run_db(cached_overview, self.repo_id)
+    
+    async def run_db(self, fn, *args):
+        """Run blocking ``fn(session, *args)`` off the event loop, on a session of its own.
+        
+        ``self.db`` only supplies the engine; agents never query it on the loop.
+        """
+        from database import run_in_session
+        return await run_in_session(self.db.get_bind(), fn, *args)
+    
+    async def run_index_db(self, fn, *args):
+        """Like ``run_db``, with the session holding the repository's code blocks."""
+        from indexing.shards import run_in_index_session
+        return await run_in_index_session(self.db.get_bind(), self.repo_id, fn, *args)
+    
+    async def run_tools(
+        self,
+        user_message: str,
+        history: list = None,
+        budget: ToolBudget = None,
+        session: ToolSession = None,
+    ) -> ToolLoopResult:
+        """Answer ``user_message``, letting the model call repository tools until it answers or the budget runs out."""
+        from services.metrics import metrics
+        budget = budget or ToolBudget.from_settings()
+        session = session or self.tool_session
+        started = time.perf_counter()
+        base = await self._build_llm_request(user_message, history)
+        messages = base.messages
+        steps, tokens = [], 0
+        
+        while True:
+            stopped = budget.exhausted(len(steps), tokens, time.perf_counter() - started)
+            request = base.model_copy(update={"messages": messages, "tools": None if stopped else TOOLS})
+            stage = time.perf_counter()
+            response = await self.provider.generate(request)
+            step = ToolStep(index=len(steps), model_ms=round((time.perf_counter() - stage) * 1000, 1))
+            tokens += response.tokens_used
+            if stopped or not response.tool_calls:
+                steps.append(step)
+                self.tool_steps = steps
+                return ToolLoopResult(content=response.content, tokens_used=tokens, stopped=stopped or "answer", steps=steps)
+            remaining = budget.max_seconds - (time.perf_counter() - started)
+            if remaining <= 0:
+                # The model call used up the time budget: ask again for an answer without tools.
+                steps.append(step)
+                continue
+            
+            messages.append({
+                "role": "assistant",
+                "content": response.content,
+                "tool_calls": [{"function": {"name": call.name, "arguments": call.arguments}} for call in response.tool_calls],
+            })
+            stage = time.perf_counter()
+            outcomes = await asyncio.gather(*(
+                self._call_tool(session, call.name, call.arguments, remaining) for call in response.tool_calls
+            ))
+            step.tools_ms = round((time.perf_counter() - stage) * 1000, 1)
+            for record, result in outcomes:
+                step.calls.append(record)
+                tokens += self.provider.count_tokens(result)
+                messages.append({"role": "tool", "content": result, "tool_name": record.name})
+            steps.append(step)
+            metrics.increment("agent.tool_calls", len(outcomes))
+            metrics.increment("agent.tool_cache_hits", sum(record.cached for record, _ in outcomes))
+    
+    async def _call_tool(self, session: ToolSession, name: str, arguments: dict, timeout: float):
+        started = time.perf_counter()
+        record = ToolCallRecord(name=name, arguments=arguments, took_ms=0.0)
+        try:
+            result, record.cached = await asyncio.wait_for(
+                session.call(name, arguments, lambda: self.execute_tool(name, arguments)), timeout
+            )
+        except asyncio.TimeoutError:
+            record.error = "timed out"
+            result = f"Tool {name} timed out."
+        except Exception as e:
+            record.error = str(e)
+            result = f"Tool {name} failed: {e}"
+        record.took_ms = round((time.perf_counter() - started) * 1000, 1)
+        return record, result
+    
+    async def execute_tool(self, name: str, arguments: dict) -> str:
+        from services.retrieval import format_block
+        if name == "search_code":
+            blocks = await self.search_codebase(arguments["query"], limit=min(int(arguments.get("limit") or 5), 10))
+            text = "".join(format_block(block) for block in blocks)
+        elif name == "get_file_content":
+            blocks = sorted(await self.get_file_content(arguments["file_path"]), key=lambda block: (block.start_line, -block.end_line))
+            covered_to, parts = 0, []
+            for block in blocks:
+                # Methods are already part of their class's block.
+                if block.start_line > covered_to:
+                    parts.append(format_block(block))
+                    covered_to = block.end_line
+            text = "".join(parts)
+        elif name == "grep":
+            matches = await self.grep_repository(arguments["pattern"], path_glob=arguments.get("path_glob"))
+            text = "\n".join(f"{match['path']}:{match['line']}: {match['text']}" for match in matches)
+        elif name == "symbol_neighborhood":
+            names = arguments["names"]
+            blocks = await self.get_symbol_neighborhood(
+                [names] if isinstance(names, str) else names,
+                depth=min(int(arguments.get("depth") or 1), 3),
+            )
+            text = "".join(format_block(block) for block in blocks)
+        else:
+            raise ValueError(f"unknown tool {name!r}")
+        return truncate_result(text) or "No results."
+    
+    async def memoized(self, operation: str, inputs: tuple, run, revalidate: bool = None):
+        """Run ``run(agent)`` through the agent result store, keyed on the operation's inputs.
+
+        A background refresh outlives the request and its database session,
+        so it runs on a copy of this agent with a session of its own.
+        """
+        from config import settings
+        from services.agent_memo import MemoKey, agent_memo, code_hash
+        from services.retrieval_cache import current_index_version
+        key = MemoKey(
+            operation=operation,
+            model=self.model,
+            template_version=self.PROMPT_VERSIONS.get(operation, 1),
+            code_hash=code_hash(*inputs),
+            index_version=await self.run_db(current_index_version, self.repo_id) if self.repo_id else None,
+        )
+        if revalidate is None:
+            revalidate = settings.AGENT_MEMO_REVALIDATE
+        return await agent_memo.get_or_compute(
+            key, lambda: run(self), revalidate=revalidate, refresh=lambda: self._on_own_session(run)
+        )
+    
+    async def _on_own_session(self, run):
+        with Session(bind=self.db.get_bind()) as db:
+            agent = copy.copy(self)
+            agent.db = db
+            return await run(agent)
+    
+    async def context_block(self, user_message: str, context: dict, limit: int) -> str:
+        """Repository code for the prompt; reuses ``context["retrieved"]`` when a pipeline already retrieved it."""
+        if "retrieved" in context:
+            context_str = context["retrieved"]
+        else:
+            context_str = await self.retrieve_context(user_message, limit=limit)
+        if not context_str:
+            return ""
+        return f"\n\nRelevant code from the repository:\n{context_str}"
+    
+    async def retrieve_context(self, query: str, limit: int = 8) -> str:
+        from services.retrieval import RetrievalService
+        if not self.repo_id:
+            return ""
+        retrieval = RetrievalService(self.db, self.repo_id, self.provider)
+        return await retrieval.build_context(query, self.model, limit=limit)
+    
+    async def search_codebase(self, query: str, limit: int = 5, **filters):
+        from indexing.bm25 import bm25_registry
+        from services.retrieval_cache import current_index_version, retrieval_cache
+        from services.search import CodeSearchService
+        
+        async def search():
+            index = bm25_registry.get(self.repo_id)
+            if not filters and index.exists():
+                return [block_id for block_id, _ in await asyncio.to_thread(index.search, query, limit)]
+            hits = await self.run_index_db(
+                lambda index_db: CodeSearchService(index_db).search(self.repo_id, query, limit=limit, **filters)
+            )
+            return [str(hit.block.id) for hit in hits]
+        
+        block_ids = await retrieval_cache.get_or_compute(
+            self.repo_id,
+            await self.run_db(current_index_version, self.repo_id),
+            "search_codebase",
+            query,
+            dict(filters, limit=limit),
+            search,
+        )
+        return await self._load_blocks(block_ids)
+    
+    async def semantic_search(self, query: str, limit: int = 5):
+        from indexing.embeddings import vector_registry
+        index = vector_registry.get(self.repo_id)
+        if not index.exists():
+            return []
+        
+        try:
+            vectors = await self.provider.embed([query])
+        except RuntimeError:
+            return []
+        if not vectors:
+            return []
+        
+        ranked = await asyncio.to_thread(index.search, vectors[0], limit)
+        return await self._load_blocks([block_id for block_id, _ in ranked])
+    
+    async def grep_repository(self, pattern: str, regex: bool = True, path_glob: str = None, limit: int = 50):
+        from models import Repository
+        from services.grep import RepositoryGrep
+        
+        local_path = await self.run_db(lambda db: db.query(Repository.local_path).filter(
+            Repository.id == uuid.UUID(str(self.repo_id))
+        ).scalar())
+        if not local_path:
+            return []
+        
+        grep = RepositoryGrep(local_path, pattern, regex=regex, path_glob=path_glob, max_matches=limit)
+        matches, _ = await grep.collect()
+        return matches
+    
+    async def find_duplicates(self, min_size: int = 2, limit: int = 10):
+        from indexing.minhash import minhash_registry
+        if not self.repo_id:
+            return []
+        
+        clusters = await asyncio.to_thread(minhash_registry.get(self.repo_id).clusters, min_size=min_size, limit=limit)
+        return [
+            {"similarity": cluster["similarity"], "blocks": await self._load_blocks(cluster["block_ids"])}
+            for cluster in clusters
+        ]
+    
+    async def _load_blocks(self, block_ids: list):
+        from services.search import CodeSearchService
+        return await self.run_index_db(lambda index_db: CodeSearchService(index_db).get_blocks(block_ids))
+    
+    async def get_symbol_neighborhood(self, names: list, depth: int = 1, limit: int = 5):
+        from indexing.graph import SymbolGraph
+        return await self.run_index_db(
+            lambda index_db: SymbolGraph(index_db, uuid.UUID(str(self.repo_id))).neighborhood_blocks(names, depth=depth, limit=limit)
+        )
     
     async def get_file_content(self, file_path: str):
         from models import CodeBlock
-        blocks = self.db.query(CodeBlock).filter(
-            (CodeBlock.repository_id == self.repo_id) &
+        return await self.run_index_db(lambda index_db: index_db.query(CodeBlock).filter(
+            (CodeBlock.repository_id == uuid.UUID(str(self.repo_id))) &
             (CodeBlock.file_path == file_path)
-        ).all()
-        return blocks
+        ).all())
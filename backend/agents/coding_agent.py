@@ -1,11 +1,13 @@
 from sqlalchemy.orm import Session
 from .base import BaseAgent
-from llm import OllamaProvider
+from llm import provider_pool
 from llm.base import LLMRequest
 
 
 class CodingAgent(BaseAgent):
-    def __init__(self, db: Session, repo_id: str, model: str = "codellama:latest"):
+    PROMPT_VERSIONS = {"refactor_code": 1, "debug_code": 1}
+    
+    def __init__(self, db: Session, repo_id: str, model: str = "codellama:latest", provider=None):
         super().__init__(db, repo_id, model)
         self.system_prompt = """You are an expert AI code generation and modification assistant.
 
@@ -23,23 +25,21 @@ When generating code:
 - Suggest tests when applicable
 
 Always provide clear explanations of your changes and reasoning."""
-        self.provider = OllamaProvider(model=model)
+        self.provider = provider or provider_pool.get()
     
     async def process(self, user_message: str, context: dict = None, history: list = None) -> str:
         context = context or {}
         history = history or []
         
-        relevant_code = await self.search_codebase(user_message, limit=3)
-        
-        context_str = ""
-        if relevant_code:
-            context_str = "\n\nRelevant code from the repository:\n"
-            for block in relevant_code:
-                context_str += f"\nFile: {block.file_path}\n{block.content}\n"
+        context_str = await self.context_block(user_message, context, limit=6)
         
         enhanced_message = f"{user_message}{context_str}"
         
-        llm_request = self._build_llm_request(enhanced_message, history)
+        if context.get("tools"):
+            result = await self.run_tools(enhanced_message, history)
+            return result.content
+        
+        llm_request = await self._build_llm_request(enhanced_message, history)
         response = await self.provider.generate(llm_request)
         
         return response.content
@@ -57,7 +57,7 @@ Provide complete, working code with:
         
         return await self.process(prompt)
     
-    async def refactor_code(self, code: str, improvement_focus: str = "readability"):
+    async def refactor_code(self, code: str, improvement_focus: str = "readability", revalidate: bool = None):
         prompt = f"""Refactor the following code focusing on {improvement_focus}:
 
 ```
@@ -69,9 +69,10 @@ Provide:
 2. Explanation of changes
 3. Any warnings or breaking changes"""
         
-        return await self.process(prompt)
+        result = await self.memoized("refactor_code", (code, improvement_focus), lambda agent: agent.process(prompt), revalidate)
+        return result.value
     
-    async def debug_code(self, code: str, error_message: str):
+    async def debug_code(self, code: str, error_message: str, revalidate: bool = None):
         prompt = f"""Debug the following code:
 
 Code:
@@ -86,4 +87,5 @@ Provide:
 2. Fixed code
 3. Explanation of the fix"""
         
-        return await self.process(prompt)
+        result = await self.memoized("debug_code", (code, error_message), lambda agent: agent.process(prompt), revalidate)
+        return result.value
@@ -0,0 +1,214 @@
+"""
+Concurrent multi-agent pipeline with seer synthesis (premium tier).
+
+The coding, QA and (when the tier has one) reasoning agents answer the same
+request side by side, and the seer model merges their answers. Retrieval
+runs once and its packed context is handed to every branch, and all agents
+share one provider, so they share its connection pool too. Retrieval is
+packed for the branch model with the smallest context window so the same
+text fits all of them.
+
+Stages overlap where they can. Branch and seer models are preloaded while
+retrieval runs, and the seer keeps loading while the branches generate, so
+end-to-end latency is roughly retrieval + slowest branch + synthesis. Each
+branch has its own timeout; a branch that times out or fails is left out
+of the synthesis. Cancelling ``run`` cancels every in-flight branch and
+preload. With fewer than two usable answers, or no seer, the best single
+answer is returned as is.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from llm import provider_pool
+from llm.base import LLMRequest
+from services.metrics import metrics
+from .base import BaseAgent
+from .coding_agent import CodingAgent
+from .qa_agent import QAAgent
+from .reasoning_agent import ReasoningAgent
+
+logger = logging.getLogger(__name__)
+
+# Also the order of preference when falling back to a single answer.
+BRANCHES = ("coding", "qa", "reasoning")
+RETRIEVAL_LIMIT = 8
+SYNTHESIS_MAX_TOKENS = 3000
+
+SEER_PROMPT = """You are a senior reviewer. Several specialist assistants answered the same request independently.
+Merge their answers into one response for the user:
+- Keep correct code and explanations; prefer the most complete working code
+- Resolve contradictions by checking them against the request and the answers' reasoning
+- Drop repetition and anything unsupported
+- Do not mention the assistants or that answers were merged"""
+
+
+@dataclass
+class BranchResult:
+    name: str
+    model: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    took_ms: float = 0.0
+
+
+@dataclass
+class PipelineResult:
+    content: str
+    model: str
+    synthesized: bool
+    branches: List[BranchResult] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def pipeline_models() -> Dict[str, Optional[str]]:
+    """Tier models for each pipeline stage; ``reasoning`` and ``seer`` may be ``None``."""
+    from services.model_selector import model_selector
+    return {
+        "coding": model_selector.get_code_model(),
+        "qa": model_selector.get_general_model(),
+        "reasoning": model_selector.get_reasoning_model(),
+        "seer": model_selector.get_seer_model(),
+    }
+
+
+def pipeline_available() -> bool:
+    from services.tier_config import tier_config
+    return tier_config.is_premium() and tier_config.supports_seer()
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+class AgentPipeline:
+    def __init__(
+        self,
+        db: Session,
+        repo_id: Optional[str],
+        provider=None,
+        models: Optional[Dict[str, Optional[str]]] = None,
+        branch_timeout: Optional[float] = None,
+    ):
+        self.db = db
+        self.repo_id = repo_id
+        self.provider = provider or provider_pool.get()
+        self.models = models or pipeline_models()
+        self.branch_timeout = branch_timeout or settings.PIPELINE_BRANCH_TIMEOUT_SECONDS
+        self.agents = self._build_agents()
+
+    def _build_agents(self) -> Dict[str, BaseAgent]:
+        classes = {"coding": CodingAgent, "qa": QAAgent, "reasoning": ReasoningAgent}
+        return {
+            name: classes[name](self.db, self.repo_id, self.models[name], provider=self.provider)
+            for name in BRANCHES if self.models.get(name)
+        }
+
+    async def run(self, message: str, history: list = None) -> PipelineResult:
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        history = history or []
+        metrics.increment("pipeline.runs")
+
+        models = {agent.model for agent in self.agents.values()}
+        if self.models.get("seer"):
+            models.add(self.models["seer"])
+        tasks = [asyncio.create_task(self._preload(model)) for model in sorted(models)]
+        try:
+            stage = time.perf_counter()
+            retrieved = await self._retrieve(message)
+            timings["retrieval_ms"] = _elapsed_ms(stage)
+
+            branches = [
+                asyncio.create_task(self._branch(name, agent, message, retrieved, history))
+                for name, agent in self.agents.items()
+            ]
+            tasks.extend(branches)
+            results = await asyncio.gather(*branches)
+            for result in results:
+                timings[f"{result.name}_ms"] = result.took_ms
+
+            stage = time.perf_counter()
+            content, model, synthesized = await self._synthesize(message, results)
+            timings["synthesis_ms"] = _elapsed_ms(stage)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        timings["total_ms"] = _elapsed_ms(started)
+        return PipelineResult(content=content, model=model, synthesized=synthesized, branches=results, timings=timings)
+
+    async def _retrieve(self, message: str) -> str:
+        from services.retrieval import RetrievalService
+        if not self.repo_id or not self.agents:
+            return ""
+        model = min((agent.model for agent in self.agents.values()), key=self.provider.get_context_window)
+        return await RetrievalService(self.db, self.repo_id, self.provider).build_context(
+            message, model, limit=RETRIEVAL_LIMIT
+        )
+
+    async def _preload(self, model: str):
+        try:
+            await self.provider.preload(model)
+        except RuntimeError as e:
+            logger.warning(f"Pipeline preload failed: {e}")
+
+    async def _branch(self, name: str, agent: BaseAgent, message: str, retrieved: str, history: list) -> BranchResult:
+        started = time.perf_counter()
+        result = BranchResult(name=name, model=agent.model)
+        try:
+            result.content = await asyncio.wait_for(
+                agent.process(message, {"retrieved": retrieved}, history), self.branch_timeout
+            )
+        except asyncio.TimeoutError:
+            result.error = f"timed out after {self.branch_timeout}s"
+        except RuntimeError as e:
+            result.error = str(e)
+        result.took_ms = _elapsed_ms(started)
+        if result.error:
+            metrics.increment("pipeline.branch_failed")
+            logger.warning(f"Pipeline branch {name} ({agent.model}) failed: {result.error}")
+        return result
+
+    async def _synthesize(self, message: str, results: List[BranchResult]):
+        answers = [result for result in results if result.content]
+        if not answers:
+            errors = "; ".join(f"{result.name}: {result.error}" for result in results)
+            raise RuntimeError(f"All pipeline branches failed ({errors or 'no branches configured'})")
+
+        seer = self.models.get("seer")
+        if seer and len(answers) > 1:
+            try:
+                response = await self.provider.generate(LLMRequest(
+                    system_prompt=SEER_PROMPT,
+                    messages=[{"role": "user", "content": self._seer_prompt(message, answers)}],
+                    model=seer,
+                    temperature=0.3,
+                    max_tokens=SYNTHESIS_MAX_TOKENS,
+                ))
+                if response.content.strip():
+                    return response.content, seer, True
+            except RuntimeError as e:
+                logger.warning(f"Pipeline synthesis with {seer} failed: {e}")
+
+        metrics.increment("pipeline.unsynthesized")
+        best = min(answers, key=lambda result: BRANCHES.index(result.name))
+        return best.content, best.model, False
+
+    def _seer_prompt(self, message: str, answers: List[BranchResult]) -> str:
+        sections = "\n\n".join(
+            f"### Answer {i} ({result.name} assistant)\n{result.content}"
+            for i, result in enumerate(answers, 1)
+        )
+        return f"""Request:
+{message}
+
+{sections}
+
+Write the single best response to the request."""
@@ -1,10 +1,12 @@
 from sqlalchemy.orm import Session
 from .base import BaseAgent
-from llm import OllamaProvider
+from llm import provider_pool
 
 
 class QAAgent(BaseAgent):
-    def __init__(self, db: Session, repo_id: str, model: str = "llama3:latest"):
+    PROMPT_VERSIONS = {"explain_code": 1}
+    
+    def __init__(self, db: Session, repo_id: str, model: str = "llama3:latest", provider=None):
         super().__init__(db, repo_id, model)
         self.system_prompt = """You are a knowledgeable code analysis and explanation assistant.
 
@@ -21,29 +23,26 @@ When answering:
 - Reference specific code sections when relevant
 - Explain both the "what" and "why"
 - Suggest alternatives when applicable"""
-        self.provider = OllamaProvider(model=model)
+        self.provider = provider or provider_pool.get()
     
     async def process(self, user_message: str, context: dict = None, history: list = None) -> str:
         context = context or {}
         history = history or []
         
-        relevant_code = await self.search_codebase(user_message, limit=5)
-        
-        context_str = ""
-        if relevant_code:
-            context_str = "\n\nRelevant code from the repository:\n"
-            for block in relevant_code:
-                context_str += f"\nFile: {block.file_path}\nFunction/Class: {block.entity_name}\n"
-                context_str += f"{block.content}\n"
+        context_str = await self.context_block(user_message, context, limit=8)
         
         enhanced_message = f"{user_message}{context_str}"
         
-        llm_request = self._build_llm_request(enhanced_message, history)
+        if context.get("tools"):
+            result = await self.run_tools(enhanced_message, history)
+            return result.content
+        
+        llm_request = await self._build_llm_request(enhanced_message, history)
         response = await self.provider.generate(llm_request)
         
         return response.content
     
-    async def explain_code(self, code: str):
+    async def explain_code(self, code: str, revalidate: bool = None):
         prompt = f"""Explain the following code in detail:
 
 ```
@@ -56,7 +55,8 @@ Cover:
 3. Key components and their purpose
 4. Any important edge cases or considerations"""
         
-        return await self.process(prompt)
+        result = await self.memoized("explain_code", (code,), lambda agent: agent.process(prompt), revalidate)
+        return result.value
     
     async def answer_question(self, question: str):
         prompt = f"""Answer the following question about the codebase:
@@ -89,5 +89,47 @@ Provide:
 3. Maintainability
 4. Test coverage
 5. Documentation"""
+            overview = await self.summarize_repository()
+            if overview:
+                prompt += f"\n\nRepository summary:\n{overview}"
+            hotspots = self._format_duplicates(await self.find_duplicates(limit=5))
+            if hotspots:
+                prompt += f"\n\nCopy-paste hot spots found in the index:\n{hotspots}"
+        
+        return await self.process(prompt)
+    
+    async def summarize_repository(self) -> str:
+        """Stored summaries of the repository and its top-level directories; "" until warm-up has built them."""
+        from services.summaries import cached_summaries
+        if not self.repo_id:
+            return ""
+        
+        summaries = await self.run_db(cached_summaries, self.repo_id)
+        if not summaries.get(""):
+            return ""
+        sections = [summaries[""]] + [f"{path}/: {text}" for path, text in summaries.items() if path]
+        return "\n\n".join(sections)
+    
+    async def report_duplicates(self, limit: int = 10):
+        hotspots = self._format_duplicates(await self.find_duplicates(limit=limit))
+        if not hotspots:
+            return "No near-duplicate code was found in the indexed repository."
+        
+        prompt = f"""The following groups of code blocks are near-duplicates (copy-paste hot spots):
+{hotspots}
+
+For each group, provide:
+1. What logic is duplicated
+2. Whether it should be extracted into a shared helper, and where
+3. Any differences between the copies that could be bugs"""
         
         return await self.process(prompt)
+    
+    def _format_duplicates(self, hotspots: list) -> str:
+        lines = []
+        for i, hotspot in enumerate(hotspots, 1):
+            lines.append(f"{i}. {len(hotspot['blocks'])} blocks, ~{hotspot['similarity']:.0%} similar:")
+            for block in hotspot["blocks"]:
+                label = f" ({block.entity_name})" if block.entity_name else ""
+                lines.append(f"   - {block.file_path}:{block.start_line}-{block.end_line}{label}")
+        return "\n".join(lines)
@@ -0,0 +1,39 @@
+from sqlalchemy.orm import Session
+from .base import BaseAgent
+from llm import provider_pool
+
+
+class ReasoningAgent(BaseAgent):
+    def __init__(self, db: Session, repo_id: str, model: str = "qwen3:8b", provider=None):
+        super().__init__(db, repo_id, model)
+        self.system_prompt = """You are a careful software engineering analyst.
+
+Your capabilities include:
+1. Breaking a problem down into steps
+2. Tracing control and data flow through the code
+3. Identifying assumptions, edge cases and failure modes
+4. Weighing alternative approaches and their trade-offs
+
+When answering:
+- Reason step by step before concluding
+- Ground every claim in the code provided
+- Say clearly when the code shown is not enough to decide
+- End with a short, concrete conclusion"""
+        self.provider = provider or provider_pool.get()
+    
+    async def process(self, user_message: str, context: dict = None, history: list = None) -> str:
+        context = context or {}
+        history = history or []
+        
+        context_str = await self.context_block(user_message, context, limit=8)
+        
+        enhanced_message = f"{user_message}{context_str}"
+        
+        if context.get("tools"):
+            result = await self.run_tools(enhanced_message, history)
+            return result.content
+        
+        llm_request = await self._build_llm_request(enhanced_message, history)
+        response = await self.provider.generate(llm_request)
+        
+        return response.content
@@ -0,0 +1,101 @@
+"""
+Chat agent registry.
+
+Maps a chat ``agent_type`` to the agent that serves it and the tier model it
+runs on. Every agent it builds shares the pooled provider, so they reuse one
+set of HTTP connections. Agents are bound to a request's database session,
+so instances are cheap per-request objects. What is worth keeping across
+requests is kept here: each chat session's tool-result cache.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple, Type
+
+from sqlalchemy.orm import Session
+
+from llm import provider_pool
+from .base import BaseAgent
+from .coding_agent import CodingAgent
+from .pipeline import AgentPipeline, pipeline_available
+from .qa_agent import QAAgent
+from .reasoning_agent import ReasoningAgent
+from .tools import ToolSession
+
+MAX_TOOL_SESSIONS = 1024
+
+
+def _code_model() -> str:
+    from services.model_selector import model_selector
+    return model_selector.get_code_model()
+
+
+def _general_model() -> str:
+    from services.model_selector import model_selector
+    return model_selector.get_general_model()
+
+
+def _review_model() -> str:
+    from services.model_selector import model_selector
+    return model_selector.get_seer_model() or model_selector.get_general_model()
+
+
+def _reasoning_model() -> str:
+    from services.model_selector import model_selector
+    return model_selector.get_reasoning_model() or model_selector.get_general_model()
+
+
+class AgentRegistry:
+    def __init__(self, default_type: str = "qa"):
+        self.default_type = default_type
+        self._types: Dict[str, Tuple[Type[BaseAgent], Callable[[], str]]] = {}
+        self._tool_sessions: "OrderedDict[str, ToolSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, agent_type: str, agent_class: Type[BaseAgent], model_for: Callable[[], str]):
+        self._types[agent_type] = (agent_class, model_for)
+
+    def types(self):
+        return sorted(self._types) + ["pipeline"]
+
+    def uses_pipeline(self, agent_type: str) -> bool:
+        return agent_type == "pipeline" and pipeline_available()
+
+    def resolve_model(self, agent_type: str) -> str:
+        if agent_type == "pipeline":
+            agent_type = "coding"
+        _, model_for = self._types.get(agent_type, self._types[self.default_type])
+        return model_for()
+
+    def create(self, agent_type: str, db: Session, repo_id, model: Optional[str] = None, session_id=None) -> BaseAgent:
+        if agent_type == "pipeline":
+            agent_type = "coding"
+        agent_class, model_for = self._types.get(agent_type, self._types[self.default_type])
+        agent = agent_class(db, repo_id, model or model_for(), provider=provider_pool.get())
+        if session_id is not None:
+            agent.tool_session = self.tool_session(session_id)
+        return agent
+
+    def pipeline(self, db: Session, repo_id) -> AgentPipeline:
+        return AgentPipeline(db, repo_id, provider=provider_pool.get())
+
+    def tool_session(self, session_id) -> ToolSession:
+        key = str(session_id)
+        with self._lock:
+            session = self._tool_sessions.get(key)
+            if session is None:
+                session = self._tool_sessions[key] = ToolSession()
+            self._tool_sessions.move_to_end(key)
+            while len(self._tool_sessions) > MAX_TOOL_SESSIONS:
+                self._tool_sessions.popitem(last=False)
+            return session
+
+
+agent_registry = AgentRegistry()
+agent_registry.register("coding", CodingAgent, _code_model)
+agent_registry.register("web_dev", CodingAgent, _code_model)
+agent_registry.register("testing", CodingAgent, _code_model)
+agent_registry.register("docs", QAAgent, _general_model)
+agent_registry.register("qa", QAAgent, _general_model)
+agent_registry.register("review", QAAgent, _review_model)
+agent_registry.register("reasoning", ReasoningAgent, _reasoning_model)
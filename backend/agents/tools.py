@@ -0,0 +1,173 @@
+"""
+Tools for the agent tool-use loop (``BaseAgent.run_tools``).
+
+Chat requests opt in with ``"tools": true`` on an indexed repository.
+The model may ask for several tools in one turn; those calls are
+independent, so the loop runs them concurrently and the turn costs as much
+as its slowest tool. Results are cached per ``ToolSession`` (one per chat
+session, from ``agent_registry``), so a repeated search or
+file read is answered from memory. The loop stops offering tools once the
+request's step, token or time budget is spent and asks the model for its
+final answer.
+"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from llm.base import LLMTool
+
+MAX_RESULT_CHARS = 6000
+MAX_CACHED_RESULTS = 256
+
+TOOLS = [
+    LLMTool(
+        name="search_code",
+        description="Search the repository's indexed code by keywords. Returns the best matching functions, classes and files.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Keywords or identifiers to look for"},
+                "limit": {"type": "integer", "description": "Maximum number of results (default 5)"},
+            },
+            "required": ["query"],
+        },
+    ),
+    LLMTool(
+        name="get_file_content",
+        description="Read the indexed code of one file by its repository-relative path.",
+        parameters={
+            "type": "object",
+            "properties": {"file_path": {"type": "string", "description": "Path relative to the repository root"}},
+            "required": ["file_path"],
+        },
+    ),
+    LLMTool(
+        name="grep",
+        description="Search file contents with a regular expression. Returns matching lines with their file and line number.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "pattern": {"type": "string", "description": "Regular expression"},
+                "path_glob": {"type": "string", "description": "Only search files matching this glob, e.g. '*.py'"},
+            },
+            "required": ["pattern"],
+        },
+    ),
+    LLMTool(
+        name="symbol_neighborhood",
+        description="Find the code that calls, or is called by, the named functions or classes.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "names": {"type": "array", "items": {"type": "string"}, "description": "Function or class names"},
+                "depth": {"type": "integer", "description": "Call-graph hops to follow (default 1)"},
+            },
+            "required": ["names"],
+        },
+    ),
+]
+
+
+@dataclass
+class ToolBudget:
+    max_steps: int
+    max_tokens: int
+    max_seconds: float
+
+    @classmethod
+    def from_settings(cls) -> "ToolBudget":
+        return cls(
+            max_steps=settings.AGENT_TOOL_MAX_STEPS,
+            max_tokens=settings.AGENT_TOOL_TOKEN_BUDGET,
+            max_seconds=settings.AGENT_TOOL_TIME_BUDGET_SECONDS,
+        )
+
+    def exhausted(self, steps: int, tokens: int, elapsed: float) -> Optional[str]:
+        """Why no more tool calls are allowed, or ``None`` while within budget."""
+        if steps >= self.max_steps:
+            return "max_steps"
+        if tokens >= self.max_tokens:
+            return "tokens"
+        if elapsed >= self.max_seconds:
+            return "time"
+        return None
+
+
+@dataclass
+class ToolCallRecord:
+    name: str
+    arguments: Dict[str, Any]
+    took_ms: float
+    cached: bool = False
+    error: Optional[str] = None
+
+
+@dataclass
+class ToolStep:
+    index: int
+    model_ms: float
+    tools_ms: float = 0.0
+    calls: List[ToolCallRecord] = field(default_factory=list)
+
+
+@dataclass
+class ToolLoopResult:
+    content: str
+    tokens_used: int
+    stopped: str
+    steps: List[ToolStep] = field(default_factory=list)
+
+
+class ToolSession:
+    def __init__(self, max_results: int = MAX_CACHED_RESULTS):
+        self.max_results = max_results
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(name: str, arguments: Dict[str, Any]) -> str:
+        return json.dumps([name, arguments], sort_keys=True, default=str)
+
+    async def call(self, name: str, arguments: Dict[str, Any], run: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """Return ``(result, cached)``; identical concurrent calls share one execution.
+
+        Every caller, the first included, waits on the execution through a
+        shield, so one caller timing out never cancels it for the others.
+        """
+        key = self.key(name, arguments)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key], True
+        task = self._inflight.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(run())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise  # This caller was cancelled; the execution goes on.
+            raise RuntimeError(f"tool {name} was cancelled")
+
+    def _finished(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._results[key] = task.result()
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+
+
+def truncate_result(text: str) -> str:
+    if len(text) <= MAX_RESULT_CHARS:
+        return text
+    return text[:MAX_RESULT_CHARS] + f"\n... ({len(text) - MAX_RESULT_CHARS} more characters truncated)"
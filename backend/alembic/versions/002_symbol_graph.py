@@ -0,0 +1,42 @@
+"""Symbol reference graph over indexed code blocks
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'symbol_edges',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('repository_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('block_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('file_path', sa.String(), nullable=False),
+        sa.Column('source', sa.String(), nullable=False),
+        sa.Column('target', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['repository_id'], ['repositories.id'], ),
+        sa.ForeignKeyConstraint(['block_id'], ['code_blocks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_symbol_edges_repo_target', 'symbol_edges', ['repository_id', 'target'], unique=False)
+    op.create_index('ix_symbol_edges_repo_source', 'symbol_edges', ['repository_id', 'source'], unique=False)
+    op.create_index('ix_symbol_edges_repo_file', 'symbol_edges', ['repository_id', 'file_path'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_symbol_edges_repo_file', table_name='symbol_edges')
+    op.drop_index('ix_symbol_edges_repo_source', table_name='symbol_edges')
+    op.drop_index('ix_symbol_edges_repo_target', table_name='symbol_edges')
+    op.drop_table('symbol_edges')
@@ -0,0 +1,31 @@
+"""Full-text search vector and GIN index on code blocks
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(r"""
+        ALTER TABLE code_blocks ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple'::regconfig, coalesce(entity_name, '')), 'A') ||
+            setweight(to_tsvector('simple'::regconfig, regexp_replace(coalesce(entity_name, ''), '([a-z0-9])([A-Z])|_', '\1 \2', 'g')), 'A') ||
+            setweight(to_tsvector('simple'::regconfig, coalesce(docstring, '')), 'B') ||
+            setweight(to_tsvector('simple'::regconfig, left(regexp_replace(content, '([a-z0-9])([A-Z])|[_.]', '\1 \2', 'g'), 200000)), 'C')
+        ) STORED
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_code_blocks_search_vector ON code_blocks USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_code_blocks_search_vector")
+    op.execute("ALTER TABLE code_blocks DROP COLUMN IF EXISTS search_vector")
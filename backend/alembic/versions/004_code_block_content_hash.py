@@ -0,0 +1,24 @@
+"""Content hash on code blocks for incremental embedding
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('code_blocks', sa.Column('content_hash', sa.String(length=40), nullable=True))
+    op.create_index(op.f('ix_code_blocks_content_hash'), 'code_blocks', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_code_blocks_content_hash'), table_name='code_blocks')
+    op.drop_column('code_blocks', 'content_hash')
@@ -0,0 +1,37 @@
+"""Catalog of per-repository index shards
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'index_shards',
+        sa.Column('repository_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('node_id', sa.String(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('format_version', sa.Integer(), nullable=False),
+        sa.Column('block_count', sa.Integer(), nullable=False),
+        sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['repository_id'], ['repositories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('repository_id'),
+    )
+    op.create_index(op.f('ix_index_shards_node_id'), 'index_shards', ['node_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_index_shards_node_id'), table_name='index_shards')
+    op.drop_table('index_shards')
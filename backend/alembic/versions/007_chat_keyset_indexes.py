@@ -0,0 +1,26 @@
+"""Composite indexes for keyset pagination of sessions and messages
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps chat writable while messages is indexed; it can't run in a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_sessions_user_id_updated_at'), 'sessions', ['user_id', 'updated_at'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_messages_session_id_created_at'), 'messages', ['session_id', 'created_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_messages_session_id_created_at'), table_name='messages', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_sessions_user_id_updated_at'), table_name='sessions', postgresql_concurrently=True)
@@ -0,0 +1,100 @@
+"""Partition messages by month and add the idle-session message archive
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:00:00.000000
+
+On Postgres, ``messages`` becomes a table range-partitioned on
+``created_at``. It has one partition per month from the oldest message up to
+a couple of months ahead, plus a default partition for anything outside
+those ranges. Later months are added by the compaction job. The primary key
+becomes ``(id, created_at)``, because a partitioned table's keys must include
+the partition column.
+
+The existing rows are copied into the new table in the same transaction, so
+run this in a maintenance window on large installs.
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 2
+
+
+def next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def upgrade() -> None:
+    op.add_column('sessions', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.create_table(
+        'message_archives',
+        sa.Column('session_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('raw_bytes', sa.Integer(), nullable=False),
+        sa.Column('compressed_bytes', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('session_id'),
+    )
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute("ALTER INDEX ix_messages_session_id_created_at RENAME TO ix_messages_legacy_session_id_created_at")
+    op.execute("UPDATE messages_legacy SET created_at = now() WHERE created_at IS NULL")
+    op.execute(
+        "CREATE TABLE messages (LIKE messages_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER TABLE messages ALTER COLUMN created_at SET NOT NULL")
+    op.execute("ALTER TABLE messages ADD CONSTRAINT messages_pkey_partitioned PRIMARY KEY (id, created_at)")
+    op.execute("ALTER TABLE messages ADD FOREIGN KEY (session_id) REFERENCES sessions (id)")
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+    oldest = bind.execute(sa.text("SELECT date_trunc('month', min(created_at)) FROM messages_legacy")).scalar()
+    month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month = min(oldest, month) if oldest else month
+    last = datetime.utcnow()
+    for _ in range(MONTHS_AHEAD):
+        last = next_month(last)
+    while month <= last:
+        upper = next_month(month)
+        op.execute(
+            f"CREATE TABLE messages_p{month:%Y_%m} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+        )
+        month = upper
+
+    op.execute("INSERT INTO messages SELECT * FROM messages_legacy")
+    op.execute("DROP TABLE messages_legacy")
+    op.create_index(op.f('ix_messages_session_id_created_at'), 'messages', ['session_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT count(*) FROM message_archives")).scalar():
+        raise RuntimeError("Sessions are still archived; run `python -m services.compaction --restore-all` first")
+    if bind.dialect.name == 'postgresql':
+        op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+        op.execute("ALTER INDEX ix_messages_session_id_created_at RENAME TO ix_messages_partitioned_session_id_created_at")
+        op.execute("CREATE TABLE messages (LIKE messages_partitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        op.execute("ALTER TABLE messages ADD PRIMARY KEY (id)")
+        op.execute("ALTER TABLE messages ADD FOREIGN KEY (session_id) REFERENCES sessions (id)")
+        op.execute("INSERT INTO messages SELECT * FROM messages_partitioned")
+        op.execute("DROP TABLE messages_partitioned")
+        op.create_index(op.f('ix_messages_session_id_created_at'), 'messages', ['session_id', 'created_at'], unique=False)
+
+    op.drop_table('message_archives')
+    op.drop_column('sessions', 'archived_at')
@@ -0,0 +1,35 @@
+"""Per-user, per-model daily token usage rollups
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 00:00:00.000000
+
+The table starts empty. Fill it from existing messages and archives with
+``python -m services.usage --rebuild`` after upgrading.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_rollups',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('tokens_used', sa.BigInteger(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'day', 'model'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('usage_rollups')
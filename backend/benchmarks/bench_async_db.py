@@ -0,0 +1,130 @@
+"""
+Event-loop blocking benchmark: sync Session vs AsyncSession in async handlers.
+
+Every route in the API is ``async def``. With the old synchronous session,
+a query runs on the event loop thread, so while one slow query is in flight
+no other request makes progress. This drives the same handler against
+both session layers with many concurrent clients. A fraction of requests
+run a slow query (a SQLite ``sleep(ms)`` function standing in for a slow
+Postgres query); the rest are fast lookups. It reports requests per second
+and wall time. The client runs in-process on the same event loop, so
+per-request latencies would be skewed by the blocking they measure and are
+not reported.
+
+    python -m benchmarks.bench_async_db --requests 400 --concurrency 50 --slow-ms 50 --slow-fraction 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from database import Base, async_database_url
+from models import User
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+    return 0
+
+
+def add_sleep_function(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep", 1, sleep_ms)
+
+
+def build_app(url: str, slow_ms: int) -> FastAPI:
+    sync_engine = create_engine(url, poolclass=NullPool, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(async_database_url(url), poolclass=NullPool)
+    event.listen(sync_engine, "connect", add_sleep_function)
+    event.listen(async_engine.sync_engine, "connect", add_sleep_function)
+    SyncSession = sessionmaker(bind=sync_engine)
+    AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+    slow_query = text("SELECT sleep(:ms)").bindparams(ms=slow_ms)
+
+    app = FastAPI()
+
+    @app.get("/sync/{user_id}")
+    async def sync_handler(user_id: int, slow: bool = False):
+        with SyncSession() as db:
+            if slow:
+                db.execute(slow_query)
+            return {"user": db.scalar(select(User.username).offset(user_id).limit(1))}
+
+    @app.get("/async/{user_id}")
+    async def async_handler(user_id: int, slow: bool = False):
+        async with AsyncSession() as db:
+            if slow:
+                await db.execute(slow_query)
+            return {"user": await db.scalar(select(User.username).offset(user_id).limit(1))}
+
+    return app
+
+
+async def drive(app: FastAPI, mode: str, plan: list, concurrency: int) -> dict:
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                user_id, slow = queue.get_nowait()
+                response = await client.get(f"/{mode}/{user_id}", params={"slow": slow})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"rps": len(plan) / elapsed, "elapsed": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--slow-ms", type=int, default=50)
+    parser.add_argument("--slow-fraction", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_async_db_")
+    url = f"sqlite:///{workdir}/bench.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all(
+            User(email=f"user{i}@example.com", username=f"user{i}", hashed_password="x")
+            for i in range(args.users)
+        )
+        db.commit()
+
+    app = build_app(url, args.slow_ms)
+    plan = [(rng.randrange(args.users), rng.random() < args.slow_fraction) for _ in range(args.requests)]
+
+    serial = sum(slow for _, slow in plan) * args.slow_ms / 1000
+    print(
+        f"requests={args.requests} concurrency={args.concurrency} "
+        f"slow={args.slow_fraction:.0%} x {args.slow_ms}ms (serialized slow time {serial:.2f}s)"
+    )
+    for mode, label in (("sync", "sync Session (old get_db)"), ("async", "AsyncSession (get_db)")):
+        stats = asyncio.run(drive(app, mode, plan, args.concurrency))
+        print(f"{label:28s} {stats['rps']:8.1f} req/s  wall={stats['elapsed']:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
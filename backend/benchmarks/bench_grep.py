@@ -0,0 +1,118 @@
+"""
+Grep throughput benchmark: line-by-line Python scan vs. RepositoryGrep.
+
+Generates a large synthetic source tree (plus a sprinkling of binary files)
+in a temporary directory and times the same patterns through a naive
+read-and-loop scanner, RepositoryGrep on one worker with and without the
+literal prefilter, and RepositoryGrep on the process pool.
+
+    python -m benchmarks.bench_grep --files 4000 --kb 32
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from services.grep import RepositoryGrep
+
+WORDS = ["user", "config", "session", "token", "load", "parse", "render", "cache", "index", "value"]
+PATTERNS = {
+    "rare literal": ("ERR_QUOTA_EXCEEDED_7731", False),
+    "common literal": ("return", False),
+    "regex with literal": (r"def \w+_session_\d+\(", True),
+    "regex without literal": (r"[A-Z]{4}_\d{3}", True),
+}
+
+
+def generate_tree(root: str, files: int, kb: int, rng: random.Random):
+    for i in range(files):
+        directory = os.path.join(root, f"pkg{i % 50}", f"mod{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        if i % 200 == 0:
+            with open(os.path.join(directory, f"asset{i}.bin"), "wb") as f:
+                f.write(os.urandom(kb * 1024))
+            continue
+        lines, size = [], 0
+        while size < kb * 1024:
+            a, b = rng.choice(WORDS), rng.choice(WORDS)
+            line = f"def {a}_{b}_{rng.randint(0, 9999)}({b}):\n    return {a}.{b}({rng.randint(0, 99)})\n"
+            lines.append(line)
+            size += len(line)
+        if i % 997 == 0:
+            lines.insert(len(lines) // 2, "    raise QuotaError('ERR_QUOTA_EXCEEDED_7731')\n")
+        with open(os.path.join(directory, f"file{i}.py"), "w") as f:
+            f.writelines(lines)
+
+
+def naive_grep(root: str, pattern: str, regex: bool, max_matches: int):
+    compiled = re.compile(pattern if regex else re.escape(pattern))
+    count = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            with open(os.path.join(directory, name), encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    if compiled.search(line):
+                        count += 1
+                        if count >= max_matches:
+                            return count
+    return count
+
+
+def repository_grep(root: str, pattern: str, regex: bool, workers: int, max_matches: int, prefilter: bool = True):
+    grep = RepositoryGrep(root, pattern, regex=regex, workers=workers, max_matches=max_matches, max_bytes=10**12)
+    if not prefilter:
+        grep.literal = None
+    _, summary = asyncio.run(grep.collect())
+    return summary.matches
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=4000)
+    parser.add_argument("--kb", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-matches", type=int, default=settings.GREP_MAX_MATCHES)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_grep_")
+    generate_tree(root, args.files, args.kb, random.Random(args.seed))
+    total_mb = sum(
+        os.path.getsize(os.path.join(d, n)) for d, _, names in os.walk(root) for n in names
+    ) / (1024 * 1024)
+
+    # Start the pool outside the timings.
+    repository_grep(root, "warmup", False, args.workers, args.max_matches)
+
+    print(f"files={args.files} size={total_mb:.0f}MB workers={args.workers} max_matches={args.max_matches}")
+    for name, (pattern, regex) in PATTERNS.items():
+        limit = args.max_matches
+        runs = {
+            "naive": lambda: naive_grep(root, pattern, regex, limit),
+            "grep x1 no prefilter": lambda: repository_grep(root, pattern, regex, 1, limit, prefilter=False),
+            "grep x1": lambda: repository_grep(root, pattern, regex, 1, limit),
+        }
+        if args.workers > 1:
+            runs[f"grep x{args.workers}"] = lambda: repository_grep(root, pattern, regex, args.workers, limit)
+        print(f"\n{name}: {pattern}")
+        for label, fn in runs.items():
+            matches, elapsed = timed(fn)
+            print(f"  {label:24s} {elapsed:9.1f}ms  matches={matches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Chat persistence throughput: per-turn commits vs the write-behind journal.
+
+Each simulated chat turn persists a new session, a user message and an
+assistant message. "direct" does it the way the chat route used to: a commit
+per row plus a refresh, all on the request path. "journal" appends the same
+rows to the fsynced message journal, and a background task flushes them in
+batched transactions. It reports turns per second as seen by clients, and
+for the journal the extra time to drain the queue afterwards.
+
+    python -m benchmarks.bench_message_journal --turns 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from database import Base, async_database_url
+from models import Message, Session as DBSession, User
+from models.message import MessageRole
+from services.message_journal import MessageJournal, message_record, session_record
+
+
+def turn_rows(user_id, index: int):
+    now = datetime.utcnow()
+    session = DBSession(id=uuid.uuid4(), user_id=user_id, agent_type="coding", model="bench", created_at=now, updated_at=now)
+    messages = [
+        Message(id=uuid.uuid4(), session_id=session.id, role=role, content=f"{role.value} message {index} " * 20, created_at=now)
+        for role in (MessageRole.USER, MessageRole.ASSISTANT)
+    ]
+    return session, messages
+
+
+async def drive(turns: int, concurrency: int, handler) -> float:
+    queue = asyncio.Queue()
+    for index in range(turns):
+        queue.put_nowait(index)
+
+    async def worker():
+        while not queue.empty():
+            await handler(queue.get_nowait())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def bench_direct(url: str, user_id, turns: int, concurrency: int) -> dict:
+    engine = create_async_engine(async_database_url(url), poolclass=NullPool, connect_args={"timeout": 60})
+    SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def handler(index: int):
+        session, (user_message, assistant_message) = turn_rows(user_id, index)
+        async with SessionLocal() as db:
+            db.add(session)
+            await db.commit()
+            db.add(user_message)
+            await db.commit()
+            db.add(assistant_message)
+            await db.commit()
+            await db.refresh(assistant_message)
+
+    elapsed = await drive(turns, concurrency, handler)
+    await engine.dispose()
+    return {"turns_per_second": turns / elapsed, "elapsed": elapsed, "drain": 0.0}
+
+
+async def bench_journal(url: str, user_id, turns: int, concurrency: int, directory: str) -> dict:
+    engine = create_engine(url, poolclass=NullPool, connect_args={"timeout": 60})
+    journal = MessageJournal(directory=directory)
+    journal.start(engine)
+
+    async def handler(index: int):
+        session, (user_message, assistant_message) = turn_rows(user_id, index)
+        await journal.append([session_record(session), message_record(user_message)])
+        await journal.append([message_record(assistant_message)])
+
+    elapsed = await drive(turns, concurrency, handler)
+    started = time.perf_counter()
+    await journal.close()
+    drain = time.perf_counter() - started
+    engine.dispose()
+    return {"turns_per_second": turns / elapsed, "elapsed": elapsed, "drain": drain}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_message_journal_")
+    print(f"turns={args.turns} concurrency={args.concurrency} (3 rows per turn)")
+    for mode in ("direct", "journal"):
+        url = f"sqlite:///{workdir}/{mode}.db"
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        with sessionmaker(bind=engine)() as db:
+            user = User(email="bench@example.com", username="bench", hashed_password="x")
+            db.add(user)
+            db.commit()
+            user_id = user.id
+        engine.dispose()
+
+        if mode == "direct":
+            stats = asyncio.run(bench_direct(url, user_id, args.turns, args.concurrency))
+        else:
+            stats = asyncio.run(bench_journal(url, user_id, args.turns, args.concurrency, f"{workdir}/journal"))
+        print(
+            f"{mode:8s} {stats['turns_per_second']:8.1f} turns/s  wall={stats['elapsed']:6.2f}s  "
+            f"drain={stats['drain']:5.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Query-latency benchmark: legacy ILIKE lookup vs. FTS vs. in-process BM25.
+
+Generates a synthetic repository of code blocks in a throwaway SQLite
+database, builds the BM25 index from it and times the same query mix
+against each retrieval path.
+
+    python -m benchmarks.bench_search --blocks 50000 --queries 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from indexing.bm25 import BM25Index
+from models import CodeBlock, Repository, User
+from models.code_index import EntityType
+from services.search import CodeSearchService
+
+VERBS = ["get", "set", "load", "parse", "render", "build", "fetch", "update", "delete", "validate"]
+NOUNS = ["user", "config", "session", "token", "repository", "message", "index", "cache", "model", "file"]
+
+
+def synthetic_block(repo_id, i: int, rng: random.Random) -> CodeBlock:
+    verb, noun, other = rng.choice(VERBS), rng.choice(NOUNS), rng.choice(NOUNS)
+    name = f"{verb}{noun.title()}{i}" if i % 2 else f"{verb}_{noun}_{i}"
+    body = "\n".join(
+        f"    {rng.choice(VERBS)}_{rng.choice(NOUNS)}({other}, value_{j})" for j in range(rng.randint(3, 15))
+    )
+    return CodeBlock(
+        repository_id=repo_id,
+        file_path=f"pkg/{noun}/{verb}_{i % 500}.py",
+        start_line=1,
+        end_line=20,
+        language="python",
+        content=f"def {name}({other}):\n{body}\n",
+        entity_type=EntityType.FUNCTION,
+        entity_name=name,
+        docstring=f"{verb.title()} the {noun} from the {other}.",
+    )
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_search_")
+    engine = create_engine(f"sqlite:///{workdir}/bench.db")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    user = User(email="bench@example.com", username="bench", hashed_password="x")
+    db.add(user)
+    db.commit()
+    repo = Repository(user_id=user.id, name="bench")
+    db.add(repo)
+    db.commit()
+
+    for start in range(0, args.blocks, 5000):
+        db.add_all(synthetic_block(repo.id, i, rng) for i in range(start, min(start + 5000, args.blocks)))
+        db.commit()
+
+    started = time.perf_counter()
+    index = BM25Index(repo.id, base_dir=workdir)
+    index.rebuild(db)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    queries = [f"{rng.choice(VERBS)} {rng.choice(NOUNS)}" for _ in range(args.queries)]
+    service = CodeSearchService(db)
+
+    def ilike(query):
+        return db.query(CodeBlock).filter(
+            CodeBlock.repository_id == repo.id,
+            CodeBlock.entity_name.ilike(f"%{query}%")
+        ).limit(5).all()
+
+    results = {
+        "ilike (legacy search_codebase)": timed(ilike, queries),
+        "fts (CodeSearchService)": timed(lambda q: service.search(repo.id, q, limit=5), queries),
+        "bm25 (cold, first query)": timed(lambda q: BM25Index(repo.id, base_dir=workdir).search(q, limit=5), queries[:1]),
+        "bm25 (warm)": timed(lambda q: index.search(q, limit=5), queries),
+    }
+
+    print(f"blocks={args.blocks} queries={args.queries} bm25_build={build_ms:.0f}ms")
+    for name, stats in results.items():
+        print(f"{name:34s} mean={stats['mean']:8.2f}ms p50={stats['p50']:8.2f}ms p95={stats['p95']:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,230 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.pool import NullPool
+"""
+Database engines and sessions.
+
+Request handlers use the async engine (``get_db``); background jobs and the
+services that still take a sync ``Session`` use the sync engine
+(``get_sync_db``). A handler that needs such a service takes the engine
+(``get_sync_engine``) rather than a second session, and runs the blocking
+part in a worker thread with ``run_in_session``, so it neither stalls the
+event loop nor holds two connections. Both engines are pooled according to
+``DB_POOL_MODE``:
+
+* ``pooled``: a QueuePool per engine with pre-ping and recycling, so cheap
+  endpoints reuse connections instead of paying for TCP and auth each time.
+* ``pgbouncer``: no app-side pool (PgBouncer does the pooling) and no
+  server-side prepared statements, which transaction pooling can't route.
+* ``null``: a new connection per checkout.
+
+Pool checkouts are timed, and wait time, timeouts and saturation are
+exported as ``db.<engine>.*`` metrics. With ``DATABASE_REPLICA_URLS`` set,
+``get_read_db`` and ``get_read_sync_db`` give a routing session that sends
+plain SELECTs to a replica. Once the session writes, it stays on the
+primary so it reads its own writes.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Callable, List, Optional
+from sqlalchemy import Select, create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from config import settings
+from services.metrics import metrics
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """The asyncio-driver form of a sync ``DATABASE_URL`` (psycopg2 -> asyncpg, sqlite -> aiosqlite)."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+class _TimedCheckout:
+    """Pool mixin recording how long checkouts wait for a connection."""
+    metrics_name = "db"
+
+    def __init__(self, *args, max_overflow: int = 10, **kwargs):
+        super().__init__(*args, max_overflow=max_overflow, **kwargs)
+        # QueuePool keeps this only as a private attribute; -1 means no limit.
+        self.overflow_limit = max_overflow
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.increment(f"db.{self.metrics_name}.checkout_timeouts")
+            raise
+        finally:
+            metrics.increment(f"db.{self.metrics_name}.checkouts")
+            metrics.increment(f"db.{self.metrics_name}.checkout_wait_ms", (time.perf_counter() - started) * 1000)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool) -> dict:
+    options = {"echo": settings.DEBUG}
+    mode = settings.DB_POOL_MODE
+    if mode in ("null", "pgbouncer") or make_url(url).get_backend_name() == "sqlite":
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    if mode == "pgbouncer" and make_url(url).drivername == "postgresql+asyncpg":
+        # Transaction pooling may run each statement on a different server
+        # connection, where a prepared statement doesn't exist.
+        options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return options
+
+
+def register_pool_metrics(name: str, engine):
+    """Export checkout wait, timeouts and saturation for ``engine``'s pool as ``db.<name>.*``."""
+    pool = engine.pool
+    if not isinstance(pool, _TimedCheckout):
+        return
+    pool.metrics_name = name
+    capacity = pool.size() + max(pool.overflow_limit, 0)
+    metrics.register_gauge(f"db.{name}.checked_out", pool.checkedout)
+    metrics.register_gauge(f"db.{name}.saturation", lambda: round(pool.checkedout() / capacity, 3))
+    metrics.register_gauge(f"db.{name}.checkout_wait_ms_avg", lambda: round(
+        metrics.get(f"db.{name}.checkout_wait_ms") / max(metrics.get(f"db.{name}.checkouts"), 1), 3
+    ))
+
+
+def build_engine(url: str, name: str) -> Engine:
+    engine = create_engine(url, **engine_options(url, is_async=False))
+    register_pool_metrics(name, engine)
+    return engine
+
+
+def build_async_engine(url: str, name: str) -> AsyncEngine:
+    url = async_database_url(url)
+    engine = create_async_engine(url, **engine_options(url, is_async=True))
+    register_pool_metrics(name, engine)
+    return engine
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica until it writes, then uses the primary."""
+
+    def __init__(self, primary: Engine = None, replicas: Optional[List[Engine]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.primary = primary
+        # One replica per session, so its reads see a single consistent copy.
+        self.replica = random.choice(replicas) if replicas else primary
+        self.pinned = False
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    poolclass=NullPool,
-)
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.pinned or self._flushing or not self._is_read(clause):
+            self.pinned = True
+            return self.primary
+        return self.replica
+
+    @staticmethod
+    def _is_read(clause) -> bool:
+        if clause is None:
+            return True
+        return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+replica_urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+# Sync engine: background jobs (indexing, warm-up, snapshots), Alembic, and
+# the services that still take a sync Session.
+engine = build_engine(settings.DATABASE_URL, "sync")
+
+# Async engine: request handlers, so a slow query doesn't block the event loop.
+async_engine = build_async_engine(settings.DATABASE_URL, "primary")
+
+replica_engines = [build_engine(url, f"sync_replica{i}") for i, url in enumerate(replica_urls)]
+async_replica_engines = [build_async_engine(url, f"replica{i}") for i, url in enumerate(replica_urls)]
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit; an expired attribute would need a lazy
+# load, which an AsyncSession cannot do implicitly.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if replica_urls:
+    ReadSessionLocal = sessionmaker(
+        class_=RoutingSession, autoflush=False, primary=engine, replicas=replica_engines,
+    )
+    AsyncReadSessionLocal = async_sessionmaker(
+        sync_session_class=RoutingSession,
+        autoflush=False,
+        expire_on_commit=False,
+        primary=async_engine.sync_engine,
+        replicas=[replica.sync_engine for replica in async_replica_engines],
+    )
+else:
+    ReadSessionLocal, AsyncReadSessionLocal = SessionLocal, AsyncSessionLocal
+
 Base = declarative_base()
 
 
-def get_db():
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db() -> AsyncIterator[AsyncSession]:
+    """Session for read-mostly endpoints; plain SELECTs go to a replica when configured."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_sync_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_sync_engine() -> Engine:
+    """The sync engine, for work a handler runs in a thread; checks out no connection itself."""
+    return engine
+
+
+async def run_in_session(bind, fn: Callable[..., Any], *args) -> Any:
+    """Run blocking ``fn(session, *args)`` in a worker thread, on a session of its own."""
+    def work():
+        with Session(bind=bind) as db:
+            return fn(db, *args)
+    return await asyncio.to_thread(work)
+
+
+async def dispose_engines():
+    for async_db_engine in [async_engine, *async_replica_engines]:
+        await async_db_engine.dispose()
+    for sync_db_engine in [engine, *replica_engines]:
+        sync_db_engine.dispose()
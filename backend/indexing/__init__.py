@@ -1,3 +1,4 @@
 from .indexer import RepositoryIndexer
+from .graph import SymbolGraph
 
-__all__ = ["RepositoryIndexer"]
+__all__ = ["RepositoryIndexer", "SymbolGraph"]
@@ -0,0 +1,418 @@
+"""
+In-process BM25 index over a repository's code blocks.
+
+The index is a small log-structured set of immutable segments stored under
+``INDEX_DATA_DIR/<repo_id>/bm25``. Each segment holds:
+
+* ``<name>.terms.json`` - lexicon mapping a term to ``[offset, count]``
+* ``<name>.postings.npy`` - ``uint32`` array of ``(doc, term_frequency)`` rows
+* ``<name>.lengths.npy`` - ``uint32`` token count per document
+* ``<name>.docs.json`` - block ids and file paths per document
+
+Postings and lengths are memory-mapped. Every file of a segment is opened
+when the segment list is swapped in, so a merge can unlink superseded
+segments while searches still hold the previous list.
+Incremental re-indexing appends a segment for the changed files and records
+path tombstones; once there are too many segments or too many dead
+documents, all segments are merged into one without touching the database.
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import CodeBlock
+from .registry import IndexRegistry
+from .tokenizer import tokenize
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAX_SEGMENTS = 8
+MAX_DEAD_RATIO = 0.3
+PAGE_BYTES = 4096
+
+
+def block_text(block: CodeBlock) -> str:
+    return " ".join(filter(None, [block.entity_name, block.entity_name, block.docstring, block.content]))
+
+
+class _Segment:
+    def __init__(self, directory: Path, name: str, generation: int):
+        self.directory = directory
+        self.name = name
+        self.generation = generation
+        self._terms = None
+        self._docs = None
+        self._postings = None
+        self._lengths = None
+
+    @property
+    def terms(self) -> Dict[str, List[int]]:
+        if self._terms is None:
+            with open(self.directory / f"{self.name}.terms.json") as f:
+                self._terms = json.load(f)
+        return self._terms
+
+    @property
+    def docs(self) -> Dict[str, List[str]]:
+        if self._docs is None:
+            with open(self.directory / f"{self.name}.docs.json") as f:
+                self._docs = json.load(f)
+        return self._docs
+
+    @property
+    def postings(self) -> np.ndarray:
+        if self._postings is None:
+            self._postings = np.load(self.directory / f"{self.name}.postings.npy", mmap_mode="r")
+        return self._postings
+
+    @property
+    def lengths(self) -> np.ndarray:
+        if self._lengths is None:
+            self._lengths = np.load(self.directory / f"{self.name}.lengths.npy", mmap_mode="r")
+        return self._lengths
+
+    def load(self) -> "_Segment":
+        """Open every file of the segment, so a merge may unlink them under a reader."""
+        self._terms = self.terms
+        self._docs = self.docs
+        self._postings = self.postings
+        self._lengths = self.lengths
+        return self
+
+    def term_postings(self, term: str) -> Optional[np.ndarray]:
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        offset, count = entry
+        return self.postings[offset:offset + count]
+
+    def live_mask(self, tombstones: Dict[str, int]) -> np.ndarray:
+        return np.fromiter(
+            (self.generation >= tombstones.get(path, 0) for path in self.docs["paths"]),
+            dtype=bool,
+            count=len(self.docs["paths"]),
+        )
+
+    def files(self) -> List[Path]:
+        return [
+            self.directory / f"{self.name}.{suffix}"
+            for suffix in ("terms.json", "docs.json", "postings.npy", "lengths.npy")
+        ]
+
+
+class BM25Index:
+    def __init__(self, repo_id: str, base_dir: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.repo_id = str(repo_id)
+        self.repo_uuid = uuid.UUID(self.repo_id)
+        self.directory = Path(base_dir or settings.INDEX_DATA_DIR) / self.repo_id / "bm25"
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._segments: List[_Segment] = []
+        self._live: List[np.ndarray] = []
+        self._stats = (0, 0.0)
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.directory / "manifest.json"
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Return ``[(block_id, score)]`` ordered by descending BM25 score."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self._load():
+            return []
+
+        with self._lock:
+            segments, live, (total_docs, avg_length) = self._segments, self._live, self._stats
+        if total_docs == 0:
+            return []
+
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = sum(
+                int(np.count_nonzero(mask[postings[:, 0]]))
+                for segment, mask in zip(segments, live)
+                for postings in [segment.term_postings(term)]
+                if postings is not None
+            )
+
+        candidates = []
+        for segment, mask in zip(segments, live):
+            scores = None
+            norm = None
+            for term in terms:
+                postings = segment.term_postings(term)
+                if postings is None or not frequencies[term]:
+                    continue
+                if scores is None:
+                    scores = np.zeros(len(mask), dtype=np.float32)
+                    norm = self.k1 * (1 - self.b + self.b * np.asarray(segment.lengths, dtype=np.float32) / avg_length)
+                docs = postings[:, 0]
+                tf = postings[:, 1].astype(np.float32)
+                df = frequencies[term]
+                idf = np.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+            if scores is None:
+                continue
+
+            scores[~mask] = 0.0
+            top = top_k(scores, limit)
+            ids = segment.docs["ids"]
+            candidates.extend((ids[i], float(scores[i])) for i in top if scores[i] > 0)
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:limit]
+
+    def rebuild(self, db: Session):
+        """Replace every segment with one built from the repository's blocks."""
+        blocks = db.query(CodeBlock).filter(CodeBlock.repository_id == self.repo_uuid).yield_per(1000)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            old = self._read_manifest()
+            generation = old["generation"] + 1 if old else 1
+            name = f"seg-{generation:06d}"
+            docs = self._write_segment(name, ((str(b.id), b.file_path, block_text(b)) for b in blocks))
+            self._commit({
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "segments": [{"name": name, "generation": generation, "docs": docs}],
+                "tombstones": {},
+            }, previous=old)
+
+    def apply(self, db: Session, changed_paths: Iterable[str]):
+        """Append a segment for re-indexed files and tombstone their old documents."""
+        changed_paths = list(changed_paths)
+        if not changed_paths:
+            return
+        if not self.exists():
+            self.rebuild(db)
+            return
+
+        blocks = db.query(CodeBlock).filter(
+            (CodeBlock.repository_id == self.repo_uuid) &
+            (CodeBlock.file_path.in_(changed_paths))
+        ).all()
+
+        with self._lock:
+            manifest = self._read_manifest()
+            generation = manifest["generation"] + 1
+            name = f"seg-{generation:06d}"
+            docs = self._write_segment(name, ((str(b.id), b.file_path, block_text(b)) for b in blocks))
+
+            tombstones = dict(manifest["tombstones"])
+            for path in changed_paths:
+                tombstones[path] = generation
+
+            updated = {
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "segments": manifest["segments"] + [{"name": name, "generation": generation, "docs": docs}],
+                "tombstones": tombstones,
+            }
+            self._commit(updated, previous=None)
+
+            if self._needs_merge(updated):
+                self.merge()
+
+    def merge(self):
+        """Merge all segments into one, dropping tombstoned documents."""
+        with self._lock:
+            manifest = self._read_manifest()
+            if not manifest:
+                return
+            tombstones = manifest["tombstones"]
+            segments = [self._open_segment(entry) for entry in manifest["segments"]]
+            generation = manifest["generation"] + 1
+            name = f"seg-{generation:06d}"
+
+            ids, paths, lengths, remaps = [], [], [], []
+            for segment in segments:
+                mask = segment.live_mask(tombstones)
+                remap = np.full(len(mask), -1, dtype=np.int64)
+                remap[mask] = np.arange(len(ids), len(ids) + int(mask.sum()))
+                remaps.append(remap)
+                ids.extend(i for i, keep in zip(segment.docs["ids"], mask) if keep)
+                paths.extend(p for p, keep in zip(segment.docs["paths"], mask) if keep)
+                lengths.append(np.asarray(segment.lengths)[mask])
+
+            vocabulary = sorted(set().union(*(segment.terms.keys() for segment in segments)))
+            lexicon, chunks, offset = {}, [], 0
+            for term in vocabulary:
+                parts = []
+                for segment, remap in zip(segments, remaps):
+                    postings = segment.term_postings(term)
+                    if postings is None:
+                        continue
+                    mapped = remap[postings[:, 0]]
+                    keep = mapped >= 0
+                    if keep.any():
+                        parts.append(np.column_stack([mapped[keep], postings[keep, 1]]))
+                if not parts:
+                    continue
+                merged = np.concatenate(parts).astype(np.uint32)
+                lexicon[term] = [offset, len(merged)]
+                chunks.append(merged)
+                offset += len(merged)
+
+            postings = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype=np.uint32)
+            length_array = np.concatenate(lengths).astype(np.uint32) if lengths else np.zeros(0, dtype=np.uint32)
+            self._write_files(name, lexicon, ids, paths, postings, length_array)
+
+            self._commit({
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "segments": [{"name": name, "generation": generation, "docs": len(ids)}],
+                "tombstones": {},
+            }, previous=manifest)
+
+    def warm(self) -> int:
+        """Load every segment's lexicon and page its postings in; returns bytes touched."""
+        if not self._load():
+            return 0
+        with self._lock:
+            segments = list(self._segments)
+        touched = 0
+        for segment in segments:
+            segment.load()
+            touched += touch_pages(segment.postings) + touch_pages(segment.lengths)
+        return touched
+
+    def close(self):
+        with self._lock:
+            self._segments = []
+            self._live = []
+            self._manifest = None
+            self._manifest_mtime = None
+
+    def _needs_merge(self, manifest: dict) -> bool:
+        if len(manifest["segments"]) > MAX_SEGMENTS:
+            return True
+        total = sum(entry["docs"] for entry in manifest["segments"])
+        live = sum(int(mask.sum()) for mask in self._live)
+        return total > 0 and (total - live) / total > MAX_DEAD_RATIO
+
+    def _load(self) -> bool:
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        with self._lock:
+            if self._manifest is not None and mtime == self._manifest_mtime:
+                return True
+            try:
+                self._activate(self._read_manifest(), mtime)
+            except FileNotFoundError:
+                # Another process merged and unlinked segments between reading the manifest and opening them.
+                self._activate(self._read_manifest())
+        return True
+
+    def _activate(self, manifest: dict, mtime: Optional[int] = None):
+        # Loaded up front: searches holding this list must not open files a later merge unlinks.
+        segments = [self._open_segment(entry).load() for entry in manifest["segments"]]
+        live = [segment.live_mask(manifest["tombstones"]) for segment in segments]
+        total_docs = sum(int(mask.sum()) for mask in live)
+        total_length = sum(float(np.asarray(s.lengths, dtype=np.float64)[mask].sum()) for s, mask in zip(segments, live))
+
+        self._manifest = manifest
+        self._manifest_mtime = mtime if mtime is not None else self.manifest_path.stat().st_mtime_ns
+        self._segments = segments
+        self._live = live
+        self._stats = (total_docs, total_length / total_docs if total_docs else 0.0)
+
+    def _open_segment(self, entry: dict) -> _Segment:
+        for segment in self._segments:
+            if segment.name == entry["name"]:
+                return segment
+        return _Segment(self.directory, entry["name"], entry["generation"])
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not self.manifest_path.exists():
+            return None
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            logger.warning(f"Ignoring BM25 index with unsupported format for repository {self.repo_id}")
+            return None
+        return manifest
+
+    def _commit(self, manifest: dict, previous: Optional[dict]):
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._activate(manifest)
+
+        if previous:
+            current = {entry["name"] for entry in manifest["segments"]}
+            for entry in previous["segments"]:
+                if entry["name"] not in current:
+                    for path in _Segment(self.directory, entry["name"], entry["generation"]).files():
+                        path.unlink(missing_ok=True)
+
+    def _write_segment(self, name: str, documents: Iterable[Tuple[str, str, str]]) -> int:
+        ids, paths, lengths = [], [], []
+        inverted: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, (block_id, path, text) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            ids.append(block_id)
+            paths.append(path)
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                inverted.setdefault(term, []).append((doc, tf))
+
+        lexicon, offset = {}, 0
+        postings = np.zeros((sum(len(rows) for rows in inverted.values()), 2), dtype=np.uint32)
+        for term in sorted(inverted):
+            rows = inverted[term]
+            postings[offset:offset + len(rows)] = rows
+            lexicon[term] = [offset, len(rows)]
+            offset += len(rows)
+
+        self._write_files(name, lexicon, ids, paths, postings, np.asarray(lengths, dtype=np.uint32))
+        return len(ids)
+
+    def _write_files(self, name, lexicon, ids, paths, postings, lengths):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        np.save(self.directory / f"{name}.postings.npy", postings)
+        np.save(self.directory / f"{name}.lengths.npy", lengths)
+        with open(self.directory / f"{name}.terms.json", "w") as f:
+            json.dump(lexicon, f)
+        with open(self.directory / f"{name}.docs.json", "w") as f:
+            json.dump({"ids": ids, "paths": paths}, f)
+
+
+def touch_pages(array: Optional[np.ndarray]) -> int:
+    """Fault every page of a (memory-mapped) array into memory; returns its size."""
+    if array is None or array.size == 0:
+        return 0
+    flat = np.asarray(array).reshape(-1).view(np.uint8)
+    # Copying one byte per page makes the kernel fault each page in.
+    pages = np.array(flat[::PAGE_BYTES])
+    return min(len(pages) * PAGE_BYTES, flat.nbytes)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+bm25_registry = IndexRegistry(BM25Index)
@@ -0,0 +1,343 @@
+"""
+Dense vector index over a repository's code blocks.
+
+Vectors are L2-normalised and stored under ``INDEX_DATA_DIR/<repo_id>/vectors``
+as a single ``float16`` matrix, or as ``int8`` with a per-row scale, so cosine
+similarity is a plain matrix-vector product. Rows are keyed by a hash of the
+embedding model and the exact text embedded (path, name, docstring and
+content): re-indexing only sends blocks whose key is new to the embedding
+endpoint and copies every other row from the previous matrix. A rename, a
+move, a docstring edit or a model change therefore re-embeds the block.
+
+Repositories above ``VECTOR_IVF_THRESHOLD`` blocks get a coarse quantizer
+(k-means centroids, rows grouped by cluster) so a query scans only the
+``nprobe`` closest clusters instead of every row.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import CodeBlock
+from .bm25 import top_k, touch_pages
+from .registry import IndexRegistry
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+SCAN_CHUNK_ROWS = 65536
+MAX_EMBED_CHARS = 4000
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def embedding_text(file_path: str, entity_name: Optional[str], docstring: Optional[str], content: str) -> str:
+    header = f"{file_path} {entity_name or ''}".strip()
+    parts = [header, docstring or "", content or ""]
+    return "\n".join(part for part in parts if part)[:MAX_EMBED_CHARS]
+
+
+def embedding_key(text: str, model: str) -> str:
+    return hashlib.sha1(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1)
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None] * 127).astype(np.int8)
+        return quantized, (scales / 127).astype(np.float32)
+    return matrix.astype(np.float16), None
+
+
+class VectorIndex:
+    def __init__(self, repo_id: str, base_dir: Optional[str] = None, dtype: Optional[str] = None):
+        self.repo_id = str(repo_id)
+        self.repo_uuid = uuid.UUID(self.repo_id)
+        self.directory = Path(base_dir or settings.INDEX_DATA_DIR) / self.repo_id / "vectors"
+        self.dtype = dtype or settings.EMBEDDING_DTYPE
+        self._lock = threading.RLock()
+        self._meta = None
+        self._meta_mtime = None
+        self._vectors = None
+        self._scales = None
+        self._centroids = None
+        self._offsets = None
+
+    @property
+    def meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def exists(self) -> bool:
+        return self.meta_path.exists()
+
+    async def update(
+        self, db: Session, embed: EmbedFn, batch_size: Optional[int] = None, model: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Re-align the matrix with the repository's blocks, embedding only new texts.
+
+        ``model`` must name the model ``embed`` uses; it defaults to ``EMBEDDING_MODEL``.
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        model = model or settings.EMBEDDING_MODEL
+        rows = db.query(
+            CodeBlock.id,
+            CodeBlock.file_path,
+            CodeBlock.entity_name,
+            CodeBlock.docstring,
+            CodeBlock.content,
+        ).filter(CodeBlock.repository_id == self.repo_uuid).all()
+
+        ids, hashes, texts = [], [], {}
+        for block_id, file_path, entity_name, docstring, content in rows:
+            text = embedding_text(file_path, entity_name, docstring, content)
+            key = embedding_key(text, model)
+            ids.append(str(block_id))
+            hashes.append(key)
+            texts.setdefault(key, text)
+
+        self._load()
+        with self._lock:
+            old_meta, old_vectors, old_scales = self._meta, self._vectors, self._scales
+        old_rows = {}
+        if old_meta and old_meta["dtype"] == self.dtype:
+            # Only rows whose key is still wanted are reused; the rest say nothing about ``dim``.
+            old_rows = {content_hash: row for row, content_hash in enumerate(old_meta["hashes"]) if content_hash in texts}
+
+        missing = [content_hash for content_hash in texts if content_hash not in old_rows]
+        fresh = await self._embed(embed, texts, missing, batch_size)
+        if old_rows and fresh and len(next(iter(fresh.values()))) != old_meta["dim"]:
+            # The endpoint now returns another dimension: nothing stored can be mixed in.
+            reembed = list(old_rows)
+            old_rows = {}
+            missing += reembed
+            fresh.update(await self._embed(embed, texts, reembed, batch_size))
+
+        dim = old_meta["dim"] if old_rows else (len(next(iter(fresh.values()))) if fresh else 0)
+        matrix, scales = self._assemble(hashes, fresh, old_rows, old_vectors, old_scales, dim)
+        self._write(ids, hashes, matrix, scales, dim)
+
+        return {"total": len(ids), "embedded": len(missing), "reused": len(texts) - len(missing)}
+
+    async def _embed(self, embed, texts: Dict[str, str], keys: List[str], batch_size: int) -> Dict[str, np.ndarray]:
+        fresh = {}
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            vectors = await embed([texts[content_hash] for content_hash in batch])
+            if len(vectors) != len(batch):
+                raise RuntimeError(f"Embedding endpoint returned {len(vectors)} vectors for {len(batch)} inputs")
+            for content_hash, vector in zip(batch, _normalize(np.asarray(vectors))):
+                fresh[content_hash] = vector
+        return fresh
+
+    def search(self, query_vector: List[float], limit: int = 10, nprobe: int = 8) -> List[Tuple[str, float]]:
+        """Return ``[(block_id, cosine_similarity)]`` for the closest blocks."""
+        if not self._load():
+            return []
+        with self._lock:
+            meta, vectors, scales = self._meta, self._vectors, self._scales
+            centroids, offsets = self._centroids, self._offsets
+        if not meta["ids"]:
+            return []
+
+        query = _normalize(np.asarray(query_vector))
+        if centroids is not None:
+            probes = np.argsort(-(centroids @ query))[:nprobe]
+            ranges = [(int(offsets[c]), int(offsets[c + 1])) for c in probes]
+        else:
+            ranges = [(start, min(start + SCAN_CHUNK_ROWS, len(meta["ids"])))
+                      for start in range(0, len(meta["ids"]), SCAN_CHUNK_ROWS)]
+
+        best_rows, best_scores = [], []
+        for start, end in ranges:
+            if start == end:
+                continue
+            scores = np.asarray(vectors[start:end], dtype=np.float32) @ query
+            if scales is not None:
+                scores *= scales[start:end]
+            top = top_k(scores, limit)
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+
+        if not best_rows:
+            return []
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        order = top_k(scores, limit)
+        return [(meta["ids"][rows[i]], float(scores[i])) for i in order]
+
+    def snapshot(self) -> Optional[Tuple[dict, np.ndarray, Optional[np.ndarray]]]:
+        """The current ``(meta, vectors, scales)``, with ``vectors`` memory-mapped."""
+        if not self._load():
+            return None
+        with self._lock:
+            return self._meta, self._vectors, self._scales
+
+    def replace(self, ids: List[str], hashes: List[str], matrix: np.ndarray, scales: Optional[np.ndarray] = None):
+        """Install a prebuilt matrix (e.g. from an imported snapshot) as the next generation."""
+        stored = np.int8 if self.dtype == "int8" else np.float16
+        if matrix.dtype != stored:
+            dense = np.asarray(matrix, dtype=np.float32)
+            if scales is not None:
+                dense *= scales[:, None]
+            matrix, scales = _quantize(_normalize(dense), self.dtype)
+        self._write(ids, hashes, matrix, scales, matrix.shape[1] if len(matrix) else 0)
+
+    def warm(self) -> int:
+        """Page the vector matrix in; returns bytes touched."""
+        if not self._load():
+            return 0
+        with self._lock:
+            return touch_pages(self._vectors)
+
+    def close(self):
+        with self._lock:
+            self._meta = None
+            self._meta_mtime = None
+            self._vectors = None
+            self._scales = None
+            self._centroids = None
+            self._offsets = None
+
+    def _assemble(self, hashes, fresh, old_rows, old_vectors, old_scales, dim):
+        matrix = np.zeros((len(hashes), dim), dtype=np.int8 if self.dtype == "int8" else np.float16)
+        scales = np.ones(len(hashes), dtype=np.float32) if self.dtype == "int8" else None
+
+        reuse_new = [i for i, h in enumerate(hashes) if h not in fresh]
+        if reuse_new:
+            reuse_old = [old_rows[hashes[i]] for i in reuse_new]
+            matrix[reuse_new] = old_vectors[reuse_old]
+            if scales is not None:
+                scales[reuse_new] = old_scales[reuse_old]
+
+        embed_new = [i for i, h in enumerate(hashes) if h in fresh]
+        if embed_new:
+            quantized, new_scales = _quantize(np.stack([fresh[hashes[i]] for i in embed_new]), self.dtype)
+            matrix[embed_new] = quantized
+            if scales is not None:
+                scales[embed_new] = new_scales
+        return matrix, scales
+
+    def _write(self, ids, hashes, matrix, scales, dim):
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            previous = self._read_meta()
+            generation = previous["generation"] + 1 if previous else 1
+
+            use_ivf = len(ids) >= settings.VECTOR_IVF_THRESHOLD
+            if use_ivf:
+                order, centroids, offsets = _build_ivf(matrix, scales)
+                ids = [ids[i] for i in order]
+                hashes = [hashes[i] for i in order]
+                matrix = matrix[order]
+                scales = scales[order] if scales is not None else None
+                np.save(self._path("centroids", generation), centroids)
+                np.save(self._path("offsets", generation), offsets)
+
+            np.save(self._path("vectors", generation), matrix)
+            if scales is not None:
+                np.save(self._path("scales", generation), scales)
+
+            meta = {
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "dtype": self.dtype,
+                "dim": dim,
+                "ivf": use_ivf,
+                "ids": ids,
+                "hashes": hashes,
+            }
+            tmp_path = self.meta_path.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self.meta_path)
+
+            if previous:
+                for name in ("vectors", "scales", "centroids", "offsets"):
+                    self._path(name, previous["generation"]).unlink(missing_ok=True)
+
+    def _path(self, name: str, generation: int) -> Path:
+        return self.directory / f"{name}-{generation:06d}.npy"
+
+    def _read_meta(self) -> Optional[dict]:
+        if not self.meta_path.exists():
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            logger.warning(f"Ignoring vector index with unsupported format for repository {self.repo_id}")
+            return None
+        return meta
+
+    def _load(self) -> bool:
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        with self._lock:
+            if self._meta is not None and mtime == self._meta_mtime:
+                return True
+            meta = self._read_meta()
+            if meta is None:
+                return False
+
+            generation = meta["generation"]
+            self._vectors = np.load(self._path("vectors", generation), mmap_mode="r")
+            self._scales = np.load(self._path("scales", generation)) if meta["dtype"] == "int8" else None
+            if meta["ivf"]:
+                self._centroids = np.load(self._path("centroids", generation))
+                self._offsets = np.load(self._path("offsets", generation))
+            else:
+                self._centroids = None
+                self._offsets = None
+            self._meta = meta
+            self._meta_mtime = mtime
+        return True
+
+
+def _build_ivf(matrix: np.ndarray, scales: Optional[np.ndarray]):
+    from sklearn.cluster import MiniBatchKMeans
+
+    n_lists = max(1, min(4096, int(math.sqrt(len(matrix)))))
+    sample_size = min(len(matrix), n_lists * 256)
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(len(matrix), size=sample_size, replace=False))
+
+    def dequantize(rows):
+        block = np.asarray(matrix[rows], dtype=np.float32)
+        return block * scales[rows][:, None] if scales is not None else block
+
+    kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=1, random_state=0)
+    kmeans.fit(dequantize(sample_rows))
+
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), SCAN_CHUNK_ROWS):
+        rows = np.arange(start, min(start + SCAN_CHUNK_ROWS, len(matrix)))
+        assignments[rows] = kmeans.predict(dequantize(rows))
+
+    order = np.argsort(assignments, kind="stable")
+    counts = np.bincount(assignments, minlength=n_lists)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    centroids = _normalize(kmeans.cluster_centers_)
+    return order, centroids, offsets
+
+
+vector_registry = IndexRegistry(VectorIndex)
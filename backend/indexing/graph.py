@@ -0,0 +1,123 @@
+from collections import deque
+from typing import Dict, Iterable, List
+import uuid
+from sqlalchemy.orm import Session
+from models import CodeBlock, SymbolEdge
+from models.symbol_graph import EdgeKind
+
+
+class SymbolGraph:
+    """Adjacency queries over the ``symbol_edges`` table of one repository.
+
+    Every lookup is a single indexed query on ``(repository_id, source)`` or
+    ``(repository_id, target)``; neighbourhood expansion issues one query per
+    hop for the whole frontier rather than one per symbol.
+    """
+
+    def __init__(self, db: Session, repo_id: str):
+        self.db = db
+        self.repo_id = repo_id
+
+    def add_block_edges(self, block: CodeBlock):
+        source = block.entity_name or block.file_path
+        for target in block.dependencies or []:
+            self.db.add(self._edge(block, source, target, EdgeKind.CALL))
+        for target in block.imports or []:
+            self.db.add(self._edge(block, source, target, EdgeKind.IMPORT))
+
+    def remove_file(self, file_path: str):
+        self.db.query(SymbolEdge).filter(
+            (SymbolEdge.repository_id == self.repo_id) &
+            (SymbolEdge.file_path == file_path)
+        ).delete(synchronize_session=False)
+
+    def callers(self, name: str, limit: int = 100) -> List[SymbolEdge]:
+        return self.db.query(SymbolEdge).filter(
+            (SymbolEdge.repository_id == self.repo_id) &
+            (SymbolEdge.target == name) &
+            (SymbolEdge.kind == EdgeKind.CALL)
+        ).limit(limit).all()
+
+    def dependencies(self, name: str, limit: int = 100) -> List[SymbolEdge]:
+        return self.db.query(SymbolEdge).filter(
+            (SymbolEdge.repository_id == self.repo_id) &
+            (SymbolEdge.source == name)
+        ).limit(limit).all()
+
+    def importers(self, module: str, limit: int = 100) -> List[SymbolEdge]:
+        return self.db.query(SymbolEdge).filter(
+            (SymbolEdge.repository_id == self.repo_id) &
+            (SymbolEdge.target == module) &
+            (SymbolEdge.kind == EdgeKind.IMPORT)
+        ).limit(limit).all()
+
+    def neighborhood(
+        self,
+        names: Iterable[str],
+        depth: int = 1,
+        direction: str = "both",
+        max_nodes: int = 50,
+    ) -> Dict[str, int]:
+        """Breadth-first expansion of call edges; returns ``{symbol: distance}``."""
+        distances = {name: 0 for name in names}
+        frontier = deque(distances)
+
+        for hop in range(1, depth + 1):
+            if not frontier or len(distances) >= max_nodes:
+                break
+            current = list(frontier)
+            frontier.clear()
+
+            for neighbor in self._adjacent(current, direction):
+                if neighbor in distances:
+                    continue
+                distances[neighbor] = hop
+                frontier.append(neighbor)
+                if len(distances) >= max_nodes:
+                    break
+
+        return distances
+
+    def neighborhood_blocks(
+        self,
+        names: Iterable[str],
+        depth: int = 1,
+        direction: str = "both",
+        limit: int = 10,
+    ) -> List[CodeBlock]:
+        distances = self.neighborhood(names, depth=depth, direction=direction, max_nodes=limit * 4)
+        related = [name for name, hop in distances.items() if hop > 0]
+        if not related:
+            return []
+
+        blocks = self.db.query(CodeBlock).filter(
+            (CodeBlock.repository_id == self.repo_id) &
+            (CodeBlock.entity_name.in_(related))
+        ).all()
+        blocks.sort(key=lambda block: distances.get(block.entity_name, depth + 1))
+        return blocks[:limit]
+
+    def _adjacent(self, names: List[str], direction: str) -> List[str]:
+        neighbors = []
+        base = self.db.query(SymbolEdge).filter(
+            (SymbolEdge.repository_id == self.repo_id) &
+            (SymbolEdge.kind == EdgeKind.CALL)
+        )
+        if direction in ("both", "out"):
+            rows = base.filter(SymbolEdge.source.in_(names)).with_entities(SymbolEdge.target).all()
+            neighbors.extend(row[0] for row in rows)
+        if direction in ("both", "in"):
+            rows = base.filter(SymbolEdge.target.in_(names)).with_entities(SymbolEdge.source).all()
+            neighbors.extend(row[0] for row in rows)
+        return list(dict.fromkeys(neighbors))
+
+    def _edge(self, block: CodeBlock, source: str, target: str, kind: EdgeKind) -> SymbolEdge:
+        return SymbolEdge(
+            id=uuid.uuid4(),
+            repository_id=self.repo_id,
+            block_id=block.id,
+            file_path=block.file_path,
+            source=source,
+            target=target,
+            kind=kind,
+        )
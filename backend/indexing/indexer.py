@@ -1,10 +1,36 @@
 import os
 import ast
+import hashlib
+import logging
+import uuid
 from pathlib import Path
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
-from models import CodeBlock, Repository
+from models import CodeBlock, Repository, SymbolEdge
 from models.code_index import EntityType
+from config import settings
+from llm import OllamaProvider
+from services.retrieval_cache import retrieval_cache
+from .bm25 import bm25_registry
+from .embeddings import vector_registry
+from .graph import SymbolGraph
+from .minhash import minhash_registry
+from .shards import index_session, shard_manager, sharding_enabled
+from .symbols import python_module_imports, extract_python_symbols, extract_generic_symbols
+
+logger = logging.getLogger(__name__)
+
+
+def publish_index_version(db: Session, repo: Optional[Repository]):
+    """Publish a new index version once every index reflects the latest change.
+
+    Retrieval caches key on the version, so this invalidates them all.
+    """
+    if repo is None:
+        return
+    repo.index_version = uuid.uuid4().hex[:16]
+    db.commit()
+    retrieval_cache.invalidate(repo.id, repo.index_version)
 
 
 class RepositoryIndexer:
@@ -13,97 +39,141 @@ class RepositoryIndexer:
         self.repo_id = repo_id
         self.repo_path = repo_path
         self.supported_extensions = {'.py', '.js', '.ts', '.jsx', '.tsx', '.go', '.rs', '.java', '.cpp', '.c'}
-    
-    async def index_repository(self) -> Dict[str, any]:
+        self.index_db = db
+        self.graph = SymbolGraph(db, repo_id)
+
+    async def index_repository(self, force: bool = False) -> Dict[str, any]:
+        with index_session(self.db, self.repo_id) as index_db:
+            self.index_db = index_db
+            self.graph = SymbolGraph(index_db, self.repo_id)
+            return await self._index_repository(force)
+
+    async def _index_repository(self, force: bool) -> Dict[str, any]:
         total_files = 0
         indexed_files = 0
+        skipped_files = 0
         errors = []
-        
+
+        repo = self.db.query(Repository).filter(Repository.id == self.repo_id).first()
+        repo_metadata = dict(repo.repo_metadata or {}) if repo else {}
+        manifest = {} if force else dict(repo_metadata.get("manifest", {}))
+        if manifest and not self._has_blocks():
+            # The manifest is kept with the repository row, the blocks in the index database.
+            # A new, lost or moved shard holds none of them, so nothing on disk counts as indexed.
+            logger.info(f"Index for repository {self.repo_id} has no blocks; rebuilding it in full")
+            manifest, force = {}, True
+
+        if force:
+            self._remove_all()
+
+        seen = set()
+        changed_paths = []
         for root, dirs, files in os.walk(self.repo_path):
             dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__' and d != 'node_modules']
-            
+
             for file in files:
                 file_path = os.path.join(root, file)
                 relative_path = os.path.relpath(file_path, self.repo_path)
-                
+
                 ext = os.path.splitext(file)[1]
                 if ext not in self.supported_extensions:
                     continue
-                
+
                 total_files += 1
+                seen.add(relative_path)
                 try:
-                    await self._index_file(file_path, relative_path, ext)
+                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        content = f.read()
+
+                    file_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+                    if manifest.get(relative_path) == file_hash:
+                        skipped_files += 1
+                        continue
+
+                    self._remove_file(relative_path)
+                    await self._index_file(relative_path, content, ext)
+                    manifest[relative_path] = file_hash
+                    changed_paths.append(relative_path)
                     indexed_files += 1
                 except Exception as e:
+                    self.index_db.rollback()
                     errors.append(f"{relative_path}: {str(e)}")
-        
-        repo = self.db.query(Repository).filter(Repository.id == self.repo_id).first()
+
+        removed_files = [path for path in manifest if path not in seen]
+        for relative_path in removed_files:
+            self._remove_file(relative_path)
+            del manifest[relative_path]
+
         if repo:
+            repo_metadata["manifest"] = manifest
+            repo.repo_metadata = repo_metadata
             repo.indexed = True
-            repo.index_version = "1.0"
-            self.db.commit()
-        
+        self.index_db.commit()
+        self.db.commit()
+
+        self._update_search_index(changed_paths + removed_files, rebuild=force)
+        if changed_paths or removed_files or force:
+            self._update_duplicate_index()
+            await self._update_vector_index()
+            if sharding_enabled():
+                shard_manager.claim(self.db, self.repo_id)
+            publish_index_version(self.db, repo)
+
         return {
             "total_files": total_files,
             "indexed_files": indexed_files,
+            "skipped_files": skipped_files,
+            "removed_files": len(removed_files),
             "errors": errors
         }
-    
-    async def _index_file(self, file_path: str, relative_path: str, ext: str):
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
+
+    def _has_blocks(self) -> bool:
+        return self.index_db.query(CodeBlock.id).filter(CodeBlock.repository_id == self.repo_id).first() is not None
+
+    async def _index_file(self, relative_path: str, content: str, ext: str):
         language = self._get_language(ext)
-        
+
         if ext == '.py':
             await self._index_python_file(relative_path, content, language)
         else:
             await self._index_generic_file(relative_path, content, language)
-    
+
     async def _index_python_file(self, file_path: str, content: str, language: str):
         try:
             tree = ast.parse(content)
         except SyntaxError:
             return
-        
+
         lines = content.split('\n')
-        
+        module_imports = python_module_imports(tree)
+
         for node in ast.walk(tree):
             if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                docstring = ast.get_docstring(node)
-                code_block = CodeBlock(
-                    repository_id=self.repo_id,
-                    file_path=file_path,
-                    start_line=node.lineno,
-                    end_line=node.end_lineno or node.lineno,
-                    language=language,
-                    content='\n'.join(lines[node.lineno - 1:node.end_lineno or node.lineno]),
-                    entity_type=EntityType.FUNCTION,
-                    entity_name=node.name,
-                    docstring=docstring,
-                )
-                self.db.add(code_block)
-            
+                entity_type = EntityType.FUNCTION
             elif isinstance(node, ast.ClassDef):
-                docstring = ast.get_docstring(node)
-                code_block = CodeBlock(
-                    repository_id=self.repo_id,
-                    file_path=file_path,
-                    start_line=node.lineno,
-                    end_line=node.end_lineno or node.lineno,
-                    language=language,
-                    content='\n'.join(lines[node.lineno - 1:node.end_lineno or node.lineno]),
-                    entity_type=EntityType.CLASS,
-                    entity_name=node.name,
-                    docstring=docstring,
-                )
-                self.db.add(code_block)
-        
-        self.db.commit()
-    
+                entity_type = EntityType.CLASS
+            else:
+                continue
+
+            imports, dependencies = extract_python_symbols(node, module_imports)
+            self._add_block(
+                file_path=file_path,
+                start_line=node.lineno,
+                end_line=node.end_lineno or node.lineno,
+                language=language,
+                content='\n'.join(lines[node.lineno - 1:node.end_lineno or node.lineno]),
+                entity_type=entity_type,
+                entity_name=node.name,
+                docstring=ast.get_docstring(node),
+                imports=imports,
+                dependencies=dependencies,
+            )
+
+        self.index_db.commit()
+
     async def _index_generic_file(self, file_path: str, content: str, language: str):
-        code_block = CodeBlock(
-            repository_id=self.repo_id,
+        imports, dependencies = extract_generic_symbols(content, language)
+        self._add_block(
             file_path=file_path,
             start_line=1,
             end_line=len(content.split('\n')),
@@ -111,10 +181,64 @@ class RepositoryIndexer:
             content=content[:5000],
             entity_type=EntityType.MODULE,
             entity_name=file_path.split('/')[-1],
+            imports=imports,
+            dependencies=dependencies,
         )
-        self.db.add(code_block)
-        self.db.commit()
-    
+        self.index_db.commit()
+
+    def _add_block(self, **fields) -> CodeBlock:
+        fields["content_hash"] = hashlib.sha1(fields["content"].encode('utf-8')).hexdigest()
+        code_block = CodeBlock(id=uuid.uuid4(), repository_id=self.repo_id, **fields)
+        self.index_db.add(code_block)
+        self.graph.add_block_edges(code_block)
+        return code_block
+
+    def _update_search_index(self, changed_paths: List[str], rebuild: bool = False):
+        index = bm25_registry.get(self.repo_id)
+        try:
+            if rebuild or not index.exists():
+                index.rebuild(self.index_db)
+            else:
+                index.apply(self.index_db, changed_paths)
+        except OSError as e:
+            logger.error(f"Failed to update BM25 index for repository {self.repo_id}: {e}")
+
+    def _update_duplicate_index(self):
+        try:
+            stats = minhash_registry.get(self.repo_id).update(self.index_db)
+            logger.info(
+                f"Duplicate index for repository {self.repo_id}: "
+                f"{stats['hashed']} hashed, {stats['reused']} reused"
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to update duplicate index for repository {self.repo_id}: {e}")
+
+    async def _update_vector_index(self):
+        if not settings.EMBEDDINGS_ENABLED:
+            return
+        provider = OllamaProvider()
+        try:
+            stats = await vector_registry.get(self.repo_id).update(self.index_db, provider.embed)
+            logger.info(
+                f"Vector index for repository {self.repo_id}: "
+                f"{stats['embedded']} embedded, {stats['reused']} reused"
+            )
+        except (RuntimeError, OSError, ValueError) as e:
+            logger.warning(f"Skipping vector index update for repository {self.repo_id}: {e}")
+        finally:
+            provider.close()
+
+    def _remove_file(self, relative_path: str):
+        self.graph.remove_file(relative_path)
+        self.index_db.query(CodeBlock).filter(
+            (CodeBlock.repository_id == self.repo_id) &
+            (CodeBlock.file_path == relative_path)
+        ).delete(synchronize_session=False)
+
+    def _remove_all(self):
+        self.index_db.query(SymbolEdge).filter(SymbolEdge.repository_id == self.repo_id).delete(synchronize_session=False)
+        self.index_db.query(CodeBlock).filter(CodeBlock.repository_id == self.repo_id).delete(synchronize_session=False)
+
     def _get_language(self, ext: str) -> str:
         ext_to_lang = {
             '.py': 'python',
@@ -0,0 +1,372 @@
+"""
+Near-duplicate detection over a repository's code blocks.
+
+Each block is reduced to a MinHash signature of its normalised token
+shingles: comments are dropped, string and number literals become
+placeholders, and every run of ``SHINGLE_TOKENS`` tokens is hashed. The
+fraction of equal signature slots between two blocks estimates the Jaccard
+similarity of their shingle sets.
+
+Signatures are split into ``MINHASH_BANDS`` bands and each band is hashed
+to a bucket key. Keys are stored sorted per band under
+``INDEX_DATA_DIR/<repo_id>/minhash``, so finding the candidates for a block
+takes one binary search per band rather than a scan of every row. Only
+candidates are compared slot by slot. Like the vector index, rows are keyed
+by content hash, and re-indexing only hashes blocks whose content changed.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import CodeBlock
+from .bm25 import touch_pages
+from .registry import IndexRegistry
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+SHINGLE_TOKENS = 5
+MIN_TOKENS = 12
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+
+_GENERATION_FILE = re.compile(r'^[a-z]+-(\d+)\.npy$')
+_COMMENT = re.compile(r'#[^\n]*|//[^\n]*|/\*.*?\*/', re.DOTALL)
+_TOKEN = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`[^`]*`'
+    r'|[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?|[^\sA-Za-z0-9_]'
+)
+
+
+def normalized_tokens(content: str) -> List[str]:
+    """Tokens of ``content`` with comments removed and literals replaced."""
+    tokens = []
+    for token in _TOKEN.findall(_COMMENT.sub(" ", content or "")):
+        if token[0] in "\"'`":
+            tokens.append("<str>")
+        elif token[0].isdigit():
+            tokens.append("<num>")
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _permutations(count: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(1)
+    # Coefficients below 2**32 keep a * x + b within uint64 for 32-bit x.
+    a = rng.integers(1, 1 << 32, size=count, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=count, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signature(content: str, permutations: Optional[int] = None) -> Optional[np.ndarray]:
+    """``uint32`` MinHash signature of ``content``, or ``None`` if it is too short."""
+    tokens = normalized_tokens(content)
+    if len(tokens) < MIN_TOKENS:
+        return None
+    token_hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint64, count=len(tokens))
+
+    shingles = np.zeros(len(tokens) - SHINGLE_TOKENS + 1, dtype=np.uint64)
+    for offset in range(SHINGLE_TOKENS):
+        shingles = (shingles * np.uint64(1000003) + token_hashes[offset:offset + len(shingles)]) & MAX_HASH
+    shingles = np.unique(shingles)
+
+    a, b = _permutations(permutations or settings.MINHASH_PERMUTATIONS)
+    hashed = ((a[:, None] * shingles[None, :] + b[:, None]) % MERSENNE_PRIME) & MAX_HASH
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray, bands: int) -> np.ndarray:
+    """``(len(signatures), bands)`` bucket keys, one per band of each signature."""
+    rows = signatures.shape[1] // bands
+    banded = signatures[:, :rows * bands].reshape(len(signatures), bands, rows).astype(np.uint64)
+    keys = np.zeros(banded.shape[:2], dtype=np.uint64)
+    for column in range(rows):
+        keys = keys * np.uint64(0x100000001B3) ^ banded[:, :, column]
+    return keys
+
+
+class MinHashIndex:
+    def __init__(self, repo_id: str, base_dir: Optional[str] = None):
+        self.repo_id = str(repo_id)
+        self.repo_uuid = uuid.UUID(self.repo_id)
+        self.directory = Path(base_dir or settings.INDEX_DATA_DIR) / self.repo_id / "minhash"
+        self.permutations = settings.MINHASH_PERMUTATIONS
+        self.bands = settings.MINHASH_BANDS
+        self._lock = threading.RLock()
+        self._meta = None
+        self._meta_mtime = None
+        self._rows: Dict[str, int] = {}
+        self._signatures = None
+        self._keys = None
+        self._order = None
+
+    @property
+    def meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def exists(self) -> bool:
+        return self.meta_path.exists()
+
+    def update(self, db: Session) -> Dict[str, int]:
+        """Re-align the index with the repository's blocks, hashing only new content."""
+        rows = db.query(CodeBlock.id, CodeBlock.content_hash, CodeBlock.content).filter(
+            CodeBlock.repository_id == self.repo_uuid
+        ).yield_per(1000)
+
+        self._load()
+        with self._lock:
+            old_meta, old_signatures = self._meta, self._signatures
+        old_rows = {}
+        if old_meta and old_meta["permutations"] == self.permutations:
+            old_rows = {content_hash: row for row, content_hash in enumerate(old_meta["hashes"])}
+
+        ids, hashes, signatures = [], [], []
+        computed: Dict[str, Optional[np.ndarray]] = {}
+        reused = 0
+        for block_id, content_hash, content in rows:
+            content_hash = content_hash or str(zlib.crc32((content or "").encode("utf-8")))
+            if content_hash in old_rows:
+                signature = old_signatures[old_rows[content_hash]]
+                reused += 1
+            else:
+                if content_hash not in computed:
+                    computed[content_hash] = minhash_signature(content, self.permutations)
+                signature = computed[content_hash]
+            if signature is None:
+                continue
+            ids.append(str(block_id))
+            hashes.append(content_hash)
+            signatures.append(signature)
+
+        matrix = np.stack(signatures) if signatures else np.zeros((0, self.permutations), dtype=np.uint32)
+        self._write(ids, hashes, matrix)
+        return {"total": len(ids), "hashed": len(computed), "reused": reused}
+
+    def similar(
+        self,
+        block_id: str,
+        threshold: Optional[float] = None,
+        limit: int = 10,
+    ) -> List[Tuple[str, float]]:
+        """Return ``[(block_id, estimated_jaccard)]`` for blocks resembling ``block_id``."""
+        if not self._load():
+            return []
+        with self._lock:
+            row = self._rows.get(str(block_id))
+            if row is None:
+                return []
+            signature = self._signatures[row]
+        return self.query(signature, threshold, limit, exclude={row})
+
+    def similar_to(self, content: str, threshold: Optional[float] = None, limit: int = 10) -> List[Tuple[str, float]]:
+        signature = minhash_signature(content, self.permutations)
+        if signature is None or not self._load():
+            return []
+        return self.query(signature, threshold, limit)
+
+    def query(
+        self,
+        signature: np.ndarray,
+        threshold: Optional[float] = None,
+        limit: int = 10,
+        exclude: Iterable[int] = (),
+    ) -> List[Tuple[str, float]]:
+        threshold = settings.DUPLICATE_THRESHOLD if threshold is None else threshold
+        if not self._load():
+            return []
+        with self._lock:
+            meta, signatures, keys, order = self._meta, self._signatures, self._keys, self._order
+
+        candidates = set()
+        for band, key in enumerate(band_keys(signature[None, :], meta["bands"])[0]):
+            start = np.searchsorted(keys[band], key, side="left")
+            end = np.searchsorted(keys[band], key, side="right")
+            candidates.update(order[band, start:end].tolist())
+        candidates.difference_update(exclude)
+        if not candidates:
+            return []
+
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        scores = (signatures[rows] == signature[None, :]).mean(axis=1)
+        keep = np.flatnonzero(scores >= threshold)
+        ranked = sorted(((meta["ids"][rows[i]], float(scores[i])) for i in keep), key=lambda hit: hit[1], reverse=True)
+        return ranked[:limit]
+
+    def redundant(self, block_ids: List[str], threshold: Optional[float] = None) -> Set[str]:
+        """Ids in ``block_ids`` that nearly duplicate an earlier id in the list."""
+        threshold = settings.DUPLICATE_THRESHOLD if threshold is None else threshold
+        if len(block_ids) < 2 or not self._load():
+            return set()
+        with self._lock:
+            known = [(block_id, self._rows[str(block_id)]) for block_id in block_ids if str(block_id) in self._rows]
+            signatures = self._signatures[[row for _, row in known]] if known else None
+        dropped, kept = set(), []
+        for i, (block_id, _) in enumerate(known):
+            if any((signatures[i] == signatures[j]).mean() >= threshold for j in kept):
+                dropped.add(block_id)
+            else:
+                kept.append(i)
+        return dropped
+
+    def clusters(
+        self,
+        threshold: Optional[float] = None,
+        min_size: int = 2,
+        limit: int = 20,
+    ) -> List[Dict]:
+        """Groups of near-duplicate blocks, largest first: copy-paste hot spots."""
+        threshold = settings.DUPLICATE_THRESHOLD if threshold is None else threshold
+        min_size = max(min_size, 2)
+        if not self._load():
+            return []
+        with self._lock:
+            meta, signatures, keys, order = self._meta, self._signatures, self._keys, self._order
+
+        parent = list(range(len(meta["ids"])))
+
+        def find(row):
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for band in range(meta["bands"]):
+            boundaries = np.flatnonzero(np.diff(keys[band])) + 1
+            starts = np.concatenate([[0], boundaries])
+            ends = np.concatenate([boundaries, [len(parent)]])
+            shared = ends - starts >= 2
+            for start, end in zip(starts[shared], ends[shared]):
+                bucket = order[band, start:end]
+                head = bucket[0]
+                similar = (signatures[bucket[1:]] == signatures[head]).mean(axis=1) >= threshold
+                for row in bucket[1:][similar]:
+                    parent[find(int(row))] = find(int(head))
+
+        groups: Dict[int, List[int]] = {}
+        for row in range(len(parent)):
+            groups.setdefault(find(row), []).append(row)
+
+        results = []
+        for rows in groups.values():
+            if len(rows) < min_size:
+                continue
+            similarity = (signatures[rows[1:]] == signatures[rows[0]]).mean(axis=1).min()
+            results.append({"block_ids": [meta["ids"][row] for row in rows], "similarity": float(similarity)})
+        results.sort(key=lambda group: (len(group["block_ids"]), group["similarity"]), reverse=True)
+        return results[:limit]
+
+    def warm(self) -> int:
+        """Page signatures and band tables in; returns bytes touched."""
+        if not self._load():
+            return 0
+        with self._lock:
+            return touch_pages(self._signatures) + touch_pages(self._keys) + touch_pages(self._order)
+
+    def close(self):
+        with self._lock:
+            self._meta = None
+            self._meta_mtime = None
+            self._rows = {}
+            self._signatures = None
+            self._keys = None
+            self._order = None
+
+    def _write(self, ids: List[str], hashes: List[str], signatures: np.ndarray):
+        keys = band_keys(signatures, self.bands).T
+        order = np.argsort(keys, axis=1, kind="stable").astype(np.int32)
+        sorted_keys = np.take_along_axis(keys, order, axis=1)
+
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            previous = self._read_meta()
+            generation = previous["generation"] + 1 if previous else 1
+
+            for name, array in (("signatures", signatures), ("keys", sorted_keys), ("order", order)):
+                self._save(self._path(name, generation), array)
+
+            meta = {
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "permutations": self.permutations,
+                "bands": self.bands,
+                "ids": ids,
+                "hashes": hashes,
+            }
+            tmp_path = self.meta_path.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self.meta_path)
+
+            # A reader that read the previous meta may not have opened its arrays yet, so that
+            # generation stays on disk; only older ones are removed.
+            if previous:
+                self._remove_generations_before(previous["generation"])
+
+    def _save(self, path: Path, array: np.ndarray):
+        tmp_path = path.with_suffix(".npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def _remove_generations_before(self, generation: int):
+        for path in self.directory.glob("*-*.npy"):
+            match = _GENERATION_FILE.match(path.name)
+            if match and int(match.group(1)) < generation:
+                path.unlink(missing_ok=True)
+
+    def _path(self, name: str, generation: int) -> Path:
+        return self.directory / f"{name}-{generation:06d}.npy"
+
+    def _read_meta(self) -> Optional[dict]:
+        if not self.meta_path.exists():
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            logger.warning(f"Ignoring MinHash index with unsupported format for repository {self.repo_id}")
+            return None
+        return meta
+
+    def _load(self) -> bool:
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        with self._lock:
+            if self._meta is not None and mtime == self._meta_mtime:
+                return True
+            meta = self._read_meta()
+            if meta is None:
+                return False
+            try:
+                arrays = self._open_arrays(meta["generation"])
+            except FileNotFoundError:
+                # Two writes landed between reading meta and opening its arrays; take the newest.
+                mtime = self.meta_path.stat().st_mtime_ns
+                meta = self._read_meta()
+                arrays = self._open_arrays(meta["generation"])
+
+            self._signatures, self._keys, self._order = arrays
+            self._rows = {block_id: row for row, block_id in enumerate(meta["ids"])}
+            self._meta = meta
+            self._meta_mtime = mtime
+        return True
+
+    def _open_arrays(self, generation: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return tuple(np.load(self._path(name, generation), mmap_mode="r") for name in ("signatures", "keys", "order"))
+
+
+minhash_registry = IndexRegistry(MinHashIndex)
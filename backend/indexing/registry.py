@@ -0,0 +1,32 @@
+import threading
+from typing import Callable, Dict, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class IndexRegistry(Generic[T]):
+    """Process-wide cache of per-repository index objects.
+
+    Keeping one instance per repository means memory-mapped files and parsed
+    lexicons survive between agent turns instead of being reopened per query.
+    """
+
+    def __init__(self, factory: Callable[[str], T]):
+        self._factory = factory
+        self._indexes: Dict[str, T] = {}
+        self._lock = threading.Lock()
+
+    def get(self, repo_id: str) -> T:
+        key = str(repo_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._factory(key)
+                self._indexes[key] = index
+            return index
+
+    def evict(self, repo_id: str):
+        with self._lock:
+            index = self._indexes.pop(str(repo_id), None)
+        if index is not None and hasattr(index, "close"):
+            index.close()
@@ -0,0 +1,180 @@
+"""
+Per-repository index shards.
+
+With ``INDEX_STORAGE_MODE=shard`` a repository's code blocks and symbol
+edges live in their own SQLite file next to its BM25 segments and vector
+matrix, under ``INDEX_DATA_DIR/<repo_id>/``. One tenant's indexing load
+then stays out of everyone else's ``code_blocks`` table, and a repository's
+whole index is one directory that can be copied to another node.
+
+Shards open lazily. Open handles (the SQLite engine plus the mmapped BM25
+and vector files) are kept in an LRU of at most ``SHARD_MAX_OPEN`` entries.
+The ``index_shards`` table in the main database records which node holds
+each shard. A request for a shard held elsewhere raises
+``ShardNotLocalError`` so the API can point the caller at the right node.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from fastapi import Depends
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import services.search  # noqa: F401  (FTS5 tables, triggers and SQL functions)
+from config import settings
+from database import get_read_sync_db, run_in_session
+from models import CodeBlock, IndexShard, SymbolEdge
+from .bm25 import bm25_registry
+from .embeddings import vector_registry
+from .minhash import minhash_registry
+
+logger = logging.getLogger(__name__)
+
+SHARD_FORMAT_VERSION = 1
+SHARD_FILENAME = "blocks.sqlite"
+SHARD_TABLES = [CodeBlock.__table__, SymbolEdge.__table__]
+
+
+class ShardNotLocalError(Exception):
+    def __init__(self, repo_id, node_id: str):
+        self.repo_id = str(repo_id)
+        self.node_id = node_id
+        super().__init__(f"Index shard for repository {repo_id} is held by node {node_id}")
+
+
+def sharding_enabled() -> bool:
+    return settings.INDEX_STORAGE_MODE == "shard"
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.SHARD_MMAP_BYTES}")
+    cursor.close()
+
+
+class ShardManager:
+    def __init__(self, base_dir: Optional[str] = None, max_open: Optional[int] = None):
+        self.base_dir = base_dir
+        self.max_open = max_open or settings.SHARD_MAX_OPEN
+        self._engines: "OrderedDict[str, Engine]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, repo_id) -> Path:
+        return Path(self.base_dir or settings.INDEX_DATA_DIR) / str(repo_id) / SHARD_FILENAME
+
+    def engine(self, repo_id) -> Engine:
+        """Return the shard's engine, opening (and creating) it on first use."""
+        key = str(repo_id)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                return engine
+
+            path = self.path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+            event.listen(engine, "connect", _configure_connection)
+            CodeBlock.metadata.create_all(bind=engine, tables=SHARD_TABLES)
+            self._engines[key] = engine
+
+            evicted = []
+            while len(self._engines) > self.max_open:
+                evicted.append(self._engines.popitem(last=False))
+        for evicted_id, evicted_engine in evicted:
+            self._close(evicted_id, evicted_engine)
+        return engine
+
+    def session(self, db: Session, repo_id) -> Session:
+        holder = self.locate(db, repo_id)
+        if holder is not None and holder.node_id != settings.NODE_ID:
+            raise ShardNotLocalError(repo_id, holder.node_id)
+        return Session(bind=self.engine(repo_id))
+
+    def locate(self, db: Session, repo_id) -> Optional[IndexShard]:
+        return db.query(IndexShard).filter(IndexShard.repository_id == uuid.UUID(str(repo_id))).first()
+
+    def claim(self, db: Session, repo_id) -> IndexShard:
+        """Record this node as the shard's holder, refreshing its size and block count."""
+        with Session(bind=self.engine(repo_id)) as shard_db:
+            block_count = shard_db.query(CodeBlock).count()
+        path = self.path(repo_id)
+        size_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path.parent)
+            for name in names
+        )
+
+        shard = self.locate(db, repo_id)
+        if shard is None:
+            shard = IndexShard(repository_id=uuid.UUID(str(repo_id)))
+            db.add(shard)
+        shard.node_id = settings.NODE_ID
+        shard.path = str(path.parent)
+        shard.format_version = SHARD_FORMAT_VERSION
+        shard.block_count = block_count
+        shard.size_bytes = size_bytes
+        db.commit()
+        return shard
+
+    def evict(self, repo_id):
+        with self._lock:
+            engine = self._engines.pop(str(repo_id), None)
+        if engine is not None:
+            self._close(str(repo_id), engine)
+
+    def close_all(self):
+        with self._lock:
+            engines, self._engines = list(self._engines.items()), OrderedDict()
+        for repo_id, engine in engines:
+            self._close(repo_id, engine)
+
+    def open_count(self) -> int:
+        return len(self._engines)
+
+    def _close(self, repo_id: str, engine: Engine):
+        logger.debug(f"Closing index shard for repository {repo_id}")
+        engine.dispose()
+        bm25_registry.evict(repo_id)
+        vector_registry.evict(repo_id)
+        minhash_registry.evict(repo_id)
+
+
+shard_manager = ShardManager()
+
+
+@contextmanager
+def index_session(db: Session, repo_id) -> Iterator[Session]:
+    """Session holding ``repo_id``'s code blocks: ``db`` itself, or its shard."""
+    if not sharding_enabled():
+        yield db
+        return
+    shard_db = shard_manager.session(db, repo_id)
+    try:
+        yield shard_db
+    finally:
+        shard_db.close()
+
+
+async def run_in_index_session(bind, repo_id, fn: Callable[..., Any], *args) -> Any:
+    """Run blocking ``fn(index_db, *args)`` in a worker thread, on ``repo_id``'s index session."""
+    def work(db: Session):
+        with index_session(db, repo_id) as index_db:
+            return fn(index_db, *args)
+    return await run_in_session(bind, work)
+
+
+def get_index_db(repo_id: uuid.UUID, db: Session = Depends(get_read_sync_db)) -> Iterator[Session]:
+    """FastAPI dependency yielding the index session for the ``repo_id`` path parameter."""
+    with index_session(db, repo_id) as index_db:
+        yield index_db
@@ -0,0 +1,361 @@
+"""
+Portable snapshots of a repository's index.
+
+A snapshot carries everything that is expensive to rebuild: code blocks,
+the file manifest, the symbol graph and the embedding matrix. Moving or
+restoring an index is then a bulk copy instead of a re-parse and
+re-embed. Only the BM25 segments and the MinHash duplicate index are
+rebuilt on import, from the imported blocks.
+
+Layout (all integers big-endian)::
+
+    b"AMPSNAP\\0"  u16 format version
+    frame*         4-byte kind, u32 raw length, u32 compressed length,
+                   u32 CRC-32 of the raw payload, zlib payload
+    END_ frame     {"sha256": <digest of every preceding byte>, "frames": n}
+
+Frames are bounded in size (``ROWS_PER_FRAME`` blocks or edges, or
+``VECTOR_ROWS_PER_FRAME`` vectors), so both ends stream with constant
+memory apart from the vector matrix. Each frame is verified as soon as it
+arrives. The import only commits once the trailer's digest matches.
+"""
+
+import hashlib
+import json
+import logging
+import struct
+import uuid
+import zlib
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import CodeBlock, Repository, SymbolEdge
+from utils.rowcodec import column_decoder, encode_value
+from .bm25 import bm25_registry
+from .embeddings import vector_registry
+from .indexer import publish_index_version
+from .minhash import minhash_registry
+from .shards import index_session, shard_manager, sharding_enabled
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AMPSNAP\x00"
+FORMAT_VERSION = 1
+VERSION = struct.Struct(">H")
+FRAME_HEADER = struct.Struct(">4sIII")
+ROWS_PER_FRAME = 2000
+# A full vector frame at 8192 dimensions in float16 is 128 MiB; anything above is not ours.
+MAX_FRAME_BYTES = 128 * 1024 * 1024
+VECTOR_ROWS_PER_FRAME = 8192
+MEDIA_TYPE = "application/vnd.amplify.index-snapshot"
+
+BLOCKS = CodeBlock.__table__
+EDGES = SymbolEdge.__table__
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class SnapshotConflict(SnapshotError):
+    """The snapshot's rows collide with rows that already exist outside the target repository."""
+
+
+class SnapshotWriter:
+    def __init__(self, level: Optional[int] = None):
+        self.level = settings.SNAPSHOT_COMPRESSION_LEVEL if level is None else level
+        self.frames = 0
+        self._hash = hashlib.sha256()
+
+    def header(self) -> bytes:
+        data = MAGIC + VERSION.pack(FORMAT_VERSION)
+        self._hash.update(data)
+        return data
+
+    def frame(self, kind: bytes, raw: bytes) -> bytes:
+        payload = zlib.compress(raw, self.level)
+        data = FRAME_HEADER.pack(kind, len(raw), len(payload), zlib.crc32(raw)) + payload
+        self._hash.update(data)
+        self.frames += 1
+        return data
+
+    def json_frame(self, kind: bytes, obj) -> bytes:
+        return self.frame(kind, json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+    def end(self) -> bytes:
+        raw = json.dumps({"sha256": self._hash.hexdigest(), "frames": self.frames}).encode("utf-8")
+        return FRAME_HEADER.pack(b"END_", len(raw), len(raw), zlib.crc32(raw)) + raw
+
+
+def export_snapshot(db: Session, repo_id) -> Iterator[bytes]:
+    """Yield the snapshot of ``repo_id``'s index as a stream of byte chunks."""
+    repo_uuid = uuid.UUID(str(repo_id))
+    repo = db.query(Repository).filter(Repository.id == repo_uuid).first()
+    if repo is None:
+        raise SnapshotError(f"Repository {repo_id} not found")
+
+    writer = SnapshotWriter()
+    block_columns = [column.name for column in BLOCKS.columns]
+    edge_columns = [column.name for column in EDGES.columns]
+    vectors = vector_registry.get(repo_uuid).snapshot()
+
+    with index_session(db, repo_uuid) as index_db:
+        yield writer.header()
+        yield writer.json_frame(b"META", {
+            "format": FORMAT_VERSION,
+            "repository_id": str(repo_uuid),
+            "repository_name": repo.name,
+            "index_version": repo.index_version,
+            "manifest": (repo.repo_metadata or {}).get("manifest", {}),
+            "block_columns": block_columns,
+            "edge_columns": edge_columns,
+            "created_at": datetime.utcnow().isoformat(),
+            "node_id": settings.NODE_ID,
+        })
+
+        for kind, table, columns in ((b"BLKS", BLOCKS, block_columns), (b"EDGE", EDGES, edge_columns)):
+            result = index_db.execute(
+                select(table).where(table.c.repository_id == repo_uuid).execution_options(yield_per=ROWS_PER_FRAME)
+            )
+            for rows in result.partitions():
+                encoded = [[encode_value(row._mapping[name]) for name in columns] for row in rows]
+                yield writer.json_frame(kind, encoded)
+
+    if vectors is not None:
+        meta, matrix, scales = vectors
+        yield writer.json_frame(b"VECM", {
+            "dtype": meta["dtype"],
+            "dim": meta["dim"],
+            "ids": meta["ids"],
+            "hashes": meta["hashes"],
+            "model": settings.EMBEDDING_MODEL,
+        })
+        for start in range(0, len(meta["ids"]), VECTOR_ROWS_PER_FRAME):
+            rows = np.ascontiguousarray(matrix[start:start + VECTOR_ROWS_PER_FRAME])
+            yield writer.frame(b"VECR", rows.tobytes())
+        if scales is not None:
+            yield writer.frame(b"VECS", np.ascontiguousarray(scales, dtype=np.float32).tobytes())
+
+    yield writer.end()
+
+
+def _inflate(payload: bytes, raw_length: int) -> Optional[bytes]:
+    """Decompress a frame, stopping just past its declared length; ``None`` if it is corrupt."""
+    inflater = zlib.decompressobj()
+    try:
+        raw = inflater.decompress(payload, raw_length + 1)
+    except zlib.error:
+        return None
+    if len(raw) > raw_length or inflater.unconsumed_tail or not inflater.eof:
+        return None
+    return raw
+
+
+class SnapshotImporter:
+    """Incrementally verify and bulk-load a snapshot into ``repo_id``.
+
+    Feed it the archive in arbitrary chunks, then call ``finish()``. Existing
+    blocks and edges are replaced inside one transaction that only commits
+    when the whole archive has been read and its digest matches. Importing
+    into a different repository than the one exported gives every block and
+    edge a fresh id.
+    """
+
+    def __init__(self, db: Session, repo_id):
+        self.db = db
+        self.repo_id = uuid.UUID(str(repo_id))
+        self.stats = {"blocks": 0, "edges": 0, "vectors": 0, "bytes": 0}
+        self._stack = ExitStack()
+        self._buffer = bytearray()
+        self._hash = hashlib.sha256()
+        self._started = False
+        self._ended = False
+        self._frames = 0
+        self._meta = None
+        self._remap = False
+        self._id_map: Dict[str, uuid.UUID] = {}
+        self._vector_meta = None
+        self._vectors = None
+        self._vector_rows = 0
+        self._scales = None
+
+    def __enter__(self):
+        self.index_db = self._stack.enter_context(index_session(self.db, self.repo_id))
+        self.index_db.query(SymbolEdge).filter(SymbolEdge.repository_id == self.repo_id).delete(synchronize_session=False)
+        self.index_db.query(CodeBlock).filter(CodeBlock.repository_id == self.repo_id).delete(synchronize_session=False)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or not self._ended:
+            self.index_db.rollback()
+            self.db.rollback()
+        self._stack.close()
+        return False
+
+    def feed(self, data: bytes):
+        if self._ended and data:
+            raise SnapshotError("Unexpected data after end of snapshot")
+        self._buffer.extend(data)
+        self.stats["bytes"] += len(data)
+
+        if not self._started:
+            header_size = len(MAGIC) + VERSION.size
+            if len(self._buffer) < header_size:
+                return
+            if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+                raise SnapshotError("Not an index snapshot")
+            (version,) = VERSION.unpack_from(self._buffer, len(MAGIC))
+            if version > FORMAT_VERSION:
+                raise SnapshotError(f"Unsupported snapshot format version {version}")
+            self._hash.update(self._buffer[:header_size])
+            del self._buffer[:header_size]
+            self._started = True
+
+        while len(self._buffer) >= FRAME_HEADER.size and not self._ended:
+            kind, raw_length, compressed_length, crc = FRAME_HEADER.unpack_from(self._buffer)
+            if raw_length > MAX_FRAME_BYTES or compressed_length > MAX_FRAME_BYTES:
+                raise SnapshotError(f"Oversized {kind.decode(errors='replace')} frame")
+            frame_size = FRAME_HEADER.size + compressed_length
+            if len(self._buffer) < frame_size:
+                return
+            frame = bytes(self._buffer[:frame_size])
+            del self._buffer[:frame_size]
+
+            payload = frame[FRAME_HEADER.size:]
+            raw = payload if kind == b"END_" else _inflate(payload, raw_length)
+            if raw is None or len(raw) != raw_length or zlib.crc32(raw) != crc:
+                raise SnapshotError(f"Corrupt {kind.decode(errors='replace')} frame")
+
+            if kind == b"END_":
+                self._end(json.loads(raw))
+            else:
+                self._hash.update(frame)
+                self._frames += 1
+                self._dispatch(kind, raw)
+
+        if self._ended and self._buffer:
+            raise SnapshotError("Unexpected data after end of snapshot")
+
+    def finish(self) -> Dict[str, int]:
+        if not self._started:
+            raise SnapshotError("Not an index snapshot")
+        if not self._ended:
+            raise SnapshotError("Snapshot is truncated")
+        self._check_vectors()
+
+        repo = self.db.query(Repository).filter(Repository.id == self.repo_id).first()
+        repo_metadata = dict(repo.repo_metadata or {})
+        repo_metadata["manifest"] = self._meta.get("manifest", {})
+        repo.repo_metadata = repo_metadata
+        repo.indexed = True
+        self.index_db.commit()
+        self.db.commit()
+
+        vector_index = vector_registry.get(self.repo_id)
+        if self._vector_meta is not None:
+            ids = [str(self._id_map.get(block_id, block_id)) for block_id in self._vector_meta["ids"]]
+            vector_index.replace(ids, self._vector_meta["hashes"], self._vectors, self._scales)
+        elif vector_index.exists():
+            vector_index.replace([], [], np.zeros((0, 0), dtype=np.float16))
+        bm25_registry.get(self.repo_id).rebuild(self.index_db)
+        minhash_registry.get(self.repo_id).update(self.index_db)
+
+        if sharding_enabled():
+            shard_manager.claim(self.db, self.repo_id)
+        publish_index_version(self.db, repo)
+        return self.stats
+
+    def _end(self, trailer: dict):
+        if trailer.get("frames") != self._frames or trailer.get("sha256") != self._hash.hexdigest():
+            raise SnapshotError("Snapshot checksum mismatch")
+        if self._meta is None:
+            raise SnapshotError("Snapshot has no metadata")
+        self._ended = True
+
+    def _dispatch(self, kind: bytes, raw: bytes):
+        if kind == b"META":
+            self._meta = json.loads(raw)
+            self._remap = self._meta["repository_id"] != str(self.repo_id)
+            return
+        if self._meta is None:
+            raise SnapshotError("Snapshot metadata must come first")
+
+        if kind == b"BLKS":
+            rows = self._decode_rows(BLOCKS, self._meta["block_columns"], json.loads(raw))
+            for row in rows:
+                row["repository_id"] = self.repo_id
+                if self._remap:
+                    new_id = uuid.uuid4()
+                    self._id_map[str(row["id"])] = new_id
+                    row["id"] = new_id
+            self._bulk_insert(BLOCKS, rows)
+            self.stats["blocks"] += len(rows)
+        elif kind == b"EDGE":
+            rows = self._decode_rows(EDGES, self._meta["edge_columns"], json.loads(raw))
+            for row in rows:
+                row["repository_id"] = self.repo_id
+                if self._remap:
+                    row["id"] = uuid.uuid4()
+                    row["block_id"] = self._id_map.get(str(row["block_id"]))
+            rows = [row for row in rows if row["block_id"] is not None]
+            self._bulk_insert(EDGES, rows)
+            self.stats["edges"] += len(rows)
+        elif kind == b"VECM":
+            meta = json.loads(raw)
+            if meta.get("model") != settings.EMBEDDING_MODEL:
+                raise SnapshotError(
+                    f"Snapshot vectors were embedded with {meta.get('model')!r}, "
+                    f"this node uses {settings.EMBEDDING_MODEL!r}"
+                )
+            if meta.get("dtype") not in ("int8", "float16") or not isinstance(meta.get("dim"), int) or meta["dim"] <= 0:
+                raise SnapshotError("Invalid vector metadata")
+            if len(meta["hashes"]) != len(meta["ids"]):
+                raise SnapshotError("Vector metadata lists a different number of ids and hashes")
+            self._vector_meta = meta
+            dtype = np.int8 if meta["dtype"] == "int8" else np.float16
+            self._vectors = np.empty((len(meta["ids"]), meta["dim"]), dtype=dtype)
+        elif kind == b"VECR":
+            if self._vectors is None:
+                raise SnapshotError("Vector rows before vector metadata")
+            try:
+                rows = np.frombuffer(raw, dtype=self._vectors.dtype).reshape(-1, self._vectors.shape[1])
+            except ValueError as e:
+                raise SnapshotError(f"Vector rows do not match dimension {self._vectors.shape[1]}") from e
+            if self._vector_rows + len(rows) > len(self._vectors):
+                raise SnapshotError("More vector rows than the vector metadata lists")
+            self._vectors[self._vector_rows:self._vector_rows + len(rows)] = rows
+            self._vector_rows += len(rows)
+            self.stats["vectors"] = self._vector_rows
+        elif kind == b"VECS":
+            self._scales = np.frombuffer(raw, dtype=np.float32).copy()
+        else:
+            logger.debug(f"Skipping unknown snapshot frame {kind!r}")
+
+    def _check_vectors(self):
+        """Reject vectors the stream did not fully deliver; the buffer is uninitialized until then."""
+        if self._vector_meta is None:
+            return
+        expected = len(self._vector_meta["ids"])
+        if self._vector_rows != expected:
+            raise SnapshotError(f"Snapshot holds {self._vector_rows} of its {expected} vectors")
+        if self._vector_meta["dtype"] == "int8" and (self._scales is None or len(self._scales) != expected):
+            raise SnapshotError("Snapshot int8 vectors have no matching scales")
+
+    def _decode_rows(self, table, columns: List[str], rows: List[list]) -> List[dict]:
+        known = [(i, name, column_decoder(table.c[name])) for i, name in enumerate(columns) if name in table.c]
+        return [{name: decode(row[i]) for i, name, decode in known} for row in rows]
+
+    def _bulk_insert(self, table, rows: List[dict]):
+        if not rows:
+            return
+        try:
+            self.index_db.execute(insert(table), rows)
+        except IntegrityError as e:
+            raise SnapshotConflict(f"Snapshot {table.name} collide with existing rows: {e.orig}") from e
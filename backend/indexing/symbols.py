@@ -0,0 +1,138 @@
+"""
+Import and symbol-reference extraction for indexed code blocks.
+
+Python sources are analysed with ``ast``; every other supported language
+falls back to lightweight regular expressions, which is enough to populate
+``CodeBlock.imports`` / ``CodeBlock.dependencies`` and the symbol graph.
+"""
+
+import ast
+import builtins
+import re
+from typing import Dict, List, Set, Tuple
+
+PYTHON_BUILTINS = set(dir(builtins))
+
+GENERIC_KEYWORDS = {
+    'if', 'for', 'while', 'switch', 'catch', 'return', 'sizeof', 'typeof',
+    'function', 'func', 'fn', 'new', 'delete', 'match', 'await', 'async',
+    'else', 'elif', 'do', 'try', 'throw', 'throws', 'case', 'defer', 'go',
+    'super', 'this', 'self', 'import', 'require', 'include', 'assert',
+}
+
+IMPORT_PATTERNS = {
+    'javascript': [
+        re.compile(r'''^\s*import\s+(?:[\w*{}\s,]+\s+from\s+)?['"]([^'"]+)['"]''', re.MULTILINE),
+        re.compile(r'''require\(\s*['"]([^'"]+)['"]\s*\)'''),
+    ],
+    'typescript': [
+        re.compile(r'''^\s*import\s+(?:type\s+)?(?:[\w*{}\s,]+\s+from\s+)?['"]([^'"]+)['"]''', re.MULTILINE),
+        re.compile(r'''require\(\s*['"]([^'"]+)['"]\s*\)'''),
+    ],
+    'go': [re.compile(r'''^\s*import\s+(?:\w+\s+)?"([^"]+)"''', re.MULTILINE)],
+    'rust': [re.compile(r'^\s*(?:pub\s+)?use\s+([\w:]+)', re.MULTILINE)],
+    'java': [re.compile(r'^\s*import\s+(?:static\s+)?([\w.]+)\s*;', re.MULTILINE)],
+    'cpp': [re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)],
+    'c': [re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)],
+}
+
+GO_IMPORT_BLOCK = re.compile(r'^\s*import\s*\(([^)]*)\)', re.MULTILINE)
+GO_IMPORT_PATH = re.compile(r'"([^"]+)"')
+
+CALL_PATTERN = re.compile(r'\b([A-Za-z_][A-Za-z0-9_]*)\s*\(')
+DEFINITION_PATTERN = re.compile(r'\b(?:function|func|fn)\s+([A-Za-z_][A-Za-z0-9_]*)')
+
+
+def python_module_imports(tree: ast.Module) -> Dict[str, str]:
+    """Map every name bound by a module-level import to its qualified target."""
+    bindings = {}
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                local = alias.asname or alias.name.split('.')[0]
+                bindings[local] = alias.name if alias.asname else local
+        elif isinstance(node, ast.ImportFrom):
+            module = '.' * node.level + (node.module or '')
+            for alias in node.names:
+                if alias.name == '*':
+                    continue
+                bindings[alias.asname or alias.name] = f"{module}.{alias.name}".lstrip('.') or alias.name
+    return bindings
+
+
+class _ReferenceCollector(ast.NodeVisitor):
+    def __init__(self):
+        self.calls: Set[str] = set()
+        self.names: Set[str] = set()
+        self.local_imports: Set[str] = set()
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            self.calls.add(func.id)
+        elif isinstance(func, ast.Attribute):
+            self.calls.add(func.attr)
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.names.add(node.id)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.local_imports.add(alias.name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = '.' * node.level + (node.module or '')
+        for alias in node.names:
+            self.local_imports.add(f"{module}.{alias.name}".lstrip('.'))
+
+
+def extract_python_symbols(
+    node: ast.AST,
+    module_imports: Dict[str, str],
+) -> Tuple[List[str], List[str]]:
+    """Return ``(imports, dependencies)`` for a function or class node."""
+    collector = _ReferenceCollector()
+    collector.visit(node)
+
+    referenced = collector.names | collector.calls
+    if isinstance(node, ast.ClassDef):
+        for base in node.bases:
+            if isinstance(base, ast.Name):
+                referenced.add(base.id)
+                collector.calls.add(base.id)
+            elif isinstance(base, ast.Attribute):
+                collector.calls.add(base.attr)
+
+    imports = {
+        target for local, target in module_imports.items()
+        if local in referenced
+    }
+    imports |= collector.local_imports
+
+    own_name = getattr(node, 'name', None)
+    dependencies = {
+        name for name in collector.calls
+        if name not in PYTHON_BUILTINS and name != own_name
+    }
+
+    return sorted(imports), sorted(dependencies)
+
+
+def extract_generic_symbols(content: str, language: str) -> Tuple[List[str], List[str]]:
+    """Regex-based ``(imports, dependencies)`` for non-Python sources."""
+    imports = set()
+    for pattern in IMPORT_PATTERNS.get(language, []):
+        imports.update(match.strip() for match in pattern.findall(content))
+    if language == 'go':
+        for block in GO_IMPORT_BLOCK.findall(content):
+            imports.update(GO_IMPORT_PATH.findall(block))
+
+    defined = set(DEFINITION_PATTERN.findall(content))
+    dependencies = {
+        name for name in CALL_PATTERN.findall(content)
+        if name not in GENERIC_KEYWORDS and name not in defined
+    }
+
+    return sorted(imports), sorted(dependencies)
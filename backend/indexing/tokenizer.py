@@ -0,0 +1,50 @@
+import re
+from typing import List
+
+_ACRONYM_BOUNDARY = re.compile(r'([A-Z]+)([A-Z][a-z])')
+_CAMEL_BOUNDARY = re.compile(r'([a-z0-9])([A-Z])')
+_SEPARATORS = re.compile(r'[_\W]+')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|[0-9]+')
+
+
+def split_identifiers(text: str) -> str:
+    """Break camelCase, PascalCase and snake_case identifiers into words.
+
+    ``parseHTTPResponse_body`` becomes ``parse HTTP Response body``; other
+    text is left untouched apart from separator normalisation.
+    """
+    if not text:
+        return ""
+    text = _ACRONYM_BOUNDARY.sub(r'\1 \2', text)
+    text = _CAMEL_BOUNDARY.sub(r'\1 \2', text)
+    return _SEPARATORS.sub(' ', text).strip()
+
+
+def query_terms(query: str, min_length: int = 2) -> List[str]:
+    """Lower-cased, de-duplicated search terms for a free-text or identifier query."""
+    terms = []
+    for word in _WORD.findall(split_identifiers(query)):
+        word = word.lower()
+        if len(word) >= min_length and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def tokenize(text: str, min_length: int = 2) -> List[str]:
+    """Code-aware tokens: identifier parts plus the whole compound identifier.
+
+    ``getUserName`` yields ``get``, ``user``, ``name`` and ``getusername`` so
+    both natural-language and exact-identifier queries match.
+    """
+    tokens = []
+    for identifier in _IDENTIFIER.findall(text or ""):
+        if identifier.islower() and '_' not in identifier:
+            if len(identifier) >= min_length:
+                tokens.append(identifier)
+            continue
+        parts = [part.lower() for part in _WORD.findall(split_identifiers(identifier))]
+        tokens.extend(part for part in parts if len(part) >= min_length)
+        if len(parts) > 1:
+            tokens.append(identifier.replace('_', '').lower())
+    return tokens
@@ -1,9 +1,12 @@
 from .base import LLMProvider, LLMRequest, LLMResponse
 from .ollama import OllamaProvider
+from .pool import ProviderPool, provider_pool
 
 __all__ = [
     "LLMProvider",
     "LLMRequest",
     "LLMResponse",
     "OllamaProvider",
+    "ProviderPool",
+    "provider_pool",
 ]
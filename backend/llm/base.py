@@ -17,9 +17,16 @@ class LLMTool:
     parameters: Dict[str, Any]
 
 
+@dataclass
+class LLMToolCall:
+    id: str
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+
+
 class LLMRequest(BaseModel):
     system_prompt: Optional[str] = None
-    messages: List[Dict[str, str]]
+    messages: List[Dict[str, Any]]
     model: str
     temperature: float = 0.7
     max_tokens: int = 2000
@@ -32,6 +39,7 @@ class LLMResponse(BaseModel):
     cost: float
     model: str
     finish_reason: str
+    tool_calls: List[LLMToolCall] = []
 
 
 class LLMProvider(ABC):
@@ -1,6 +1,7 @@
+import asyncio
 import httpx
 import json
-from .base import LLMProvider, LLMRequest, LLMResponse
+from .base import LLMProvider, LLMRequest, LLMResponse, LLMToolCall
 from config import settings
 
 
@@ -9,15 +10,17 @@ class OllamaProvider(LLMProvider):
         self.base_url = (base_url or settings.OLLAMA_BASE_URL).rstrip('/')
         self.model = model or settings.DEFAULT_OLLAMA_MODEL
         self.client = httpx.Client(timeout=120.0)
+        self._async_client = None
+        self._async_loop = None
         
         self.model_info = {
-            "codellama:latest": {"tokens_per_second": 10, "code_focused": True},
-            "codellama:7b": {"tokens_per_second": 10, "code_focused": True},
-            "granite-8b-code-base-128k-GGUF:Q4_K_M": {"tokens_per_second": 8, "code_focused": True},
-            "deepseek-coder:latest": {"tokens_per_second": 12, "code_focused": True},
-            "qwen3:8b": {"tokens_per_second": 15, "code_focused": False},
-            "llama3:latest": {"tokens_per_second": 12, "code_focused": False},
-            "mistral:latest": {"tokens_per_second": 15, "code_focused": False},
+            "codellama:latest": {"tokens_per_second": 10, "code_focused": True, "context_window": 16384},
+            "codellama:7b": {"tokens_per_second": 10, "code_focused": True, "context_window": 16384},
+            "granite-8b-code-base-128k-GGUF:Q4_K_M": {"tokens_per_second": 8, "code_focused": True, "context_window": 131072},
+            "deepseek-coder:latest": {"tokens_per_second": 12, "code_focused": True, "context_window": 16384},
+            "qwen3:8b": {"tokens_per_second": 15, "code_focused": False, "context_window": 32768},
+            "llama3:latest": {"tokens_per_second": 12, "code_focused": False, "context_window": 8192},
+            "mistral:latest": {"tokens_per_second": 15, "code_focused": False, "context_window": 32768},
         }
     
     async def generate(self, request: LLMRequest) -> LLMResponse:
@@ -35,30 +38,62 @@ class OllamaProvider(LLMProvider):
             "stream": False,
             "temperature": request.temperature,
         }
+        if request.tools:
+            payload["tools"] = [
+                {
+                    "type": "function",
+                    "function": {"name": tool.name, "description": tool.description, "parameters": tool.parameters},
+                }
+                for tool in request.tools
+            ]
         
         try:
-            response = self.client.post(
-                f"{self.base_url}/api/chat",
-                json=payload,
-                timeout=300.0
-            )
+            response = await self._chat_client().post(f"{self.base_url}/api/chat", json=payload)
             response.raise_for_status()
             
             result = response.json()
+            message = result.get("message", {})
             
-            tokens_used = self._count_tokens(result.get("message", {}).get("content", ""))
+            tokens_used = self._count_tokens(message.get("content", ""))
+            tool_calls = self._tool_calls(message)
             
             return LLMResponse(
-                content=result.get("message", {}).get("content", ""),
+                content=message.get("content", ""),
                 tokens_used=tokens_used,
                 cost=0.0,
                 model=request.model or self.model,
-                finish_reason=result.get("done", True) and "stop" or "incomplete",
+                finish_reason="tool_calls" if tool_calls else result.get("done", True) and "stop" or "incomplete",
+                tool_calls=tool_calls,
             )
         
         except Exception as e:
             raise RuntimeError(f"Ollama API error: {str(e)}")
     
+    def _tool_calls(self, message: dict) -> list:
+        calls = []
+        for i, call in enumerate(message.get("tool_calls") or []):
+            function = call.get("function", {})
+            arguments = function.get("arguments") or {}
+            if isinstance(arguments, str):
+                try:
+                    arguments = json.loads(arguments)
+                except ValueError:
+                    arguments = {}
+            calls.append(LLMToolCall(id=call.get("id") or f"call_{i}", name=function.get("name", ""), arguments=arguments))
+        return calls
+    
+    def _chat_client(self) -> httpx.AsyncClient:
+        # One keep-alive client per event loop, so concurrent agents sharing
+        # this provider reuse connections instead of opening one per call.
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client.is_closed or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                timeout=300.0,
+                limits=httpx.Limits(max_connections=settings.LLM_MAX_CONNECTIONS),
+            )
+            self._async_loop = loop
+        return self._async_client
+    
     def count_tokens(self, text: str) -> int:
         return self._count_tokens(text)
     
@@ -68,6 +103,10 @@ class OllamaProvider(LLMProvider):
     def get_cost_per_1k_tokens(self) -> float:
         return 0.0
     
+    def get_context_window(self, model: str = None) -> int:
+        info = self.model_info.get(model or self.model, {})
+        return info.get("context_window", settings.DEFAULT_CONTEXT_WINDOW)
+    
     async def list_available_models(self) -> list:
         try:
             async with httpx.AsyncClient(timeout=10.0) as client:
@@ -81,6 +120,33 @@ class OllamaProvider(LLMProvider):
         except Exception as e:
             raise RuntimeError(f"Failed to list Ollama models: {str(e)}")
     
+    async def embed(self, texts: list, model: str = None) -> list:
+        try:
+            async with httpx.AsyncClient(timeout=120.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/api/embed",
+                    json={"model": model or settings.EMBEDDING_MODEL, "input": texts}
+                )
+                response.raise_for_status()
+                return response.json().get("embeddings", [])
+        
+        except Exception as e:
+            raise RuntimeError(f"Ollama embedding error: {str(e)}")
+    
+    async def preload(self, model: str = None, keep_alive: str = None) -> bool:
+        """Load ``model`` into memory and keep it resident for ``keep_alive``."""
+        try:
+            async with httpx.AsyncClient(timeout=300.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": model or self.model, "keep_alive": keep_alive or settings.WARM_KEEP_ALIVE}
+                )
+                response.raise_for_status()
+                return True
+        
+        except Exception as e:
+            raise RuntimeError(f"Failed to preload model {model or self.model}: {str(e)}")
+    
     async def pull_model(self, model_name: str) -> bool:
         try:
             async with httpx.AsyncClient(timeout=None) as client:
@@ -103,3 +169,9 @@ class OllamaProvider(LLMProvider):
     
     def close(self):
         self.client.close()
+    
+    async def aclose(self):
+        self.client.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
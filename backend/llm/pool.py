@@ -0,0 +1,38 @@
+"""
+Shared LLM providers.
+
+Agents used to build their own ``OllamaProvider`` each, so every agent held
+its own HTTP clients and connections. The pool hands out one provider per
+Ollama endpoint; concurrent agents (see ``agents.pipeline``) then share its
+keep-alive connections.
+"""
+
+import threading
+from typing import Dict, Optional
+
+from config import settings
+from .ollama import OllamaProvider
+
+
+class ProviderPool:
+    def __init__(self):
+        self._providers: Dict[str, OllamaProvider] = {}
+        self._lock = threading.Lock()
+
+    def get(self, base_url: Optional[str] = None) -> OllamaProvider:
+        key = (base_url or settings.OLLAMA_BASE_URL).rstrip("/")
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is None:
+                provider = self._providers[key] = OllamaProvider(base_url=key)
+            return provider
+
+    async def close(self):
+        with self._lock:
+            providers = list(self._providers.values())
+            self._providers.clear()
+        for provider in providers:
+            await provider.aclose()
+
+
+provider_pool = ProviderPool()
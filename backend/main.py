@@ -1,13 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from database import Base, engine
+from fastapi.responses import FileResponse, JSONResponse
+from database import Base, dispose_engines, engine
 from config import settings
-from routes import auth_router, repositories_router, chat_router, models_router
+from routes import auth_router, repositories_router, chat_router, models_router, search_router, usage_router
 from routes.clone import router as clone_router
 from services.tier_config import tier_config
 from services.model_selector import model_selector
+from services.metrics import metrics
+from indexing.shards import ShardNotLocalError, shard_manager
+from llm import provider_pool
+from services.message_journal import message_journal
 import logging
 from pathlib import Path
 import os
@@ -35,8 +39,17 @@ app.include_router(auth_router)
 app.include_router(repositories_router)
 app.include_router(chat_router)
 app.include_router(models_router)
+app.include_router(search_router)
+app.include_router(usage_router)
 app.include_router(clone_router)
 
+@app.exception_handler(ShardNotLocalError)
+async def shard_not_local_handler(request, exc: ShardNotLocalError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "node_id": exc.node_id},
+    )
+
 @app.get("/favicon.svg")
 async def favicon():
     favicon_path = Path(__file__).parent.parent / "favicon.svg"
@@ -51,10 +64,18 @@ async def startup_event():
     logger.info(f"Tier-specific models: {tier_config.get_amplify_models_for_tier()}")
     await model_selector.initialize()
     logger.info(f"Available amplify models: {model_selector.get_available_amplify_models()}")
+    if message_journal.enabled():
+        replayed = await message_journal.recover(engine)
+        logger.info(f"Message journal ready ({replayed} rows replayed)")
+        message_journal.start(engine)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down AI Coding Agent API")
+    shard_manager.close_all()
+    await provider_pool.close()
+    await message_journal.close()
+    await dispose_engines()
 
 @app.get("/clone")
 async def clone_ui():
@@ -76,6 +97,10 @@ async def chat_ui():
 async def health_check():
     return {"status": "healthy", "version": "0.1.0"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
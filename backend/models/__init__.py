@@ -2,6 +2,11 @@ from .user import User
 from .repository import Repository
 from .session import Session
 from .message import Message
+from .message_archive import MessageArchive
 from .code_index import CodeBlock
+from .symbol_graph import SymbolEdge
+from .index_shard import IndexShard
+from .code_summary import CodeSummary
+from .usage_rollup import UsageRollup
 
-__all__ = ["User", "Repository", "Session", "Message", "CodeBlock"]
+__all__ = ["User", "Repository", "Session", "Message", "MessageArchive", "CodeBlock", "SymbolEdge", "IndexShard", "CodeSummary", "UsageRollup"]
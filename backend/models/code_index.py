@@ -28,13 +28,15 @@ class CodeBlock(Base):
     content = Column(Text, nullable=False)
     entity_type = Column(SQLEnum(EntityType), nullable=True)
     entity_name = Column(String, nullable=True, index=True)
-    dependencies = Column(ARRAY(String), default=list)
-    imports = Column(ARRAY(String), default=list)
+    dependencies = Column(ARRAY(String).with_variant(JSON, "sqlite"), default=list)
+    imports = Column(ARRAY(String).with_variant(JSON, "sqlite"), default=list)
     docstring = Column(Text, nullable=True)
+    content_hash = Column(String(40), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     repository = relationship("Repository", back_populates="code_blocks")
+    edges = relationship("SymbolEdge", back_populates="block", cascade="all, delete-orphan", passive_deletes=True)
     
     def __repr__(self):
         return f"<CodeBlock {self.file_path}:{self.start_line}>"
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, UniqueConstraint, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+from database import Base
+import uuid
+import enum
+
+
+class SummaryLevel(str, enum.Enum):
+    FILE = "file"
+    DIRECTORY = "directory"
+    REPOSITORY = "repository"
+
+
+class CodeSummary(Base):
+    """Cached LLM summary of a file, directory or whole repository.
+
+    ``content_hash`` is the file hash for files, and a hash of the children's
+    hashes for directories and the repository, so a summary stays valid
+    until something beneath it changes.
+    """
+
+    __tablename__ = "code_summaries"
+    __table_args__ = (UniqueConstraint("repository_id", "level", "path", name="uq_code_summaries_node"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    repository_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id", ondelete="CASCADE"), nullable=False)
+    level = Column(SQLEnum(SummaryLevel), nullable=False)
+    path = Column(String, nullable=False)
+    content_hash = Column(String(40), nullable=False)
+    model = Column(String, nullable=False)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CodeSummary {self.level.value}:{self.path}>"
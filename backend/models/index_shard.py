@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+from database import Base
+
+
+class IndexShard(Base):
+    """Catalog entry recording which node holds a repository's index shard."""
+
+    __tablename__ = "index_shards"
+
+    repository_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id", ondelete="CASCADE"), primary_key=True)
+    node_id = Column(String, nullable=False, index=True)
+    path = Column(String, nullable=False)
+    format_version = Column(Integer, nullable=False, default=1)
+    block_count = Column(Integer, nullable=False, default=0)
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<IndexShard {self.repository_id} @ {self.node_id}>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Enum as SQLEnum, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Integer, Enum as SQLEnum, Text
 from sqlalchemy.dialects.postgresql import UUID, JSON, ARRAY
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -15,16 +15,18 @@ class MessageRole(str, enum.Enum):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_session_id_created_at", "session_id", "created_at"),)
     
+    # (id, created_at), as migration 008 declares it: a partitioned table's key must include the partition column.
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id"), nullable=False)
     role = Column(SQLEnum(MessageRole), nullable=False)
     content = Column(Text, nullable=False)
-    files_referenced = Column(ARRAY(String), default=list)
-    tools_used = Column(ARRAY(String), default=list)
+    files_referenced = Column(ARRAY(String).with_variant(JSON, "sqlite"), default=list)
+    tools_used = Column(ARRAY(String).with_variant(JSON, "sqlite"), default=list)
     tokens_used = Column(Integer, default=0)
     msg_metadata = Column(JSON, default=dict)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     
     session = relationship("Session", back_populates="messages")
     
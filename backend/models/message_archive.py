@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, LargeBinary
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+from database import Base
+
+
+class MessageArchive(Base):
+    """Compressed messages of a session that went idle, moved out of ``messages``.
+
+    ``payload`` is the zlib-compressed JSON list of the session's message
+    rows. ``title`` and ``message_count`` keep session listings complete
+    without decompressing it.
+    """
+
+    __tablename__ = "message_archives"
+
+    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    message_count = Column(Integer, nullable=False)
+    title = Column(String, nullable=True)
+    raw_bytes = Column(Integer, nullable=False)
+    compressed_bytes = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<MessageArchive {self.session_id}>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -13,10 +13,14 @@ class AgentType(str, enum.Enum):
     TESTING = "testing"
     DOCS = "docs"
     QA = "qa"
+    REVIEW = "review"
+    REASONING = "reasoning"
+    PIPELINE = "pipeline"
 
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (Index("ix_sessions_user_id_updated_at", "user_id", "updated_at"),)
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
@@ -27,6 +31,8 @@ class Session(Base):
     session_metadata = Column(JSON, default=dict)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set while the session's messages are compacted into ``message_archives``.
+    archived_at = Column(DateTime, nullable=True)
     
     user = relationship("User", back_populates="sessions")
     repository = relationship("Repository", back_populates="sessions")
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from database import Base
+import uuid
+import enum
+
+
+class EdgeKind(str, enum.Enum):
+    CALL = "call"
+    IMPORT = "import"
+
+
+class SymbolEdge(Base):
+    __tablename__ = "symbol_edges"
+    __table_args__ = (
+        Index("ix_symbol_edges_repo_target", "repository_id", "target"),
+        Index("ix_symbol_edges_repo_source", "repository_id", "source"),
+        Index("ix_symbol_edges_repo_file", "repository_id", "file_path"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    repository_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=False)
+    block_id = Column(UUID(as_uuid=True), ForeignKey("code_blocks.id", ondelete="CASCADE"), nullable=False)
+    file_path = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    target = Column(String, nullable=False)
+    kind = Column(SQLEnum(EdgeKind), nullable=False, default=EdgeKind.CALL)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    block = relationship("CodeBlock", back_populates="edges")
+
+    def __repr__(self):
+        return f"<SymbolEdge {self.source} -{self.kind.value}-> {self.target}>"
@@ -0,0 +1,24 @@
+from sqlalchemy import BigInteger, Column, Date, DateTime, ForeignKey, Integer, String
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+from database import Base
+
+
+class UsageRollup(Base):
+    """Tokens and responses per user, model and UTC day.
+
+    Kept current on every assistant-message insert, so usage reads never
+    scan ``messages``.
+    """
+
+    __tablename__ = "usage_rollups"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    model = Column(String, primary_key=True)
+    tokens_used = Column(BigInteger, nullable=False, default=0)
+    message_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UsageRollup {self.user_id} {self.day} {self.model}>"
@@ -2,5 +2,7 @@ from .auth import router as auth_router
 from .repositories import router as repositories_router
 from .chat import router as chat_router
 from .models import router as models_router
+from .search import router as search_router
+from .usage import router as usage_router
 
-__all__ = ["auth_router", "repositories_router", "chat_router", "models_router"]
+__all__ = ["auth_router", "repositories_router", "chat_router", "models_router", "search_router", "usage_router"]
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from database import get_db
+from database import get_db, get_read_db
 from models import User
 from schemas import UserCreate, UserLogin, UserResponse, TokenResponse
 from utils.auth import hash_password, verify_password, create_access_token, get_current_user
@@ -11,11 +12,11 @@ router = APIRouter(prefix="/api/v1/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=TokenResponse)
-async def register(user_create: UserCreate, db: Session = Depends(get_db)):
+async def register(user_create: UserCreate, db: AsyncSession = Depends(get_db)):
     normalized_email = user_create.email.lower()
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         (User.email == normalized_email) | (User.username == user_create.username)
-    ).first()
+    ).limit(1))
     
     if existing_user:
         raise HTTPException(
@@ -31,8 +32,8 @@ async def register(user_create: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     access_token = create_access_token(data={"sub": str(db_user.id)})
     
@@ -43,9 +44,9 @@ async def register(user_create: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(user_login: UserLogin, db: Session = Depends(get_db)):
+async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
     normalized_email = user_login.email.lower()
-    db_user = db.query(User).filter(User.email == normalized_email).first()
+    db_user = await db.scalar(select(User).where(User.email == normalized_email).limit(1))
     
     if not db_user or not verify_password(user_login.password, db_user.hashed_password):
         raise HTTPException(
@@ -62,8 +63,8 @@ async def login(user_login: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_me(user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def get_me(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    db_user = await db.get(User, user_id)
     
     if not db_user:
         raise HTTPException(
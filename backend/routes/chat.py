@@ -1,131 +1,260 @@
+import asyncio
+import time
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from uuid import UUID
+from uuid import UUID, uuid4
 from datetime import datetime
-from database import get_db
-from models import Session as DBSession, Message, User, Repository
+from typing import Optional
+from database import get_db, get_sync_engine
+from models import Session as DBSession, Message, MessageArchive, User, Repository
 from models.message import MessageRole
-from models.session import AgentType
-from schemas import ChatRequest, ChatResponse, SessionResponse
+from schemas import ChatRequest, ChatResponse, MessagePage, MessageResponse, SessionPage, SessionResponse, SessionSummary
 from utils.auth import get_current_user
-from llm import OllamaProvider
-from llm.base import LLMRequest
+from utils.pagination import decode_cursor, encode_cursor, keyset_after
+from agents import agent_registry
+from llm import provider_pool
 from config import settings
-from services.model_selector import model_selector
+from services.retrieval import RetrievalService
+from services.chat_export import ChatHistoryExport
+from services.compaction import restore_session
+from services.session_cache import session_cache
+from services.usage import record_usage, usage_counter
+from services.message_journal import message_journal, message_record, message_row
 
 router = APIRouter(prefix="/api/v1/chat", tags=["chat"])
 
+RETRIEVAL_LIMIT = 8
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+TITLE_CHARS = 80
+
+
+async def _load_messages(db: AsyncSession, session, exclude_id) -> list:
+    """Earlier messages of the session, oldest first, including ones still in the journal."""
+    if session.archived_at is not None:
+        await db.run_sync(restore_session, session.id)
+    # No message predates its session, so Postgres only scans partitions from then on.
+    rows = await db.execute(
+        select(Message.id, Message.created_at, Message.role, Message.content).where(
+            (Message.session_id == session.id) & (Message.created_at >= session.created_at)
+        )
+    )
+    messages = {str(id): (created_at, role.value, content) for id, created_at, role, content in rows}
+    for record in message_journal.pending_messages(session.id):
+        messages.setdefault(record["id"], (datetime.fromisoformat(record["created_at"]), record["role"], record["content"]))
+    messages.pop(str(exclude_id), None)
+    return [
+        {"id": id, "role": role, "content": content}
+        for id, (_, role, content) in sorted(messages.items(), key=lambda item: item[1][0])
+    ]
+
+
+async def _persist(db: AsyncSession, message: Message, new_session: DBSession = None, owner: tuple = None):
+    """Save a turn's rows: one journal append when write-behind is on, else one commit.
+
+    A new session is committed even with write-behind, so follow-ups served by
+    another worker find it. ``owner`` is the session's ``(user_id, model)``; the
+    journal looks it up when it flushes, and keeps the user on the queued row so
+    the usage counter sees it before then.
+    """
+    if message_journal.enabled():
+        if new_session is not None:
+            db.add(new_session)
+            await db.commit()
+        await message_journal.append([message_record(message, owner[0] if owner else None)])
+        return
+    if new_session is not None:
+        db.add(new_session)
+    else:
+        await db.execute(update(DBSession).where(DBSession.id == message.session_id).values(updated_at=message.created_at))
+    db.add(message)
+    if owner is not None:
+        await db.run_sync(record_usage, [message_row(message_record(message))], {message.session_id: owner})
+    await db.commit()
+
+
+async def _owned_repository(db: AsyncSession, repo_id, user_id):
+    return await db.scalar(select(Repository).where(
+        (Repository.id == repo_id) & (Repository.user_id == user_id)
+    ))
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
 
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    sync_engine: Engine = Depends(get_sync_engine)
 ):
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if not db_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    started = time.perf_counter()
+    if request.agent_type not in agent_registry.types():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown agent type '{request.agent_type}'",
+        )
+    
+    # An active session's cached state stands in for the user, session and history queries.
+    state = await session_cache.get(request.session_id, user_id) if request.session_id else None
+    if state is None:
+        db_user = await db.get(User, user_id)
+        if not db_user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
     db_repo = None
     if request.repository_id:
-        db_repo = db.query(Repository).filter(
-            (Repository.id == request.repository_id) & (Repository.user_id == user_id)
-        ).first()
+        db_repo = await _owned_repository(db, request.repository_id, user_id)
         if not db_repo:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
     
-    model_to_use = request.model
-    if not model_to_use:
-        if request.agent_type == "coding":
-            model_to_use = model_selector.get_code_model()
-        elif request.agent_type == "review":
-            model_to_use = model_selector.get_seer_model() or model_selector.get_general_model()
-        elif request.agent_type == "reasoning":
-            model_to_use = model_selector.get_reasoning_model() or model_selector.get_general_model()
-        else:
-            model_to_use = model_selector.get_general_model()
-    
-    if request.session_id:
-        session = db.query(DBSession).filter(
+    if state is not None:
+        session = DBSession(
+            id=UUID(state.session_id),
+            user_id=user_id,
+            repository_id=UUID(state.repository_id) if state.repository_id else None,
+            agent_type=state.agent_type,
+            model=state.model,
+        )
+        if db_repo is None and session.repository_id:
+            db_repo = await _owned_repository(db, session.repository_id, user_id)
+        new_session = None
+    elif request.session_id:
+        session = await db.scalar(select(DBSession).where(
             (DBSession.id == request.session_id) & (DBSession.user_id == user_id)
-        ).first()
+        ))
+        if not session:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+        if db_repo is None and session.repository_id:
+            db_repo = await _owned_repository(db, session.repository_id, user_id)
+        new_session = None
     else:
-        session = DBSession(
+        now = datetime.utcnow()
+        session = new_session = DBSession(
+            id=uuid4(),
             user_id=user_id,
             repository_id=request.repository_id if db_repo else None,
             agent_type=request.agent_type,
-            model=model_to_use,
+            model=request.model or agent_registry.resolve_model(request.agent_type),
+            created_at=now,
+            updated_at=now,
+        )
+        state = session_cache.new_state(session, [])
+    
+    usage = await usage_counter.get(db, user_id)
+    if usage.exceeded:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Monthly token quota of {usage.limit} for the {usage.tier} tier is used up",
         )
-        db.add(session)
-        db.commit()
-        db.refresh(session)
     
     user_message = Message(
+        id=uuid4(),
         session_id=session.id,
         role=MessageRole.USER,
         content=request.message,
         files_referenced=request.files or [],
+        created_at=datetime.utcnow(),
     )
-    db.add(user_message)
-    db.commit()
+    await _persist(db, user_message, new_session)
     
-    messages_history = db.query(Message).filter(Message.session_id == session.id).all()
-    formatted_messages = [
-        {"role": msg.role.value, "content": msg.content}
-        for msg in messages_history
-    ]
+    repo_id = db_repo.id if db_repo else None
+    timings = {}
+    # Agents and retrieval only take the engine from it; their queries run in worker threads.
+    sync_db = Session(bind=sync_engine)
+    
+    async def load_history():
+        nonlocal state
+        stage = time.perf_counter()
+        if state is None:
+            state = session_cache.new_state(session, await _load_messages(db, session, user_message.id))
+        history = state.history()
+        await session_cache.add_message(state, user_message.id, MessageRole.USER.value, user_message.content)
+        timings["history_ms"] = _elapsed_ms(stage)
+        return history
     
-    system_prompt = f"You are a helpful AI coding assistant specializing in {request.agent_type} tasks."
+    async def retrieve():
+        if not db_repo or not db_repo.indexed:
+            return ""
+        stage = time.perf_counter()
+        retrieval = RetrievalService(sync_db, repo_id, provider_pool.get())
+        context = await retrieval.build_context(request.message, session.model, limit=RETRIEVAL_LIMIT)
+        timings["retrieval_ms"] = _elapsed_ms(stage)
+        return context
     
     try:
-        provider = OllamaProvider()
-        llm_request = LLMRequest(
-            system_prompt=system_prompt,
-            messages=formatted_messages,
-            model=session.model,
-            temperature=0.7,
-            max_tokens=2000,
-        )
-        
-        llm_response = await provider.generate(llm_request)
+        stage = time.perf_counter()
+        if agent_registry.uses_pipeline(request.agent_type):
+            # The pipeline runs its own shared retrieval for its branch models.
+            history = await load_history()
+            result = await agent_registry.pipeline(sync_db, repo_id).run(request.message, history)
+            content, model, tools_used = result.content, result.model, []
+            timings.update(result.timings)
+        else:
+            history, retrieved = await asyncio.gather(load_history(), retrieve())
+            agent = agent_registry.create(request.agent_type, sync_db, repo_id, session.model, session_id=session.id)
+            stage = time.perf_counter()
+            use_tools = request.tools and bool(db_repo and db_repo.indexed)
+            content = await agent.process(request.message, {"retrieved": retrieved, "tools": use_tools}, history)
+            model = agent.model
+            tools_used = sorted({call.name for step in agent.tool_steps for call in step.calls})
+        timings["generation_ms"] = _elapsed_ms(stage)
+        timings["total_ms"] = _elapsed_ms(started)
         
+        tokens_used = provider_pool.get().count_tokens(content)
         assistant_message = Message(
+            id=uuid4(),
             session_id=session.id,
             role=MessageRole.ASSISTANT,
-            content=llm_response.content,
-            tokens_used=llm_response.tokens_used,
+            content=content,
+            tools_used=tools_used,
+            tokens_used=tokens_used,
+            msg_metadata={"agent_type": request.agent_type, "model": model, "timings": timings},
+            created_at=datetime.utcnow(),
         )
-        db.add(assistant_message)
-        db.commit()
-        db.refresh(assistant_message)
+        # Counted before the rollup is written, so a concurrent reload can't count it twice.
+        await usage_counter.add(user_id, tokens_used)
+        try:
+            await _persist(db, assistant_message, owner=(user_id, session.model))
+        except Exception:
+            await usage_counter.add(user_id, -tokens_used)
+            raise
+        await session_cache.add_message(state, assistant_message.id, MessageRole.ASSISTANT.value, content)
         
         return ChatResponse(
             session_id=session.id,
             message_id=assistant_message.id,
-            content=llm_response.content,
-            tools_used=[],
-            tokens_used=llm_response.tokens_used,
+            content=content,
+            tools_used=tools_used,
+            tokens_used=tokens_used,
             created_at=assistant_message.created_at.isoformat(),
         )
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating response: {str(e)}"
         )
 
 
+# Session and message reads stay on the primary: they usually follow a chat
+# turn, and a replica that hasn't replayed it yet would miss or 404 it.
 @router.get("/sessions/{session_id}", response_model=SessionResponse)
 async def get_session(
     session_id: UUID,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    session = db.query(DBSession).filter(
+    session = await db.scalar(select(DBSession).where(
         (DBSession.id == session_id) & (DBSession.user_id == user_id)
-    ).first()
+    ))
     
     if not session:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
@@ -133,10 +262,120 @@ async def get_session(
     return SessionResponse.from_orm(session)
 
 
-@router.get("/sessions/")
+def _page_size(limit: int) -> int:
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def _keyset_after(position_column, id_column, cursor: Optional[str], descending: bool = False):
+    try:
+        return keyset_after(position_column, id_column, cursor, descending)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/sessions/", response_model=SessionPage)
 async def list_sessions(
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """The user's sessions, most recently active first, without message bodies."""
+    limit = _page_size(limit)
+    in_session = (Message.session_id == DBSession.id) & (Message.created_at >= DBSession.created_at)
+    title = select(func.substr(Message.content, 1, TITLE_CHARS)).where(
+        in_session & (Message.role == MessageRole.USER)
+    ).order_by(Message.created_at).limit(1).correlate(DBSession).scalar_subquery()
+    message_count = select(func.count(Message.id)).where(in_session).correlate(DBSession).scalar_subquery()
+    
+    # Archived sessions keep their title and count in the archive row.
+    query = select(
+        DBSession.id, DBSession.repository_id, DBSession.agent_type, DBSession.model,
+        DBSession.created_at, DBSession.updated_at,
+        func.coalesce(title, MessageArchive.title).label("title"),
+        (message_count + func.coalesce(MessageArchive.message_count, 0)).label("message_count"),
+    ).outerjoin(MessageArchive, MessageArchive.session_id == DBSession.id).where(DBSession.user_id == user_id)
+    if cursor:
+        query = query.where(_keyset_after(DBSession.updated_at, DBSession.id, cursor, descending=True))
+    rows = (await db.execute(
+        query.order_by(DBSession.updated_at.desc(), DBSession.id.desc()).limit(limit + 1)
+    )).all()
+    
+    sessions = [SessionSummary(**row._mapping) for row in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1].updated_at, rows[limit - 1].id) if len(rows) > limit else None
+    return SessionPage(sessions=sessions, next_cursor=next_cursor)
+
+
+@router.get("/sessions/{session_id}/messages", response_model=MessagePage)
+async def list_messages(
+    session_id: UUID,
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    sessions = db.query(DBSession).filter(DBSession.user_id == user_id).all()
-    return [SessionResponse.from_orm(s) for s in sessions]
+    """A session's messages, oldest first."""
+    session = (await db.execute(select(DBSession.id, DBSession.created_at, DBSession.archived_at).where(
+        (DBSession.id == session_id) & (DBSession.user_id == user_id)
+    ))).first()
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    if session.archived_at is not None:
+        await db.run_sync(restore_session, session_id)
+    
+    limit = _page_size(limit)
+    query = select(
+        Message.id, Message.session_id, Message.role, Message.content, Message.files_referenced,
+        Message.tools_used, Message.tokens_used, Message.created_at,
+    ).where((Message.session_id == session_id) & (Message.created_at >= session.created_at))
+    if cursor:
+        query = query.where(_keyset_after(Message.created_at, Message.id, cursor))
+    rows = (await db.execute(query.order_by(Message.created_at, Message.id).limit(limit + 1))).all()
+    
+    messages = [
+        MessageResponse(**dict(row._mapping, files_referenced=row.files_referenced or [], tools_used=row.tools_used or []))
+        for row in rows
+    ]
+    # Rows still in the write-behind journal join the same keyset order before the page is cut,
+    # so a page never exceeds ``limit`` and the cursor neither skips nor repeats them.
+    stored = {row.id for row in rows}
+    after = decode_cursor(cursor) if cursor else None
+    for record in message_journal.pending_messages(session.id):
+        row = message_row(record)
+        if row["id"] not in stored and (after is None or (row["created_at"], row["id"]) > after):
+            messages.append(MessageResponse(**row))
+    messages.sort(key=lambda m: (m.created_at, m.id))
+    
+    next_cursor = encode_cursor(messages[limit - 1].created_at, messages[limit - 1].id) if len(messages) > limit else None
+    return MessagePage(messages=messages[:limit], next_cursor=next_cursor)
+
+
+@router.get("/export")
+async def export_history(
+    gzip: bool = False,
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user),
+    sync_engine: Engine = Depends(get_sync_engine)
+):
+    """Every session and message of the user as NDJSON; resume with a checkpoint's ``cursor``."""
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if message_journal.enabled() and message_journal.pending_count():
+        await message_journal.flush()
+    
+    def chunks():
+        # Read from the primary: the flush above has not necessarily reached a replica yet.
+        with Session(bind=sync_engine) as export_db:
+            export = ChatHistoryExport(export_db, user_id, cursor)
+            yield from export.gzip() if gzip else export.ndjson()
+    
+    if gzip:
+        return StreamingResponse(
+            chunks(),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="chat-history.ndjson.gz"'},
+        )
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
@@ -1,21 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from typing import Optional
 from uuid import UUID
-from database import get_db
+import asyncio
+import json
+import logging
+import os
+from config import settings
+from database import get_db, get_read_db, get_sync_engine, SessionLocal
 from models import Repository, User
-from schemas import RepositoryCreate, RepositoryResponse, RepositorySearchRequest
+from schemas import RepositoryCreate, RepositoryResponse, RepositorySearchRequest, RepositoryGrepRequest, CodeSearchResult
+from indexing import RepositoryIndexer, SymbolGraph
+from indexing.minhash import minhash_registry
+from indexing.shards import get_index_db
+from indexing.snapshot import MEDIA_TYPE as SNAPSHOT_MEDIA_TYPE, SnapshotConflict, SnapshotError, SnapshotImporter, export_snapshot
+from services.grep import RepositoryGrep
+from services.model_selector import model_selector
+from services.retrieval_cache import retrieval_cache
+from services.search import CodeSearchService
+from services.warmup import warmer
 from utils.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1/repositories", tags=["repositories"])
 
 
+@asynccontextmanager
+async def _in_thread(context):
+    """Enter and exit a blocking context manager in a worker thread."""
+    entered = await asyncio.to_thread(context.__enter__)
+    try:
+        yield entered
+    except BaseException as e:
+        if not await asyncio.to_thread(context.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await asyncio.to_thread(context.__exit__, None, None, None)
+
+
+async def _owned_repository(db: AsyncSession, repo_id, user_id):
+    return await db.scalar(select(Repository).where(
+        (Repository.id == repo_id) & (Repository.user_id == user_id)
+    ))
+
+
 @router.post("/", response_model=RepositoryResponse)
 async def create_repository(
     repo_create: RepositoryCreate,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
@@ -29,8 +70,8 @@ async def create_repository(
     )
     
     db.add(db_repo)
-    db.commit()
-    db.refresh(db_repo)
+    await db.commit()
+    await db.refresh(db_repo)
     
     return RepositoryResponse.from_orm(db_repo)
 
@@ -39,11 +80,9 @@ async def create_repository(
 async def get_repository(
     repo_id: UUID,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    db_repo = db.query(Repository).filter(
-        (Repository.id == repo_id) & (Repository.user_id == user_id)
-    ).first()
+    db_repo = await _owned_repository(db, repo_id, user_id)
     
     if not db_repo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
@@ -54,26 +93,47 @@ async def get_repository(
 @router.get("/", response_model=list[RepositoryResponse])
 async def list_repositories(
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    repositories = db.query(Repository).filter(Repository.user_id == user_id).all()
+    repositories = (await db.scalars(select(Repository).where(Repository.user_id == user_id))).all()
     return [RepositoryResponse.from_orm(repo) for repo in repositories]
 
 
+def run_indexer(repo_id: UUID, repo_path: str, force_reindex: bool = False):
+    # A plain function, so Starlette runs it in its threadpool: walking, parsing and
+    # the index writes are synchronous and would otherwise hold the event loop.
+    db = SessionLocal()
+    try:
+        indexer = RepositoryIndexer(db, repo_id, repo_path)
+        result = asyncio.run(indexer.index_repository(force=force_reindex))
+        logger.info(
+            f"Indexed repository {repo_id}: {result['indexed_files']} indexed, "
+            f"{result['skipped_files']} unchanged, {result['removed_files']} removed"
+        )
+    except Exception as e:
+        logger.error(f"Indexing failed for repository {repo_id}: {e}")
+    finally:
+        db.close()
+
+
 @router.post("/{repo_id}/index")
 async def index_repository(
     repo_id: UUID,
+    background_tasks: BackgroundTasks,
     force_reindex: bool = False,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    db_repo = db.query(Repository).filter(
-        (Repository.id == repo_id) & (Repository.user_id == user_id)
-    ).first()
+    db_repo = await _owned_repository(db, repo_id, user_id)
     
     if not db_repo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
     
+    if not db_repo.local_path:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Repository has no local path")
+    
+    background_tasks.add_task(run_indexer, repo_id, db_repo.local_path, force_reindex)
+    
     return {
         "repo_id": str(repo_id),
         "indexing": True,
@@ -82,22 +142,287 @@ async def index_repository(
     }
 
 
+async def run_warmup(bind, repo_id: UUID, index_version: Optional[str], model: str):
+    if not warmer.claim(repo_id, index_version):
+        return
+    try:
+        await warmer.warm(bind, repo_id, model)
+    except Exception as e:
+        # A failed warm-up only means a cold first query.
+        logger.warning(f"Warm-up of repository {repo_id} failed: {e}")
+
+
+@router.post("/{repo_id}/warm", status_code=status.HTTP_202_ACCEPTED)
+async def warm_repository(
+    repo_id: UUID,
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    sync_engine: Engine = Depends(get_sync_engine)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    model = model_selector.get_code_model()
+    warming = warmer.due(repo_id, db_repo.index_version)
+    if warming:
+        background_tasks.add_task(run_warmup, sync_engine, repo_id, db_repo.index_version, model)
+    
+    return {
+        "repo_id": str(repo_id),
+        "warming": warming,
+        "model": model,
+    }
+
+
 @router.post("/{repo_id}/search")
 async def search_repository(
     repo_id: UUID,
     search_request: RepositorySearchRequest,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db),
+    index_db: Session = Depends(get_index_db)
 ):
-    db_repo = db.query(Repository).filter(
-        (Repository.id == repo_id) & (Repository.user_id == user_id)
-    ).first()
+    db_repo = await _owned_repository(db, repo_id, user_id)
     
     if not db_repo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
     
+    service = CodeSearchService(index_db)
+    limit = min(search_request.limit, 100)
+    filters = {
+        "entity_type": search_request.entity_type,
+        "language": search_request.language,
+        "path_prefix": search_request.path_prefix,
+    }
+    
+    async def search():
+        hits = await asyncio.to_thread(service.search, repo_id, search_request.query, limit=limit, **filters)
+        return [[str(hit.block.id), hit.score] for hit in hits]
+    
+    try:
+        ranked = await retrieval_cache.get_or_compute(
+            repo_id,
+            db_repo.index_version,
+            "search",
+            search_request.query,
+            dict(filters, limit=limit),
+            search,
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown entity type: {search_request.entity_type}"
+        )
+    
+    results = await asyncio.to_thread(_search_results, service, ranked)
+    
     return {
         "query": search_request.query,
-        "results": [],
-        "total": 0
+        "results": results,
+        "total": len(results)
+    }
+
+
+def _search_results(service: CodeSearchService, ranked: list) -> list[CodeSearchResult]:
+    scores = dict((block_id, score) for block_id, score in ranked)
+    return [
+        CodeSearchResult(
+            id=block.id,
+            file_path=block.file_path,
+            start_line=block.start_line,
+            end_line=block.end_line,
+            language=block.language,
+            entity_type=block.entity_type.value if block.entity_type else None,
+            entity_name=block.entity_name,
+            docstring=block.docstring,
+            score=scores[str(block.id)],
+        )
+        for block in service.get_blocks([block_id for block_id, _ in ranked])
+    ]
+
+
+@router.get("/{repo_id}/blocks/{block_id}/similar")
+async def get_similar_blocks(
+    repo_id: UUID,
+    block_id: UUID,
+    threshold: float = settings.DUPLICATE_THRESHOLD,
+    limit: int = 10,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    index_db: Session = Depends(get_index_db)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    def similar():
+        ranked = minhash_registry.get(repo_id).similar(block_id, threshold=threshold, limit=min(limit, 100))
+        return _search_results(CodeSearchService(index_db), ranked)
+    
+    results = await asyncio.to_thread(similar)
+    
+    return {
+        "block_id": str(block_id),
+        "results": results,
+        "total": len(results)
     }
+
+
+@router.get("/{repo_id}/duplicates")
+async def get_duplicate_clusters(
+    repo_id: UUID,
+    threshold: float = settings.DUPLICATE_THRESHOLD,
+    min_size: int = 2,
+    limit: int = 20,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    index_db: Session = Depends(get_index_db)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    def duplicates():
+        service = CodeSearchService(index_db)
+        clusters = minhash_registry.get(repo_id).clusters(threshold=threshold, min_size=min_size, limit=min(limit, 100))
+        return [
+            {
+                "similarity": cluster["similarity"],
+                "blocks": _search_results(service, [(block_id, cluster["similarity"]) for block_id in cluster["block_ids"]]),
+            }
+            for cluster in clusters
+        ]
+    
+    results = await asyncio.to_thread(duplicates)
+    
+    return {
+        "clusters": results,
+        "total": len(results)
+    }
+
+
+@router.post("/{repo_id}/grep")
+async def grep_repository(
+    repo_id: UUID,
+    grep_request: RepositoryGrepRequest,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    if not db_repo.local_path or not os.path.isdir(db_repo.local_path):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Repository has no local path")
+    
+    try:
+        grep = RepositoryGrep(
+            db_repo.local_path,
+            grep_request.pattern,
+            regex=grep_request.regex,
+            ignore_case=grep_request.ignore_case,
+            path_glob=grep_request.path_glob,
+            max_matches=min(grep_request.max_matches, settings.GREP_MAX_MATCHES),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    async def ndjson():
+        async for event in grep.stream():
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/{repo_id}/snapshot")
+async def export_repository_snapshot(
+    repo_id: UUID,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    sync_engine: Engine = Depends(get_sync_engine)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    if not db_repo.indexed:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Repository is not indexed")
+    
+    def chunks():
+        # Iterated in a worker thread, on a session that lives as long as the stream.
+        with Session(bind=sync_engine) as snapshot_db:
+            yield from export_snapshot(snapshot_db, repo_id)
+    
+    filename = f"{db_repo.name}-{db_repo.index_version or 'index'}.snapshot"
+    return StreamingResponse(
+        chunks(),
+        media_type=SNAPSHOT_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/{repo_id}/snapshot")
+async def import_repository_snapshot(
+    repo_id: UUID,
+    request: Request,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    sync_engine: Engine = Depends(get_sync_engine)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    try:
+        with Session(bind=sync_engine) as sync_db:
+            async with _in_thread(SnapshotImporter(sync_db, repo_id)) as importer:
+                async for chunk in request.stream():
+                    await asyncio.to_thread(importer.feed, chunk)
+                stats = await asyncio.to_thread(importer.finish)
+    except SnapshotConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    await db.refresh(db_repo)
+    return {"repo_id": str(repo_id), "index_version": db_repo.index_version, **stats}
+
+
+@router.get("/{repo_id}/graph/{symbol}")
+async def get_symbol_graph(
+    repo_id: UUID,
+    symbol: str,
+    depth: int = 1,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    index_db: Session = Depends(get_index_db)
+):
+    db_repo = await _owned_repository(db, repo_id, user_id)
+    
+    if not db_repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+    
+    def symbol_graph():
+        graph = SymbolGraph(index_db, repo_id)
+        return {
+            "symbol": symbol,
+            "callers": [
+                {"name": edge.source, "file_path": edge.file_path}
+                for edge in graph.callers(symbol)
+            ],
+            "dependencies": [
+                {"name": edge.target, "kind": edge.kind.value}
+                for edge in graph.dependencies(symbol)
+            ],
+            "neighborhood": graph.neighborhood([symbol], depth=min(depth, 3)),
+        }
+    
+    return await asyncio.to_thread(symbol_graph)
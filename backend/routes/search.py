@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+import asyncio
+import json
+from database import get_read_sync_db
+from models import Repository
+from models.code_index import EntityType
+from schemas import CrossRepositorySearchRequest
+from services.fanout import CrossRepositorySearch
+from utils.auth import get_current_user
+
+router = APIRouter(prefix="/api/v1/search", tags=["search"])
+
+
+@router.post("/")
+async def search_repositories(
+    search_request: CrossRepositorySearchRequest,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_read_sync_db)
+):
+    if search_request.entity_type:
+        try:
+            EntityType(search_request.entity_type.lower())
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown entity type: {search_request.entity_type}"
+            )
+    
+    query = db.query(Repository).filter(
+        (Repository.user_id == user_id) & Repository.indexed.is_(True)
+    )
+    if search_request.repository_ids:
+        query = query.filter(Repository.id.in_(search_request.repository_ids))
+    
+    search = CrossRepositorySearch(db, await asyncio.to_thread(query.all))
+    
+    async def ndjson():
+        async for event in search.stream(
+            search_request.query,
+            limit=min(search_request.limit, 100),
+            entity_type=search_request.entity_type,
+            language=search_request.language,
+            path_prefix=search_request.path_prefix,
+        ):
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
+from typing import Optional
+from database import get_read_db
+from models import UsageRollup
+from schemas import QuotaStatus, UsageDay, UsageReport
+from services.usage import usage_counter
+from utils.auth import get_current_user
+
+router = APIRouter(prefix="/api/v1/usage", tags=["usage"])
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+
+
+@router.get("/", response_model=UsageReport)
+async def get_usage(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    model: Optional[str] = None,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Daily token usage per model from the rollups, plus this month's quota."""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start is after end")
+    if (end - start).days >= MAX_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_DAYS} days per request")
+    
+    query = select(UsageRollup).where(
+        (UsageRollup.user_id == user_id) & (UsageRollup.day >= start) & (UsageRollup.day <= end)
+    )
+    if model:
+        query = query.where(UsageRollup.model == model)
+    days = [UsageDay.model_validate(row) for row in await db.scalars(query.order_by(UsageRollup.day, UsageRollup.model))]
+    
+    quota = await usage_counter.get(db, user_id)
+    return UsageReport(
+        start=start,
+        end=end,
+        tokens_used=sum(day.tokens_used for day in days),
+        message_count=sum(day.message_count for day in days),
+        days=days,
+        quota=QuotaStatus(
+            tier=quota.tier,
+            period_start=quota.period_start,
+            tokens_used=quota.tokens_used,
+            limit=quota.limit or None,
+            remaining=quota.remaining,
+        ),
+    )
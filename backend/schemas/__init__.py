@@ -1,7 +1,8 @@
 from .user import UserCreate, UserResponse, UserLogin, TokenResponse
-from .repository import RepositoryCreate, RepositoryResponse, RepositorySearchRequest
-from .session import SessionCreate, SessionResponse, ChatRequest, ChatResponse
-from .message import MessageResponse
+from .repository import RepositoryCreate, RepositoryResponse, RepositorySearchRequest, CrossRepositorySearchRequest, RepositoryGrepRequest, CodeSearchResult
+from .session import SessionCreate, SessionResponse, SessionSummary, SessionPage, ChatRequest, ChatResponse
+from .message import MessageResponse, MessagePage
+from .usage import UsageDay, QuotaStatus, UsageReport
 
 __all__ = [
     "UserCreate",
@@ -11,9 +12,18 @@ __all__ = [
     "RepositoryCreate",
     "RepositoryResponse",
     "RepositorySearchRequest",
+    "CrossRepositorySearchRequest",
+    "RepositoryGrepRequest",
+    "CodeSearchResult",
     "SessionCreate",
     "SessionResponse",
+    "SessionSummary",
+    "SessionPage",
     "ChatRequest",
     "ChatResponse",
     "MessageResponse",
+    "MessagePage",
+    "UsageDay",
+    "QuotaStatus",
+    "UsageReport",
 ]
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, field_serializer
+from typing import List, Optional
 from uuid import UUID
+from datetime import datetime
 
 
 class MessageResponse(BaseModel):
@@ -11,7 +12,16 @@ class MessageResponse(BaseModel):
     files_referenced: List[str]
     tools_used: List[str]
     tokens_used: int
-    created_at: str
+    created_at: datetime
+    
+    @field_serializer('created_at')
+    def serialize_timestamps(self, value: datetime):
+        return value.isoformat() if isinstance(value, datetime) else value
     
     class Config:
         from_attributes = True
+
+
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]
+    next_cursor: Optional[str] = None
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_serializer
+from typing import List, Optional
 from uuid import UUID
+from datetime import datetime
 
 
 class RepositoryCreate(BaseModel):
@@ -19,8 +20,12 @@ class RepositoryResponse(BaseModel):
     language: Optional[str] = None
     indexed: bool
     index_version: Optional[str] = None
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
+    
+    @field_serializer('created_at', 'updated_at')
+    def serialize_timestamps(self, value: datetime):
+        return value.isoformat() if isinstance(value, datetime) else value
     
     class Config:
         from_attributes = True
@@ -29,4 +34,35 @@ class RepositoryResponse(BaseModel):
 class RepositorySearchRequest(BaseModel):
     query: str
     entity_type: Optional[str] = None
+    language: Optional[str] = None
+    path_prefix: Optional[str] = None
     limit: int = 10
+
+
+class CrossRepositorySearchRequest(BaseModel):
+    query: str
+    repository_ids: Optional[List[UUID]] = None
+    entity_type: Optional[str] = None
+    language: Optional[str] = None
+    path_prefix: Optional[str] = None
+    limit: int = 20
+
+
+class RepositoryGrepRequest(BaseModel):
+    pattern: str
+    regex: bool = True
+    ignore_case: bool = False
+    path_glob: Optional[str] = None
+    max_matches: int = 200
+
+
+class CodeSearchResult(BaseModel):
+    id: UUID
+    file_path: str
+    start_line: int
+    end_line: int
+    language: str
+    entity_type: Optional[str] = None
+    entity_name: Optional[str] = None
+    docstring: Optional[str] = None
+    score: float
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_serializer
 from typing import Optional, List
 from uuid import UUID
+from datetime import datetime
 
 
 class SessionCreate(BaseModel):
@@ -11,16 +12,31 @@ class SessionCreate(BaseModel):
 
 class SessionResponse(BaseModel):
     id: UUID
-    repository_id: UUID
+    repository_id: Optional[UUID] = None
     agent_type: str
     model: str
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
+    
+    @field_serializer('created_at', 'updated_at')
+    def serialize_timestamps(self, value: datetime):
+        return value.isoformat() if isinstance(value, datetime) else value
     
     class Config:
         from_attributes = True
 
 
+class SessionSummary(SessionResponse):
+    """A session for listings: counts and a title preview instead of message bodies."""
+    title: Optional[str] = None
+    message_count: int = 0
+
+
+class SessionPage(BaseModel):
+    sessions: List[SessionSummary]
+    next_cursor: Optional[str] = None
+
+
 class ChatRequest(BaseModel):
     session_id: Optional[UUID] = None
     repository_id: Optional[UUID] = None
@@ -28,6 +44,8 @@ class ChatRequest(BaseModel):
     message: str
     files: Optional[List[str]] = None
     model: Optional[str] = None
+    # Let the agent call repository tools (search, grep, files, symbols) before answering.
+    tools: bool = False
 
 
 class ChatResponse(BaseModel):
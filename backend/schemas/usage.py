@@ -0,0 +1,30 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+
+
+class UsageDay(BaseModel):
+    day: date
+    model: str
+    tokens_used: int
+    message_count: int
+    
+    class Config:
+        from_attributes = True
+
+
+class QuotaStatus(BaseModel):
+    tier: str
+    period_start: date
+    tokens_used: int
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+
+
+class UsageReport(BaseModel):
+    start: date
+    end: date
+    tokens_used: int
+    message_count: int
+    days: List[UsageDay]
+    quota: QuotaStatus
@@ -0,0 +1,170 @@
+"""
+Memoized agent operations.
+
+``explain_code``, ``refactor_code`` and ``debug_code`` are often asked about
+the same snippet again, for example the same file in a new session. Their
+answers are stored under ``(operation, model, prompt template version, code
+hash, index version)``. The code hash covers every input of the operation,
+and the index version covers the repository context retrieved for the
+prompt. Bumping an operation's template version retires its old answers.
+
+Entries are fresh for ``AGENT_MEMO_TTL_SECONDS``. After that they may still
+be served for ``AGENT_MEMO_STALE_SECONDS`` more when the caller asks for
+stale-while-revalidate: the stored answer is returned at once and a single
+background task recomputes it. The request that served it may be gone by
+then, so the refresh uses a separate ``refresh`` callable that doesn't
+borrow the request's database session. Otherwise, or without one, stale
+entries are recomputed inline. The store is an in-process LRU capped at ``AGENT_MEMO_SIZE`` entries,
+and concurrent misses for one key share a single computation.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Set
+
+from config import settings
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MemoKey(NamedTuple):
+    operation: str
+    model: str
+    template_version: int
+    code_hash: str
+    index_version: Optional[str]
+
+
+@dataclass
+class MemoResult:
+    value: str
+    cached: bool
+    stale: bool = False
+    age_seconds: float = 0.0
+
+
+def code_hash(*inputs: str) -> str:
+    """Hash of an operation's inputs; trailing whitespace and line endings don't matter."""
+    digest = hashlib.sha256()
+    for text in inputs:
+        normalized = "\n".join(line.rstrip() for line in (text or "").strip().splitlines())
+        digest.update(normalized.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class AgentResultStore:
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        stale_seconds: Optional[float] = None,
+    ):
+        self.max_entries = max_entries or settings.AGENT_MEMO_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.AGENT_MEMO_TTL_SECONDS
+        self.stale_seconds = stale_seconds if stale_seconds is not None else settings.AGENT_MEMO_STALE_SECONDS
+        self._entries: "OrderedDict[MemoKey, tuple]" = OrderedDict()
+        self._inflight: Dict[MemoKey, asyncio.Future] = {}
+        self._refreshing: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    def peek(self, key: MemoKey) -> Optional[MemoResult]:
+        """The stored result for ``key`` (fresh or within the stale window), without computing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age >= self.ttl_seconds + self.stale_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return MemoResult(value=value, cached=True, stale=age >= self.ttl_seconds, age_seconds=round(age, 3))
+
+    async def get_or_compute(
+        self,
+        key: MemoKey,
+        compute: Callable[[], Awaitable[str]],
+        revalidate: bool = False,
+        refresh: Optional[Callable[[], Awaitable[str]]] = None,
+    ) -> MemoResult:
+        """Return the stored result for ``key``, computing it on a miss.
+
+        A stale entry is returned as is when ``revalidate`` is set and a
+        ``refresh`` is given to recompute it in the background; otherwise it
+        is recomputed before returning. ``refresh`` must not use anything
+        scoped to the current request, such as its database session.
+        """
+        cached = self.peek(key)
+        if cached and not cached.stale:
+            metrics.increment("agent_memo.hits")
+            return cached
+        if cached and revalidate and refresh is not None:
+            metrics.increment("agent_memo.stale_hits")
+            self._refresh(key, refresh)
+            return cached
+
+        metrics.increment("agent_memo.misses")
+        return MemoResult(value=await self._compute(key, compute), cached=False)
+
+    def invalidate(self, operation: Optional[str] = None):
+        with self._lock:
+            if operation is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.operation == operation]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _compute(self, key: MemoKey, compute: Callable[[], Awaitable[str]]) -> str:
+        # Every caller, the one that started it included, waits through a shield,
+        # so one caller being cancelled never cancels the computation for the others.
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: MemoKey, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result():
+            self._store(key, task.result())
+
+    def _refresh(self, key: MemoKey, compute: Callable[[], Awaitable[str]]):
+        if key in self._inflight:
+            return
+
+        async def refresh():
+            try:
+                await self._compute(key, compute)
+                metrics.increment("agent_memo.refreshed")
+            except Exception as e:
+                logger.warning(f"Background refresh of {key.operation} failed: {e}")
+
+        task = asyncio.create_task(refresh())
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    def _store(self, key: MemoKey, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("agent_memo.evictions")
+
+
+agent_memo = AgentResultStore()
+metrics.register_gauge("agent_memo.entries", lambda: len(agent_memo))
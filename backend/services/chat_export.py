@@ -0,0 +1,153 @@
+"""
+Streaming export of a user's chat history as NDJSON.
+
+Sessions are exported oldest first, each followed by its messages and a
+``checkpoint`` line with the session's totals and a resume cursor::
+
+    {"type": "session", "id": ..., "model": ..., "created_at": ...}
+    {"type": "message", "id": ..., "role": "user", "content": ..., "tokens_used": ...}
+    {"type": "checkpoint", "session_id": ..., "messages": 2, "tokens_used": 130, "cursor": "..."}
+    {"type": "end", "sessions": 1, "messages": 2, "tokens_used": 130}
+
+Everything comes from one query over sessions outer-joined to messages. It
+runs on a server-side cursor and fetches ``CHAT_EXPORT_BATCH_SIZE`` rows at a
+time, so memory stays flat however long the history is. An interrupted
+download resumes by passing the last checkpoint's cursor. It then restarts
+at the session after it, so a partially received session is sent again in
+full. Archived sessions are read from their archive rows without being
+restored.
+"""
+
+import json
+import zlib
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Message, MessageArchive, Session as DBSession
+from services.compaction import decode_messages
+from utils.pagination import encode_cursor, keyset_after
+
+CHUNK_BYTES = 64 * 1024
+
+SESSION_COLUMNS = [
+    DBSession.id, DBSession.repository_id, DBSession.agent_type, DBSession.model,
+    DBSession.created_at, DBSession.updated_at, DBSession.archived_at,
+]
+MESSAGE_COLUMNS = [
+    Message.id, Message.role, Message.content, Message.files_referenced, Message.tools_used,
+    Message.tokens_used, Message.msg_metadata, Message.created_at,
+]
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+def session_line(row) -> Dict:
+    return {
+        "type": "session",
+        "id": str(row.id),
+        "repository_id": str(row.repository_id) if row.repository_id else None,
+        "agent_type": _value(row.agent_type),
+        "model": row.model,
+        "created_at": row.created_at.isoformat(),
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "archived": row.archived_at is not None,
+    }
+
+
+def message_line(message: Dict) -> Dict:
+    return {
+        "type": "message",
+        "id": str(message["id"]),
+        "role": _value(message["role"]),
+        "content": message["content"],
+        "files_referenced": message["files_referenced"] or [],
+        "tools_used": message["tools_used"] or [],
+        "tokens_used": message["tokens_used"] or 0,
+        "metadata": message["msg_metadata"] or {},
+        "created_at": message["created_at"].isoformat(),
+    }
+
+
+class ChatHistoryExport:
+    def __init__(self, db: Session, user_id, cursor: Optional[str] = None, batch_size: Optional[int] = None):
+        self.db = db
+        self.user_id = user_id
+        self.cursor = cursor
+        self.batch_size = batch_size or settings.CHAT_EXPORT_BATCH_SIZE
+        self.totals = {"sessions": 0, "messages": 0, "tokens_used": 0}
+
+    def lines(self) -> Iterator[Dict]:
+        query = select(*SESSION_COLUMNS, *[column.label(f"message_{column.key}") for column in MESSAGE_COLUMNS]).outerjoin(
+            Message, (Message.session_id == DBSession.id) & (Message.created_at >= DBSession.created_at)
+        ).where(DBSession.user_id == self.user_id)
+        if self.cursor:
+            query = query.where(keyset_after(DBSession.created_at, DBSession.id, self.cursor))
+        query = query.order_by(DBSession.created_at, DBSession.id, Message.created_at, Message.id)
+
+        result = self.db.execute(query.execution_options(stream_results=True, yield_per=self.batch_size))
+        current, counts = None, None
+        for row in result:
+            if current is None or row.id != current.id:
+                if current is not None:
+                    yield self._checkpoint(current, counts)
+                current, counts = row, {"messages": 0, "tokens_used": 0}
+                yield session_line(row)
+                if row.archived_at is not None:
+                    yield from self._archived(row, counts)
+            if row.message_id is not None:
+                yield self._count(counts, message_line({
+                    column.key: getattr(row, f"message_{column.key}") for column in MESSAGE_COLUMNS
+                }))
+        if current is not None:
+            yield self._checkpoint(current, counts)
+        yield {"type": "end", **self.totals}
+
+    def ndjson(self) -> Iterator[bytes]:
+        """The export as NDJSON, in chunks of roughly ``CHUNK_BYTES``."""
+        buffer = []
+        size = 0
+        for line in self.lines():
+            encoded = (json.dumps(line) + "\n").encode("utf-8")
+            buffer.append(encoded)
+            size += len(encoded)
+            if size >= CHUNK_BYTES:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b"".join(buffer)
+
+    def gzip(self) -> Iterator[bytes]:
+        compressor = zlib.compressobj(settings.CHAT_EXPORT_COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        for chunk in self.ndjson():
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def _archived(self, session, counts: Dict) -> Iterator[Dict]:
+        # Archived rows predate any message written since, so they come first.
+        payload = self.db.scalar(select(MessageArchive.payload).where(MessageArchive.session_id == session.id))
+        archived = decode_messages(zlib.decompress(payload)) if payload else []
+        for message in sorted(archived, key=lambda message: (message["created_at"], message["id"])):
+            yield self._count(counts, message_line(message))
+
+    def _checkpoint(self, session, counts: Dict) -> Dict:
+        self.totals["sessions"] += 1
+        return {
+            "type": "checkpoint",
+            "session_id": str(session.id),
+            **counts,
+            "cursor": encode_cursor(session.created_at, session.id),
+        }
+
+    def _count(self, counts: Dict, line: Dict) -> Dict:
+        counts["messages"] += 1
+        counts["tokens_used"] += line["tokens_used"]
+        self.totals["messages"] += 1
+        self.totals["tokens_used"] += line["tokens_used"]
+        return line
@@ -0,0 +1,236 @@
+"""
+Cold-archive compaction of idle chat sessions.
+
+Messages of sessions idle for ``MESSAGE_ARCHIVE_IDLE_DAYS`` are moved out of
+``messages`` into one ``message_archives`` row per session. That row holds a
+zlib-compressed JSON payload. ``sessions.archived_at`` marks the move. The
+chat routes call ``restore_session`` when an archived session is opened. It
+puts the rows back, so callers never see the difference.
+
+On Postgres ``messages`` is partitioned by month (migration 008). Each run
+also creates the partitions for the coming months. It drops old monthly
+partitions that compaction has emptied, which returns their space to the
+filesystem instead of leaving dead tuples for autovacuum. Restored rows
+whose month has been dropped land in the default partition.
+
+Run it periodically, e.g. from cron::
+
+    python -m services.compaction --idle-days 30
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Message, MessageArchive, Session as DBSession
+from models.message import MessageRole
+from services.metrics import metrics
+from utils.rowcodec import column_decoder, encode_value
+
+logger = logging.getLogger(__name__)
+
+MESSAGES = Message.__table__
+PARTITION_NAME = re.compile(r"^messages_p(\d{4})_(\d{2})$")
+TITLE_CHARS = 80
+
+
+def _next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def encode_messages(rows) -> bytes:
+    columns = [column.name for column in MESSAGES.columns]
+    payload = {"columns": columns, "rows": [[encode_value(row._mapping[name]) for name in columns] for row in rows]}
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def decode_messages(raw: bytes) -> List[Dict]:
+    payload = json.loads(raw)
+    known = [(i, name, column_decoder(MESSAGES.c[name])) for i, name in enumerate(payload["columns"]) if name in MESSAGES.c]
+    return [{name: decode(row[i]) for i, name, decode in known} for row in payload["rows"]]
+
+
+def partitioned_months(db: Session) -> Optional[List[datetime]]:
+    """Months with their own ``messages`` partition, or ``None`` when the table isn't partitioned."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    names = db.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'messages'"
+    )).scalars().all()
+    if not names:
+        return None
+    return sorted(
+        datetime(int(match.group(1)), int(match.group(2)), 1)
+        for match in map(PARTITION_NAME.match, names) if match
+    )
+
+
+def ensure_partitions(db: Session, months_ahead: Optional[int] = None) -> List[str]:
+    """Create the monthly ``messages`` partitions up to ``months_ahead`` from now."""
+    months = partitioned_months(db)
+    if months is None:
+        return []
+    months_ahead = settings.MESSAGE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    month, created = _month_start(datetime.utcnow()), []
+    for _ in range(months_ahead + 1):
+        if month not in months:
+            name = f"messages_p{month:%Y_%m}"
+            try:
+                with db.begin_nested():
+                    db.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF messages "
+                        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+                    ))
+                created.append(name)
+            except SQLAlchemyError as e:
+                # The default partition already holds rows for that month.
+                logger.warning(f"Could not create partition {name}: {e}")
+        month = _next_month(month)
+    db.commit()
+    return created
+
+
+def drop_empty_partitions(db: Session, before: datetime) -> List[str]:
+    """Drop monthly partitions that end before ``before`` and hold no rows."""
+    dropped = []
+    for month in partitioned_months(db) or []:
+        if _next_month(month) > before:
+            continue
+        name = f"messages_p{month:%Y_%m}"
+        if db.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is None:
+            db.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    db.commit()
+    return dropped
+
+
+def restore_session(db: Session, session_id) -> int:
+    """Move an archived session's messages back into ``messages``; returns how many."""
+    # Deleting the archive row claims it, so concurrent restores can't both insert.
+    raw = db.scalar(delete(MessageArchive).where(MessageArchive.session_id == session_id).returning(MessageArchive.payload))
+    db.execute(update(DBSession).where(DBSession.id == session_id).values(archived_at=None, updated_at=DBSession.updated_at))
+    if raw is None:
+        db.commit()
+        return 0
+    rows = decode_messages(zlib.decompress(raw))
+    if rows:
+        db.execute(insert(Message), rows)
+    db.commit()
+    metrics.increment("compaction.restored_sessions")
+    logger.info(f"Restored {len(rows)} archived messages of session {session_id}")
+    return len(rows)
+
+
+class MessageCompactor:
+    def __init__(self, db: Session, idle_days: Optional[int] = None, batch_size: Optional[int] = None, level: Optional[int] = None):
+        self.db = db
+        self.idle_days = settings.MESSAGE_ARCHIVE_IDLE_DAYS if idle_days is None else idle_days
+        self.batch_size = batch_size or settings.MESSAGE_ARCHIVE_BATCH_SIZE
+        self.level = settings.MESSAGE_ARCHIVE_COMPRESSION_LEVEL if level is None else level
+        self.stats = {
+            "sessions": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0,
+            "partitions_created": [], "partitions_dropped": [],
+        }
+
+    def run(self) -> Dict:
+        """Archive every idle session, then maintain partitions. Returns what was saved."""
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days)
+        self.stats["partitions_created"] = ensure_partitions(self.db)
+
+        while True:
+            sessions = self.db.scalars(
+                select(DBSession).where(
+                    (DBSession.updated_at < cutoff) & DBSession.archived_at.is_(None)
+                ).order_by(DBSession.updated_at).limit(self.batch_size)
+            ).all()
+            if not sessions:
+                break
+            for session in sessions:
+                self._archive(session)
+            self.db.commit()
+
+        self.stats["partitions_dropped"] = drop_empty_partitions(self.db, _month_start(cutoff))
+        self.stats["bytes_saved"] = self.stats["raw_bytes"] - self.stats["compressed_bytes"]
+        metrics.increment("compaction.archived_sessions", self.stats["sessions"])
+        metrics.increment("compaction.archived_messages", self.stats["messages"])
+        metrics.increment("compaction.bytes_saved", self.stats["bytes_saved"])
+        logger.info(
+            f"Compaction archived {self.stats['messages']} messages of {self.stats['sessions']} sessions: "
+            f"{self.stats['raw_bytes']} -> {self.stats['compressed_bytes']} bytes, "
+            f"{len(self.stats['partitions_dropped'])} partitions dropped"
+        )
+        return self.stats
+
+    def _archive(self, session: DBSession):
+        # The lower bound lets Postgres skip partitions older than the session.
+        rows = self.db.execute(
+            select(MESSAGES).where(
+                (MESSAGES.c.session_id == session.id) & (MESSAGES.c.created_at >= session.created_at)
+            ).order_by(MESSAGES.c.created_at)
+        ).all()
+        # Archiving is not activity: keep updated_at, which orders the session list.
+        self.db.execute(update(DBSession).where(DBSession.id == session.id).values(
+            archived_at=datetime.utcnow(), updated_at=DBSession.updated_at,
+        ))
+        if not rows:
+            return
+        raw = encode_messages(rows)
+        payload = zlib.compress(raw, self.level)
+        title = next((row.content[:TITLE_CHARS] for row in rows if row.role == MessageRole.USER), None)
+        self.db.add(MessageArchive(
+            session_id=session.id,
+            message_count=len(rows),
+            title=title,
+            raw_bytes=len(raw),
+            compressed_bytes=len(payload),
+            payload=payload,
+        ))
+        # Only the archived rows: a message written meanwhile stays live and is kept on restore.
+        self.db.execute(delete(Message).where(Message.id.in_([row.id for row in rows])))
+        self.stats["sessions"] += 1
+        self.stats["messages"] += len(rows)
+        self.stats["raw_bytes"] += len(raw)
+        self.stats["compressed_bytes"] += len(payload)
+
+
+def restore_all(db: Session) -> int:
+    restored = 0
+    for session_id in db.scalars(select(MessageArchive.session_id)).all():
+        restored += restore_session(db, session_id)
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle chat sessions and maintain message partitions.")
+    parser.add_argument("--idle-days", type=int, default=None)
+    parser.add_argument("--restore-all", action="store_true", help="restore every archived session instead")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    with SessionLocal() as db:
+        if args.restore_all:
+            print(f"Restored {restore_all(db)} messages")
+            return
+        stats = MessageCompactor(db, idle_days=args.idle_days).run()
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Search fan-out across all of a user's indexed repositories.
+
+Each repository is searched on its own worker thread and database session,
+bounded by a concurrency limit and a per-repository timeout, so one huge
+or slow repository only drops out of the answer instead of stalling it.
+Hits are merged into a global top-k min-heap as each repository finishes,
+and every completion is reported as it happens so callers can stream
+partial results.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from indexing.shards import index_session
+from models import Repository
+from services.retrieval_cache import retrieval_cache
+from services.search import CodeSearchService
+
+
+class RepositoryRef(NamedTuple):
+    """Detached view of a repository that worker threads can read safely."""
+    id: object
+    name: str
+    index_version: Optional[str]
+
+
+def describe_block(block, score: float, repo: RepositoryRef) -> Dict:
+    return {
+        "id": str(block.id),
+        "repository_id": str(repo.id),
+        "repository_name": repo.name,
+        "file_path": block.file_path,
+        "start_line": block.start_line,
+        "end_line": block.end_line,
+        "language": block.language,
+        "entity_type": block.entity_type.value if block.entity_type else None,
+        "entity_name": block.entity_name,
+        "docstring": block.docstring,
+        "score": score,
+    }
+
+
+class CrossRepositorySearch:
+    def __init__(
+        self,
+        db: Session,
+        repositories: List[Repository],
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.bind = db.get_bind()
+        self.repositories = [RepositoryRef(repo.id, repo.name, repo.index_version) for repo in repositories]
+        self.timeout = timeout or settings.SEARCH_FANOUT_TIMEOUT_SECONDS
+        self.concurrency = concurrency or settings.SEARCH_FANOUT_CONCURRENCY
+
+    async def stream(
+        self,
+        query: str,
+        limit: int = 20,
+        entity_type: Optional[str] = None,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> AsyncIterator[Dict]:
+        """Yield one ``repository`` event per repository, then the merged ``results``."""
+        # Same filter shape as the single-repository search endpoint, so both
+        # share retrieval cache entries.
+        filters = {"entity_type": entity_type, "language": language, "path_prefix": path_prefix}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        heap: List[tuple] = []
+        tiebreak = itertools.count()
+        timed_out = []
+
+        async def run(repo):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    hits = await asyncio.wait_for(self._search(repo, query, limit, filters), self.timeout)
+                    status, error = "ok", None
+                except asyncio.TimeoutError:
+                    hits, status, error = [], "timeout", None
+                except Exception as e:
+                    hits, status, error = [], "error", str(e)
+                return repo, hits, status, error, (time.perf_counter() - started) * 1000
+
+        tasks = [asyncio.ensure_future(run(repo)) for repo in self.repositories]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                repo, hits, status, error, took_ms = await next_done
+                if status == "timeout":
+                    timed_out.append(str(repo.id))
+
+                accepted = []
+                for hit in hits:
+                    entry = (hit["score"], next(tiebreak), hit)
+                    if len(heap) < limit:
+                        heapq.heappush(heap, entry)
+                    elif entry[0] > heap[0][0]:
+                        heapq.heapreplace(heap, entry)
+                    else:
+                        continue
+                    accepted.append(hit)
+
+                event = {
+                    "type": "repository",
+                    "repository_id": str(repo.id),
+                    "repository_name": repo.name,
+                    "status": status,
+                    "took_ms": round(took_ms, 1),
+                    "hits": len(hits),
+                    "results": accepted,
+                }
+                if error:
+                    event["error"] = error
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        results = [hit for _, _, hit in sorted(heap, key=lambda entry: (-entry[0], entry[1]))]
+        yield {
+            "type": "results",
+            "results": results,
+            "total": len(results),
+            "repositories": len(self.repositories),
+            "timed_out": timed_out,
+        }
+
+    async def _search(self, repo: RepositoryRef, query: str, limit: int, filters: Dict) -> List[Dict]:
+        ranked = await retrieval_cache.get_or_compute(
+            repo.id,
+            repo.index_version,
+            "search",
+            query,
+            dict(filters, limit=limit),
+            lambda: asyncio.to_thread(self._ranked, repo.id, query, limit, filters),
+        )
+        return await asyncio.to_thread(self._describe, repo, ranked)
+
+    def _ranked(self, repo_id, query: str, limit: int, filters: Dict) -> List[list]:
+        with Session(bind=self.bind) as db, index_session(db, repo_id) as index_db:
+            hits = CodeSearchService(index_db).search(repo_id, query, limit=limit, **filters)
+            return [[str(hit.block.id), hit.score] for hit in hits]
+
+    def _describe(self, repo: RepositoryRef, ranked: List[list]) -> List[Dict]:
+        if not ranked:
+            return []
+        with Session(bind=self.bind) as db, index_session(db, repo.id) as index_db:
+            scores = dict((block_id, score) for block_id, score in ranked)
+            blocks = CodeSearchService(index_db).get_blocks([block_id for block_id, _ in ranked])
+            return [describe_block(block, scores[str(block.id)], repo) for block in blocks]
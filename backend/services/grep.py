@@ -0,0 +1,269 @@
+"""
+Exact-match (literal or regex) search over a repository checkout.
+
+Files are scanned in batches on a process pool so large trees use every
+core instead of contending for the GIL. Each file is memory-mapped and
+rejected cheaply before any regex work when it looks binary (a NUL byte in
+its first few KB, as git and grep do) or when it lacks the longest literal
+run the pattern requires. Matches are yielded batch by batch as workers
+finish, so callers can stream them while the rest of the tree is scanned.
+"""
+
+import asyncio
+import fnmatch
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SKIP_DIRS = {"__pycache__", "node_modules"}
+BINARY_SNIFF_BYTES = 8192
+BATCH_BYTES = 4 * 1024 * 1024
+BATCH_FILES = 256
+MAX_LINE_CHARS = 500
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.GREP_WORKERS or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def required_literal(pattern: str, flags: int = 0) -> Optional[bytes]:
+    """Longest run of literal characters every match of ``pattern`` contains.
+
+    Only top-level literals count; anything under alternation, repetition or
+    a group is ignored, which keeps the prefilter conservative. Returns
+    ``None`` when there is no usable literal, or for case-insensitive
+    patterns (including an inline ``(?i)``), where a byte-level ``find``
+    would miss matches.
+    """
+    if flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+    state = getattr(parsed, "state", None) or parsed.pattern  # ``pattern`` before Python 3.11
+    if state.flags & re.IGNORECASE:
+        return None
+
+    best, run = "", []
+    for op, arg in list(parsed) + [(None, None)]:
+        if op is sre_constants.LITERAL:
+            run.append(chr(arg))
+            continue
+        if len("".join(run)) > len(best):
+            best = "".join(run)
+        run = []
+    return best.encode("utf-8") if best else None
+
+
+def compile_pattern(pattern: str, regex: bool = True, ignore_case: bool = False) -> Tuple[re.Pattern, Optional[bytes]]:
+    """Compile a user pattern to a bytes regex, raising ``ValueError`` if invalid."""
+    source = pattern if regex else re.escape(pattern)
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    try:
+        compiled = re.compile(source.encode("utf-8"), flags)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern: {e}")
+    return compiled, required_literal(source, flags)
+
+
+def scan_file(path: str, compiled: re.Pattern, literal: Optional[bytes], limit: int) -> List[Dict]:
+    """Return up to ``limit`` matching lines of one file (at most one per line)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if b"\0" in mm[:BINARY_SNIFF_BYTES]:
+                return []
+            if literal is not None and mm.find(literal) == -1:
+                return []
+
+            matches = []
+            pos, line_number, counted = 0, 1, 0
+            while len(matches) < limit and pos <= size:
+                match = compiled.search(mm, pos)
+                if match is None:
+                    break
+                line_start = mm.rfind(b"\n", 0, match.start()) + 1
+                line_end = mm.find(b"\n", match.end())
+                if line_end == -1:
+                    line_end = size
+                line_number += mm[counted:line_start].count(b"\n")
+                counted = line_start
+                text = mm[line_start:line_end].decode("utf-8", errors="replace").rstrip("\r")
+                matches.append({
+                    "line": line_number,
+                    "column": match.start() - line_start + 1,
+                    "text": text[:MAX_LINE_CHARS],
+                })
+                pos = line_end + 1
+            return matches
+
+
+def scan_batch(root: str, files: List[str], pattern: bytes, flags: int, literal: Optional[bytes], limit: int):
+    """Worker entry point: scan ``files`` and return ``(matches, bytes, files)``."""
+    compiled = re.compile(pattern, flags)
+    matches, scanned_bytes = [], 0
+    for relative_path in files:
+        if len(matches) >= limit:
+            break
+        path = os.path.join(root, relative_path)
+        try:
+            scanned_bytes += os.path.getsize(path)
+            for match in scan_file(path, compiled, literal, limit - len(matches)):
+                match["path"] = relative_path
+                matches.append(match)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Skipping {relative_path}: {e}")
+    return matches, scanned_bytes, len(files)
+
+
+@dataclass
+class GrepSummary:
+    files_scanned: int = 0
+    bytes_scanned: int = 0
+    matches: int = 0
+    truncated: bool = False
+    reason: Optional[str] = None
+
+
+class RepositoryGrep:
+    def __init__(
+        self,
+        root: str,
+        pattern: str,
+        regex: bool = True,
+        ignore_case: bool = False,
+        path_glob: Optional[str] = None,
+        max_matches: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        self.root = os.path.realpath(root)
+        self.compiled, self.literal = compile_pattern(pattern, regex, ignore_case)
+        self.path_glob = path_glob
+        self.max_matches = max_matches or settings.GREP_MAX_MATCHES
+        self.max_bytes = max_bytes or settings.GREP_MAX_BYTES
+        self.workers = workers or settings.GREP_WORKERS or os.cpu_count()
+
+    def iter_files(self):
+        """Yield ``(relative_path, size)`` for candidate text files under the root."""
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d not in SKIP_DIRS)
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                relative_path = os.path.relpath(path, self.root)
+                if self.path_glob and not fnmatch.fnmatch(relative_path, self.path_glob):
+                    continue
+                if os.path.islink(path):
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                if 0 < size <= settings.GREP_MAX_FILE_BYTES:
+                    yield relative_path, size
+
+    def iter_batches(self, summary: GrepSummary):
+        batch, batch_bytes, scheduled = [], 0, 0
+        for relative_path, size in self.iter_files():
+            if scheduled + size > self.max_bytes:
+                summary.truncated, summary.reason = True, "max_bytes"
+                break
+            batch.append(relative_path)
+            batch_bytes += size
+            scheduled += size
+            if batch_bytes >= BATCH_BYTES or len(batch) >= BATCH_FILES:
+                yield batch
+                batch, batch_bytes = [], 0
+        if batch:
+            yield batch
+
+    async def stream(self, timeout: Optional[float] = None) -> AsyncIterator[Dict]:
+        """Yield ``{"type": "match", ...}`` events, then one ``{"type": "summary", ...}``."""
+        summary = GrepSummary()
+        deadline = time.monotonic() + (timeout or settings.GREP_TIMEOUT_SECONDS)
+        loop = asyncio.get_running_loop()
+        executor = get_executor() if self.workers > 1 else None
+        batches = self.iter_batches(summary)
+        pending = set()
+
+        def submit(batch):
+            args = (
+                self.root, batch, self.compiled.pattern, self.compiled.flags,
+                self.literal, self.max_matches - summary.matches,
+            )
+            return loop.run_in_executor(executor, scan_batch, *args)
+
+        async def fill():
+            # Walking the tree stats every file, so batches are pulled off the event loop.
+            while len(pending) < self.workers * 2:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                pending.add(submit(batch))
+
+        try:
+            await fill()
+            while pending:
+                remaining = deadline - time.monotonic()
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    summary.truncated, summary.reason = True, "timeout"
+                    break
+                for future in done:
+                    matches, scanned_bytes, scanned_files = future.result()
+                    summary.bytes_scanned += scanned_bytes
+                    summary.files_scanned += scanned_files
+                    for match in matches:
+                        if summary.matches >= self.max_matches:
+                            break
+                        summary.matches += 1
+                        yield {"type": "match", **match}
+                if summary.matches >= self.max_matches:
+                    summary.truncated, summary.reason = True, "max_matches"
+                    break
+                await fill()
+        finally:
+            for future in pending:
+                future.cancel()
+
+        yield {"type": "summary", **summary.__dict__}
+
+    async def collect(self) -> Tuple[List[Dict], GrepSummary]:
+        matches, summary = [], None
+        async for event in self.stream():
+            if event.pop("type") == "match":
+                matches.append(event)
+            else:
+                summary = GrepSummary(**event)
+        return matches, summary
@@ -0,0 +1,375 @@
+"""
+Write-behind journal for chat sessions and messages.
+
+Without it a chat turn commits to Postgres four times on the request path
+(new session, user message, assistant message, and the refresh). With
+``MESSAGE_JOURNAL_ENABLED`` a turn instead appends its rows to an
+append-only journal file and fsyncs it. That append is the acknowledgment.
+A background task then inserts the journaled rows into the database in
+batched transactions.
+
+Rows waiting in the journal are also kept in memory, indexed by session and
+user, so the chat routes merge them into what they read back: a follow-up
+message sees its own session's history before the flush has happened. The
+usage counter likewise adds the tokens of queued responses to the rollups
+when it reloads.
+
+On startup ``recover`` replays the journal left by a crashed process, and
+the app starts the flush task once. Inserts skip ids that already exist, so
+replaying rows that were flushed just before the crash is harmless. After
+each flushed batch the file is rewritten with only the rows still queued,
+so it stays as small as the backlog.
+
+Each worker process needs its own ``MESSAGE_JOURNAL_DIR``: the journal is
+local to the process that writes it. For the same reason pending rows are
+only visible on the worker that journaled them. The chat route therefore
+commits a new session directly and journals only messages, so a follow-up
+that lands on another worker finds the session. Until the flush (every
+``MESSAGE_JOURNAL_FLUSH_INTERVAL_MS``), that worker reads the history from
+the session cache, or without Redis from the database, which may not have
+the last turn yet.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Message, Session as DBSession
+from models.message import MessageRole
+from models.session import AgentType
+from services.metrics import metrics
+from services.usage import record_usage
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = "messages.journal"
+FLUSH_RETRY_SECONDS = 1.0
+
+
+def session_record(session: DBSession) -> Dict:
+    return {
+        "type": "session",
+        "id": str(session.id),
+        "user_id": str(session.user_id),
+        "repository_id": str(session.repository_id) if session.repository_id else None,
+        "agent_type": AgentType(session.agent_type).value,
+        "model": session.model,
+        "created_at": session.created_at.isoformat(),
+    }
+
+
+def message_record(message: Message, user_id=None) -> Dict:
+    """``user_id`` is the session's owner, when known, so queued responses count towards usage."""
+    return {
+        "type": "message",
+        "user_id": str(user_id) if user_id else None,
+        "id": str(message.id),
+        "session_id": str(message.session_id),
+        "role": MessageRole(message.role).value,
+        "content": message.content,
+        "files_referenced": list(message.files_referenced or []),
+        "tools_used": list(message.tools_used or []),
+        "tokens_used": message.tokens_used or 0,
+        "msg_metadata": message.msg_metadata or {},
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def session_row(record: Dict) -> Dict:
+    return {
+        "id": uuid.UUID(record["id"]),
+        "user_id": uuid.UUID(record["user_id"]),
+        "repository_id": uuid.UUID(record["repository_id"]) if record["repository_id"] else None,
+        "agent_type": AgentType(record["agent_type"]),
+        "model": record["model"],
+        "context": {},
+        "session_metadata": {},
+        "created_at": datetime.fromisoformat(record["created_at"]),
+        "updated_at": datetime.fromisoformat(record["created_at"]),
+    }
+
+
+def message_row(record: Dict) -> Dict:
+    return {
+        "id": uuid.UUID(record["id"]),
+        "session_id": uuid.UUID(record["session_id"]),
+        "role": MessageRole(record["role"]),
+        "content": record["content"],
+        "files_referenced": record["files_referenced"],
+        "tools_used": record.get("tools_used", []),
+        "tokens_used": record["tokens_used"],
+        "msg_metadata": record["msg_metadata"],
+        "created_at": datetime.fromisoformat(record["created_at"]),
+    }
+
+
+class MessageJournal:
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+        fsync: Optional[bool] = None,
+    ):
+        self.directory = directory or settings.MESSAGE_JOURNAL_DIR
+        self.batch_size = batch_size or settings.MESSAGE_JOURNAL_BATCH_SIZE
+        self.flush_interval = (flush_interval_ms or settings.MESSAGE_JOURNAL_FLUSH_INTERVAL_MS) / 1000
+        self.fsync = settings.MESSAGE_JOURNAL_FSYNC if fsync is None else fsync
+        self.bind = None
+        self._queue: List[Dict] = []
+        self._sessions: Dict[str, Dict] = {}
+        self._messages: Dict[str, List[Dict]] = {}
+        self._file = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._task_loop = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Odd while a batch is between its insert and leaving the queue.
+        self.flush_sequence = 0
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, JOURNAL_FILE)
+
+    def enabled(self) -> bool:
+        return settings.MESSAGE_JOURNAL_ENABLED
+
+    async def append(self, records: List[Dict]):
+        """Durably journal ``records``; they are visible to reads as soon as this returns."""
+        await asyncio.to_thread(self._append, records)
+        metrics.increment("message_journal.appended", len(records))
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self, bind):
+        """Flush into ``bind`` from a background task on the running loop."""
+        self.bind = bind
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task_loop is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+            self._task_loop = loop
+
+    async def flush(self) -> int:
+        """Insert everything journaled so far; returns the number of journal rows flushed."""
+        written = 0
+        while True:
+            count = await asyncio.to_thread(self._flush_batch)
+            written += count
+            if count == 0:
+                return written
+
+    async def recover(self, bind) -> int:
+        """Replay a journal left behind by a previous process into ``bind``."""
+        self.bind = bind
+        records = await asyncio.to_thread(self._load)
+        if records:
+            logger.info(f"Replaying {len(records)} journaled chat rows")
+            metrics.increment("message_journal.replayed", len(records))
+        return await self.flush()
+
+    async def close(self):
+        if self._task is not None and self._task_loop is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self.bind is not None and self._queue:
+            try:
+                await self.flush()
+            except SQLAlchemyError:
+                logger.warning(f"{len(self._queue)} journaled chat rows left for replay on next start")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def pending_session(self, session_id) -> Optional[Dict]:
+        with self._lock:
+            return self._sessions.get(str(session_id))
+
+    def pending_sessions(self, user_id) -> List[Dict]:
+        with self._lock:
+            return [record for record in self._sessions.values() if record["user_id"] == str(user_id)]
+
+    def pending_messages(self, session_id) -> List[Dict]:
+        with self._lock:
+            return list(self._messages.get(str(session_id), []))
+
+    def pending_tokens(self, user_id, since: datetime) -> int:
+        """Tokens of ``user_id``'s queued responses created at or after ``since``."""
+        user_id = str(user_id)
+        with self._lock:
+            return sum(
+                record["tokens_used"] or 0 for records in self._messages.values() for record in records
+                if record.get("user_id") == user_id and record["role"] == MessageRole.ASSISTANT.value
+                and datetime.fromisoformat(record["created_at"]) >= since
+            )
+
+    def pending_count(self) -> int:
+        return len(self._queue)
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _append(self, records: List[Dict]):
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        with self._lock:
+            journal = self._open()
+            journal.write(lines)
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+            for record in records:
+                self._track(record)
+
+    def _track(self, record: Dict):
+        self._queue.append(record)
+        if record["type"] == "session":
+            self._sessions[record["id"]] = record
+        else:
+            self._messages.setdefault(record["session_id"], []).append(record)
+
+    def _compact(self):
+        """Rewrite the journal with only the queued rows; call with ``_lock`` held."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as journal:
+            journal.write("".join(json.dumps(record, default=str) + "\n" for record in self._queue))
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; it was never acknowledged.
+                    logger.warning("Skipping incomplete message journal entry")
+        with self._lock:
+            known = {record["id"] for record in self._queue}
+            for record in records:
+                if record["id"] not in known:
+                    self._track(record)
+            # Drop any torn line now, or the next append would be glued onto it.
+            self._compact()
+        return records
+
+    def _flush_batch(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch = self._queue[:self.batch_size]
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            self.flush_sequence += 1
+            try:
+                try:
+                    written = self._insert(batch)
+                except IntegrityError:
+                    written = self._insert_each(batch)
+                except SQLAlchemyError as e:
+                    metrics.increment("message_journal.flush_failures")
+                    logger.warning(f"Message journal flush failed, keeping {len(self._queue)} rows queued: {e}")
+                    raise
+                with self._lock:
+                    del self._queue[:len(batch)]
+                    for record in batch:
+                        self._forget(record)
+                    self._compact()
+            finally:
+                self.flush_sequence += 1
+            metrics.increment("message_journal.flushed", written)
+            metrics.increment("message_journal.batches")
+            metrics.increment("message_journal.flush_ms", (time.perf_counter() - started) * 1000)
+            return len(batch)
+
+    def _insert(self, batch: List[Dict]) -> int:
+        sessions = [session_row(record) for record in batch if record["type"] == "session"]
+        messages = [message_row(record) for record in batch if record["type"] == "message"]
+        with Session(bind=self.bind) as db:
+            inserted = {}
+            for model, rows in ((DBSession, sessions), (Message, messages)):
+                if not rows:
+                    continue
+                existing = set(db.scalars(select(model.id).where(model.id.in_([row["id"] for row in rows]))))
+                inserted[model] = [row for row in rows if row["id"] not in existing]
+                if inserted[model]:
+                    db.execute(insert(model), inserted[model])
+            # Only rows inserted now, so a replay doesn't count a response twice.
+            record_usage(db, inserted.get(Message, []))
+            # Keep sessions ordered by activity for the session list.
+            latest: Dict[uuid.UUID, datetime] = {}
+            for row in messages:
+                latest[row["session_id"]] = max(latest.get(row["session_id"], row["created_at"]), row["created_at"])
+            for session_id, created_at in latest.items():
+                db.execute(update(DBSession).where(
+                    (DBSession.id == session_id) & (DBSession.updated_at < created_at)
+                ).values(updated_at=created_at))
+            db.commit()
+        return len(sessions) + len(messages)
+
+    def _insert_each(self, batch: List[Dict]) -> int:
+        """Insert rows one at a time, dropping those the database rejects (e.g. a deleted session)."""
+        written = 0
+        for record in batch:
+            try:
+                written += self._insert([record])
+            except IntegrityError as e:
+                metrics.increment("message_journal.dropped")
+                logger.error(f"Dropping journaled {record['type']} {record['id']}: {e}")
+        return written
+
+    def _forget(self, record: Dict):
+        if record["type"] == "session":
+            self._sessions.pop(record["id"], None)
+            return
+        pending = self._messages.get(record["session_id"], [])
+        if record in pending:
+            pending.remove(record)
+        if not pending:
+            self._messages.pop(record["session_id"], None)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._queue:
+                continue
+            try:
+                await self.flush()
+            except SQLAlchemyError:
+                await asyncio.sleep(FLUSH_RETRY_SECONDS)
+
+
+message_journal = MessageJournal()
+metrics.register_gauge("message_journal.pending", message_journal.pending_count)
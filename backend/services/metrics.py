@@ -0,0 +1,37 @@
+import threading
+from typing import Callable, Dict
+
+
+class Metrics:
+    """Process-local counters and gauges exposed on ``GET /metrics``."""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def register_gauge(self, name: str, fn: Callable[[], float]):
+        self._gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "counters": counters,
+            "gauges": {name: fn() for name, fn in self._gauges.items()},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+metrics = Metrics()
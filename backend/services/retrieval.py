@@ -0,0 +1,247 @@
+"""
+Hybrid code retrieval for agents.
+
+The lexical (BM25, or database FTS when no BM25 index exists) and semantic
+(vector) retrievers run concurrently. Their rankings are merged with
+reciprocal-rank fusion, and the call-graph neighbourhood of the best hits is
+fused in as a third, lower-weight list. Blocks whose line span overlaps a
+better-ranked block from the same file are dropped, for example a method
+already covered by its class, as are near-duplicates of a better-ranked
+block (copy-pasted code, per the MinHash index). The remainder is packed into a per-model
+token budget, trimming oversized blocks down to their most relevant lines.
+"""
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import run_in_session
+from indexing.bm25 import bm25_registry
+from indexing.embeddings import vector_registry
+from indexing.graph import SymbolGraph
+from indexing.minhash import minhash_registry
+from indexing.shards import run_in_index_session
+from indexing.tokenizer import tokenize
+from models import CodeBlock
+from services.retrieval_cache import current_index_version, retrieval_cache
+from services.search import CodeSearchService
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+GRAPH_WEIGHT = 0.5
+MAX_TRIM_CANDIDATES = 60
+
+
+@dataclass
+class RetrievedBlock:
+    block: CodeBlock
+    score: float
+    sources: List[str] = field(default_factory=list)
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, Sequence[str]],
+    weights: Optional[Dict[str, float]] = None,
+    k: int = RRF_K,
+) -> List[tuple]:
+    """Fuse named rankings of ids into ``[(id, score, [sources])]``."""
+    weights = weights or {}
+    scores: Dict[str, float] = {}
+    sources: Dict[str, List[str]] = {}
+    for name, ranking in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank + 1)
+            sources.setdefault(item, []).append(name)
+    fused = sorted(scores.items(), key=lambda entry: entry[1], reverse=True)
+    return [(item, score, sources[item]) for item, score in fused]
+
+
+def remove_overlaps(results: List[RetrievedBlock]) -> List[RetrievedBlock]:
+    """Keep only the best-ranked block for any overlapping span of a file."""
+    kept: List[RetrievedBlock] = []
+    spans: Dict[str, List[tuple]] = {}
+    for result in results:
+        block = result.block
+        taken = spans.setdefault(block.file_path, [])
+        if any(block.start_line <= end and start <= block.end_line for start, end in taken):
+            continue
+        taken.append((block.start_line, block.end_line))
+        kept.append(result)
+    return kept
+
+
+def remove_near_duplicates(results: List[RetrievedBlock], index) -> List[RetrievedBlock]:
+    """Drop blocks that nearly duplicate a better-ranked block."""
+    redundant = index.redundant([str(result.block.id) for result in results])
+    return [result for result in results if str(result.block.id) not in redundant]
+
+
+def trim_to_relevant_lines(
+    content: str,
+    query: str,
+    budget: int,
+    count_tokens: Callable[[str], int],
+) -> Optional[str]:
+    """Shrink ``content`` to ``budget`` tokens, keeping the signature and the
+    lines that share the most terms with ``query`` (plus one line of context)."""
+    lines = content.split("\n")
+    terms = set(tokenize(query))
+    relevance = [len(terms.intersection(tokenize(line))) for line in lines]
+    order = sorted(range(len(lines)), key=lambda i: (-relevance[i], i))
+
+    keep = set()
+    for i in [0] + order[:MAX_TRIM_CANDIDATES]:
+        candidate = keep | {j for j in (i - 1, i, i + 1) if 0 <= j < len(lines)}
+        if count_tokens(_render_lines(lines, candidate)) > budget:
+            if i == 0:
+                return None
+            continue
+        keep = candidate
+        if relevance[i] == 0 and i != 0:
+            break
+    return _render_lines(lines, keep)
+
+
+def _render_lines(lines: List[str], keep: set) -> str:
+    rendered, previous = [], -1
+    for i in sorted(keep):
+        if i != previous + 1:
+            rendered.append("    ...")
+        rendered.append(lines[i])
+        previous = i
+    if previous != len(lines) - 1:
+        rendered.append("    ...")
+    return "\n".join(rendered)
+
+
+def format_block(block: CodeBlock, content: Optional[str] = None) -> str:
+    label = f" ({block.entity_name})" if block.entity_name else ""
+    return f"\nFile: {block.file_path}:{block.start_line}-{block.end_line}{label}\n{content or block.content}\n"
+
+
+class ContextPacker:
+    def __init__(self, budget_tokens: int, count_tokens: Callable[[str], int]):
+        self.budget_tokens = budget_tokens
+        self.count_tokens = count_tokens
+
+    def pack(self, query: str, results: List[RetrievedBlock]) -> str:
+        remaining = self.budget_tokens
+        sections = []
+        for result in results:
+            section = format_block(result.block)
+            cost = self.count_tokens(section)
+            if cost > remaining:
+                header_cost = self.count_tokens(format_block(result.block, " "))
+                trimmed = trim_to_relevant_lines(
+                    result.block.content, query, remaining - header_cost, self.count_tokens
+                )
+                if trimmed is None:
+                    continue
+                section = format_block(result.block, trimmed)
+                cost = self.count_tokens(section)
+            sections.append(section)
+            remaining -= cost
+            if remaining <= 0:
+                break
+        return "".join(sections)
+
+
+def context_budget(provider, model: str) -> int:
+    window = provider.get_context_window(model)
+    return int(window * settings.RETRIEVAL_CONTEXT_FRACTION)
+
+
+class RetrievalService:
+    def __init__(self, db: Session, repo_id: str, provider=None):
+        # Only the engine is used: queries run in worker threads on sessions of their own.
+        self.bind = db.get_bind()
+        self.repo_id = uuid.UUID(str(repo_id))
+        self.provider = provider
+
+    async def retrieve(self, query: str, limit: int = 8, candidates: int = 20) -> List[RetrievedBlock]:
+        index_version = await run_in_session(self.bind, current_index_version, self.repo_id)
+        lexical, semantic = await asyncio.gather(
+            self._cached(index_version, "lexical", query, {"limit": candidates}, self._lexical),
+            self._cached(
+                index_version,
+                "semantic",
+                query,
+                {"limit": candidates, "model": settings.EMBEDDING_MODEL},
+                self._semantic,
+            ),
+            return_exceptions=True,
+        )
+        rankings = {}
+        for name, ranking in (("lexical", lexical), ("semantic", semantic)):
+            if isinstance(ranking, Exception):
+                logger.warning(f"{name} retrieval failed for repository {self.repo_id}: {ranking}")
+                continue
+            rankings[name] = ranking
+
+        fused = reciprocal_rank_fusion(rankings)
+        blocks = await self._in_index(self._load_blocks, [item for item, _, _ in fused])
+        names = [blocks[item].entity_name for item, _, _ in fused[:3] if item in blocks and blocks[item].entity_name]
+        if names:
+            neighbors = await self._in_index(
+                lambda index_db: SymbolGraph(index_db, self.repo_id).neighborhood_blocks(names, limit=candidates)
+            )
+            rankings["graph"] = [str(block.id) for block in neighbors]
+            blocks.update({str(block.id): block for block in neighbors})
+            fused = reciprocal_rank_fusion(rankings, weights={"graph": GRAPH_WEIGHT})
+
+        results = [
+            RetrievedBlock(block=blocks[item], score=score, sources=sources)
+            for item, score, sources in fused
+            if item in blocks
+        ]
+        results = remove_overlaps(results)
+        return remove_near_duplicates(results, minhash_registry.get(self.repo_id))[:limit]
+
+    async def build_context(self, query: str, model: str, limit: int = 8) -> str:
+        results = await self.retrieve(query, limit=limit)
+        if not results:
+            return ""
+        packer = ContextPacker(context_budget(self.provider, model), self.provider.count_tokens)
+        return packer.pack(query, results)
+
+    async def _cached(self, index_version, kind: str, query: str, filters: dict, retriever) -> List[str]:
+        return await retrieval_cache.get_or_compute(
+            self.repo_id, index_version, kind, query, filters,
+            lambda: retriever(query, filters["limit"]),
+        )
+
+    async def _lexical(self, query: str, limit: int) -> List[str]:
+        index = bm25_registry.get(self.repo_id)
+        if index.exists():
+            ranked = await asyncio.to_thread(index.search, query, limit)
+            return [block_id for block_id, _ in ranked]
+        # Off the loop, so the FTS query overlaps the semantic leg instead of blocking it.
+        hits = await self._in_index(lambda index_db: CodeSearchService(index_db).search(self.repo_id, query, limit=limit))
+        return [str(hit.block.id) for hit in hits]
+
+    async def _semantic(self, query: str, limit: int) -> List[str]:
+        index = vector_registry.get(self.repo_id)
+        if self.provider is None or not index.exists():
+            return []
+        vectors = await self.provider.embed([query])
+        if not vectors:
+            return []
+        ranked = await asyncio.to_thread(index.search, vectors[0], limit)
+        return [block_id for block_id, _ in ranked]
+
+    async def _in_index(self, fn, *args):
+        return await run_in_index_session(self.bind, self.repo_id, fn, *args)
+
+    def _load_blocks(self, index_db: Session, block_ids: List[str]) -> Dict[str, CodeBlock]:
+        if not block_ids:
+            return {}
+        ids = [uuid.UUID(str(block_id)) for block_id in block_ids]
+        blocks = index_db.query(CodeBlock).filter(CodeBlock.id.in_(ids)).all()
+        return {str(block.id): block for block in blocks}
@@ -0,0 +1,200 @@
+"""
+Two-tier cache for retrieval results.
+
+Entries are keyed on ``(repo_id, index_version, kind, query, filters)`` and
+hold only JSON-serialisable rankings (block ids and scores), never ORM
+objects. The first tier is an in-process LRU, the second a shared Redis
+namespace so workers benefit from each other's searches.
+
+Because the repository's ``index_version`` is part of every key, re-indexing
+invalidates all of a repository's entries at once: stale Redis keys are
+simply never read again and expire on their TTL, while the LRU drops a
+repository's entries as soon as it sees a newer version.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from config import settings
+from models import Repository
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "retrieval"
+REDIS_RETRY_SECONDS = 30
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace only; case matters to the identifier tokenizer."""
+    return " ".join((query or "").split())
+
+
+def current_index_version(db, repo_id) -> Optional[str]:
+    return db.query(Repository.index_version).filter(
+        Repository.id == uuid.UUID(str(repo_id))
+    ).scalar()
+
+
+class RetrievalCache:
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        redis_url: Optional[str] = None,
+    ):
+        self.max_entries = max_entries or settings.RETRIEVAL_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds or settings.RETRIEVAL_CACHE_TTL_SECONDS
+        self.redis_url = redis_url if redis_url is not None else settings.REDIS_URL
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._repo_keys: Dict[str, Set[str]] = {}
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_loop = None
+        self._redis_retry_at = 0.0
+
+    def make_key(self, repo_id, index_version: str, kind: str, query: str, filters: Optional[dict] = None) -> str:
+        payload = json.dumps(
+            [kind, normalize_query(query), sorted((filters or {}).items())],
+            default=str,
+        )
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return f"{REDIS_PREFIX}:{repo_id}:{index_version}:{digest}"
+
+    async def get_or_compute(
+        self,
+        repo_id,
+        index_version: Optional[str],
+        kind: str,
+        query: str,
+        filters: Optional[dict],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return the cached value for the key, computing and storing it on a miss.
+
+        Repositories that have never been indexed have no version and bypass
+        the cache entirely.
+        """
+        if not index_version:
+            return await compute()
+
+        repo_id = str(repo_id)
+        self._observe_version(repo_id, index_version)
+        key = self.make_key(repo_id, index_version, kind, query, filters)
+
+        value = self._get_local(key)
+        if value is not None:
+            metrics.increment("retrieval_cache.hits.memory")
+            return value
+
+        value = await self._get_redis(key)
+        if value is not None:
+            metrics.increment("retrieval_cache.hits.redis")
+            self._set_local(repo_id, key, value)
+            return value
+
+        metrics.increment("retrieval_cache.misses")
+        value = await compute()
+        self._set_local(repo_id, key, value)
+        await self._set_redis(key, value)
+        return value
+
+    def invalidate(self, repo_id, index_version: Optional[str] = None):
+        """Drop a repository's in-process entries, e.g. right after re-indexing."""
+        repo_id = str(repo_id)
+        with self._lock:
+            for key in self._repo_keys.pop(repo_id, set()):
+                self._entries.pop(key, None)
+            if index_version:
+                self._versions[repo_id] = index_version
+            else:
+                self._versions.pop(repo_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._repo_keys.clear()
+            self._versions.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_ratio(self) -> float:
+        hits = metrics.get("retrieval_cache.hits.memory") + metrics.get("retrieval_cache.hits.redis")
+        total = hits + metrics.get("retrieval_cache.misses")
+        return hits / total if total else 0.0
+
+    def _observe_version(self, repo_id: str, index_version: str):
+        with self._lock:
+            known = self._versions.get(repo_id)
+        if known != index_version:
+            self.invalidate(repo_id, index_version)
+
+    def _get_local(self, key: str) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, repo_id: str, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._repo_keys.setdefault(repo_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                evicted_repo = evicted.split(":", 2)[1]
+                self._repo_keys.get(evicted_repo, set()).discard(evicted)
+
+    def _client(self):
+        if not self.redis_url or time.monotonic() < self._redis_retry_at:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._redis_loop is not loop:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=0.2,
+                socket_timeout=0.2,
+            )
+            self._redis_loop = loop
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"Retrieval cache Redis tier unavailable, retrying in {REDIS_RETRY_SECONDS}s: {e}")
+        self._redis = None
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def _get_redis(self, key: str) -> Any:
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(key)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def _set_redis(self, key: str, value: Any):
+        client = self._client()
+        if client is None:
+            return
+        try:
+            await client.set(key, json.dumps(value), ex=self.ttl_seconds)
+        except Exception as e:
+            self._redis_failed(e)
+
+
+retrieval_cache = RetrievalCache()
+metrics.register_gauge("retrieval_cache.hit_ratio", retrieval_cache.hit_ratio)
+metrics.register_gauge("retrieval_cache.entries", lambda: len(retrieval_cache))
@@ -0,0 +1,169 @@
+"""
+Full-text search over indexed code blocks.
+
+Postgres uses a generated ``tsvector`` column with a GIN index and ranks
+matches with ``ts_rank_cd``. SQLite (tests, single-node setups) uses an
+FTS5 virtual table kept in sync by triggers and ranked with ``bm25()``.
+Any other dialect falls back to a case-insensitive substring match.
+"""
+
+import logging
+import sqlite3
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import DDL, event, func, desc, literal_column, or_, table, column, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from indexing.tokenizer import split_identifiers, query_terms
+from models import CodeBlock
+from models.code_index import EntityType
+
+logger = logging.getLogger(__name__)
+
+PG_SEARCH_VECTOR = r"""
+    setweight(to_tsvector('simple'::regconfig, coalesce(entity_name, '')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig, regexp_replace(coalesce(entity_name, ''), '([a-z0-9])([A-Z])|_', '\1 \2', 'g')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig, coalesce(docstring, '')), 'B') ||
+    setweight(to_tsvector('simple'::regconfig, left(regexp_replace(content, '([a-z0-9])([A-Z])|[_.]', '\1 \2', 'g'), 200000)), 'C')
+"""
+
+PG_CREATE_SEARCH_VECTOR = f"""
+ALTER TABLE code_blocks ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS ({PG_SEARCH_VECTOR}) STORED
+"""
+
+PG_CREATE_SEARCH_INDEX = """
+CREATE INDEX IF NOT EXISTS ix_code_blocks_search_vector ON code_blocks USING gin (search_vector)
+"""
+
+SQLITE_FTS_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS code_blocks_fts
+    USING fts5(entity_name, docstring, content, tokenize = 'unicode61')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS code_blocks_fts_ai AFTER INSERT ON code_blocks BEGIN
+        INSERT INTO code_blocks_fts(rowid, entity_name, docstring, content)
+        VALUES (new.rowid, split_identifiers(new.entity_name), new.docstring, split_identifiers(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS code_blocks_fts_ad AFTER DELETE ON code_blocks BEGIN
+        DELETE FROM code_blocks_fts WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS code_blocks_fts_au AFTER UPDATE ON code_blocks BEGIN
+        DELETE FROM code_blocks_fts WHERE rowid = old.rowid;
+        INSERT INTO code_blocks_fts(rowid, entity_name, docstring, content)
+        VALUES (new.rowid, split_identifiers(new.entity_name), new.docstring, split_identifiers(new.content));
+    END
+    """,
+]
+
+event.listen(CodeBlock.__table__, "after_create", DDL(PG_CREATE_SEARCH_VECTOR).execute_if(dialect="postgresql"))
+event.listen(CodeBlock.__table__, "after_create", DDL(PG_CREATE_SEARCH_INDEX).execute_if(dialect="postgresql"))
+for _statement in SQLITE_FTS_STATEMENTS:
+    event.listen(CodeBlock.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("split_identifiers", 1, split_identifiers, deterministic=True)
+
+
+fts_table = table("code_blocks_fts", column("rowid"))
+
+
+@dataclass
+class SearchHit:
+    block: CodeBlock
+    score: float
+
+
+class CodeSearchService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+
+    def search(
+        self,
+        repo_id: str,
+        query: str,
+        entity_type: Optional[str] = None,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        limit: int = 10,
+    ) -> List[SearchHit]:
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        if self.dialect == "postgresql":
+            rows = self._search_postgres(repo_id, terms, entity_type, language, path_prefix, limit)
+        elif self.dialect == "sqlite":
+            rows = self._search_sqlite(repo_id, terms, entity_type, language, path_prefix, limit)
+        else:
+            rows = self._search_substring(repo_id, terms, entity_type, language, path_prefix, limit)
+
+        return [SearchHit(block=block, score=float(score or 0.0)) for block, score in rows]
+
+    def get_blocks(self, block_ids: List[str]) -> List[CodeBlock]:
+        """Load blocks by id, preserving the order of ``block_ids``."""
+        if not block_ids:
+            return []
+        ids = [uuid.UUID(str(block_id)) for block_id in block_ids]
+        blocks = {str(block.id): block for block in self.db.query(CodeBlock).filter(CodeBlock.id.in_(ids))}
+        return [blocks[str(block_id)] for block_id in block_ids if str(block_id) in blocks]
+
+    def _search_postgres(self, repo_id, terms, entity_type, language, path_prefix, limit):
+        search_vector = literal_column("code_blocks.search_vector")
+        tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), " | ".join(terms))
+        score = func.ts_rank_cd(search_vector, tsquery).label("score")
+
+        query = self.db.query(CodeBlock, score).filter(
+            CodeBlock.repository_id == repo_id,
+            search_vector.op("@@")(tsquery),
+        )
+        query = self._apply_filters(query, entity_type, language, path_prefix)
+        return query.order_by(desc("score")).limit(limit).all()
+
+    def _search_sqlite(self, repo_id, terms, entity_type, language, path_prefix, limit):
+        match = " OR ".join(f'"{term}"' for term in terms)
+        rank = func.bm25(literal_column("code_blocks_fts"), 10.0, 5.0, 1.0)
+        score = (-rank).label("score")
+
+        query = self.db.query(CodeBlock, score).join(
+            fts_table, literal_column("code_blocks.rowid") == fts_table.c.rowid
+        ).filter(
+            CodeBlock.repository_id == repo_id,
+            text("code_blocks_fts MATCH :match").bindparams(match=match),
+        )
+        query = self._apply_filters(query, entity_type, language, path_prefix)
+        return query.order_by(rank).limit(limit).all()
+
+    def _search_substring(self, repo_id, terms, entity_type, language, path_prefix, limit):
+        conditions = []
+        for term in terms:
+            conditions.append(CodeBlock.entity_name.ilike(f"%{term}%"))
+            conditions.append(CodeBlock.docstring.ilike(f"%{term}%"))
+
+        query = self.db.query(CodeBlock, literal_column("1.0")).filter(
+            CodeBlock.repository_id == repo_id,
+            or_(*conditions),
+        )
+        query = self._apply_filters(query, entity_type, language, path_prefix)
+        return query.limit(limit).all()
+
+    def _apply_filters(self, query, entity_type, language, path_prefix):
+        if entity_type:
+            query = query.filter(CodeBlock.entity_type == EntityType(entity_type.lower()))
+        if language:
+            query = query.filter(CodeBlock.language == language)
+        if path_prefix:
+            query = query.filter(CodeBlock.file_path.startswith(path_prefix, autoescape=True))
+        return query
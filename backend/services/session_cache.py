@@ -0,0 +1,278 @@
+"""
+Hot-session cache of conversation state.
+
+Without it every chat turn reads the user, the session and the whole message
+history from the database before the model sees anything. A cached
+``SessionState`` holds everything a turn needs from those reads: the
+session's user, model, agent type and repository binding, the most recent
+``SESSION_CACHE_WINDOW`` messages, and a rolling summary of the older ones.
+
+The chat route writes through: every message it persists is also added to
+the cached state. The add is applied to the state as stored at that moment
+(under a Redis ``WATCH``), not to the copy the turn loaded, so concurrent
+turns on one session never drop each other's messages. A follow-up turn on an active session therefore runs no
+user, session or history query at all. Entries expire after
+``SESSION_CACHE_TTL_SECONDS`` without a turn. The next turn rebuilds the
+state from the database.
+
+The rolling summary is extractive. Messages that leave the window are folded
+in as one clipped line each, so it costs no model call on the request path.
+
+State lives in Redis so every worker sees the same conversation. Without a
+``REDIS_URL`` it is kept in process instead, which is only correct for a
+single worker. If Redis is unreachable, lookups miss and turns fall back to
+the database.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from config import settings
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "session_state"
+REDIS_RETRY_SECONDS = 30
+REDIS_UPDATE_ATTEMPTS = 3
+LOCAL_MAX_ENTRIES = 10000
+SUMMARY_LINE_CHARS = 200
+# A hit replaces the user lookup, the session lookup and the history query.
+QUERIES_PER_HIT = 3
+
+
+def fold_summary(summary: str, messages: List[Dict], max_chars: int) -> str:
+    """Append one clipped line per message, keeping the most recent ``max_chars``."""
+    lines = [summary] if summary else []
+    lines += [f"{m['role']}: {' '.join(m['content'].split())[:SUMMARY_LINE_CHARS]}" for m in messages]
+    text = "\n".join(lines)
+    if len(text) > max_chars:
+        text = text[-max_chars:]
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    return text
+
+
+@dataclass
+class SessionState:
+    session_id: str
+    user_id: str
+    repository_id: Optional[str]
+    agent_type: str
+    model: str
+    summary: str = ""
+    messages: List[Dict] = field(default_factory=list)
+
+    def history(self) -> List[Dict]:
+        """Conversation so far as LLM messages: the summary, then the recent window."""
+        history = [{"role": m["role"], "content": m["content"]} for m in self.messages]
+        if self.summary:
+            history.insert(0, {"role": "user", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        return history
+
+    def add(self, message_id, role: str, content: str, window: int, summary_chars: int):
+        if any(m["id"] == str(message_id) for m in self.messages):
+            return
+        self.messages.append({"id": str(message_id), "role": role, "content": content})
+        if len(self.messages) > window:
+            dropped, self.messages = self.messages[:-window], self.messages[-window:]
+            self.summary = fold_summary(self.summary, dropped, summary_chars)
+
+
+class SessionStateCache:
+    def __init__(
+        self,
+        ttl_seconds: Optional[int] = None,
+        window: Optional[int] = None,
+        summary_chars: Optional[int] = None,
+        redis_url: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds or settings.SESSION_CACHE_TTL_SECONDS
+        self.window = window or settings.SESSION_CACHE_WINDOW
+        self.summary_chars = summary_chars or settings.SESSION_CACHE_SUMMARY_CHARS
+        self.redis_url = redis_url if redis_url is not None else settings.REDIS_URL
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_loop = None
+        self._redis_retry_at = 0.0
+        # Sessions whose latest state failed to reach Redis; what Redis holds for them is stale.
+        self._unsynced = set()
+
+    def enabled(self) -> bool:
+        return settings.SESSION_CACHE_ENABLED
+
+    def new_state(self, session, messages: List[Dict]) -> SessionState:
+        """State for ``session`` from its stored ``messages`` (dicts with id, role, content), oldest first."""
+        state = SessionState(
+            session_id=str(session.id),
+            user_id=str(session.user_id),
+            repository_id=str(session.repository_id) if session.repository_id else None,
+            agent_type=getattr(session.agent_type, "value", session.agent_type),
+            model=session.model,
+        )
+        for message in messages:
+            state.add(message["id"], message["role"], message["content"], self.window, self.summary_chars)
+        return state
+
+    async def get(self, session_id, user_id) -> Optional[SessionState]:
+        """Cached state of ``session_id`` if it belongs to ``user_id``; anything else is a miss."""
+        if not self.enabled():
+            return None
+        raw = None if str(session_id) in self._unsynced else await self._get_raw(f"{REDIS_PREFIX}:{session_id}")
+        state = SessionState(**json.loads(raw)) if raw is not None else None
+        if state is None or state.user_id != str(user_id):
+            metrics.increment("session_cache.misses")
+            return None
+        metrics.increment("session_cache.hits")
+        metrics.increment("session_cache.queries_saved", QUERIES_PER_HIT)
+        return state
+
+    async def put(self, state: SessionState):
+        if not self.enabled():
+            return
+        if await self._set_raw(f"{REDIS_PREFIX}:{state.session_id}", json.dumps(asdict(state))):
+            self._unsynced.discard(state.session_id)
+        else:
+            self._unsynced.add(state.session_id)
+
+    async def add_message(self, state: SessionState, message_id, role: str, content: str):
+        """Write-through: add a just-persisted message to the stored state and to ``state``.
+
+        The message goes onto whatever is stored now, so messages another turn
+        added since ``state`` was loaded are kept. ``state`` is updated to match.
+        """
+        def apply(raw: Optional[str]) -> SessionState:
+            current = state if raw is None or state.session_id in self._unsynced else SessionState(**json.loads(raw))
+            current.add(message_id, role, content, self.window, self.summary_chars)
+            return current
+
+        if not self.enabled():
+            apply(None)
+            return
+        updated = await self._update_raw(f"{REDIS_PREFIX}:{state.session_id}", apply)
+        if updated is None:
+            apply(None)
+            self._unsynced.add(state.session_id)
+            return
+        self._unsynced.discard(state.session_id)
+        state.summary, state.messages = updated.summary, updated.messages
+
+    async def invalidate(self, session_id):
+        key = f"{REDIS_PREFIX}:{session_id}"
+        with self._lock:
+            self._entries.pop(key, None)
+        client = self._client()
+        if client is not None:
+            try:
+                await client.delete(key)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def hit_ratio(self) -> float:
+        hits = metrics.get("session_cache.hits")
+        total = hits + metrics.get("session_cache.misses")
+        return hits / total if total else 0.0
+
+    async def _get_raw(self, key: str) -> Optional[str]:
+        if not self.redis_url:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] < time.monotonic():
+                    self._entries.pop(key, None)
+                    return None
+                return entry[1]
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            return await client.get(key)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+
+    async def _set_raw(self, key: str, value: str) -> bool:
+        if not self.redis_url:
+            with self._lock:
+                self._store_local(key, value)
+            return True
+        client = self._client()
+        if client is None:
+            return False
+        try:
+            await client.set(key, value, ex=self.ttl_seconds)
+            return True
+        except Exception as e:
+            self._redis_failed(e)
+            return False
+
+    async def _update_raw(self, key: str, apply) -> Optional[SessionState]:
+        """Replace the stored value with ``apply(stored)`` atomically; ``None`` if it was not stored."""
+        if not self.redis_url:
+            with self._lock:
+                entry = self._entries.get(key)
+                updated = apply(entry[1] if entry is not None and entry[0] >= time.monotonic() else None)
+                self._store_local(key, json.dumps(asdict(updated)))
+            return updated
+        client = self._client()
+        if client is None:
+            return None
+        from redis.exceptions import WatchError
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                for _ in range(REDIS_UPDATE_ATTEMPTS):
+                    try:
+                        await pipe.watch(key)
+                        updated = apply(await pipe.get(key))
+                        pipe.multi()
+                        pipe.set(key, json.dumps(asdict(updated)), ex=self.ttl_seconds)
+                        await pipe.execute()
+                        return updated
+                    except WatchError:
+                        continue
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        # Still contended after every attempt: drop the entry so the next turn rebuilds it.
+        metrics.increment("session_cache.contended_writes")
+        await self.invalidate(key.split(":", 1)[1])
+        return None
+
+    def _store_local(self, key: str, value: str):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > LOCAL_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def _client(self):
+        if not self.redis_url or time.monotonic() < self._redis_retry_at:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._redis_loop is not loop:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=0.2,
+                socket_timeout=0.2,
+            )
+            self._redis_loop = loop
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"Session cache Redis unavailable, retrying in {REDIS_RETRY_SECONDS}s: {e}")
+        metrics.increment("session_cache.redis_errors")
+        self._redis = None
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+session_cache = SessionStateCache()
+metrics.register_gauge("session_cache.hit_ratio", session_cache.hit_ratio)
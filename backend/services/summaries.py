@@ -0,0 +1,282 @@
+"""
+Hierarchical repository summaries (map, then reduce).
+
+No prompt can hold a whole repository, so summaries are built bottom-up.
+Each file is summarized on its own (map), with at most
+``SUMMARY_CONCURRENCY`` model calls in flight. Each directory is then
+summarized from its children's summaries, deepest directories first, and
+the repository from its top-level entries (reduce).
+
+Every summary is stored in ``code_summaries`` with the hash it was built
+from: the file's manifest hash, or for a directory a hash of its children's
+(name, hash) pairs. After an incremental index only the changed files and
+their ancestor directories have new hashes, so only that path up to the
+root is re-summarized. A directory with a single entry reuses that entry's
+summary without a model call. Summaries are committed every
+``COMMIT_EVERY`` files and after each directory level, so an interrupted run
+keeps what it computed.
+
+Build them for one repository with::
+
+    python -m services.summaries <repository id> [--model MODEL]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import posixpath
+import sys
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from indexing.shards import index_session
+from llm.base import LLMRequest
+from models import CodeBlock, CodeSummary, Repository
+from models.code_summary import SummaryLevel
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_CHARS = 12000
+MAX_CHILD_CHARS = 800
+MAX_TOKENS = 400
+COMMIT_EVERY = 32
+
+SYSTEM_PROMPT = "You summarize source code for other engineers. Be factual and concise; do not speculate."
+
+
+def tree_hash(entries: List[Tuple[str, Optional[str]]]) -> str:
+    """Hash of a directory's ``(name, hash)`` entries; ``None`` marks a missing summary."""
+    joined = "\n".join(f"{name}:{entry_hash or 'missing'}" for name, entry_hash in sorted(entries))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+def directory_tree(paths: List[str]) -> Dict[str, List[str]]:
+    """Map every directory ("" is the root) to its direct children's paths."""
+    children: Dict[str, set] = {"": set()}
+    for path in paths:
+        child, parent = path, posixpath.dirname(path)
+        while True:
+            known = parent in children
+            children.setdefault(parent, set()).add(child)
+            if known or parent == "":
+                break
+            child, parent = parent, posixpath.dirname(parent)
+    return {directory: sorted(entries) for directory, entries in children.items()}
+
+
+class RepositorySummarizer:
+    def __init__(self, db: Session, repo_id, provider, model: str, concurrency: Optional[int] = None):
+        self.db = db
+        self.repo_id = uuid.UUID(str(repo_id))
+        self.provider = provider
+        self.model = model
+        self.semaphore = asyncio.Semaphore(concurrency or settings.SUMMARY_CONCURRENCY)
+        self.stats = {"computed": 0, "reused": 0, "failed": 0}
+
+    async def summarize(self) -> Optional[str]:
+        """Bring every summary up to date and return the repository summary."""
+        # Database work runs in a worker thread, one step at a time, so the loop keeps serving.
+        repo, cached = await asyncio.to_thread(self._load)
+        manifest = dict((repo.repo_metadata or {}).get("manifest", {})) if repo else {}
+        if not manifest:
+            return None
+        hashes: Dict[str, Optional[str]] = {}
+        texts: Dict[str, Optional[str]] = {}
+
+        # Map: files.
+        stale = []
+        for path, file_hash in manifest.items():
+            row = cached.get((SummaryLevel.FILE, path))
+            if self._fresh(row, file_hash):
+                hashes[path], texts[path] = file_hash, row.summary
+                self.stats["reused"] += 1
+            else:
+                stale.append(path)
+        for start in range(0, len(stale), COMMIT_EVERY):
+            batch = stale[start:start + COMMIT_EVERY]
+            sources = await asyncio.to_thread(self._file_sources, batch)
+            results = await asyncio.gather(*(
+                self._generate(self._file_prompt(path, sources[path])) for path in batch
+            ))
+            for path, text in zip(batch, results):
+                hashes[path], texts[path] = (manifest[path], text) if text else (None, None)
+                if text:
+                    self._store(cached, SummaryLevel.FILE, path, manifest[path], text)
+            await asyncio.to_thread(self._commit)
+
+        # Reduce: directories, deepest first, then the repository.
+        tree = directory_tree(list(manifest))
+        by_depth: Dict[int, List[str]] = {}
+        for directory in tree:
+            depth = directory.count("/") + 1 if directory else 0
+            by_depth.setdefault(depth, []).append(directory)
+
+        for depth in sorted(by_depth, reverse=True):
+            pending = []
+            for directory in by_depth[depth]:
+                level = SummaryLevel.REPOSITORY if directory == "" else SummaryLevel.DIRECTORY
+                entries = tree[directory]
+                node_hash = tree_hash([(posixpath.basename(entry), hashes.get(entry)) for entry in entries])
+                row = cached.get((level, directory))
+                if self._fresh(row, node_hash):
+                    hashes[directory], texts[directory] = node_hash, row.summary
+                    self.stats["reused"] += 1
+                elif not any(texts.get(entry) for entry in entries):
+                    hashes[directory], texts[directory] = None, None
+                elif len(entries) == 1 and level == SummaryLevel.DIRECTORY:
+                    hashes[directory], texts[directory] = node_hash, texts[entries[0]]
+                    self._store(cached, level, directory, node_hash, texts[directory])
+                else:
+                    pending.append((level, directory, node_hash))
+
+            prompts = [self._directory_prompt(repo, directory, tree[directory], texts) for _, directory, _ in pending]
+            results = await asyncio.gather(*(self._generate(prompt) for prompt in prompts))
+            for (level, directory, node_hash), text in zip(pending, results):
+                hashes[directory], texts[directory] = (node_hash, text) if text else (None, None)
+                if text:
+                    self._store(cached, level, directory, node_hash, text)
+            await asyncio.to_thread(self._commit)
+
+        current = {(SummaryLevel.FILE, path) for path in manifest}
+        current.update((SummaryLevel.REPOSITORY if d == "" else SummaryLevel.DIRECTORY, d) for d in tree)
+        await asyncio.to_thread(self._save, cached, current)
+
+        logger.info(
+            f"Summaries for repository {self.repo_id}: {self.stats['computed']} computed, "
+            f"{self.stats['reused']} reused, {self.stats['failed']} failed"
+        )
+        return texts.get("")
+
+    def _load(self) -> Tuple[Optional[Repository], Dict]:
+        repo = self.db.query(Repository).filter(Repository.id == self.repo_id).first()
+        cached = {
+            (row.level, row.path): row
+            for row in self.db.query(CodeSummary).filter(CodeSummary.repository_id == self.repo_id)
+        }
+        return repo, cached
+
+    def _file_sources(self, paths: List[str]) -> Dict[str, str]:
+        with index_session(self.db, self.repo_id) as index_db:
+            return {path: self._file_source(index_db, path) for path in paths}
+
+    def _commit(self):
+        # Keep the loaded rows readable from the loop without a reload per row.
+        expire, self.db.expire_on_commit = self.db.expire_on_commit, False
+        try:
+            self.db.commit()
+        finally:
+            self.db.expire_on_commit = expire
+
+    def _save(self, cached: Dict, current: set):
+        for key, row in cached.items():
+            if key not in current:
+                self.db.delete(row)
+        self.db.commit()
+
+    def _fresh(self, row: Optional[CodeSummary], content_hash: str) -> bool:
+        return row is not None and row.content_hash == content_hash and row.model == self.model
+
+    def _store(self, cached: Dict, level: SummaryLevel, path: str, content_hash: str, text: str):
+        row = cached.get((level, path))
+        if row is None:
+            row = CodeSummary(repository_id=self.repo_id, level=level, path=path)
+            self.db.add(row)
+            cached[(level, path)] = row
+        row.content_hash = content_hash
+        row.model = self.model
+        row.summary = text
+
+    def _file_source(self, index_db: Session, path: str) -> str:
+        blocks = index_db.query(CodeBlock).filter(
+            (CodeBlock.repository_id == self.repo_id) & (CodeBlock.file_path == path)
+        ).order_by(CodeBlock.start_line, CodeBlock.end_line.desc()).all()
+        parts, covered_to = [], 0
+        for block in blocks:
+            # Methods are already part of their class's block.
+            if block.start_line <= covered_to:
+                continue
+            parts.append(block.content)
+            covered_to = block.end_line
+        return "\n\n".join(parts)[:MAX_FILE_CHARS]
+
+    def _file_prompt(self, path: str, source: str) -> str:
+        return f"""Summarize the file {path} in 2-4 sentences: its purpose, its main classes and functions, and how it is used.
+
+```
+{source or "(no indexed code)"}
+```"""
+
+    def _directory_prompt(self, repo: Repository, directory: str, entries: List[str], texts: Dict) -> str:
+        listing = "\n".join(
+            f"- {posixpath.basename(entry)}: {texts[entry][:MAX_CHILD_CHARS]}"
+            for entry in entries if texts.get(entry)
+        )
+        if directory == "":
+            return f"""Summarize the repository {repo.name} in one or two paragraphs from the summaries of its top-level files and directories below. Cover its purpose, architecture and main components.
+
+{listing}"""
+        return f"""Summarize the directory {directory}/ in 3-5 sentences from the summaries of its contents below. Describe its responsibility and how its parts fit together.
+
+{listing}"""
+
+    async def _generate(self, prompt: str) -> Optional[str]:
+        async with self.semaphore:
+            try:
+                response = await self.provider.generate(LLMRequest(
+                    system_prompt=SYSTEM_PROMPT,
+                    messages=[{"role": "user", "content": prompt}],
+                    model=self.model,
+                    temperature=0.2,
+                    max_tokens=MAX_TOKENS,
+                ))
+            except RuntimeError as e:
+                logger.warning(f"Summary generation failed for repository {self.repo_id}: {e}")
+                self.stats["failed"] += 1
+                metrics.increment("summaries.failed")
+                return None
+        self.stats["computed"] += 1
+        metrics.increment("summaries.computed")
+        return response.content.strip() or None
+
+
+def cached_summaries(db: Session, repo_id, max_depth: int = 1) -> Dict[str, str]:
+    """Stored repository and directory summaries down to ``max_depth``, keyed by path."""
+    rows = db.query(CodeSummary).filter(
+        (CodeSummary.repository_id == uuid.UUID(str(repo_id))) &
+        (CodeSummary.level != SummaryLevel.FILE)
+    ).all()
+    return {
+        row.path: row.summary
+        for row in sorted(rows, key=lambda row: row.path)
+        if row.path == "" or row.path.count("/") < max_depth
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update a repository's hierarchical summaries.")
+    parser.add_argument("repository_id")
+    parser.add_argument("--model", help="model to summarize with (default: the code model)")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    from llm import OllamaProvider
+    from services.model_selector import model_selector
+
+    provider = OllamaProvider()
+    try:
+        with SessionLocal() as db:
+            summarizer = RepositorySummarizer(db, args.repository_id, provider, args.model or model_selector.get_code_model())
+            summary = asyncio.run(summarizer.summarize())
+    finally:
+        provider.close()
+    print(summary or "(no summary)")
+    print(summarizer.stats)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
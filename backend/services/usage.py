@@ -0,0 +1,397 @@
+"""
+Token usage rollups and quota counters.
+
+``usage_rollups`` holds one row per user, model and UTC day with the tokens
+and responses of the assistant messages in it. ``record_usage`` adds each
+assistant message to its row in the same transaction that inserts the
+message. The chat route calls it when it commits, and the write-behind
+journal calls it when it flushes. Messages the journal skips as already
+inserted are not counted again. Restoring an archived session re-inserts
+rows without going through it, so archiving doesn't change usage either.
+
+``python -m services.usage --rebuild`` recomputes the rollups from live
+messages and archives. Use it after the migration that adds the table, or
+to repair drift.
+
+Quota checks read ``usage_counter`` instead of summing anything. It holds
+each user's month-to-date tokens and subscription tier. A miss or an expiry
+after ``USAGE_COUNTER_TTL_SECONDS`` reloads both from the rollups, which is
+at most one row per model and day. Between reloads the chat route adds each
+response's tokens to the counter. Like the session cache, it lives in Redis
+when ``REDIS_URL`` is set and in process otherwise.
+
+The chat route adds a response to the counter before its rollup is written,
+and ``add`` only touches a counter that is already loaded. A reload only
+fills in a counter nobody else has loaded (``HSETNX``). So a response is in
+either the counter or the rollups a reload reads, never both, and a reload
+never overwrites increments that landed while it read. A reload also counts
+this worker's responses still queued in the write-behind journal, whose
+rollups are not written yet; other workers' queues reach the rollups within
+a flush interval. ``change_tier`` drops the counter along with the tier change.
+
+``python -m services.usage --set-tier EMAIL TIER`` moves a user to another
+tier.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Message, MessageArchive, Session as DBSession, UsageRollup, User
+from models.message import MessageRole
+from models.user import SubscriptionTier
+from services.compaction import decode_messages
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "usage"
+REDIS_RETRY_SECONDS = 30
+LOCAL_MAX_ENTRIES = 10000
+
+RollupKey = Tuple[uuid.UUID, date, str]
+# Reads of the rollups to retry when a journal flush moved rows into them meanwhile.
+RELOAD_ATTEMPTS = 3
+
+# Increment a counter only once a reload has filled in its tier and tokens.
+INCREMENT_LOADED = """
+if redis.call('HEXISTS', KEYS[1], 'tier') == 1 then
+    return redis.call('HINCRBY', KEYS[1], 'tokens', ARGV[1])
+end
+return false
+"""
+
+
+def quota_for(tier) -> int:
+    """Monthly token quota of a subscription tier; 0 means unlimited."""
+    tier = SubscriptionTier(getattr(tier, "value", tier) or SubscriptionTier.FREE.value)
+    return getattr(settings, f"USAGE_QUOTA_{tier.name}_TOKENS")
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _add(totals: Dict[RollupKey, list], key: RollupKey, tokens: int):
+    entry = totals.setdefault(key, [0, 0])
+    entry[0] += tokens
+    entry[1] += 1
+
+
+def _upsert(db: Session, totals: Dict[RollupKey, list]):
+    dialect_insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    now = datetime.utcnow()
+    # Sorted, so concurrent flushes lock rows in the same order.
+    rows = [
+        {"user_id": user_id, "day": day, "model": model, "tokens_used": tokens, "message_count": count, "updated_at": now}
+        for (user_id, day, model), (tokens, count) in sorted(totals.items(), key=lambda item: (str(item[0][0]), item[0][1], item[0][2]))
+    ]
+    statement = dialect_insert(UsageRollup).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[UsageRollup.user_id, UsageRollup.day, UsageRollup.model],
+        set_={
+            "tokens_used": UsageRollup.tokens_used + statement.excluded.tokens_used,
+            "message_count": UsageRollup.message_count + statement.excluded.message_count,
+            "updated_at": statement.excluded.updated_at,
+        },
+    ))
+
+
+def record_usage(db: Session, messages: Iterable[Dict], owners: Optional[Dict] = None) -> int:
+    """Add just-inserted message rows to their rollups; returns how many counted.
+
+    ``owners`` maps session ids to ``(user_id, model)`` when the caller knows
+    them; other sessions are looked up. Commit is left to the caller.
+    """
+    messages = [m for m in messages if MessageRole(m["role"]) == MessageRole.ASSISTANT]
+    if not messages:
+        return 0
+    owners = dict(owners or {})
+    unknown = {m["session_id"] for m in messages} - set(owners)
+    if unknown:
+        owners.update({
+            id: (user_id, model) for id, user_id, model in
+            db.execute(select(DBSession.id, DBSession.user_id, DBSession.model).where(DBSession.id.in_(unknown)))
+        })
+    totals: Dict[RollupKey, list] = {}
+    for message in messages:
+        user_id, session_model = owners[message["session_id"]]
+        model = (message["msg_metadata"] or {}).get("model") or session_model
+        _add(totals, (uuid.UUID(str(user_id)), message["created_at"].date(), model), message["tokens_used"] or 0)
+    _upsert(db, totals)
+    return len(messages)
+
+
+def rebuild_usage(db: Session, batch_size: int = 1000) -> Dict:
+    """Recompute every rollup from live messages and archives.
+
+    Responses recorded while it runs can be lost, so run it while chat is quiet.
+    """
+    totals: Dict[RollupKey, list] = {}
+    live = db.execute(
+        select(DBSession.user_id, DBSession.model, Message.msg_metadata, Message.tokens_used, Message.created_at)
+        .join(Message, (Message.session_id == DBSession.id) & (Message.created_at >= DBSession.created_at))
+        .where(Message.role == MessageRole.ASSISTANT)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for user_id, session_model, metadata, tokens, created_at in live:
+        _add(totals, (user_id, created_at.date(), (metadata or {}).get("model") or session_model), tokens or 0)
+
+    archived = db.execute(
+        select(DBSession.user_id, DBSession.model, MessageArchive.payload)
+        .join(MessageArchive, MessageArchive.session_id == DBSession.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for user_id, session_model, payload in archived:
+        for message in decode_messages(zlib.decompress(payload)):
+            if message["role"] == MessageRole.ASSISTANT:
+                model = (message["msg_metadata"] or {}).get("model") or session_model
+                _add(totals, (user_id, message["created_at"].date(), model), message["tokens_used"] or 0)
+
+    db.execute(delete(UsageRollup))
+    if totals:
+        db.execute(insert(UsageRollup), [
+            {"user_id": user_id, "day": day, "model": model, "tokens_used": tokens, "message_count": count}
+            for (user_id, day, model), (tokens, count) in totals.items()
+        ])
+    db.commit()
+    stats = {
+        "rollups": len(totals),
+        "messages": sum(count for _, count in totals.values()),
+        "tokens_used": sum(tokens for tokens, _ in totals.values()),
+    }
+    logger.info(f"Rebuilt {stats['rollups']} usage rollups from {stats['messages']} messages")
+    return stats
+
+
+@dataclass
+class QuotaUsage:
+    tier: str
+    period_start: date
+    tokens_used: int
+    limit: int
+
+    @property
+    def remaining(self) -> Optional[int]:
+        return max(self.limit - self.tokens_used, 0) if self.limit else None
+
+    @property
+    def exceeded(self) -> bool:
+        return bool(self.limit) and self.tokens_used >= self.limit
+
+
+class UsageCounter:
+    def __init__(self, ttl_seconds: Optional[int] = None, redis_url: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds or settings.USAGE_COUNTER_TTL_SECONDS
+        self.redis_url = redis_url if redis_url is not None else settings.REDIS_URL
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_loop = None
+        self._redis_retry_at = 0.0
+
+    async def get(self, db, user_id) -> QuotaUsage:
+        """Month-to-date usage of ``user_id``, from the counter or, on a miss, the rollups."""
+        period_start = _month_start(datetime.utcnow().date())
+        key = self._key(user_id, period_start)
+        cached = await self._get_raw(key)
+        if cached is not None:
+            metrics.increment("usage_counter.hits")
+            tier, tokens = cached
+        else:
+            metrics.increment("usage_counter.misses")
+            tier = await db.scalar(select(User.subscription_tier).where(User.id == user_id))
+            tier = getattr(tier, "value", tier) or SubscriptionTier.FREE.value
+            tokens = await self._load_tokens(db, user_id, period_start)
+            tier, tokens = await self._set_raw(key, tier, tokens)
+        return QuotaUsage(tier=tier, period_start=period_start, tokens_used=int(tokens), limit=quota_for(tier))
+
+    async def _load_tokens(self, db, user_id, period_start: date) -> int:
+        """Rollups plus this worker's queued responses, each counted once."""
+        from services.message_journal import message_journal
+        since = datetime.combine(period_start, datetime.min.time())
+        for _ in range(RELOAD_ATTEMPTS):
+            # A flush moves rows from the queue into the rollups; read both between flushes.
+            sequence = message_journal.flush_sequence
+            pending = message_journal.pending_tokens(user_id, since)
+            stored = await db.scalar(select(func.coalesce(func.sum(UsageRollup.tokens_used), 0)).where(
+                (UsageRollup.user_id == user_id) & (UsageRollup.day >= period_start)
+            ))
+            if sequence % 2 == 0 and message_journal.flush_sequence == sequence:
+                break
+        return int(stored) + pending
+
+    async def add(self, user_id, tokens: int):
+        """Count ``tokens`` used by ``user_id`` towards this month; call before their rollup is written.
+
+        A counter that isn't loaded is left alone: the reload reads the rollup instead.
+        """
+        if not tokens:
+            return
+        key = self._key(user_id, _month_start(datetime.utcnow().date()))
+        if not self.redis_url:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry[2] += tokens
+            return
+        client = self._client()
+        if client is None:
+            return
+        try:
+            await client.eval(INCREMENT_LOADED, 1, key, tokens)
+        except Exception as e:
+            self._redis_failed(e)
+
+    async def invalidate(self, user_id):
+        """Drop the counter, e.g. after a tier change; the next check reloads it."""
+        key = self._key(user_id, _month_start(datetime.utcnow().date()))
+        with self._lock:
+            self._entries.pop(key, None)
+        client = self._client()
+        if client is not None:
+            try:
+                await client.delete(key)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def hit_ratio(self) -> float:
+        hits = metrics.get("usage_counter.hits")
+        total = hits + metrics.get("usage_counter.misses")
+        return hits / total if total else 0.0
+
+    def _key(self, user_id, period_start: date) -> str:
+        return f"{REDIS_PREFIX}:{user_id}:{period_start:%Y-%m}"
+
+    async def _get_raw(self, key: str) -> Optional[Tuple[str, int]]:
+        if not self.redis_url:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] < time.monotonic():
+                    self._entries.pop(key, None)
+                    return None
+                return entry[1], entry[2]
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = await client.hgetall(key)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        return self._loaded(raw)
+
+    @staticmethod
+    def _loaded(raw: Dict[bytes, bytes]) -> Optional[Tuple[str, int]]:
+        if b"tier" not in raw or b"tokens" not in raw:
+            return None
+        return raw[b"tier"].decode("utf-8"), int(raw[b"tokens"])
+
+    async def _set_raw(self, key: str, tier: str, tokens: int) -> Tuple[str, int]:
+        """Load the counter unless another request already has; returns what it holds."""
+        if not self.redis_url:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] < time.monotonic():
+                    entry = self._entries[key] = [time.monotonic() + self.ttl_seconds, tier, tokens]
+                self._entries.move_to_end(key)
+                while len(self._entries) > LOCAL_MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+                return entry[1], entry[2]
+        client = self._client()
+        if client is None:
+            return tier, tokens
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hsetnx(key, "tokens", tokens).hsetnx(key, "tier", tier).expire(key, self.ttl_seconds)
+                *_, raw = await pipe.hgetall(key).execute()
+        except Exception as e:
+            self._redis_failed(e)
+            return tier, tokens
+        return self._loaded(raw) or (tier, tokens)
+
+    def _client(self):
+        if not self.redis_url or time.monotonic() < self._redis_retry_at:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._redis_loop is not loop:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=0.2,
+                socket_timeout=0.2,
+            )
+            self._redis_loop = loop
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"Usage counter Redis unavailable, retrying in {REDIS_RETRY_SECONDS}s: {e}")
+        metrics.increment("usage_counter.redis_errors")
+        self._redis = None
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+usage_counter = UsageCounter()
+metrics.register_gauge("usage_counter.hit_ratio", usage_counter.hit_ratio)
+
+
+async def change_tier(db, user_id, tier):
+    """Move ``user_id`` to ``tier`` and drop their counter, so the next quota check applies it."""
+    await db.execute(update(User).where(User.id == user_id).values(subscription_tier=SubscriptionTier(tier)))
+    await db.commit()
+    await usage_counter.invalidate(user_id)
+
+
+async def _set_tier(email: str, tier: str) -> bool:
+    from database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        user_id = await db.scalar(select(User.id).where(User.email == email))
+        if user_id is None:
+            return False
+        await change_tier(db, user_id, tier)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain per-user, per-model daily token usage rollups.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every rollup from messages and archives")
+    parser.add_argument("--set-tier", nargs=2, metavar=("EMAIL", "TIER"), help="move a user to another subscription tier")
+    args = parser.parse_args()
+    if args.set_tier:
+        email, tier = args.set_tier
+        if tier not in [t.value for t in SubscriptionTier]:
+            parser.error(f"unknown tier {tier!r}")
+        if not asyncio.run(_set_tier(email, tier)):
+            parser.error(f"no user with email {email!r}")
+        return
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild or --set-tier")
+
+    from database import SessionLocal
+    with SessionLocal() as db:
+        stats = rebuild_usage(db)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Repository pre-warm.
+
+Without it, the first question in a session pays for every cold start at
+once: opening the index shard, reading the BM25 lexicons, paging postings,
+vectors and MinHash tables in from disk, and Ollama loading the code model.
+Clients call ``POST /repositories/{id}/warm`` when a repository is selected.
+That does all of the above in the background and also precomputes the
+repository overview that agents put in front of their prompts. Overviews
+live in ``repo_metadata`` keyed by index version, so they are rebuilt only
+after re-indexing. Agents only read them; until a warm-up has built one,
+prompts go without it.
+
+Hierarchical summaries cost a model call per changed file on the same
+Ollama instance that is about to answer, so warm-up only builds them with
+``SUMMARIES_ON_WARM``. Otherwise run ``python -m services.summaries``.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from indexing.bm25 import bm25_registry
+from indexing.embeddings import vector_registry
+from indexing.minhash import minhash_registry
+from indexing.shards import index_session
+from llm import OllamaProvider
+from models import CodeBlock, Repository, SymbolEdge
+from models.symbol_graph import EdgeKind
+from services.metrics import metrics
+from services.summaries import RepositorySummarizer
+
+logger = logging.getLogger(__name__)
+
+OVERVIEW_DIRECTORIES = 8
+OVERVIEW_SYMBOLS = 15
+
+
+def build_overview(index_db: Session, repo: Repository) -> str:
+    """Short orientation text: size, languages, main directories and key symbols."""
+    files = index_db.query(CodeBlock.file_path, CodeBlock.language).filter(
+        CodeBlock.repository_id == repo.id
+    ).distinct().all()
+    block_count = index_db.query(func.count(CodeBlock.id)).filter(CodeBlock.repository_id == repo.id).scalar()
+
+    languages = Counter(language for _, language in files)
+    directories = Counter(
+        file_path.split("/", 1)[0] + "/" if "/" in file_path else "(root)"
+        for file_path, _ in files
+    )
+
+    referenced = index_db.query(SymbolEdge.target, func.count(SymbolEdge.id).label("refs")).filter(
+        (SymbolEdge.repository_id == repo.id) & (SymbolEdge.kind == EdgeKind.CALL)
+    ).group_by(SymbolEdge.target).order_by(func.count(SymbolEdge.id).desc()).limit(OVERVIEW_SYMBOLS * 4).all()
+    defined = dict(index_db.query(CodeBlock.entity_name, CodeBlock.file_path).filter(
+        (CodeBlock.repository_id == repo.id) &
+        (CodeBlock.entity_name.in_([target for target, _ in referenced]))
+    ).all()) if referenced else {}
+    symbols = [
+        f"{target} ({defined[target]}, {refs} references)"
+        for target, refs in referenced if target in defined
+    ][:OVERVIEW_SYMBOLS]
+
+    lines = [
+        f"Repository overview: {repo.name}",
+        f"{len(files)} files, {block_count} indexed code blocks.",
+    ]
+    if repo.description:
+        lines.append(repo.description)
+    if languages:
+        lines.append("Languages: " + ", ".join(f"{language} ({count} files)" for language, count in languages.most_common()))
+    if directories:
+        lines.append("Main directories: " + ", ".join(
+            f"{directory} ({count} files)" for directory, count in directories.most_common(OVERVIEW_DIRECTORIES)
+        ))
+    if symbols:
+        lines.append("Most referenced symbols: " + ", ".join(symbols))
+    return "\n".join(lines)
+
+
+def _cached_text(repo: Optional[Repository]) -> Optional[str]:
+    cached = (repo.repo_metadata or {}).get("overview") if repo is not None else None
+    if cached and cached.get("index_version") == repo.index_version:
+        return cached["text"]
+    return None
+
+
+def cached_overview(db: Session, repo_id) -> Optional[str]:
+    """The overview for the repository's current index if warm-up has built it; never builds one."""
+    return _cached_text(db.query(Repository).filter(Repository.id == uuid.UUID(str(repo_id))).first())
+
+
+def repository_overview(db: Session, repo_id) -> Optional[str]:
+    """The cached overview for the repository's current index, building it if missing."""
+    repo = db.query(Repository).filter(Repository.id == uuid.UUID(str(repo_id))).first()
+    if repo is None or not repo.indexed:
+        return None
+    cached = _cached_text(repo)
+    if cached:
+        return cached
+
+    with index_session(db, repo.id) as index_db:
+        text = build_overview(index_db, repo)
+    repo_metadata = dict(repo.repo_metadata or {})
+    repo_metadata["overview"] = {"index_version": repo.index_version, "text": text}
+    repo.repo_metadata = repo_metadata
+    db.commit()
+    return text
+
+
+class RepositoryWarmer:
+    def __init__(self):
+        self._warmed: Dict[str, tuple] = {}
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def due(self, repo_id, index_version: Optional[str]) -> bool:
+        """Whether ``repo_id`` needs a warm-up: none is running or recently finished."""
+        with self._lock:
+            return self._due(str(repo_id), index_version)
+
+    def claim(self, repo_id, index_version: Optional[str]) -> bool:
+        """Reserve a warm-up for ``repo_id`` if one is due.
+
+        Claim from the task that runs ``warm``, so the reservation is always
+        released by it.
+        """
+        key = str(repo_id)
+        with self._lock:
+            if not self._due(key, index_version):
+                return False
+            self._inflight.add(key)
+            return True
+
+    def _due(self, key: str, index_version: Optional[str]) -> bool:
+        if key in self._inflight:
+            return False
+        warmed = self._warmed.get(key)
+        return not (warmed and warmed[0] == index_version and time.monotonic() - warmed[1] < settings.WARM_INTERVAL_SECONDS)
+
+    async def warm(self, bind, repo_id, model: Optional[str] = None) -> Dict:
+        """Warm ``repo_id``'s indexes, overview and model. Call after ``claim``."""
+        key = str(repo_id)
+        started = time.perf_counter()
+        try:
+            stats = await asyncio.to_thread(self._warm_indexes, bind, repo_id)
+            stats["model"] = await self._warm_models(model, stats.pop("has_vectors"))
+            stats["summaries"] = await self._warm_summaries(bind, repo_id, model)
+            stats["took_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                self._warmed[key] = (stats["index_version"], time.monotonic())
+            metrics.increment("warmup.completed")
+            logger.info(f"Warmed repository {repo_id} in {stats['took_ms']}ms")
+            return stats
+        except Exception as e:
+            metrics.increment("warmup.failed")
+            logger.warning(f"Warm-up failed for repository {repo_id}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def forget(self, repo_id=None):
+        with self._lock:
+            if repo_id is None:
+                self._warmed.clear()
+            else:
+                self._warmed.pop(str(repo_id), None)
+
+    def _warm_indexes(self, bind, repo_id) -> Dict:
+        with Session(bind=bind) as db:
+            repo = db.query(Repository).filter(Repository.id == uuid.UUID(str(repo_id))).first()
+            index_version = repo.index_version if repo else None
+            # Opens the shard (when sharding) and primes its first pages.
+            with index_session(db, repo_id) as index_db:
+                index_db.query(CodeBlock.id).filter(CodeBlock.repository_id == uuid.UUID(str(repo_id))).limit(1).all()
+            overview = repository_overview(db, repo_id)
+
+        return {
+            "index_version": index_version,
+            "overview_chars": len(overview or ""),
+            "bm25_bytes": bm25_registry.get(repo_id).warm(),
+            "vector_bytes": vector_registry.get(repo_id).warm(),
+            "minhash_bytes": minhash_registry.get(repo_id).warm(),
+            "has_vectors": vector_registry.get(repo_id).exists(),
+        }
+
+    async def _warm_summaries(self, bind, repo_id, model: Optional[str]) -> Optional[Dict]:
+        # Incremental: after the first warm-up only re-indexed paths cost model calls.
+        if not model or not settings.SUMMARIES_ON_WARM:
+            return None
+        provider = OllamaProvider()
+        try:
+            with Session(bind=bind) as db:
+                summarizer = RepositorySummarizer(db, repo_id, provider, model)
+                await summarizer.summarize()
+            return summarizer.stats
+        finally:
+            provider.close()
+
+    async def _warm_models(self, model: Optional[str], has_vectors: bool) -> Optional[str]:
+        provider = OllamaProvider()
+        try:
+            jobs = []
+            if model:
+                jobs.append(provider.preload(model))
+            if has_vectors and settings.EMBEDDINGS_ENABLED:
+                jobs.append(provider.embed(["warm up"]))
+            for result in await asyncio.gather(*jobs, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.warning(f"Model warm-up failed: {result}")
+            return model
+        finally:
+            provider.close()
+
+
+warmer = RepositoryWarmer()
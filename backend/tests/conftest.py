@@ -1,35 +1,65 @@
+import asyncio
+
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-from database import Base, get_db
+from database import Base, get_db, get_read_db, get_read_sync_db, get_sync_db, get_sync_engine
 from main import app
 from fastapi.testclient import TestClient
 
 
 @pytest.fixture(scope="function")
-def test_db():
+def test_db_path(tmp_path):
+    # A file, not :memory:, so the sync and async engines see the same database.
+    return tmp_path / "test.db"
+
+
+@pytest.fixture(scope="function")
+def test_db(test_db_path):
     engine = create_engine(
-        "sqlite:///:memory:",
+        f"sqlite:///{test_db_path}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
     Base.metadata.create_all(bind=engine)
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-    def override_get_db():
+    def override_get_sync_db():
         try:
             db = TestingSessionLocal()
             yield db
         finally:
             db.close()
 
-    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_sync_db] = override_get_sync_db
+    app.dependency_overrides[get_read_sync_db] = override_get_sync_db
+    app.dependency_overrides[get_sync_engine] = lambda: engine
     yield TestingSessionLocal
+    app.dependency_overrides.pop(get_sync_db, None)
+    app.dependency_overrides.pop(get_read_sync_db, None)
+    app.dependency_overrides.pop(get_sync_engine, None)
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def async_test_db(test_db, test_db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{test_db_path}")
+    TestingAsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    yield TestingAsyncSessionLocal
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_read_db, None)
+    asyncio.run(engine.dispose())
 
 
 @pytest.fixture(scope="function")
-def client(test_db):
+def client(test_db, async_test_db):
     return TestClient(app)
 
 
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from agents import QAAgent
+from llm.base import LLMResponse
+from models import Repository
+from services.agent_memo import AgentResultStore, MemoKey, agent_memo, code_hash
+from services.retrieval import RetrievalService
+
+KEY = MemoKey("explain_code", "model", 1, code_hash("x = 1"), "v1")
+
+
+class CountingCompute:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f"result {self.calls}"
+
+
+class FakeProvider:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, request):
+        self.calls += 1
+        return LLMResponse(content=f"explanation {self.calls}", tokens_used=3, cost=0.0, model=request.model, finish_reason="stop")
+
+    def get_context_window(self, model=None):
+        return 4096
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+class TestAgentResultStore:
+    def test_hit_after_miss_and_concurrent_misses_share_one_call(self):
+        store = AgentResultStore(max_entries=10, ttl_seconds=60, stale_seconds=60)
+        compute = CountingCompute(delay=0.05)
+
+        async def run():
+            first, second = await asyncio.gather(store.get_or_compute(KEY, compute), store.get_or_compute(KEY, compute))
+            third = await store.get_or_compute(KEY, compute)
+            return first, second, third
+
+        first, second, third = asyncio.run(run())
+        assert compute.calls == 1
+        assert first.value == second.value == third.value == "result 1"
+        assert not first.cached and third.cached
+
+    def test_cancelled_owner_does_not_cancel_sharers(self):
+        store = AgentResultStore(max_entries=10, ttl_seconds=60, stale_seconds=60)
+        compute = CountingCompute(delay=0.05)
+
+        async def run():
+            owner = asyncio.ensure_future(store.get_or_compute(KEY, compute))
+            await asyncio.sleep(0)
+            sharer = asyncio.ensure_future(store.get_or_compute(KEY, compute))
+            await asyncio.sleep(0)
+            owner.cancel()
+            return await sharer
+
+        assert asyncio.run(run()).value == "result 1"
+        assert compute.calls == 1
+        assert store.peek(KEY).value == "result 1"
+
+    def test_stale_entry_is_served_then_refreshed(self):
+        store = AgentResultStore(max_entries=10, ttl_seconds=0.05, stale_seconds=60)
+        compute = CountingCompute()
+
+        async def run():
+            await store.get_or_compute(KEY, compute)
+            await asyncio.sleep(0.06)
+            stale = await store.get_or_compute(KEY, compute, revalidate=True, refresh=compute)
+            await asyncio.sleep(0.01)
+            return stale, store.peek(KEY)
+
+        stale, refreshed = asyncio.run(run())
+        assert stale.stale and stale.value == "result 1"
+        assert compute.calls == 2
+        assert refreshed.value == "result 2" and not refreshed.stale
+
+    def test_stale_entry_is_recomputed_without_revalidate_and_expires(self):
+        store = AgentResultStore(max_entries=10, ttl_seconds=0.02, stale_seconds=0.02)
+        compute = CountingCompute()
+
+        async def run():
+            await store.get_or_compute(KEY, compute)
+            await asyncio.sleep(0.03)
+            inline = await store.get_or_compute(KEY, compute)
+            await asyncio.sleep(0.05)
+            return inline, store.peek(KEY)
+
+        inline, expired = asyncio.run(run())
+        assert inline.value == "result 2" and not inline.cached
+        assert expired is None
+
+    def test_lru_eviction(self):
+        store = AgentResultStore(max_entries=2, ttl_seconds=60, stale_seconds=0)
+        keys = [KEY._replace(code_hash=code_hash(str(i))) for i in range(3)]
+
+        async def run():
+            for key in keys[:2]:
+                await store.get_or_compute(key, CountingCompute())
+            store.peek(keys[0])
+            await store.get_or_compute(keys[2], CountingCompute())
+
+        asyncio.run(run())
+        assert store.peek(keys[0]) and store.peek(keys[2])
+        assert store.peek(keys[1]) is None
+
+    def test_code_hash_ignores_trailing_whitespace(self):
+        assert code_hash("def f():\r\n    pass  \n") == code_hash("def f():\n    pass")
+        assert code_hash("a", "b") != code_hash("ab", "")
+
+
+@pytest.fixture
+def repo(test_db, test_user, monkeypatch):
+    async def build_context(self, query, model, limit=8):
+        return ""
+
+    monkeypatch.setattr(RetrievalService, "build_context", build_context)
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="memo-repo", indexed=True, index_version="v1")
+    db.add(repo)
+    db.commit()
+    agent_memo.invalidate()
+    yield db, repo
+    agent_memo.invalidate()
+
+
+class TestMemoizedAgentOperations:
+    def test_explain_code_is_reused_until_reindex_or_template_change(self, repo, monkeypatch):
+        db, repo = repo
+        provider = FakeProvider()
+        agent = QAAgent(db, repo.id, "test-model", provider=provider)
+
+        assert asyncio.run(agent.explain_code("def f():\n    return 1")) == "explanation 1"
+        assert asyncio.run(agent.explain_code("def f():\n    return 1\n")) == "explanation 1"
+        assert provider.calls == 1
+
+        repo.index_version = "v2"
+        db.commit()
+        assert asyncio.run(agent.explain_code("def f():\n    return 1")) == "explanation 2"
+
+        monkeypatch.setattr(QAAgent, "PROMPT_VERSIONS", {"explain_code": 2})
+        assert asyncio.run(agent.explain_code("def f():\n    return 1")) == "explanation 3"
+        assert provider.calls == 3
+
+    def test_background_refresh_runs_on_its_own_session(self, repo, monkeypatch):
+        db, repo = repo
+        sessions = []
+
+        async def process(self, user_message, context=None, history=None):
+            sessions.append(self.db)
+            return f"explanation {len(sessions)}"
+
+        monkeypatch.setattr(QAAgent, "process", process)
+        monkeypatch.setattr(agent_memo, "ttl_seconds", 0.0)
+        agent = QAAgent(db, repo.id, "test-model", provider=FakeProvider())
+
+        async def run():
+            first = await agent.explain_code("x = 1", revalidate=True)
+            stale = await agent.explain_code("x = 1", revalidate=True)
+            await asyncio.sleep(0.01)
+            return first, stale
+
+        assert asyncio.run(run()) == ("explanation 1", "explanation 1")
+        assert len(sessions) == 2
+        assert sessions[0] is db and sessions[1] is not db
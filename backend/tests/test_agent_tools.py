@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+from agents import CodingAgent
+from agents.tools import ToolBudget, ToolSession
+from config import settings
+from indexing import RepositoryIndexer
+from indexing.bm25 import bm25_registry
+from indexing.minhash import minhash_registry
+from llm.base import LLMResponse, LLMToolCall
+from models import Repository
+
+
+class ScriptedProvider:
+    """Replays one response per model turn: a list of tool calls, or the final text."""
+
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.requests = []
+
+    async def generate(self, request):
+        self.requests.append(request)
+        turn = self.turns.pop(0)
+        if isinstance(turn, str):
+            return LLMResponse(content=turn, tokens_used=10, cost=0.0, model=request.model, finish_reason="stop")
+        calls = [LLMToolCall(id=f"call_{i}", name=name, arguments=args) for i, (name, args) in enumerate(turn)]
+        return LLMResponse(content="", tokens_used=10, cost=0.0, model=request.model, finish_reason="tool_calls", tool_calls=calls)
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+@pytest.fixture
+def indexed_repo(test_db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+
+    source = tmp_path / "src"
+    (source / "app").mkdir(parents=True)
+    (source / "app" / "config.py").write_text(
+        "def load_config(path):\n    return parse_yaml(path)\n\n"
+        "def parse_yaml(path):\n    return open(path).read()\n"
+    )
+    (source / "app" / "main.py").write_text("def main():\n    return load_config('app.yaml')\n")
+
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="tools-repo", local_path=str(source))
+    db.add(repo)
+    db.commit()
+    asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+    yield db, repo
+    bm25_registry.evict(repo.id)
+    minhash_registry.evict(repo.id)
+
+
+class TestToolLoop:
+    def test_tools_run_and_results_feed_the_next_turn(self, indexed_repo):
+        db, repo = indexed_repo
+        provider = ScriptedProvider([
+            [("search_code", {"query": "load_config"}), ("grep", {"pattern": "parse_yaml\\("}),
+             ("get_file_content", {"file_path": "app/main.py"}), ("symbol_neighborhood", {"names": ["load_config"]})],
+            "load_config reads YAML via parse_yaml.",
+        ])
+        agent = CodingAgent(db, repo.id, "test-model", provider=provider)
+        result = asyncio.run(agent.run_tools("Where is config parsed?"))
+
+        assert result.content == "load_config reads YAML via parse_yaml."
+        assert result.stopped == "answer"
+        assert provider.requests[0].tools and len(result.steps) == 2
+        tool_messages = {m["tool_name"]: m["content"] for m in provider.requests[1].messages if m["role"] == "tool"}
+        assert "File: app/config.py:1-2 (load_config)" in tool_messages["search_code"]
+        assert "app/config.py:2:     return parse_yaml(path)" in tool_messages["grep"]
+        assert "def main()" in tool_messages["get_file_content"]
+        assert "parse_yaml" in tool_messages["symbol_neighborhood"]
+        assert all(call.error is None for call in result.steps[0].calls)
+
+    def test_independent_calls_run_concurrently_and_are_cached(self, indexed_repo, monkeypatch):
+        db, repo = indexed_repo
+        executed = []
+
+        async def slow_tool(self, name, arguments):
+            executed.append(name)
+            await asyncio.sleep(0.2)
+            return f"{name} result"
+
+        monkeypatch.setattr(CodingAgent, "execute_tool", slow_tool)
+        provider = ScriptedProvider([
+            [("search_code", {"query": "a"}), ("grep", {"pattern": "b"}), ("search_code", {"query": "a"})],
+            [("grep", {"pattern": "b"})],
+            "done",
+        ])
+        agent = CodingAgent(db, repo.id, "test-model", provider=provider)
+
+        started = time.perf_counter()
+        result = asyncio.run(agent.run_tools("question"))
+        elapsed = time.perf_counter() - started
+
+        assert executed == ["search_code", "grep"]
+        assert elapsed < 0.35
+        assert [call.cached for call in result.steps[0].calls] == [False, False, True]
+        assert result.steps[1].calls[0].cached
+
+    def test_budget_stops_tool_use(self, indexed_repo):
+        db, repo = indexed_repo
+        provider = ScriptedProvider([[("search_code", {"query": "load_config"})], "best effort answer"])
+        agent = CodingAgent(db, repo.id, "test-model", provider=provider)
+
+        result = asyncio.run(agent.run_tools("question", budget=ToolBudget(max_steps=1, max_tokens=10000, max_seconds=30)))
+        assert result.stopped == "max_steps"
+        assert result.content == "best effort answer"
+        assert provider.requests[-1].tools is None
+
+    def test_tool_errors_are_reported_to_the_model(self, indexed_repo):
+        db, repo = indexed_repo
+        provider = ScriptedProvider([[("grep", {"pattern": "("}), ("unknown_tool", {})], "ok"])
+        agent = CodingAgent(db, repo.id, "test-model", provider=provider)
+
+        result = asyncio.run(agent.run_tools("question"))
+        assert all(call.error for call in result.steps[0].calls)
+        contents = [m["content"] for m in provider.requests[1].messages if m["role"] == "tool"]
+        assert contents[1].startswith("Tool unknown_tool failed")
+
+    def test_a_timed_out_caller_does_not_cancel_a_shared_call(self, indexed_repo):
+        db, repo = indexed_repo
+        agent = CodingAgent(db, repo.id, "test-model", provider=ScriptedProvider([]))
+        session = ToolSession()
+        executions = []
+
+        async def slow_tool(name, arguments):
+            executions.append(name)
+            await asyncio.sleep(0.2)
+            return "result"
+
+        agent.execute_tool = slow_tool
+
+        async def run():
+            return await asyncio.gather(
+                agent._call_tool(session, "grep", {"pattern": "a"}, 0.05),
+                agent._call_tool(session, "grep", {"pattern": "a"}, 1.0),
+            )
+
+        (owner, _), (sharer, result) = asyncio.run(run())
+        assert owner.error == "timed out"
+        assert sharer.error is None and sharer.cached and result == "result"
+        assert executions == ["grep"]
+        assert session.key("grep", {"pattern": "a"}) in session._results
+
+    def test_spent_time_budget_skips_the_tool_round(self, indexed_repo, monkeypatch):
+        db, repo = indexed_repo
+        provider = ScriptedProvider([[("search_code", {"query": "load_config"})], "answer"])
+        agent = CodingAgent(db, repo.id, "test-model", provider=provider)
+        executed = []
+
+        async def tool(self, name, arguments):
+            executed.append(name)
+            return "result"
+
+        async def slow_generate(request):
+            await asyncio.sleep(0.05)
+            return await ScriptedProvider.generate(provider, request)
+
+        monkeypatch.setattr(CodingAgent, "execute_tool", tool)
+        provider.generate = slow_generate
+
+        result = asyncio.run(agent.run_tools("question", budget=ToolBudget(max_steps=5, max_tokens=10000, max_seconds=0.01)))
+        assert executed == []
+        assert result.stopped == "time" and result.content == "answer"
+        assert provider.requests[-1].tools is None
+        assert not any(m["role"] == "tool" for m in provider.requests[-1].messages)
@@ -66,3 +66,29 @@ class TestAuth:
         )
         assert response.status_code == 200
         assert response.json()["email"] == "test@example.com"
+
+    def test_register_is_visible_to_async_sessions(self, client, async_test_db):
+        import asyncio
+        from sqlalchemy import select
+        from models import User
+
+        response = client.post(
+            "/api/v1/auth/register",
+            json={"email": "Async@Example.com", "username": "asyncuser", "password": "password123"},
+        )
+        assert response.status_code == 200
+
+        async def lookup():
+            async with async_test_db() as db:
+                return await db.scalar(select(User).where(User.username == "asyncuser"))
+
+        user = asyncio.run(lookup())
+        assert user.email == "async@example.com"
+        assert str(user.id) == response.json()["user"]["id"]
+
+    def test_malformed_subject_is_rejected(self, client):
+        from utils.auth import create_access_token
+
+        token = create_access_token(data={"sub": "not-a-uuid"})
+        response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
@@ -0,0 +1,98 @@
+import pytest
+from indexing.bm25 import BM25Index, MAX_SEGMENTS
+from indexing.tokenizer import tokenize
+from models import CodeBlock, Repository
+from models.code_index import EntityType
+
+
+def add_block(db, repo, name, path, content):
+    block = CodeBlock(
+        repository_id=repo.id,
+        file_path=path,
+        start_line=1,
+        end_line=1,
+        language="python",
+        content=content,
+        entity_type=EntityType.FUNCTION,
+        entity_name=name,
+    )
+    db.add(block)
+    db.commit()
+    return block
+
+
+@pytest.fixture
+def repo_db(test_db, test_user):
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="bm25-repo")
+    db.add(repo)
+    db.commit()
+    return db, repo
+
+
+class TestTokenizer:
+    def test_splits_camel_and_snake_case(self):
+        assert tokenize("getUserName load_http_config") == [
+            "get", "user", "name", "getusername", "load", "http", "config", "loadhttpconfig",
+        ]
+
+
+class TestBM25Index:
+    def test_rebuild_and_search(self, repo_db, tmp_path):
+        db, repo = repo_db
+        target = add_block(db, repo, "loadConfig", "a.py", "def loadConfig(path): return read(path)")
+        add_block(db, repo, "renderTree", "b.py", "def renderTree(node): return node")
+
+        index = BM25Index(repo.id, base_dir=str(tmp_path))
+        index.rebuild(db)
+
+        results = BM25Index(repo.id, base_dir=str(tmp_path)).search("load config")
+        assert results[0][0] == str(target.id)
+        assert len(results) == 1
+
+    def test_apply_replaces_changed_files(self, repo_db, tmp_path):
+        db, repo = repo_db
+        old = add_block(db, repo, "loadConfig", "a.py", "def loadConfig(): pass")
+        add_block(db, repo, "renderTree", "b.py", "def renderTree(): pass")
+        index = BM25Index(repo.id, base_dir=str(tmp_path))
+        index.rebuild(db)
+
+        db.delete(old)
+        new = add_block(db, repo, "saveConfig", "a.py", "def saveConfig(): pass")
+        index.apply(db, ["a.py"])
+
+        ids = [block_id for block_id, _ in index.search("config")]
+        assert ids == [str(new.id)]
+
+    def test_segments_are_merged(self, repo_db, tmp_path):
+        db, repo = repo_db
+        for i in range(4):
+            add_block(db, repo, f"stable{i}", f"stable{i}.py", "def stable(): pass")
+        index = BM25Index(repo.id, base_dir=str(tmp_path))
+        index.rebuild(db)
+
+        for i in range(MAX_SEGMENTS + 1):
+            add_block(db, repo, f"extra{i}", f"extra{i}.py", "def extra(): pass")
+            index.apply(db, [f"extra{i}.py"])
+
+        manifest = index._read_manifest()
+        assert len(manifest["segments"]) <= MAX_SEGMENTS
+        assert len(index.search("stable")) == 4
+        assert len(index.search("extra", limit=50)) == MAX_SEGMENTS + 1
+
+    def test_merge_does_not_break_searches_holding_old_segments(self, repo_db, tmp_path):
+        db, repo = repo_db
+        add_block(db, repo, "stable", "stable.py", "def stable(): pass")
+        writer = BM25Index(repo.id, base_dir=str(tmp_path))
+        writer.rebuild(db)
+        add_block(db, repo, "extra", "extra.py", "def extra(): pass")
+        writer.apply(db, ["extra.py"])
+        reader = BM25Index(repo.id, base_dir=str(tmp_path))
+        reader.search("stable")
+        held = list(reader._segments)
+
+        writer.merge()
+
+        assert not any(path.exists() for segment in held for path in segment.files())
+        assert [segment.term_postings("stable") is not None for segment in held] == [True, False]
+        assert len(reader.search("stable extra")) == 2
@@ -66,4 +66,203 @@ class TestChat:
             headers={"Authorization": f"Bearer {token}"},
         )
         assert response.status_code == 200
-        assert isinstance(response.json(), list)
+        assert response.json() == {"sessions": [], "next_cursor": None}
+
+
+class TestChatAgents:
+    @pytest.fixture
+    def indexed_repo(self, test_db, test_user, tmp_path, monkeypatch):
+        import asyncio
+        from config import settings
+        from indexing import RepositoryIndexer
+        from indexing.bm25 import bm25_registry
+        from indexing.minhash import minhash_registry
+        from models import Repository
+
+        monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+        monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+        source = tmp_path / "src"
+        source.mkdir()
+        (source / "fib.py").write_text("def fibonacci(n):\n    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)\n")
+
+        db = test_db()
+        repo = Repository(user_id=test_user.id, name="chat-repo", local_path=str(source))
+        db.add(repo)
+        db.commit()
+        asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+        yield db, repo
+        bm25_registry.evict(repo.id)
+        minhash_registry.evict(repo.id)
+
+    @pytest.fixture
+    def requests(self, monkeypatch):
+        from llm import OllamaProvider
+        seen = []
+
+        async def generate(self, request):
+            seen.append(request)
+            return LLMResponse(content=f"reply {len(seen)}", tokens_used=5, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        return seen
+
+    @pytest.fixture
+    def headers(self, client, test_user):
+        response = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def test_repository_chat_uses_agent_with_code_context(self, client, headers, indexed_repo, requests):
+        import uuid
+        from models import Message
+        db, repo = indexed_repo
+
+        response = client.post("/api/v1/chat/", headers=headers, json={
+            "repository_id": str(repo.id), "agent_type": "coding", "model": "test-model",
+            "message": "How does fibonacci work?",
+        })
+        assert response.status_code == 200
+        assert response.json()["content"] == "reply 1"
+        assert requests[0].system_prompt.startswith("You are an expert AI code generation")
+        assert "File: fib.py:1-2 (fibonacci)" in requests[0].messages[-1]["content"]
+
+        response = client.post("/api/v1/chat/", headers=headers, json={
+            "session_id": response.json()["session_id"], "agent_type": "coding", "message": "And for n=0?",
+        })
+        assert [m["content"] for m in requests[1].messages[:2]] == ["How does fibonacci work?", "reply 1"]
+
+        message = db.query(Message).filter(Message.id == uuid.UUID(response.json()["message_id"])).one()
+        assert message.msg_metadata["model"] == "test-model"
+        assert {"history_ms", "retrieval_ms", "generation_ms", "total_ms"} <= set(message.msg_metadata["timings"])
+
+    def test_chat_can_let_the_agent_use_tools(self, client, headers, indexed_repo, monkeypatch):
+        import uuid
+        from llm import OllamaProvider
+        from llm.base import LLMToolCall
+        from models import Message
+        db, repo = indexed_repo
+        seen = []
+
+        async def generate(self, request):
+            seen.append(request)
+            if len(seen) == 1:
+                call = LLMToolCall(id="call_0", name="grep", arguments={"pattern": "fibonacci"})
+                return LLMResponse(content="", tokens_used=5, cost=0.0, model=request.model, finish_reason="tool_calls", tool_calls=[call])
+            return LLMResponse(content="recursive", tokens_used=5, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        response = client.post("/api/v1/chat/", headers=headers, json={
+            "repository_id": str(repo.id), "agent_type": "coding", "model": "test-model",
+            "message": "How does fibonacci work?", "tools": True,
+        })
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "recursive"
+        assert response.json()["tools_used"] == ["grep"]
+        assert seen[0].tools
+        assert any(m["role"] == "tool" and "fib.py:1:" in m["content"] for m in seen[1].messages)
+        message = db.query(Message).filter(Message.id == uuid.UUID(response.json()["message_id"])).one()
+        assert message.tools_used == ["grep"]
+
+    def test_unknown_agent_type_is_rejected(self, client, headers, requests):
+        response = client.post("/api/v1/chat/", headers=headers, json={"agent_type": "poet", "message": "hi"})
+        assert response.status_code == 400
+        assert requests == []
+
+    def test_registry_maps_types_to_agents(self, test_db):
+        from agents import CodingAgent, QAAgent, ReasoningAgent, agent_registry
+        from llm import provider_pool
+
+        db = test_db()
+        assert isinstance(agent_registry.create("web_dev", db, None, "m"), CodingAgent)
+        assert isinstance(agent_registry.create("docs", db, None, "m"), QAAgent)
+        assert isinstance(agent_registry.create("reasoning", db, None, "m"), ReasoningAgent)
+        first = agent_registry.create("qa", db, None, "m", session_id="s1")
+        second = agent_registry.create("coding", db, None, "m", session_id="s1")
+        assert first.provider is second.provider is provider_pool.get()
+        assert first.tool_session is second.tool_session
+
+
+class TestChatPagination:
+    @pytest.fixture
+    def headers(self, client, test_user):
+        response = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    @pytest.fixture
+    def sessions(self, test_db, test_user):
+        from datetime import datetime, timedelta
+        from models import Message, Session as DBSession
+        from models.message import MessageRole
+
+        db = test_db()
+        start = datetime(2026, 1, 1)
+        sessions = []
+        for i in range(5):
+            session = DBSession(user_id=test_user.id, model="m", created_at=start, updated_at=start + timedelta(hours=i))
+            db.add(session)
+            db.flush()
+            for j in range(3):
+                role = MessageRole.USER if j % 2 == 0 else MessageRole.ASSISTANT
+                db.add(Message(session_id=session.id, role=role, content=f"s{i} m{j} " + "x" * 200, created_at=start + timedelta(minutes=j)))
+            sessions.append(session)
+        db.commit()
+        return [str(session.id) for session in sessions]
+
+    def test_sessions_are_paged_by_recent_activity(self, client, headers, sessions):
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = client.get("/api/v1/chat/sessions/", headers=headers, params=params).json()
+            pages.append(page["sessions"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert [len(page) for page in pages] == [2, 2, 1]
+        listed = [session for page in pages for session in page]
+        assert [s["id"] for s in listed] == sessions[::-1]
+        assert listed[0]["message_count"] == 3
+        assert listed[0]["title"] == ("s4 m0 " + "x" * 200)[:80]
+        assert "messages" not in listed[0]
+
+    def test_messages_are_paged_oldest_first(self, client, headers, sessions):
+        url = f"/api/v1/chat/sessions/{sessions[0]}/messages"
+        first = client.get(url, headers=headers, params={"limit": 2}).json()
+        second = client.get(url, headers=headers, params={"limit": 2, "cursor": first["next_cursor"]}).json()
+        contents = [m["content"][:5] for m in first["messages"] + second["messages"]]
+        assert contents == ["s0 m0", "s0 m1", "s0 m2"]
+        assert second["next_cursor"] is None
+
+    def test_journaled_messages_join_the_page_order(self, client, headers, sessions, tmp_path, monkeypatch):
+        import uuid
+        from datetime import datetime, timedelta
+        from models import Message
+        from models.message import MessageRole
+        from services.message_journal import MessageJournal, message_record
+
+        journal = MessageJournal(directory=str(tmp_path / "journal"), flush_interval_ms=60000)
+        start = datetime(2026, 1, 1)
+        journal._append([
+            message_record(Message(id=uuid.uuid4(), session_id=uuid.UUID(sessions[0]), role=MessageRole.ASSISTANT,
+                                   content=f"p{i}", created_at=start + timedelta(seconds=seconds)))
+            for i, seconds in enumerate([30, 90, 180])
+        ])
+        monkeypatch.setattr("routes.chat.message_journal", journal)
+
+        url = f"/api/v1/chat/sessions/{sessions[0]}/messages"
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = client.get(url, headers=headers, params=params).json()
+            pages.append([m["content"][:5] for m in page["messages"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert pages == [["s0 m0", "p0"], ["s0 m1", "p1"], ["s0 m2", "p2"]]
+
+    def test_bad_cursor_and_foreign_session(self, client, headers, sessions):
+        response = client.get("/api/v1/chat/sessions/", headers=headers, params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+        response = client.get("/api/v1/chat/sessions/00000000-0000-0000-0000-000000000000/messages", headers=headers)
+        assert response.status_code == 404
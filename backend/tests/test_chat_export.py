@@ -0,0 +1,119 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import pytest
+from models import Message, Session as DBSession
+from models.message import MessageRole
+from services.chat_export import ChatHistoryExport
+from services.compaction import MessageCompactor
+
+
+@pytest.fixture
+def history(test_db, test_user):
+    db = test_db()
+    now = datetime.utcnow()
+    ids = []
+    for s, age_days in enumerate((90, 2, 1)):
+        started = now - timedelta(days=age_days)
+        session = DBSession(user_id=test_user.id, model="m", created_at=started, updated_at=started)
+        db.add(session)
+        db.flush()
+        for i in range(3):
+            db.add(Message(
+                session_id=session.id, role=MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT,
+                content=f"session {s} message {i}", tokens_used=10 * (i + 1), created_at=started + timedelta(minutes=i),
+            ))
+        ids.append(str(session.id))
+    db.add(DBSession(user_id=test_user.id, model="m", created_at=now, updated_at=now))
+    db.commit()
+    return db, ids
+
+
+@pytest.fixture
+def headers(client, test_user):
+    response = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _lines(body: bytes):
+    return [json.loads(line) for line in body.decode("utf-8").splitlines()]
+
+
+class TestChatHistoryExport:
+    def test_sessions_are_followed_by_their_messages_and_a_checkpoint(self, history, test_user):
+        db, ids = history
+        lines = list(ChatHistoryExport(db, test_user.id, batch_size=2).lines())
+
+        assert [line["type"] for line in lines[:5]] == ["session", "message", "message", "message", "checkpoint"]
+        assert [line["id"] for line in lines if line["type"] == "session"][:3] == ids
+        assert [line["content"] for line in lines[1:4]] == [f"session 0 message {i}" for i in range(3)]
+        assert lines[4]["messages"] == 3 and lines[4]["tokens_used"] == 60
+        # The session without messages is exported too.
+        assert lines[-3]["type"] == "session" and lines[-2]["messages"] == 0
+        assert lines[-1] == {"type": "end", "sessions": 4, "messages": 9, "tokens_used": 180}
+
+    def test_archived_sessions_are_exported_without_restoring(self, history, test_user):
+        db, ids = history
+        MessageCompactor(db, idle_days=30).run()
+
+        lines = list(ChatHistoryExport(db, test_user.id).lines())
+
+        assert lines[0]["id"] == ids[0] and lines[0]["archived"] is True
+        assert [line["content"] for line in lines[1:4]] == [f"session 0 message {i}" for i in range(3)]
+        assert lines[-1]["messages"] == 9
+        assert db.get(DBSession, UUID(ids[0])).archived_at is not None
+
+
+class TestExportRoute:
+    def test_resumes_from_a_checkpoint(self, client, headers, history):
+        _, ids = history
+        full = _lines(client.get("/api/v1/chat/export", headers=headers).content)
+        checkpoint = next(line for line in full if line["type"] == "checkpoint")
+
+        response = client.get("/api/v1/chat/export", params={"cursor": checkpoint["cursor"]}, headers=headers)
+
+        assert response.headers["content-type"] == "application/x-ndjson"
+        resumed = _lines(response.content)
+        assert resumed[0]["id"] == ids[1]
+        assert resumed[:-1] == full[full.index(checkpoint) + 1:-1]
+        assert resumed[-1] == {"type": "end", "sessions": 3, "messages": 6, "tokens_used": 120}
+
+    def test_gzip(self, client, headers, history):
+        plain = client.get("/api/v1/chat/export", headers=headers).content
+
+        response = client.get("/api/v1/chat/export", params={"gzip": True}, headers=headers)
+
+        assert response.headers["content-type"] == "application/gzip"
+        assert "attachment" in response.headers["content-disposition"]
+        assert gzip.decompress(response.content) == plain
+
+    def test_only_exports_own_sessions(self, client, history):
+        token = client.post(
+            "/api/v1/auth/register", json={"email": "other@example.com", "username": "other", "password": "password123"}
+        ).json()["access_token"]
+
+        lines = _lines(client.get("/api/v1/chat/export", headers={"Authorization": f"Bearer {token}"}).content)
+
+        assert lines == [{"type": "end", "sessions": 0, "messages": 0, "tokens_used": 0}]
+
+    def test_reads_from_the_primary(self, client, headers, history, monkeypatch):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import Session
+        from database import Base, get_read_sync_db
+        from main import app
+
+        # A replica that has not caught up with anything yet.
+        replica = create_engine("sqlite://")
+        Base.metadata.create_all(bind=replica)
+        monkeypatch.setitem(app.dependency_overrides, get_read_sync_db, lambda: Session(bind=replica))
+
+        lines = _lines(client.get("/api/v1/chat/export", headers=headers).content)
+
+        assert lines[-1]["sessions"] == 4
+
+    def test_invalid_cursor(self, client, headers):
+        response = client.get("/api/v1/chat/export", params={"cursor": "bogus"}, headers=headers)
+
+        assert response.status_code == 400
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from llm.base import LLMResponse
+from models import Message, MessageArchive, Session as DBSession
+from models.message import MessageRole
+from services.compaction import MessageCompactor, ensure_partitions, restore_session
+
+
+@pytest.fixture
+def sessions(test_db, test_user):
+    db = test_db()
+    now = datetime.utcnow()
+    created = {}
+    for name, age_days in (("idle", 90), ("active", 1)):
+        started = now - timedelta(days=age_days)
+        session = DBSession(user_id=test_user.id, model="m", created_at=started, updated_at=started)
+        db.add(session)
+        db.flush()
+        for i in range(4):
+            role = MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT
+            db.add(Message(
+                session_id=session.id, role=role, content=f"{name} message {i} " + "lorem ipsum " * 50,
+                files_referenced=["a.py"], msg_metadata={"turn": i}, created_at=started + timedelta(minutes=i),
+            ))
+        created[name] = session.id
+    db.commit()
+    return db, created
+
+
+@pytest.fixture
+def headers(client, test_user):
+    response = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestMessageCompactor:
+    def test_archives_only_idle_sessions(self, sessions):
+        db, ids = sessions
+        idle_updated_at = db.get(DBSession, ids["idle"]).updated_at
+        stats = MessageCompactor(db, idle_days=30).run()
+
+        assert stats["sessions"] == 1 and stats["messages"] == 4
+        assert 0 < stats["compressed_bytes"] < stats["raw_bytes"]
+        assert stats["bytes_saved"] == stats["raw_bytes"] - stats["compressed_bytes"]
+        db.expire_all()
+        assert db.query(Message).filter(Message.session_id == ids["idle"]).count() == 0
+        assert db.query(Message).filter(Message.session_id == ids["active"]).count() == 4
+        idle = db.get(DBSession, ids["idle"])
+        assert idle.archived_at is not None
+        assert idle.updated_at == idle_updated_at
+        assert db.get(MessageArchive, ids["idle"]).title.startswith("idle message 0")
+
+        # Already archived sessions are skipped.
+        assert MessageCompactor(db, idle_days=30).run()["sessions"] == 0
+
+    def test_restore_round_trips_rows(self, sessions):
+        db, ids = sessions
+        before = [
+            (m.id, m.role, m.content, m.files_referenced, m.msg_metadata, m.created_at)
+            for m in db.query(Message).filter(Message.session_id == ids["idle"]).order_by(Message.created_at)
+        ]
+        MessageCompactor(db, idle_days=30).run()
+        assert restore_session(db, ids["idle"]) == 4
+
+        db.expire_all()
+        after = [
+            (m.id, m.role, m.content, m.files_referenced, m.msg_metadata, m.created_at)
+            for m in db.query(Message).filter(Message.session_id == ids["idle"]).order_by(Message.created_at)
+        ]
+        assert after == before
+        assert db.get(DBSession, ids["idle"]).archived_at is None
+        assert db.get(MessageArchive, ids["idle"]) is None
+
+    def test_partition_maintenance_is_postgres_only(self, test_db):
+        assert ensure_partitions(test_db()) == []
+
+    def test_message_key_matches_the_partitioned_table(self):
+        assert [column.name for column in Message.__table__.primary_key] == ["id", "created_at"]
+
+
+class TestArchivedSessionAccess:
+    def test_listing_and_messages_restore_transparently(self, client, headers, sessions):
+        db, ids = sessions
+        MessageCompactor(db, idle_days=30).run()
+
+        listed = {s["id"]: s for s in client.get("/api/v1/chat/sessions/", headers=headers).json()["sessions"]}
+        assert listed[str(ids["idle"])]["message_count"] == 4
+        assert listed[str(ids["idle"])]["title"].startswith("idle message 0")
+
+        page = client.get(f"/api/v1/chat/sessions/{ids['idle']}/messages", headers=headers).json()
+        assert [m["content"][:14] for m in page["messages"]] == [f"idle message {i}" for i in range(4)]
+        db.expire_all()
+        assert db.get(DBSession, ids["idle"]).archived_at is None
+
+    def test_chat_on_archived_session_sees_history(self, client, headers, sessions, monkeypatch):
+        from llm import OllamaProvider
+        db, ids = sessions
+        MessageCompactor(db, idle_days=30).run()
+        seen = []
+
+        async def generate(self, request):
+            seen.append(request)
+            return LLMResponse(content="ok", tokens_used=1, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        response = client.post("/api/v1/chat/", headers=headers, json={
+            "session_id": str(ids["idle"]), "agent_type": "qa", "message": "Still there?",
+        })
+        assert response.status_code == 200
+        assert seen[0].messages[0]["content"].startswith("idle message 0")
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import create_engine, insert, select, text, update
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from config import settings
+from database import RoutingSession, TimedQueuePool, async_database_url, engine_options, register_pool_metrics, run_in_session
+from models import User
+from services.metrics import metrics
+
+
+def sqlite_engine(path):
+    return create_engine(f"sqlite:///{path}")
+
+
+@pytest.fixture
+def engines(tmp_path):
+    primary, replica = sqlite_engine(tmp_path / "primary.db"), sqlite_engine(tmp_path / "replica.db")
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+class TestRoutingSession:
+    def test_reads_go_to_replica(self, engines):
+        primary, replica = engines
+        session = RoutingSession(primary=primary, replicas=[replica])
+        assert session.get_bind(clause=select(User)) is replica
+        assert session.get_bind() is replica
+
+    def test_write_pins_session_to_primary(self, engines):
+        primary, replica = engines
+        session = RoutingSession(primary=primary, replicas=[replica])
+        assert session.get_bind(clause=update(User).values(username="x")) is primary
+        # Later reads in the same session must see the write.
+        assert session.get_bind(clause=select(User)) is primary
+
+    def test_locking_reads_go_to_primary(self, engines):
+        primary, replica = engines
+        session = RoutingSession(primary=primary, replicas=[replica])
+        assert session.get_bind(clause=select(User).with_for_update()) is primary
+        assert session.get_bind(clause=insert(User)) is primary
+
+    def test_without_replicas_everything_uses_primary(self, engines):
+        primary, _ = engines
+        session = RoutingSession(primary=primary, replicas=[])
+        assert session.get_bind(clause=select(User)) is primary
+
+
+class TestEngineOptions:
+    def test_pooled_postgres(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_POOL_MODE", "pooled")
+        options = engine_options("postgresql://u:p@db/app", is_async=False)
+        assert options["poolclass"] is TimedQueuePool
+        assert options["pool_size"] == settings.DB_POOL_SIZE
+        assert options["pool_pre_ping"] == settings.DB_POOL_PRE_PING
+
+    def test_pgbouncer_disables_pool_and_statement_cache(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_POOL_MODE", "pgbouncer")
+        url = async_database_url("postgresql://u:p@bouncer:6432/app")
+        options = engine_options(url, is_async=True)
+        assert options["poolclass"].__name__ == "NullPool"
+        assert options["connect_args"] == {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+
+    def test_sqlite_is_never_pooled(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_POOL_MODE", "pooled")
+        assert engine_options("sqlite:///app.db", is_async=False)["poolclass"].__name__ == "NullPool"
+
+
+class TestPoolMetrics:
+    def test_checkouts_wait_and_saturation(self, tmp_path):
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05,
+        )
+        register_pool_metrics("test_pool", engine)
+        before = metrics.get("db.test_pool.checkouts")
+        gauges = metrics.snapshot()["gauges"]
+
+        held = engine.connect()
+        assert metrics.get("db.test_pool.checkouts") == before + 1
+        assert metrics.snapshot()["gauges"]["db.test_pool.saturation"] == 1.0
+
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        assert metrics.get("db.test_pool.checkout_timeouts") >= 1
+        assert metrics.get("db.test_pool.checkout_wait_ms") >= 50
+
+        held.close()
+        assert metrics.snapshot()["gauges"]["db.test_pool.saturation"] == 0.0
+        assert engine.pool.overflow_limit == 0 and engine.pool.recreate().overflow_limit == 0
+        assert "db.test_pool.checkout_wait_ms_avg" in gauges
+        engine.dispose()
+
+
+class TestRunInSession:
+    def test_runs_in_a_worker_thread_on_its_own_session(self, engines):
+        primary, _ = engines
+        with primary.begin() as connection:
+            connection.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+            connection.exec_driver_sql("INSERT INTO t VALUES (7)")
+
+        def query(db, column):
+            return threading.get_ident(), db.scalar(select(column).select_from(text("t"))), db
+
+        thread, value, db = asyncio.run(run_in_session(primary, query, text("x")))
+        assert thread != threading.get_ident()
+        assert value == 7
+        assert db.get_bind() is primary and not db.in_transaction()
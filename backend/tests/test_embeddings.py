@@ -0,0 +1,134 @@
+import asyncio
+import zlib
+import numpy as np
+import pytest
+from config import settings
+from indexing.embeddings import VectorIndex
+from models import CodeBlock, Repository
+from models.code_index import EntityType
+
+DIM = 64
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+
+    async def __call__(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self.vector(text) for text in texts]
+
+    @staticmethod
+    def vector(text):
+        vector = np.zeros(DIM, dtype=np.float32)
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % DIM] += 1.0
+        return vector.tolist()
+
+
+@pytest.fixture
+def repo_db(test_db, test_user):
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="vector-repo")
+    db.add(repo)
+    db.commit()
+    for i, words in enumerate(["load config file", "render html tree", "hash user password", "send email message"]):
+        db.add(CodeBlock(
+            repository_id=repo.id,
+            file_path=f"m{i}.py",
+            start_line=1,
+            end_line=1,
+            language="python",
+            content=words,
+            content_hash=f"hash-{i}",
+            entity_type=EntityType.FUNCTION,
+            entity_name=f"f{i}",
+        ))
+    db.commit()
+    return db, repo
+
+
+def nearest(db, index, query):
+    block_id, _ = index.search(FakeEmbedder.vector(query), limit=1)[0]
+    return db.query(CodeBlock).filter(CodeBlock.content == query).first(), block_id
+
+
+class TestVectorIndex:
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_search_returns_nearest_block(self, repo_db, tmp_path, dtype):
+        db, repo = repo_db
+        index = VectorIndex(repo.id, base_dir=str(tmp_path), dtype=dtype)
+        asyncio.run(index.update(db, FakeEmbedder()))
+
+        block, block_id = nearest(db, index, "render html tree")
+        assert block_id == str(block.id)
+
+    def test_only_changed_texts_are_embedded(self, repo_db, tmp_path):
+        db, repo = repo_db
+        index = VectorIndex(repo.id, base_dir=str(tmp_path))
+        embedder = FakeEmbedder()
+        asyncio.run(index.update(db, embedder, batch_size=2))
+        assert (embedder.calls, embedder.texts) == (2, 4)
+
+        stats = asyncio.run(index.update(db, embedder))
+        assert stats["embedded"] == 0
+
+        block = db.query(CodeBlock).filter(CodeBlock.entity_name == "f0").one()
+        block.content = "parse yaml settings"
+        db.commit()
+
+        stats = asyncio.run(index.update(db, embedder))
+        assert stats == {"total": 4, "embedded": 1, "reused": 3}
+        block_id, _ = index.search(FakeEmbedder.vector("parse yaml settings"), limit=1)[0]
+        assert block_id == str(block.id)
+
+    def test_rename_docstring_and_model_changes_re_embed(self, repo_db, tmp_path):
+        db, repo = repo_db
+        index = VectorIndex(repo.id, base_dir=str(tmp_path))
+        embedder = FakeEmbedder()
+        asyncio.run(index.update(db, embedder))
+
+        block = db.query(CodeBlock).filter(CodeBlock.entity_name == "f0").one()
+        block.file_path = "moved/m0.py"
+        db.query(CodeBlock).filter(CodeBlock.entity_name == "f1").one().docstring = "Draws the page"
+        db.commit()
+        assert asyncio.run(index.update(db, embedder))["embedded"] == 2
+
+        assert asyncio.run(index.update(db, embedder, model="other-model"))["embedded"] == 4
+
+    def test_model_with_another_dimension_replaces_the_index(self, repo_db, tmp_path):
+        db, repo = repo_db
+        index = VectorIndex(repo.id, base_dir=str(tmp_path))
+        asyncio.run(index.update(db, FakeEmbedder()))
+
+        async def wide(texts):
+            return [FakeEmbedder.vector(text) * 2 for text in texts]
+
+        assert asyncio.run(index.update(db, wide, model="wide-model"))["embedded"] == 4
+        assert index.snapshot()[1].shape == (4, DIM * 2)
+
+    def test_dimension_change_under_the_same_model_re_embeds_everything(self, repo_db, tmp_path):
+        db, repo = repo_db
+        index = VectorIndex(repo.id, base_dir=str(tmp_path))
+        asyncio.run(index.update(db, FakeEmbedder()))
+        block = db.query(CodeBlock).filter(CodeBlock.entity_name == "f0").one()
+        block.content = "parse yaml settings"
+        db.commit()
+
+        async def wide(texts):
+            return [FakeEmbedder.vector(text) * 2 for text in texts]
+
+        assert asyncio.run(index.update(db, wide)) == {"total": 4, "embedded": 4, "reused": 0}
+        assert index.snapshot()[1].shape == (4, DIM * 2)
+
+    def test_ivf_mode(self, repo_db, tmp_path, monkeypatch):
+        db, repo = repo_db
+        monkeypatch.setattr(settings, "VECTOR_IVF_THRESHOLD", 1)
+        index = VectorIndex(repo.id, base_dir=str(tmp_path))
+        asyncio.run(index.update(db, FakeEmbedder()))
+
+        assert index._read_meta()["ivf"] is True
+        results = index.search(FakeEmbedder.vector("send email message"), limit=4, nprobe=64)
+        assert len(results) == 4
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from models import CodeBlock, Repository
+from models.code_index import EntityType
+from services.fanout import CrossRepositorySearch
+
+
+@pytest.fixture
+def repositories(test_db, test_user):
+    db = test_db()
+    repos = []
+    for repo_name, names in (("api", ["load_config", "render_page"]), ("worker", ["config_loader", "run_job"])):
+        repo = Repository(user_id=test_user.id, name=repo_name, indexed=True)
+        db.add(repo)
+        db.commit()
+        for name in names:
+            db.add(CodeBlock(
+                repository_id=repo.id,
+                file_path=f"{repo_name}/{name}.py",
+                start_line=1,
+                end_line=2,
+                language="python",
+                content=f"def {name}():\n    pass",
+                entity_type=EntityType.FUNCTION,
+                entity_name=name,
+            ))
+        db.commit()
+        repos.append(repo)
+    return db, repos
+
+
+def run(search, query, **kwargs):
+    async def collect():
+        return [event async for event in search.stream(query, **kwargs)]
+    return asyncio.run(collect())
+
+
+class TestCrossRepositorySearch:
+    def test_merges_results_from_every_repository(self, repositories):
+        db, repos = repositories
+        events = run(CrossRepositorySearch(db, repos), "config", limit=5)
+
+        assert [event["type"] for event in events] == ["repository", "repository", "results"]
+        final = events[-1]
+        assert {hit["repository_name"] for hit in final["results"]} == {"api", "worker"}
+        assert {hit["entity_name"] for hit in final["results"]} == {"load_config", "config_loader"}
+        scores = [hit["score"] for hit in final["results"]]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_global_limit(self, repositories):
+        db, repos = repositories
+        final = run(CrossRepositorySearch(db, repos), "config", limit=1)[-1]
+        assert final["total"] == 1
+
+    def test_slow_repository_times_out_without_blocking_others(self, repositories, monkeypatch):
+        db, repos = repositories
+        search = CrossRepositorySearch(db, repos, timeout=0.2)
+        released = asyncio.Event()
+
+        # Neither repository touches the database: one answers at once, the
+        # other never does, so the outcome does not depend on machine load.
+        async def stub_search(repo, *args):
+            if repo.name == "worker":
+                await released.wait()
+            return [{"repository_name": repo.name, "entity_name": "load_config", "score": 1.0}]
+
+        monkeypatch.setattr(search, "_search", stub_search)
+        events = run(search, "config")
+
+        statuses = {event["repository_name"]: event["status"] for event in events if event["type"] == "repository"}
+        assert statuses == {"api": "ok", "worker": "timeout"}
+        assert events[-1]["timed_out"] == [str(repos[1].id)]
+        assert [hit["entity_name"] for hit in events[-1]["results"]] == ["load_config"]
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from services.grep import RepositoryGrep, required_literal
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "config.py").write_text(
+        "import os\n\nTIMEOUT = 30\n\ndef load():\n    raise ValueError('connection refused')\n"
+    )
+    (tmp_path / "pkg" / "app.js").write_text("const timeout = 10;\nconsole.error('connection refused');\n")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00connection refused")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").write_text("connection refused\n")
+    return tmp_path
+
+
+def grep(root, pattern, **kwargs):
+    kwargs.setdefault("workers", 1)
+    return asyncio.run(RepositoryGrep(str(root), pattern, **kwargs).collect())
+
+
+class TestRequiredLiteral:
+    def test_longest_top_level_run(self):
+        assert required_literal(r"def \w+_handler\(") == b"_handler("
+        assert required_literal("connection refused") == b"connection refused"
+
+    def test_no_literal_for_alternation_or_ignore_case(self):
+        assert required_literal("foo|bar") is None
+        assert required_literal("timeout", flags=2) is None
+
+    def test_no_literal_for_inline_ignore_case(self):
+        assert required_literal("(?i)error") is None
+        assert required_literal("(?i:error) code") == b" code"
+
+
+class TestRepositoryGrep:
+    def test_literal_match_reports_location_and_skips_binary_and_hidden(self, tree):
+        matches, summary = grep(tree, "connection refused", regex=False)
+        assert [(m["path"], m["line"], m["column"]) for m in matches] == [
+            ("pkg/app.js", 2, 16),
+            ("pkg/config.py", 6, 23),
+        ]
+        assert summary.matches == 2
+        assert not summary.truncated
+
+    def test_regex_ignore_case_and_glob(self, tree):
+        matches, _ = grep(tree, r"^timeout\s*=", ignore_case=True, path_glob="*.py")
+        assert [(m["path"], m["text"]) for m in matches] == [("pkg/config.py", "TIMEOUT = 30")]
+
+    def test_inline_ignore_case_is_not_prefiltered_away(self, tree):
+        matches, _ = grep(tree, r"(?i)^timeout\s*=", path_glob="*.py")
+        assert [m["text"] for m in matches] == ["TIMEOUT = 30"]
+
+    def test_max_matches_truncates(self, tree):
+        matches, summary = grep(tree, "o", max_matches=3)
+        assert len(matches) == 3
+        assert summary.truncated and summary.reason == "max_matches"
+
+    def test_max_bytes_truncates(self, tree):
+        matches, summary = grep(tree, "connection", max_bytes=60)
+        assert summary.truncated and summary.reason == "max_bytes"
+
+    def test_invalid_regex_raises_value_error(self, tree):
+        with pytest.raises(ValueError):
+            RepositoryGrep(str(tree), "(unclosed")
+
+    def test_process_pool_matches_inline_scan(self, tree):
+        inline, _ = grep(tree, "refused")
+        pooled, _ = grep(tree, "refused", workers=2)
+        assert sorted((m["path"], m["line"]) for m in pooled) == sorted((m["path"], m["line"]) for m in inline)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from config import settings
+from llm.base import LLMResponse
+from models import Message, Session as DBSession
+from models.message import MessageRole
+from services.message_journal import MessageJournal, message_record, session_record
+
+
+def make_session(user_id):
+    now = datetime.utcnow()
+    return DBSession(id=uuid.uuid4(), user_id=user_id, agent_type="coding", model="m", created_at=now, updated_at=now)
+
+
+def make_message(session_id, content):
+    return Message(
+        id=uuid.uuid4(), session_id=session_id, role=MessageRole.USER, content=content, created_at=datetime.utcnow(),
+    )
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return MessageJournal(directory=str(tmp_path / "journal"), batch_size=2, flush_interval_ms=60000)
+
+
+class TestMessageJournal:
+    def test_pending_rows_are_visible_until_flushed(self, journal, test_db, test_user):
+        session = make_session(test_user.id)
+        messages = [make_message(session.id, f"m{i}") for i in range(3)]
+        asyncio.run(journal.append([session_record(session)] + [message_record(m) for m in messages]))
+
+        assert journal.pending_session(session.id)["model"] == "m"
+        assert [r["content"] for r in journal.pending_messages(session.id)] == ["m0", "m1", "m2"]
+
+        journal.bind = test_db.kw["bind"]
+        assert asyncio.run(journal.flush()) == 4
+        assert journal.pending_count() == 0
+        assert journal.pending_session(session.id) is None
+        db = test_db()
+        assert db.query(Message).filter(Message.session_id == session.id).count() == 3
+        assert open(journal.path).read() == ""
+
+    def test_journal_is_compacted_after_each_batch(self, journal, test_db, test_user):
+        session = make_session(test_user.id)
+        messages = [make_message(session.id, f"m{i}") for i in range(4)]
+        asyncio.run(journal.append([session_record(session)] + [message_record(m) for m in messages]))
+        journal.bind = test_db.kw["bind"]
+
+        assert journal._flush_batch() == 2
+        remaining = [json.loads(line)["content"] for line in open(journal.path)]
+        assert remaining == ["m1", "m2", "m3"]
+
+        asyncio.run(journal.append([message_record(make_message(session.id, "m4"))]))
+        assert [json.loads(line)["content"] for line in open(journal.path)][-1] == "m4"
+        assert asyncio.run(MessageJournal(directory=journal.directory).recover(journal.bind)) == 4
+        assert test_db().query(Message).count() == 5
+
+    def test_recover_replays_after_crash_without_duplicates(self, journal, test_db, test_user, tmp_path):
+        session = make_session(test_user.id)
+        asyncio.run(journal.append([session_record(session), message_record(make_message(session.id, "hi"))]))
+        unflushed = open(journal.path).read()
+
+        # The first row made it to the database before the crash.
+        journal.bind = test_db.kw["bind"]
+        asyncio.run(journal.flush())
+        with open(journal.path, "w") as f:
+            f.write(unflushed + '{"type": "message", "id": "torn')
+
+        restarted = MessageJournal(directory=journal.directory)
+        assert asyncio.run(restarted.recover(test_db.kw["bind"])) == 2
+        db = test_db()
+        assert db.query(DBSession).count() == 1
+        assert db.query(Message).count() == 1
+
+    def test_recover_drops_a_lone_torn_line_before_new_appends(self, journal, test_db, test_user):
+        import os
+        os.makedirs(journal.directory)
+        with open(journal.path, "w") as f:
+            f.write('{"type": "message", "id": "torn')
+
+        assert asyncio.run(journal.recover(test_db.kw["bind"])) == 0
+        session = make_session(test_user.id)
+        asyncio.run(journal.append([session_record(session)]))
+
+        restarted = MessageJournal(directory=journal.directory)
+        assert [record["id"] for record in restarted._load()] == [str(session.id)]
+
+    def test_rejected_rows_are_dropped(self, journal, test_db, test_user):
+        good = make_session(test_user.id)
+        orphan = make_message(uuid.uuid4(), "no session")
+        asyncio.run(journal.append([session_record(good), message_record(orphan)]))
+
+        engine = test_db.kw["bind"]
+        event.listen(engine, "connect", lambda connection, _: connection.execute("PRAGMA foreign_keys=ON"))
+        engine.dispose()
+        journal.bind = engine
+        asyncio.run(journal.flush())
+        assert journal.pending_count() == 0
+        assert test_db().query(DBSession).count() == 1
+        assert test_db().query(Message).count() == 0
+
+
+class TestChatWriteBehind:
+    def test_follow_up_reads_its_own_unflushed_writes(self, client, test_db, test_user, tmp_path, monkeypatch):
+        from llm import OllamaProvider
+        journal = MessageJournal(directory=str(tmp_path / "journal"), flush_interval_ms=60000)
+        monkeypatch.setattr("routes.chat.message_journal", journal)
+        monkeypatch.setattr(settings, "MESSAGE_JOURNAL_ENABLED", True)
+        seen = []
+
+        async def generate(self, request):
+            seen.append(request)
+            return LLMResponse(content=f"reply {len(seen)}", tokens_used=5, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        token = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        first = client.post("/api/v1/chat/", headers=headers, json={"agent_type": "qa", "message": "What is a monad?"})
+        session_id = first.json()["session_id"]
+        db = test_db()
+        # The session is committed at once, so other workers find it; its messages wait in the journal.
+        assert db.query(DBSession).count() == 1
+        assert db.query(Message).count() == 0
+
+        client.post("/api/v1/chat/", headers=headers, json={"session_id": session_id, "agent_type": "qa", "message": "Example?"})
+        assert [m["content"] for m in seen[1].messages[:2]] == ["What is a monad?", "reply 1"]
+        assert client.get(f"/api/v1/chat/sessions/{session_id}", headers=headers).status_code == 200
+        page = client.get(f"/api/v1/chat/sessions/{session_id}/messages", headers=headers).json()
+        assert [m["content"] for m in page["messages"]] == ["What is a monad?", "reply 1", "Example?", "reply 2"]
+        assert [s["id"] for s in client.get("/api/v1/chat/sessions/", headers=headers).json()["sessions"]] == [session_id]
+
+        journal.bind = test_db.kw["bind"]
+        assert asyncio.run(journal.flush()) == 4
+        assert db.query(Message).filter(Message.session_id == uuid.UUID(session_id)).count() == 4
+        assert [s["id"] for s in client.get("/api/v1/chat/sessions/", headers=headers).json()["sessions"]] == [session_id]
@@ -0,0 +1,157 @@
+import hashlib
+
+import numpy as np
+import pytest
+from indexing.minhash import MinHashIndex, minhash_signature, normalized_tokens
+from models import CodeBlock, Repository
+from models.code_index import EntityType
+
+LOAD_CONFIG = '''def load_config(path):
+    # Read the YAML file and merge defaults.
+    with open(path) as f:
+        data = yaml.safe_load(f)
+    merged = dict(DEFAULTS)
+    merged.update(data or {})
+    return validate(merged, strict=True)
+'''
+
+LOAD_SETTINGS = '''def load_settings(path):
+    with open(path) as f:
+        data = yaml.safe_load(f)
+    merged = dict(DEFAULTS)
+    merged.update(data or {})
+    return validate(merged, strict=True)
+'''
+
+RENDER_TREE = '''def render_tree(node, depth=0):
+    lines = ["  " * depth + node.name]
+    for child in sorted(node.children, key=lambda c: c.name):
+        lines.extend(render_tree(child, depth + 1))
+    return lines
+'''
+
+
+def add_block(db, repo, name, path, content):
+    block = CodeBlock(
+        repository_id=repo.id,
+        file_path=path,
+        start_line=1,
+        end_line=content.count("\n") + 1,
+        language="python",
+        content=content,
+        content_hash=hashlib.sha1(content.encode("utf-8")).hexdigest(),
+        entity_type=EntityType.FUNCTION,
+        entity_name=name,
+    )
+    db.add(block)
+    db.commit()
+    return block
+
+
+@pytest.fixture
+def repo_db(test_db, test_user):
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="minhash-repo")
+    db.add(repo)
+    db.commit()
+    return db, repo
+
+
+def jaccard(a, b):
+    return (minhash_signature(a) == minhash_signature(b)).mean()
+
+
+class TestSignatures:
+    def test_comments_and_literals_are_normalized(self):
+        assert normalized_tokens("x = 'a' + 42  # note") == ["x", "=", "<str>", "+", "<num>"]
+
+    def test_estimate_tracks_similarity(self):
+        assert jaccard(LOAD_CONFIG, LOAD_CONFIG.replace("# Read", "# Load")) == 1.0
+        assert jaccard(LOAD_CONFIG, LOAD_SETTINGS) > 0.7
+        assert jaccard(LOAD_CONFIG, RENDER_TREE) < 0.2
+
+    def test_short_blocks_have_no_signature(self):
+        assert minhash_signature("return x") is None
+
+
+class TestMinHashIndex:
+    def test_similar_finds_near_duplicates_only(self, repo_db, tmp_path):
+        db, repo = repo_db
+        original = add_block(db, repo, "load_config", "a.py", LOAD_CONFIG)
+        copy = add_block(db, repo, "load_settings", "b.py", LOAD_SETTINGS)
+        add_block(db, repo, "render_tree", "c.py", RENDER_TREE)
+
+        index = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        stats = index.update(db)
+        assert stats["total"] == 3
+
+        results = MinHashIndex(repo.id, base_dir=str(tmp_path)).similar(original.id, threshold=0.7)
+        assert [block_id for block_id, _ in results] == [str(copy.id)]
+
+    def test_clusters_and_redundant(self, repo_db, tmp_path):
+        db, repo = repo_db
+        blocks = [add_block(db, repo, f"load_{i}", f"m{i}.py", LOAD_CONFIG) for i in range(3)]
+        other = add_block(db, repo, "render_tree", "tree.py", RENDER_TREE)
+
+        index = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        index.update(db)
+
+        clusters = index.clusters()
+        assert len(clusters) == 1
+        assert set(clusters[0]["block_ids"]) == {str(block.id) for block in blocks}
+        assert clusters[0]["similarity"] == 1.0
+
+        ranked = [str(blocks[0].id), str(other.id), str(blocks[1].id)]
+        assert index.redundant(ranked) == {str(blocks[1].id)}
+
+    def test_update_reuses_unchanged_signatures(self, repo_db, tmp_path):
+        db, repo = repo_db
+        add_block(db, repo, "load_config", "a.py", LOAD_CONFIG)
+        index = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        index.update(db)
+
+        add_block(db, repo, "render_tree", "b.py", RENDER_TREE)
+        stats = index.update(db)
+        assert stats == {"total": 2, "hashed": 1, "reused": 1}
+
+        add_block(db, repo, "load_settings", "c.py", LOAD_SETTINGS)
+        index.update(db)
+        # The previous generation stays for readers that read its meta; older ones go.
+        assert len(list(tmp_path.glob(f"{repo.id}/minhash/signatures-*.npy"))) == 2
+        assert not list(tmp_path.glob(f"{repo.id}/minhash/*.tmp"))
+
+    def test_reader_opens_arrays_after_a_write_swapped_meta(self, repo_db, tmp_path, monkeypatch):
+        db, repo = repo_db
+        original = add_block(db, repo, "load_config", "a.py", LOAD_CONFIG)
+        writer = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        writer.update(db)
+        reader = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        stale_meta = reader._read_meta()
+        copy = add_block(db, repo, "load_settings", "b.py", LOAD_SETTINGS)
+        writer.update(db)
+
+        # Meta read before the write still names arrays that are on disk.
+        monkeypatch.setattr(reader, "_read_meta", lambda: stale_meta)
+        assert reader.similar(original.id, threshold=0.7) == []
+        monkeypatch.undo()
+
+        add_block(db, repo, "render_tree", "c.py", RENDER_TREE)
+        writer.update(db)
+        reader = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        reads = iter([stale_meta, writer._read_meta()])
+        monkeypatch.setattr(reader, "_read_meta", lambda: next(reads))
+        assert [block_id for block_id, _ in reader.similar(original.id, threshold=0.7)] == [str(copy.id)]
+
+    def test_unrelated_blocks_are_not_returned(self, repo_db, tmp_path):
+        db, repo = repo_db
+        rng = np.random.default_rng(3)
+        words = [f"name{i}" for i in range(400)]
+        for i in range(200):
+            body = " ".join(rng.choice(words, size=30))
+            add_block(db, repo, f"f{i}", f"f{i}.py", f"def f{i}():\n    return [{body}]\n")
+        target = add_block(db, repo, "load_config", "a.py", LOAD_CONFIG)
+
+        index = MinHashIndex(repo.id, base_dir=str(tmp_path))
+        index.update(db)
+        assert index.similar(target.id) == []
+        assert index.similar_to(LOAD_SETTINGS, threshold=0.7)[0][0] == str(target.id)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+from agents import AgentPipeline
+from llm.base import LLMResponse
+from models import Repository
+from services.retrieval import RetrievalService
+
+MODELS = {"coding": "code-model", "qa": "general-model", "reasoning": "reasoning-model", "seer": "seer-model"}
+
+
+class FakeProvider:
+    def __init__(self, delays=None, fail=()):
+        self.delays = delays or {}
+        self.fail = set(fail)
+        self.requests = []
+        self.preloaded = []
+        self.cancelled = []
+
+    async def generate(self, request):
+        self.requests.append(request)
+        try:
+            await asyncio.sleep(self.delays.get(request.model, 0.01))
+        except asyncio.CancelledError:
+            self.cancelled.append(request.model)
+            raise
+        if request.model in self.fail:
+            raise RuntimeError("model unavailable")
+        return LLMResponse(content=f"answer from {request.model}", tokens_used=3, cost=0.0, model=request.model, finish_reason="stop")
+
+    async def preload(self, model=None, keep_alive=None):
+        self.preloaded.append(model)
+        return True
+
+    def get_context_window(self, model=None):
+        return 4096
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+@pytest.fixture
+def repo(test_db, test_user, monkeypatch):
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="pipeline-repo")
+    db.add(repo)
+    db.commit()
+
+    calls = []
+
+    async def build_context(self, query, model, limit=8):
+        calls.append(query)
+        return "def load_config(path): ..."
+
+    monkeypatch.setattr(RetrievalService, "build_context", build_context)
+    return db, repo, calls
+
+
+class TestAgentPipeline:
+    def test_branches_share_retrieval_and_run_concurrently(self, repo):
+        db, repo, calls = repo
+        provider = FakeProvider({"code-model": 0.2, "general-model": 0.2, "reasoning-model": 0.2, "seer-model": 0.05})
+        pipeline = AgentPipeline(db, repo.id, provider=provider, models=MODELS)
+
+        started = time.perf_counter()
+        result = asyncio.run(pipeline.run("How is config loaded?"))
+        elapsed = time.perf_counter() - started
+
+        assert calls == ["How is config loaded?"]
+        assert result.synthesized and result.content == "answer from seer-model"
+        # Slowest branch + synthesis, not the sum of all four calls.
+        assert elapsed < 0.4
+        branch_prompts = [r.messages[-1]["content"] for r in provider.requests if r.model != "seer-model"]
+        assert len(branch_prompts) == 3
+        assert all("def load_config(path)" in prompt for prompt in branch_prompts)
+        seer_prompt = provider.requests[-1].messages[-1]["content"]
+        assert "answer from code-model" in seer_prompt and "answer from reasoning-model" in seer_prompt
+        assert set(provider.preloaded) == set(MODELS.values())
+        assert {"retrieval_ms", "coding_ms", "qa_ms", "reasoning_ms", "synthesis_ms", "total_ms"} <= set(result.timings)
+
+    def test_slow_branch_times_out_and_is_left_out(self, repo):
+        db, repo, _ = repo
+        provider = FakeProvider({"reasoning-model": 5})
+        pipeline = AgentPipeline(db, repo.id, provider=provider, models=MODELS, branch_timeout=0.1)
+
+        result = asyncio.run(pipeline.run("Refactor load_config"))
+        reasoning = next(branch for branch in result.branches if branch.name == "reasoning")
+        assert reasoning.error.startswith("timed out")
+        assert provider.cancelled == ["reasoning-model"]
+        assert result.synthesized
+        assert "reasoning-model" not in provider.requests[-1].messages[-1]["content"]
+
+    def test_falls_back_to_best_branch_without_seer(self, repo):
+        db, repo, _ = repo
+        provider = FakeProvider(fail={"seer-model"})
+        result = asyncio.run(AgentPipeline(db, repo.id, provider=provider, models=MODELS).run("Fix the bug"))
+        assert not result.synthesized
+        assert result.content == "answer from code-model"
+
+        provider = FakeProvider(fail={"code-model", "reasoning-model"})
+        result = asyncio.run(AgentPipeline(db, repo.id, provider=provider, models=MODELS).run("Fix the bug"))
+        assert result.model == "general-model" and not result.synthesized
+
+    def test_cancelling_run_cancels_branches(self, repo):
+        db, repo, _ = repo
+        provider = FakeProvider({"code-model": 5, "general-model": 5, "reasoning-model": 5})
+        pipeline = AgentPipeline(db, repo.id, provider=provider, models=MODELS)
+
+        async def cancel_midway():
+            task = asyncio.create_task(pipeline.run("Explain the app"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_midway())
+        assert sorted(provider.cancelled) == ["code-model", "general-model", "reasoning-model"]
@@ -77,3 +77,32 @@ class TestRepositories:
             headers={"Authorization": f"Bearer {token}"},
         )
         assert response.status_code == 404
+
+
+class TestIndexingTask:
+    def test_indexer_runs_as_a_threadpool_task(self, test_db, test_user, tmp_path, monkeypatch):
+        import asyncio
+        from config import settings
+        from indexing.bm25 import bm25_registry
+        from indexing.minhash import minhash_registry
+        from models import CodeBlock, Repository
+        import routes.repositories as module
+
+        monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+        monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+        monkeypatch.setattr(module, "SessionLocal", test_db)
+        source = tmp_path / "src"
+        source.mkdir()
+        (source / "add.py").write_text("def add(a, b):\n    return a + b\n")
+        db = test_db()
+        repo = Repository(user_id=test_user.id, name="task-repo", local_path=str(source))
+        db.add(repo)
+        db.commit()
+
+        # Starlette awaits coroutine tasks on the event loop; plain functions go to its threadpool.
+        assert not asyncio.iscoroutinefunction(module.run_indexer)
+        module.run_indexer(repo.id, str(source))
+
+        assert db.query(CodeBlock).filter(CodeBlock.repository_id == repo.id).count() > 0
+        bm25_registry.evict(repo.id)
+        minhash_registry.evict(repo.id)
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+from services.retrieval import (
+    ContextPacker,
+    RetrievedBlock,
+    reciprocal_rank_fusion,
+    remove_overlaps,
+    trim_to_relevant_lines,
+)
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+def block(path, start, end, content="pass", name=None):
+    return SimpleNamespace(file_path=path, start_line=start, end_line=end, content=content, entity_name=name)
+
+
+class TestReciprocalRankFusion:
+    def test_items_ranked_by_both_lists_win(self):
+        fused = reciprocal_rank_fusion({"lexical": ["a", "b", "c"], "semantic": ["c", "b", "d"]})
+        assert {item for item, _, _ in fused[:2]} == {"b", "c"}
+        assert dict((item, sources) for item, _, sources in fused)["b"] == ["lexical", "semantic"]
+
+    def test_weights_scale_contribution(self):
+        fused = reciprocal_rank_fusion({"lexical": ["a"], "graph": ["b"]}, weights={"graph": 0.5})
+        assert [item for item, _, _ in fused] == ["a", "b"]
+
+
+class TestRemoveOverlaps:
+    def test_drops_spans_covered_by_better_result(self):
+        results = [
+            RetrievedBlock(block("a.py", 10, 40, name="Widget"), 1.0),
+            RetrievedBlock(block("a.py", 12, 20, name="Widget.render"), 0.9),
+            RetrievedBlock(block("b.py", 12, 20), 0.8),
+            RetrievedBlock(block("a.py", 41, 50), 0.7),
+        ]
+        kept = remove_overlaps(results)
+        assert [(r.block.file_path, r.block.start_line) for r in kept] == [("a.py", 10), ("b.py", 12), ("a.py", 41)]
+
+
+class TestContextPacking:
+    def test_trim_keeps_signature_and_matching_lines(self):
+        content = "\n".join(["def load_config(path):"] + [f"    step_{i}()" for i in range(30)] + ["    return parse_yaml(path)"])
+        trimmed = trim_to_relevant_lines(content, "parse yaml", 12, count_tokens)
+        assert trimmed.startswith("def load_config(path):")
+        assert "return parse_yaml(path)" in trimmed
+        assert "step_10()" not in trimmed
+        assert count_tokens(trimmed) <= 12
+
+    def test_packer_respects_budget(self):
+        results = [
+            RetrievedBlock(block("a.py", 1, 2, "def a():\n    return 1"), 1.0),
+            RetrievedBlock(block("b.py", 1, 200, "\n".join(f"x{i} = {i}" for i in range(200))), 0.5),
+        ]
+        context = ContextPacker(40, count_tokens).pack("x5", results)
+        assert "File: a.py:1-2" in context
+        assert count_tokens(context) <= 40
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from services.metrics import metrics
+from services.retrieval_cache import RetrievalCache
+
+
+@pytest.fixture
+def cache():
+    metrics.reset()
+    return RetrievalCache(max_entries=2, ttl_seconds=60, redis_url="")
+
+
+def counting(value):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return value
+
+    return compute, calls
+
+
+class TestRetrievalCache:
+    def test_repeated_query_is_served_from_memory(self, cache):
+        compute, calls = counting(["a", "b"])
+        for query in ("load config", "  load   config "):
+            assert asyncio.run(cache.get_or_compute("repo", "v1", "search", query, {"limit": 5}, compute)) == ["a", "b"]
+        assert len(calls) == 1
+        assert cache.hit_ratio() == 0.5
+
+    def test_filters_and_case_are_part_of_the_key(self, cache):
+        compute, calls = counting([])
+        asyncio.run(cache.get_or_compute("repo", "v1", "search", "getUser", {"limit": 5}, compute))
+        asyncio.run(cache.get_or_compute("repo", "v1", "search", "getuser", {"limit": 5}, compute))
+        asyncio.run(cache.get_or_compute("repo", "v1", "search", "getUser", {"limit": 10}, compute))
+        assert len(calls) == 3
+
+    def test_new_index_version_invalidates_repository(self, cache):
+        compute, calls = counting(["a"])
+        asyncio.run(cache.get_or_compute("repo", "v1", "search", "q", None, compute))
+        asyncio.run(cache.get_or_compute("other", "v1", "search", "q", None, compute))
+        asyncio.run(cache.get_or_compute("repo", "v2", "search", "q", None, compute))
+        assert len(calls) == 3
+        assert len(cache) == 2
+        asyncio.run(cache.get_or_compute("other", "v1", "search", "q", None, compute))
+        assert len(calls) == 3
+
+    def test_unindexed_repository_bypasses_cache(self, cache):
+        compute, calls = counting(["a"])
+        asyncio.run(cache.get_or_compute("repo", None, "search", "q", None, compute))
+        asyncio.run(cache.get_or_compute("repo", None, "search", "q", None, compute))
+        assert len(calls) == 2
+        assert len(cache) == 0
+
+    def test_lru_evicts_oldest_entry(self, cache):
+        compute, calls = counting(["a"])
+        for query in ("one", "two", "one", "three", "one"):
+            asyncio.run(cache.get_or_compute("repo", "v1", "search", query, None, compute))
+        assert len(calls) == 3
+        assert len(cache) == 2
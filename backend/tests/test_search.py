@@ -0,0 +1,69 @@
+import pytest
+from models import CodeBlock, Repository
+from models.code_index import EntityType
+from services.search import CodeSearchService
+
+
+@pytest.fixture
+def indexed_repo(test_db, test_user):
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="search-repo")
+    db.add(repo)
+    db.commit()
+
+    blocks = [
+        ("parseConfigFile", "src/config.py", EntityType.FUNCTION,
+         "def parseConfigFile(path):\n    return load_yaml(path)", "Read the settings file"),
+        ("render_tree", "src/view.py", EntityType.FUNCTION,
+         "def render_tree(node):\n    pass", None),
+        ("ConfigStore", "lib/store.py", EntityType.CLASS,
+         "class ConfigStore:\n    pass", "Keeps settings in memory"),
+        ("bootstrap", "app/boot.py", EntityType.FUNCTION,
+         "def bootstrap():\n    return read(config_path, config_defaults)", None),
+    ]
+    for name, path, entity_type, content, docstring in blocks:
+        db.add(CodeBlock(
+            repository_id=repo.id,
+            file_path=path,
+            start_line=1,
+            end_line=2,
+            language="python",
+            content=content,
+            entity_type=entity_type,
+            entity_name=name,
+            docstring=docstring,
+        ))
+    db.commit()
+    return db, repo
+
+
+class TestCodeSearch:
+    def test_matches_split_identifiers(self, indexed_repo):
+        db, repo = indexed_repo
+        hits = CodeSearchService(db).search(repo.id, "renderTree")
+        assert [hit.block.entity_name for hit in hits] == ["render_tree"]
+
+    def test_matches_content_and_docstring(self, indexed_repo):
+        db, repo = indexed_repo
+        names = {hit.block.entity_name for hit in CodeSearchService(db).search(repo.id, "settings yaml")}
+        assert names == {"parseConfigFile", "ConfigStore"}
+
+    def test_name_match_ranks_first(self, indexed_repo):
+        db, repo = indexed_repo
+        names = [hit.block.entity_name for hit in CodeSearchService(db).search(repo.id, "config")]
+        # ``bootstrap`` mentions config twice, but only in its body.
+        assert set(names[:2]) == {"parseConfigFile", "ConfigStore"}
+        assert names[2:] == ["bootstrap"]
+
+    def test_filters(self, indexed_repo):
+        db, repo = indexed_repo
+        service = CodeSearchService(db)
+        assert [h.block.entity_name for h in service.search(repo.id, "config", entity_type="class")] == ["ConfigStore"]
+        assert [h.block.entity_name for h in service.search(repo.id, "config", path_prefix="src/")] == ["parseConfigFile"]
+        assert service.search(repo.id, "config", language="go") == []
+
+    def test_deleted_blocks_leave_the_index(self, indexed_repo):
+        db, repo = indexed_repo
+        db.query(CodeBlock).filter(CodeBlock.entity_name == "render_tree").delete()
+        db.commit()
+        assert CodeSearchService(db).search(repo.id, "render") == []
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from llm.base import LLMResponse
+from services.metrics import metrics
+from services.session_cache import SessionState, SessionStateCache
+
+
+@pytest.fixture
+def cache():
+    metrics.reset()
+    return SessionStateCache(ttl_seconds=60, window=3, summary_chars=60, redis_url="")
+
+
+def new_state():
+    return SessionState(session_id=str(uuid.uuid4()), user_id="u", repository_id=None, agent_type="coding", model="m")
+
+
+class FailingRedis:
+    async def set(self, *args, **kwargs):
+        raise ConnectionError("redis down")
+
+    async def get(self, key):
+        return None
+
+
+class ContendedRedis:
+    """Stores one key; the first transaction finds it changed by another writer."""
+
+    def __init__(self):
+        self.values = {}
+        self.conflicts = 1
+
+    def pipeline(self, transaction=True):
+        return ContendedPipeline(self)
+
+
+class ContendedPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def watch(self, key):
+        pass
+
+    async def get(self, key):
+        return self.redis.values.get(key)
+
+    def multi(self):
+        self.queued = []
+
+    def set(self, key, value, ex=None):
+        self.queued.append((key, value))
+
+    async def execute(self):
+        from redis.exceptions import WatchError
+        if self.redis.conflicts:
+            self.redis.conflicts -= 1
+            raise WatchError("watched key changed")
+        self.redis.values.update(self.queued)
+
+
+class TestSessionState:
+    def test_window_overflow_folds_into_summary(self, cache):
+        state = new_state()
+        for i in range(5):
+            state.add(f"id{i}", "user", f"message   number {i}", cache.window, cache.summary_chars)
+        assert [m["content"] for m in state.messages] == ["message   number 2", "message   number 3", "message   number 4"]
+        assert state.summary == "user: message number 0\nuser: message number 1"
+        history = state.history()
+        assert history[0]["content"].startswith("Summary of the earlier conversation:")
+        assert len(history) == 4
+
+    def test_summary_keeps_most_recent_lines(self, cache):
+        state = new_state()
+        for i in range(10):
+            state.add(f"id{i}", "assistant", f"reply {i}", cache.window, cache.summary_chars)
+        assert len(state.summary) <= cache.summary_chars
+        assert state.summary.endswith("assistant: reply 6")
+        assert state.summary.startswith("assistant: reply")
+
+    def test_duplicate_message_is_ignored(self, cache):
+        state = new_state()
+        state.add("same", "user", "hi", cache.window, cache.summary_chars)
+        state.add("same", "user", "hi", cache.window, cache.summary_chars)
+        assert len(state.messages) == 1
+
+
+class TestSessionStateCache:
+    def test_put_get_and_expiry(self, cache, monkeypatch):
+        state = new_state()
+        asyncio.run(cache.add_message(state, "m1", "user", "hello"))
+        cached = asyncio.run(cache.get(state.session_id, "u"))
+        assert cached == state
+        assert metrics.get("session_cache.queries_saved") == 3
+
+        import services.session_cache as module
+        now = module.time.monotonic()
+        monkeypatch.setattr(module.time, "monotonic", lambda: now + 61)
+        assert asyncio.run(cache.get(state.session_id, "u")) is None
+        assert cache.hit_ratio() == 0.5
+
+    def test_concurrent_turns_keep_each_others_messages(self):
+        cache = SessionStateCache(ttl_seconds=60, window=10, summary_chars=60, redis_url="")
+        session_id = new_state().session_id
+        asyncio.run(cache.put(SessionState(session_id, "u", None, "coding", "m")))
+        first, second = (asyncio.run(cache.get(session_id, "u")) for _ in range(2))
+        asyncio.run(cache.add_message(first, "a1", "user", "first question"))
+        asyncio.run(cache.add_message(second, "b1", "user", "second question"))
+        asyncio.run(cache.add_message(first, "a2", "assistant", "first answer"))
+        asyncio.run(cache.add_message(second, "b2", "assistant", "second answer"))
+        stored = asyncio.run(cache.get(session_id, "u"))
+        assert [m["id"] for m in stored.messages] == ["a1", "b1", "a2", "b2"]
+        assert second.messages == stored.messages
+
+    def test_write_retries_when_the_watched_state_changed(self, monkeypatch):
+        cache = SessionStateCache(window=10, redis_url="redis://unused")
+        redis = ContendedRedis()
+        monkeypatch.setattr(cache, "_client", lambda: redis)
+        state = new_state()
+        asyncio.run(cache.add_message(state, "m1", "user", "hello"))
+        assert redis.conflicts == 0
+        stored = json.loads(redis.values[f"session_state:{state.session_id}"])
+        assert [m["id"] for m in stored["messages"]] == ["m1"]
+
+    def test_other_users_state_is_a_miss(self, cache):
+        state = new_state()
+        asyncio.run(cache.add_message(state, "m1", "user", "hello"))
+        assert asyncio.run(cache.get(state.session_id, "someone else")) is None
+        assert metrics.get("session_cache.hits") == 0
+
+    def test_failed_write_is_never_served_stale(self, monkeypatch):
+        cache = SessionStateCache(redis_url="redis://unused")
+        monkeypatch.setattr(cache, "_client", lambda: FailingRedis())
+        state = new_state()
+        asyncio.run(cache.put(state))
+        monkeypatch.setattr(cache, "_get_raw", lambda key: pytest.fail("stale state was read"))
+        assert asyncio.run(cache.get(state.session_id, "u")) is None
+
+
+class TestChatSessionCache:
+    def test_follow_up_turn_skips_history_and_session_queries(self, client, async_test_db, test_user, monkeypatch):
+        from llm import OllamaProvider
+        from services.session_cache import session_cache
+        from services.usage import usage_counter
+
+        monkeypatch.setattr(session_cache, "redis_url", "")
+        monkeypatch.setattr(usage_counter, "redis_url", "")
+        session_cache.clear()
+        metrics.reset()
+        seen = []
+
+        async def generate(self, request):
+            seen.append(request)
+            return LLMResponse(content=f"reply {len(seen)}", tokens_used=5, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        token = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        first = client.post("/api/v1/chat/", headers=headers, json={"agent_type": "qa", "message": "What is a monad?"})
+        session_id = first.json()["session_id"]
+
+        statements = []
+        event.listen(
+            async_test_db.kw["bind"].sync_engine, "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        client.post("/api/v1/chat/", headers=headers, json={"session_id": session_id, "agent_type": "qa", "message": "Example?"})
+
+        assert [m["content"] for m in seen[1].messages[:2]] == ["What is a monad?", "reply 1"]
+        selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+        assert selects == []
+        assert any(s.lstrip().upper().startswith("INSERT INTO MESSAGES") for s in statements)
+        assert metrics.get("session_cache.hits") == 1
+        assert metrics.get("session_cache.queries_saved") == 3
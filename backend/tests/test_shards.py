@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from config import settings
+from indexing import RepositoryIndexer
+from indexing.shards import ShardManager, ShardNotLocalError, index_session, shard_manager
+from models import CodeBlock, IndexShard, Repository
+from services.search import CodeSearchService
+
+
+@pytest.fixture
+def sharded_repo(test_db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_STORAGE_MODE", "shard")
+    monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "config.py").write_text("def load_config(path):\n    return parse_yaml(path)\n")
+
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="sharded", local_path=str(source))
+    db.add(repo)
+    db.commit()
+    asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+    yield db, repo
+    shard_manager.evict(repo.id)
+
+
+class TestShards:
+    def test_blocks_live_in_shard_and_catalog_records_node(self, sharded_repo):
+        db, repo = sharded_repo
+        assert db.query(CodeBlock).count() == 0
+        assert shard_manager.path(repo.id).exists()
+
+        with index_session(db, repo.id) as index_db:
+            hits = CodeSearchService(index_db).search(repo.id, "load config")
+            assert [hit.block.entity_name for hit in hits] == ["load_config"]
+
+        shard = db.query(IndexShard).filter(IndexShard.repository_id == repo.id).one()
+        assert shard.node_id == settings.NODE_ID
+        assert shard.block_count == 1
+        assert shard.size_bytes > 0
+
+    def test_shard_held_by_other_node_is_rejected(self, sharded_repo):
+        db, repo = sharded_repo
+        shard = db.query(IndexShard).filter(IndexShard.repository_id == repo.id).one()
+        shard.node_id = "other-node"
+        db.commit()
+
+        with pytest.raises(ShardNotLocalError) as excinfo:
+            with index_session(db, repo.id):
+                pass
+        assert excinfo.value.node_id == "other-node"
+
+    def test_lost_shard_is_rebuilt_in_full(self, sharded_repo):
+        db, repo = sharded_repo
+        shard_manager.evict(repo.id)
+        shard_manager.path(repo.id).unlink()
+
+        stats = asyncio.run(RepositoryIndexer(db, repo.id, repo.local_path).index_repository())
+
+        assert (stats["indexed_files"], stats["skipped_files"]) == (1, 0)
+        with index_session(db, repo.id) as index_db:
+            assert index_db.query(CodeBlock).filter(CodeBlock.repository_id == repo.id).count() == 1
+
+    def test_lru_closes_least_recently_used_handle(self, tmp_path):
+        manager = ShardManager(base_dir=str(tmp_path), max_open=2)
+        first = manager.engine("00000000-0000-0000-0000-000000000001")
+        manager.engine("00000000-0000-0000-0000-000000000002")
+        assert manager.engine("00000000-0000-0000-0000-000000000001") is first
+        manager.engine("00000000-0000-0000-0000-000000000003")
+
+        assert manager.open_count() == 2
+        assert manager.engine("00000000-0000-0000-0000-000000000001") is first
+        assert "00000000-0000-0000-0000-000000000002" not in manager._engines
+        manager.close_all()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from config import settings
+from indexing import RepositoryIndexer
+from indexing.bm25 import bm25_registry
+from indexing.embeddings import vector_registry
+from indexing.snapshot import (
+    FRAME_HEADER, MAGIC, SnapshotConflict, SnapshotError, SnapshotImporter, SnapshotWriter, export_snapshot,
+)
+from models import CodeBlock, Repository, SymbolEdge
+from services.search import CodeSearchService
+
+
+@pytest.fixture
+def indexed_repo(test_db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "config.py").write_text(
+        "import yaml\n\n"
+        "def load_config(path):\n    return parse_yaml(path)\n\n"
+        "def parse_yaml(path):\n    return yaml.safe_load(open(path))\n"
+    )
+
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="source", local_path=str(source))
+    target = Repository(user_id=test_user.id, name="target")
+    db.add_all([repo, target])
+    db.commit()
+    asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+
+    ids = [str(block_id) for (block_id,) in db.query(CodeBlock.id).filter(CodeBlock.repository_id == repo.id)]
+    matrix = np.random.default_rng(0).normal(size=(len(ids), 16)).astype(np.float32)
+    vector_registry.get(repo.id).replace(ids, [f"h{i}" for i in range(len(ids))], matrix)
+
+    yield db, repo, target
+    for repo_id in (repo.id, target.id):
+        bm25_registry.evict(repo_id)
+        vector_registry.evict(repo_id)
+
+
+def import_snapshot(db, repo_id, data, chunk_size=97):
+    with SnapshotImporter(db, repo_id) as importer:
+        for start in range(0, len(data), chunk_size):
+            importer.feed(data[start:start + chunk_size])
+        return importer.finish()
+
+
+def frames_of(data):
+    """The ``(kind, raw)`` frames of an exported snapshot, without the trailer."""
+    frames, pos = [], len(MAGIC) + struct.calcsize(">H")
+    while True:
+        kind, _, compressed_length, _ = FRAME_HEADER.unpack_from(data, pos)
+        payload = data[pos + FRAME_HEADER.size:pos + FRAME_HEADER.size + compressed_length]
+        pos += FRAME_HEADER.size + compressed_length
+        if kind == b"END_":
+            return frames
+        frames.append((kind, zlib.decompress(payload)))
+
+
+def write_frames(frames):
+    writer = SnapshotWriter()
+    return writer.header() + b"".join(writer.frame(kind, raw) for kind, raw in frames) + writer.end()
+
+
+class TestSnapshot:
+    def test_round_trip_into_another_repository(self, indexed_repo):
+        db, repo, target = indexed_repo
+        data = b"".join(export_snapshot(db, repo.id))
+
+        stats = import_snapshot(db, target.id, data)
+        source_blocks = db.query(CodeBlock).filter(CodeBlock.repository_id == repo.id).count()
+        assert stats["blocks"] == source_blocks
+        assert stats["edges"] == db.query(SymbolEdge).filter(SymbolEdge.repository_id == repo.id).count()
+        assert stats["vectors"] == source_blocks
+
+        db.refresh(target)
+        assert target.indexed
+        assert target.index_version
+        assert target.repo_metadata["manifest"] == repo.repo_metadata["manifest"]
+
+        # Blocks got fresh ids, and the edges and vectors follow them.
+        target_ids = {str(block_id) for (block_id,) in db.query(CodeBlock.id).filter(CodeBlock.repository_id == target.id)}
+        source_ids = {str(block_id) for (block_id,) in db.query(CodeBlock.id).filter(CodeBlock.repository_id == repo.id)}
+        assert target_ids.isdisjoint(source_ids)
+        edge_blocks = {str(edge.block_id) for edge in db.query(SymbolEdge).filter(SymbolEdge.repository_id == target.id)}
+        assert edge_blocks and edge_blocks <= target_ids
+        meta, vectors, _ = vector_registry.get(target.id).snapshot()
+        assert set(meta["ids"]) == target_ids
+        source_meta, source_vectors, _ = vector_registry.get(repo.id).snapshot()
+        assert np.array_equal(vectors, source_vectors)
+
+        hits = CodeSearchService(db).search(target.id, "load config")
+        assert hits[0].block.entity_name == "load_config"
+
+    def test_reimport_into_same_repository_replaces_blocks(self, indexed_repo):
+        db, repo, _ = indexed_repo
+        before = {str(block_id) for (block_id,) in db.query(CodeBlock.id).filter(CodeBlock.repository_id == repo.id)}
+        version = repo.index_version
+
+        import_snapshot(db, repo.id, b"".join(export_snapshot(db, repo.id)))
+
+        after = {str(block_id) for (block_id,) in db.query(CodeBlock.id).filter(CodeBlock.repository_id == repo.id)}
+        assert after == before
+        db.refresh(repo)
+        assert repo.index_version != version
+
+    def test_corrupt_snapshot_is_rejected_and_rolled_back(self, indexed_repo):
+        db, repo, target = indexed_repo
+        data = bytearray(b"".join(export_snapshot(db, repo.id)))
+        data[len(data) // 2] ^= 0xFF
+
+        with pytest.raises(SnapshotError):
+            import_snapshot(db, target.id, bytes(data))
+        assert db.query(CodeBlock).filter(CodeBlock.repository_id == target.id).count() == 0
+
+    def test_truncated_snapshot_is_rejected(self, indexed_repo):
+        db, repo, target = indexed_repo
+        data = b"".join(export_snapshot(db, repo.id))
+
+        with pytest.raises(SnapshotError, match="truncated"):
+            import_snapshot(db, target.id, data[:-10])
+        with pytest.raises(SnapshotError, match="Not an index snapshot"):
+            import_snapshot(db, target.id, b"PK\x03\x04" + data)
+
+    def test_decompression_bomb_is_rejected(self, indexed_repo):
+        db, _, target = indexed_repo
+        payload = zlib.compress(b"\0" * (32 * 1024 * 1024), 9)
+        data = MAGIC + struct.pack(">H", 1) + FRAME_HEADER.pack(b"META", 16, len(payload), 0) + payload
+
+        with pytest.raises(SnapshotError, match="Corrupt META frame"):
+            import_snapshot(db, target.id, data, chunk_size=len(data))
+
+    def test_colliding_block_ids_are_a_conflict(self, indexed_repo):
+        db, repo, target = indexed_repo
+        data = b"".join(export_snapshot(db, repo.id))
+        # The exported blocks now belong to another repository, so restoring them collides.
+        db.query(CodeBlock).filter(CodeBlock.repository_id == repo.id).update({"repository_id": target.id})
+        db.commit()
+
+        with pytest.raises(SnapshotConflict):
+            import_snapshot(db, repo.id, data)
+        assert db.query(CodeBlock).filter(CodeBlock.repository_id == target.id).count() > 0
+
+    def test_short_vector_stream_is_rejected(self, indexed_repo):
+        db, repo, target = indexed_repo
+        frames = [(kind, raw[:-32] if kind == b"VECR" else raw) for kind, raw in frames_of(b"".join(export_snapshot(db, repo.id)))]
+
+        with pytest.raises(SnapshotError, match="vectors"):
+            import_snapshot(db, target.id, write_frames(frames))
+        assert db.query(CodeBlock).filter(CodeBlock.repository_id == target.id).count() == 0
+
+    def test_misshapen_vector_rows_are_a_snapshot_error(self, indexed_repo):
+        db, repo, target = indexed_repo
+        frames = [(kind, raw + b"\0" if kind == b"VECR" else raw) for kind, raw in frames_of(b"".join(export_snapshot(db, repo.id)))]
+
+        with pytest.raises(SnapshotError, match="dimension"):
+            import_snapshot(db, target.id, write_frames(frames))
+
+    def test_int8_vectors_without_scales_are_rejected(self, indexed_repo):
+        db, repo, target = indexed_repo
+        frames = []
+        for kind, raw in frames_of(b"".join(export_snapshot(db, repo.id))):
+            if kind == b"VECM":
+                meta = dict(json.loads(raw), dtype="int8")
+                raw = json.dumps(meta).encode("utf-8")
+            elif kind == b"VECR":
+                raw = np.zeros((len(meta["ids"]), meta["dim"]), dtype=np.int8).tobytes()
+            frames.append((kind, raw))
+
+        with pytest.raises(SnapshotError, match="scales"):
+            import_snapshot(db, target.id, write_frames(frames))
+
+    def test_vectors_from_another_embedding_model_are_rejected(self, indexed_repo, monkeypatch):
+        db, repo, target = indexed_repo
+        data = b"".join(export_snapshot(db, repo.id))
+        monkeypatch.setattr(settings, "EMBEDDING_MODEL", "another-embedder")
+
+        with pytest.raises(SnapshotError, match="embedded with"):
+            import_snapshot(db, target.id, data)
+        assert db.query(CodeBlock).filter(CodeBlock.repository_id == target.id).count() == 0
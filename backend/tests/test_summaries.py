@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from config import settings
+from indexing import RepositoryIndexer
+from indexing.bm25 import bm25_registry
+from indexing.minhash import minhash_registry
+from llm.base import LLMResponse
+from models import CodeSummary, Repository
+from services.summaries import RepositorySummarizer, cached_summaries, directory_tree
+
+
+class FakeProvider:
+    def __init__(self, fail_on=None, error=RuntimeError):
+        self.prompts = []
+        self.fail_on = fail_on
+        self.error = error
+        self.active = 0
+        self.max_active = 0
+
+    async def generate(self, request):
+        prompt = request.messages[-1]["content"]
+        self.prompts.append(prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if self.fail_on and self.fail_on in prompt:
+            raise self.error("model unavailable")
+        subject = prompt.split(" in ")[0].replace("Summarize the ", "")
+        return LLMResponse(content=f"summary of {subject}", tokens_used=5, cost=0.0, model=request.model, finish_reason="stop")
+
+
+@pytest.fixture
+def indexed_repo(test_db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+
+    source = tmp_path / "src"
+    (source / "app" / "api").mkdir(parents=True)
+    (source / "lib").mkdir()
+    (source / "app" / "api" / "users.py").write_text("def get_user(user_id):\n    return db.get(user_id)\n")
+    (source / "app" / "api" / "items.py").write_text("def get_item(item_id):\n    return db.get(item_id)\n")
+    (source / "app" / "main.py").write_text("def main():\n    serve()\n")
+    (source / "lib" / "util.py").write_text("def slugify(text):\n    return text.lower()\n")
+
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="summary-repo", local_path=str(source))
+    db.add(repo)
+    db.commit()
+    asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+    yield db, repo, source
+    bm25_registry.evict(repo.id)
+    minhash_registry.evict(repo.id)
+
+
+def summarize(db, repo, provider, concurrency=2):
+    summarizer = RepositorySummarizer(db, repo.id, provider, "test-model", concurrency=concurrency)
+    return asyncio.run(summarizer.summarize()), summarizer.stats
+
+
+class TestDirectoryTree:
+    def test_links_every_ancestor(self):
+        tree = directory_tree(["a/b/c.py", "a/d.py", "e.py"])
+        assert tree == {"": ["a", "e.py"], "a": ["a/b", "a/d.py"], "a/b": ["a/b/c.py"]}
+
+
+class TestRepositorySummarizer:
+    def test_builds_file_directory_and_repository_summaries(self, indexed_repo):
+        db, repo, _ = indexed_repo
+        provider = FakeProvider()
+        summary, stats = summarize(db, repo, provider)
+
+        assert summary == "summary of repository summary-repo"
+        # 4 files + app/api + app + root; lib/ has one entry and reuses util.py's summary.
+        assert stats["computed"] == 7
+        assert provider.max_active == 2
+        directories = cached_summaries(db, repo.id)
+        assert directories["lib"] == "summary of file lib/util.py"
+        assert set(directories) == {"", "app", "lib"}
+
+    def test_only_changed_path_is_recomputed(self, indexed_repo):
+        db, repo, source = indexed_repo
+        summarize(db, repo, FakeProvider())
+
+        (source / "app" / "api" / "users.py").write_text("def get_user(user_id):\n    return cache.get(user_id)\n")
+        asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+
+        provider = FakeProvider()
+        _, stats = summarize(db, repo, provider)
+        subjects = sorted(prompt.split(" in ")[0] for prompt in provider.prompts)
+        assert subjects == [
+            "Summarize the directory app/",
+            "Summarize the directory app/api/",
+            "Summarize the file app/api/users.py",
+            "Summarize the repository summary-repo",
+        ]
+        assert stats["reused"] == 4
+
+    def test_failed_files_are_retried_next_time(self, indexed_repo):
+        db, repo, _ = indexed_repo
+        _, stats = summarize(db, repo, FakeProvider(fail_on="lib/util.py"))
+        assert stats["failed"] == 1
+        assert "lib" not in cached_summaries(db, repo.id)
+
+        provider = FakeProvider()
+        summarize(db, repo, provider)
+        subjects = sorted(prompt.split(" in ")[0] for prompt in provider.prompts)
+        assert subjects == ["Summarize the file lib/util.py", "Summarize the repository summary-repo"]
+
+    def test_file_summaries_survive_a_failed_run(self, indexed_repo):
+        db, repo, _ = indexed_repo
+        with pytest.raises(ConnectionError):
+            summarize(db, repo, FakeProvider(fail_on="Summarize the repository", error=ConnectionError))
+        db.rollback()
+
+        provider = FakeProvider()
+        summarize(db, repo, provider)
+        assert [prompt.split(" in ")[0] for prompt in provider.prompts] == ["Summarize the repository summary-repo"]
+
+    def test_removed_files_drop_their_summaries(self, indexed_repo):
+        db, repo, source = indexed_repo
+        summarize(db, repo, FakeProvider())
+
+        (source / "lib" / "util.py").unlink()
+        asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+        summarize(db, repo, FakeProvider())
+
+        paths = {row.path for row in db.query(CodeSummary).filter(CodeSummary.repository_id == repo.id)}
+        assert "lib/util.py" not in paths and "lib" not in paths
+
+    def test_agent_serves_only_stored_summaries(self, indexed_repo):
+        from agents.qa_agent import QAAgent
+        db, repo, _ = indexed_repo
+        provider = FakeProvider()
+        agent = QAAgent(db, str(repo.id), model="test-model", provider=provider)
+
+        assert asyncio.run(agent.summarize_repository()) == ""
+        assert provider.prompts == []
+
+        summarize(db, repo, FakeProvider())
+        overview = asyncio.run(agent.summarize_repository())
+        assert overview.startswith("summary of repository summary-repo")
+        assert "app/: summary of directory app/" in overview
+        assert provider.prompts == []
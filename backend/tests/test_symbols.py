@@ -0,0 +1,163 @@
+import ast
+import asyncio
+
+import pytest
+from config import settings
+from indexing import RepositoryIndexer, SymbolGraph
+from indexing.bm25 import bm25_registry
+from indexing.minhash import minhash_registry
+from models import CodeBlock, Repository, SymbolEdge
+from indexing.symbols import (
+    python_module_imports,
+    extract_python_symbols,
+    extract_generic_symbols,
+)
+
+
+SOURCE = '''
+import os
+import numpy as np
+from models import CodeBlock, Repository
+
+
+class Loader(BaseLoader):
+    def load(self, path):
+        data = os.path.join(path, "x")
+        return np.array(parse(data))
+
+
+def unused():
+    return len([])
+'''
+
+
+class TestSymbolExtraction:
+    def test_python_imports_are_filtered_to_referenced_names(self):
+        tree = ast.parse(SOURCE)
+        module_imports = python_module_imports(tree)
+        load = next(n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef) and n.name == "load")
+
+        imports, dependencies = extract_python_symbols(load, module_imports)
+
+        assert imports == ["numpy", "os"]
+        assert "parse" in dependencies
+        assert "join" in dependencies
+        assert "array" in dependencies
+
+    def test_python_builtins_and_self_are_excluded(self):
+        tree = ast.parse(SOURCE)
+        unused = next(n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef) and n.name == "unused")
+
+        imports, dependencies = extract_python_symbols(unused, python_module_imports(tree))
+
+        assert imports == []
+        assert dependencies == []
+
+    def test_class_bases_are_dependencies(self):
+        tree = ast.parse(SOURCE)
+        loader = next(n for n in ast.walk(tree) if isinstance(n, ast.ClassDef))
+
+        _, dependencies = extract_python_symbols(loader, python_module_imports(tree))
+
+        assert "BaseLoader" in dependencies
+
+    def test_generic_imports_and_calls(self):
+        content = 'import React from "react";\nconst x = require("lodash");\nfunction a() { return renderTree(x); }\n'
+
+        imports, dependencies = extract_generic_symbols(content, "javascript")
+
+        assert imports == ["lodash", "react"]
+        assert "renderTree" in dependencies
+        assert "function" not in dependencies
+        assert "a" not in dependencies
+
+    def test_go_import_block(self):
+        content = 'package main\n\nimport (\n    "fmt"\n    log "github.com/sirupsen/logrus"\n)\n'
+
+        imports, _ = extract_generic_symbols(content, "go")
+
+        assert imports == ["fmt", "github.com/sirupsen/logrus"]
+
+
+@pytest.fixture
+def indexed(test_db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "config.py").write_text(
+        "import yaml\n\n"
+        "def load_config(path):\n    return parse_yaml(path)\n\n"
+        "def parse_yaml(path):\n    return yaml.safe_load(read_file(path))\n"
+    )
+    (source / "files.py").write_text("def read_file(path):\n    return open(path).read()\n")
+
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="source", local_path=str(source))
+    db.add(repo)
+    db.commit()
+    indexer = RepositoryIndexer(db, repo.id, str(source))
+    asyncio.run(indexer.index_repository())
+    yield db, repo, source, indexer
+    bm25_registry.evict(repo.id)
+    minhash_registry.evict(repo.id)
+
+
+class TestSymbolGraph:
+    def test_callers_and_dependencies(self, indexed):
+        db, repo, _, _ = indexed
+        graph = SymbolGraph(db, repo.id)
+
+        assert [edge.source for edge in graph.callers("parse_yaml")] == ["load_config"]
+        assert {edge.target for edge in graph.dependencies("parse_yaml")} >= {"read_file", "yaml"}
+        assert [edge.source for edge in graph.importers("yaml")] == ["parse_yaml"]
+
+    def test_neighborhood_expands_by_hop(self, indexed):
+        db, repo, _, _ = indexed
+        graph = SymbolGraph(db, repo.id)
+
+        assert graph.neighborhood(["load_config"], depth=1, direction="out") == {"load_config": 0, "parse_yaml": 1}
+        distances = graph.neighborhood(["load_config"], depth=2, direction="out")
+        assert distances["read_file"] == 2
+        assert graph.neighborhood(["read_file"], depth=2, direction="in") == {
+            "read_file": 0, "parse_yaml": 1, "load_config": 2,
+        }
+        assert [block.entity_name for block in graph.neighborhood_blocks(["load_config"], depth=2)] == [
+            "parse_yaml", "read_file",
+        ]
+
+
+class TestIncrementalIndexing:
+    def test_unchanged_files_are_skipped(self, indexed):
+        _, _, _, indexer = indexed
+
+        stats = asyncio.run(indexer.index_repository())
+
+        assert (stats["indexed_files"], stats["skipped_files"], stats["removed_files"]) == (0, 2, 0)
+
+    def test_changed_file_is_reindexed_alone(self, indexed):
+        db, repo, source, indexer = indexed
+        (source / "files.py").write_text("def read_text(path):\n    return open(path).read()\n")
+
+        stats = asyncio.run(indexer.index_repository())
+
+        assert (stats["indexed_files"], stats["skipped_files"]) == (1, 1)
+        names = {name for (name,) in db.query(CodeBlock.entity_name).filter(CodeBlock.repository_id == repo.id)}
+        assert names == {"load_config", "parse_yaml", "read_text"}
+
+    def test_deleted_file_drops_its_blocks_and_edges(self, indexed):
+        db, repo, source, indexer = indexed
+        (source / "config.py").unlink()
+
+        stats = asyncio.run(indexer.index_repository())
+
+        assert stats["removed_files"] == 1
+        assert db.query(CodeBlock).filter(
+            (CodeBlock.repository_id == repo.id) & (CodeBlock.file_path == "config.py")
+        ).count() == 0
+        assert db.query(SymbolEdge).filter(
+            (SymbolEdge.repository_id == repo.id) & (SymbolEdge.file_path == "config.py")
+        ).count() == 0
+        assert SymbolGraph(db, repo.id).callers("read_file") == []
+        assert "config.py" not in db.get(Repository, repo.id).repo_metadata["manifest"]
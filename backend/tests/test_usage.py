@@ -0,0 +1,196 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from config import settings
+from llm.base import LLMResponse
+from models import Message, Session as DBSession, UsageRollup
+from models.message import MessageRole
+from services.compaction import MessageCompactor
+from services.message_journal import MessageJournal, message_record, message_row, session_record
+from services.usage import UsageCounter, rebuild_usage, record_usage
+
+
+def make_session(user_id, created_at=None):
+    created_at = created_at or datetime.utcnow()
+    return DBSession(id=uuid.uuid4(), user_id=user_id, agent_type="coding", model="m", created_at=created_at, updated_at=created_at)
+
+
+def make_reply(session_id, tokens, model=None, created_at=None):
+    return Message(
+        id=uuid.uuid4(), session_id=session_id, role=MessageRole.ASSISTANT, content="reply", tokens_used=tokens,
+        msg_metadata={"model": model} if model else {}, created_at=created_at or datetime.utcnow(),
+    )
+
+
+def rollups(db):
+    return sorted((row.day, row.model, row.tokens_used, row.message_count) for row in db.query(UsageRollup))
+
+
+@pytest.fixture
+def headers(client, test_user):
+    response = client.post("/api/v1/auth/login", json={"email": "test@example.com", "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestUsageRollups:
+    def test_record_usage_accumulates_per_model_and_day(self, test_db, test_user):
+        db = test_db()
+        session = make_session(test_user.id)
+        db.add(session)
+        db.commit()
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        replies = [make_reply(session.id, 10), make_reply(session.id, 5), make_reply(session.id, 7, model="big"),
+                   make_reply(session.id, 3, created_at=yesterday)]
+        question = Message(id=uuid.uuid4(), session_id=session.id, role=MessageRole.USER, content="q", created_at=datetime.utcnow())
+
+        assert record_usage(db, [message_row(message_record(m)) for m in replies[:2] + [question]]) == 2
+        record_usage(db, [message_row(message_record(m)) for m in replies[2:]])
+        db.commit()
+
+        today = datetime.utcnow().date()
+        assert rollups(db) == [(yesterday.date(), "m", 3, 1), (today, "big", 7, 1), (today, "m", 15, 2)]
+
+    def test_journal_replay_counts_each_response_once(self, test_db, test_user, tmp_path):
+        journal = MessageJournal(directory=str(tmp_path / "journal"), flush_interval_ms=60000)
+        session = make_session(test_user.id)
+        asyncio.run(journal.append([session_record(session), message_record(make_reply(session.id, 12))]))
+        unflushed = open(journal.path).read()
+        journal.bind = test_db.kw["bind"]
+        asyncio.run(journal.flush())
+        with open(journal.path, "w") as f:
+            f.write(unflushed)
+
+        asyncio.run(MessageJournal(directory=journal.directory).recover(test_db.kw["bind"]))
+
+        assert rollups(test_db()) == [(datetime.utcnow().date(), "m", 12, 1)]
+
+    def test_rebuild_includes_archived_sessions(self, test_db, test_user):
+        db = test_db()
+        old = datetime.utcnow() - timedelta(days=90)
+        idle, active = make_session(test_user.id, old), make_session(test_user.id)
+        db.add_all([idle, active])
+        db.flush()
+        db.add_all([make_reply(idle.id, 4, created_at=old), make_reply(active.id, 6, model="big")])
+        db.commit()
+        MessageCompactor(db, idle_days=30).run()
+
+        assert rebuild_usage(db) == {"rollups": 2, "messages": 2, "tokens_used": 10}
+        assert rollups(db) == [(old.date(), "m", 4, 1), (datetime.utcnow().date(), "big", 6, 1)]
+
+
+class TestUsageCounter:
+    def test_loads_from_rollups_then_counts_in_memory(self, async_test_db, test_db, test_user, monkeypatch):
+        monkeypatch.setattr(settings, "USAGE_QUOTA_FREE_TOKENS", 100)
+        db = test_db()
+        db.add(UsageRollup(user_id=test_user.id, day=datetime.utcnow().date(), model="m", tokens_used=60, message_count=2))
+        db.commit()
+        counter = UsageCounter(redis_url="")
+
+        async def run():
+            async with async_test_db() as session:
+                first = await counter.get(session, test_user.id)
+                await counter.add(test_user.id, 50)
+                return first, await counter.get(session, test_user.id)
+
+        first, second = asyncio.run(run())
+
+        assert (first.tier, first.tokens_used, first.remaining, first.exceeded) == ("free", 60, 40, False)
+        assert (second.tokens_used, second.remaining, second.exceeded) == (110, 0, True)
+
+    def test_reload_counts_queued_responses_without_flushing(self, async_test_db, test_db, test_user, tmp_path, monkeypatch):
+        import services.message_journal as journal_module
+        db = test_db()
+        session = make_session(test_user.id)
+        db.add(session)
+        db.add(UsageRollup(user_id=test_user.id, day=datetime.utcnow().date(), model="m", tokens_used=60, message_count=2))
+        db.commit()
+        journal = MessageJournal(directory=str(tmp_path / "journal"), flush_interval_ms=60000)
+        journal.bind = test_db.kw["bind"]
+        asyncio.run(journal.append([message_record(make_reply(session.id, 9), test_user.id)]))
+        monkeypatch.setattr(journal_module, "message_journal", journal)
+        counter = UsageCounter(redis_url="")
+
+        async def reload():
+            await counter.invalidate(test_user.id)
+            async with async_test_db() as session:
+                return (await counter.get(session, test_user.id)).tokens_used
+
+        assert asyncio.run(reload()) == 69
+        assert journal.pending_count() == 1
+        asyncio.run(journal.flush())
+        assert asyncio.run(reload()) == 69
+
+    def test_reload_keeps_a_counter_that_is_already_loaded(self, async_test_db, test_db, test_user):
+        db = test_db()
+        db.add(UsageRollup(user_id=test_user.id, day=datetime.utcnow().date(), model="m", tokens_used=60, message_count=2))
+        db.commit()
+        counter = UsageCounter(redis_url="")
+
+        async def run():
+            # Not loaded yet: the response is left to the rollup the reload reads.
+            await counter.add(test_user.id, 50)
+            async with async_test_db() as session:
+                first = await counter.get(session, test_user.id)
+            await counter.add(test_user.id, 5)
+            key = counter._key(test_user.id, first.period_start)
+            return first, await counter._set_raw(key, "free", 60)
+
+        first, reloaded = asyncio.run(run())
+
+        assert first.tokens_used == 60
+        assert reloaded == ("free", 65)
+
+    def test_tier_change_drops_the_counter(self, async_test_db, test_user, monkeypatch):
+        from services.usage import change_tier, usage_counter
+
+        monkeypatch.setattr(usage_counter, "redis_url", "")
+        usage_counter.clear()
+
+        async def run():
+            async with async_test_db() as session:
+                before = await usage_counter.get(session, test_user.id)
+                await change_tier(session, test_user.id, "pro")
+                return before, await usage_counter.get(session, test_user.id)
+
+        before, after = asyncio.run(run())
+
+        assert (before.tier, after.tier) == ("free", "pro")
+        assert after.limit == settings.USAGE_QUOTA_PRO_TOKENS
+
+
+class TestUsageRoute:
+    def test_chat_turns_show_up_in_usage(self, client, headers, monkeypatch):
+        from llm import OllamaProvider
+        from services.usage import usage_counter
+
+        async def generate(self, request):
+            return LLMResponse(content="a reply", tokens_used=5, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        monkeypatch.setattr(usage_counter, "redis_url", "")
+        for _ in range(2):
+            assert client.post("/api/v1/chat/", headers=headers, json={"agent_type": "qa", "message": "Hi?"}).status_code == 200
+
+        usage = client.get("/api/v1/usage/", headers=headers).json()
+
+        assert usage["message_count"] == 2
+        assert usage["tokens_used"] > 0
+        assert [day["message_count"] for day in usage["days"]] == [2]
+        assert usage["quota"]["tier"] == "free"
+        assert usage["quota"]["tokens_used"] == usage["tokens_used"]
+
+    def test_exhausted_quota_rejects_chat(self, client, headers, test_db, test_user, monkeypatch):
+        monkeypatch.setattr(settings, "USAGE_QUOTA_FREE_TOKENS", 50)
+        db = test_db()
+        db.add(UsageRollup(user_id=test_user.id, day=datetime.utcnow().date(), model="m", tokens_used=50, message_count=1))
+        db.commit()
+
+        response = client.post("/api/v1/chat/", headers=headers, json={"agent_type": "qa", "message": "Hi?"})
+
+        assert response.status_code == 429
+
+    def test_rejects_bad_ranges(self, client, headers):
+        assert client.get("/api/v1/usage/", params={"start": "2026-02-01", "end": "2026-01-01"}, headers=headers).status_code == 400
+        assert client.get("/api/v1/usage/", params={"start": "2024-01-01", "end": "2026-01-01"}, headers=headers).status_code == 400
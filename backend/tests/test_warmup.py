@@ -0,0 +1,127 @@
+import asyncio
+
+import numpy as np
+import pytest
+from config import settings
+from indexing import RepositoryIndexer
+from indexing.bm25 import bm25_registry, touch_pages
+from indexing.minhash import minhash_registry
+from llm import OllamaProvider
+from llm.base import LLMResponse
+from models import Repository
+from services.summaries import cached_summaries
+from services.warmup import RepositoryWarmer, cached_overview, repository_overview
+
+
+@pytest.fixture
+def indexed_repo(test_db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_DATA_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", False)
+
+    source = tmp_path / "src"
+    (source / "app").mkdir(parents=True)
+    (source / "app" / "config.py").write_text(
+        "def load_config(path):\n    return parse_yaml(path)\n\n"
+        "def parse_yaml(path):\n    return open(path).read()\n"
+    )
+    (source / "app" / "main.py").write_text("def main():\n    return load_config('app.yaml')\n")
+    (source / "web.js").write_text("function render() { return 1; }\n")
+
+    db = test_db()
+    repo = Repository(user_id=test_user.id, name="warm-repo", local_path=str(source))
+    db.add(repo)
+    db.commit()
+    asyncio.run(RepositoryIndexer(db, repo.id, str(source)).index_repository())
+    yield db, repo
+    bm25_registry.evict(repo.id)
+    minhash_registry.evict(repo.id)
+
+
+class TestOverview:
+    def test_overview_summarizes_repository(self, indexed_repo):
+        db, repo = indexed_repo
+        overview = repository_overview(db, repo.id)
+        assert "Repository overview: warm-repo" in overview
+        assert "3 files" in overview
+        assert "python (2 files)" in overview
+        assert "app/ (2 files)" in overview
+        assert "load_config (app/config.py, 1 references)" in overview
+
+    def test_overview_is_cached_per_index_version(self, indexed_repo):
+        db, repo = indexed_repo
+        first = repository_overview(db, repo.id)
+        db.refresh(repo)
+        assert repo.repo_metadata["overview"]["index_version"] == repo.index_version
+
+        repo.repo_metadata = dict(repo.repo_metadata, overview={"index_version": repo.index_version, "text": "cached"})
+        db.commit()
+        assert repository_overview(db, repo.id) == "cached"
+
+        repo.index_version = "next"
+        db.commit()
+        assert repository_overview(db, repo.id) == first
+
+    def test_cached_overview_never_builds(self, indexed_repo):
+        db, repo = indexed_repo
+        assert cached_overview(db, repo.id) is None
+        db.refresh(repo)
+        assert "overview" not in (repo.repo_metadata or {})
+
+        text = repository_overview(db, repo.id)
+        assert cached_overview(db, repo.id) == text
+
+
+class TestWarmer:
+    def test_warm_loads_indexes_and_preloads_model(self, indexed_repo, monkeypatch):
+        db, repo = indexed_repo
+        preloaded = []
+
+        async def preload(self, model=None, keep_alive=None):
+            preloaded.append(model)
+            return True
+
+        async def generate(self, request):
+            return LLMResponse(content="summary", tokens_used=1, cost=0.0, model=request.model, finish_reason="stop")
+
+        monkeypatch.setattr(OllamaProvider, "preload", preload)
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        monkeypatch.setattr(settings, "SUMMARIES_ON_WARM", True)
+        warmer = RepositoryWarmer()
+        assert warmer.due(repo.id, repo.index_version)
+        assert warmer.claim(repo.id, repo.index_version)
+        assert not warmer.due(repo.id, repo.index_version)
+        assert not warmer.claim(repo.id, repo.index_version)
+
+        stats = asyncio.run(warmer.warm(db.get_bind(), repo.id, "codellama:latest"))
+        assert preloaded == ["codellama:latest"]
+        assert stats["bm25_bytes"] > 0
+        assert stats["minhash_bytes"] > 0
+        assert stats["overview_chars"] > 0
+        assert stats["summaries"]["computed"] > 0
+        assert cached_summaries(db, repo.id)[""] == "summary"
+
+        # Recently warmed at this version: skipped until the index changes.
+        assert not warmer.claim(repo.id, repo.index_version)
+        assert warmer.claim(repo.id, "newer-version")
+
+    def test_warm_leaves_summaries_to_their_job_by_default(self, indexed_repo, monkeypatch):
+        db, repo = indexed_repo
+
+        async def preload(self, model=None, keep_alive=None):
+            return True
+
+        async def generate(self, request):
+            pytest.fail("warm-up called the model")
+
+        monkeypatch.setattr(OllamaProvider, "preload", preload)
+        monkeypatch.setattr(OllamaProvider, "generate", generate)
+        warmer = RepositoryWarmer()
+        assert warmer.claim(repo.id, repo.index_version)
+
+        stats = asyncio.run(warmer.warm(db.get_bind(), repo.id, "codellama:latest"))
+        assert stats["summaries"] is None
+
+    def test_touch_pages_reports_size(self, tmp_path):
+        np.save(tmp_path / "a.npy", np.arange(10000, dtype=np.int32))
+        assert touch_pages(np.load(tmp_path / "a.npy", mmap_mode="r")) == 40000
+        assert touch_pages(np.zeros(0)) == 0
@@ -0,0 +1,35 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(position: datetime, row_id) -> str:
+    """Opaque cursor for the row at ``(position, row_id)`` in a keyset-ordered listing."""
+    raw = json.dumps([position.isoformat(), str(row_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse of ``encode_cursor``; raises ``ValueError`` for anything it didn't produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position, row_id = json.loads(raw)
+        return datetime.fromisoformat(position), uuid.UUID(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_after(position_column, id_column, cursor: Optional[str], descending: bool = False):
+    """WHERE clause for rows after ``cursor`` when ordered by ``(position_column, id_column)``.
+
+    A row-value comparison, so the database can seek straight into the
+    matching composite index instead of skipping OFFSET rows.
+    """
+    position, row_id = decode_cursor(cursor)
+    key = tuple_(position_column, id_column)
+    bound = tuple_(position, row_id)
+    return key < bound if descending else key > bound
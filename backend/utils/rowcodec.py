@@ -0,0 +1,28 @@
+import enum
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Enum, Uuid
+
+
+def encode_value(value):
+    """JSON-safe form of a column value: UUIDs and datetimes as strings, enums by value."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def column_decoder(column):
+    """Inverse of ``encode_value`` for the values of ``column``."""
+    if isinstance(column.type, Uuid):
+        return lambda value: uuid.UUID(value) if value else None
+    if isinstance(column.type, DateTime):
+        return lambda value: datetime.fromisoformat(value) if value else None
+    if isinstance(column.type, Enum) and column.type.enum_class is not None:
+        enum_class = column.type.enum_class
+        return lambda value: enum_class(value) if value else None
+    return lambda value: value